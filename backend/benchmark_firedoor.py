@@ -0,0 +1,678 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the fire door quoting pipeline.
+
+Usage:
+    python benchmark_firedoor.py classifier [--faults 100000]
+    python benchmark_firedoor.py populate [--doors 100 1000 5000] [--renderer openpyxl streaming]
+    python benchmark_firedoor.py type2 [--sheets 50] [--rows 400] [--mode full streaming parallel] [--workers 4]
+    python benchmark_firedoor.py stages [--scale 5] [--repeats 5] [--update-thresholds]
+    python benchmark_firedoor.py preprocess [--survey path.txt]
+    python benchmark_firedoor.py extraction [--latency 0.5] [--tokens-per-second 80] [--concurrency 1 2 4 8]
+    python benchmark_firedoor.py http [--calls 200]
+
+The stages benchmark is the regression gate: it exits non-zero when any stage's
+p95 time or peak traced memory exceeds benchmark_thresholds.json. Claude is
+replaced by a deterministic stub (llm_stub_server), so it runs without an API
+key. Thresholds are absolute and machine-specific: regenerate them
+(--update-thresholds) on the machine that runs the gate.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import resource
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import firedoor_processor as fdp
+import llm_backend
+import firedna_parser
+from llm_stub_server import StubConfig, SyntheticBackend, start_stub_server
+from survey_preprocess import preprocess_survey_text
+
+
+# ============================================================================
+# FAULT CLASSIFIER
+# ============================================================================
+
+def legacy_map_fault_to_bcode(fault_text: str) -> Optional[str]:
+    """The original if-chain implementation of map_fault_to_bcode (reference for equivalence and timing)."""
+    fault_lower = fault_text.lower()
+    if any(keyword in fault_lower for keyword in ['hold open', 'hold-open', 'perco', 'chain', 'hook']):
+        return 'B08'
+    seal_keywords = ['seal', 'strip', 'coming away', 'worn', 'damage', 'missing', 'none fitted', 'not fitted']
+    if any(keyword in fault_lower for keyword in seal_keywords):
+        if 'intumescent' in fault_lower and 'smoke' not in fault_lower:
+            return 'B02'
+        return 'B01'
+    if 'intumescent' in fault_lower and 'smoke' not in fault_lower:
+        return 'B02'
+    if any(keyword in fault_lower for keyword in ['closer', 'closing']):
+        if 'not closing' in fault_lower or 'catching' in fault_lower:
+            return 'B10'
+        return 'B03'
+    if any(keyword in fault_lower for keyword in ['hinge', 'dropped', 'drop']):
+        return 'B04'
+    if any(keyword in fault_lower for keyword in ['latch', 'handle', 'lock', 'keep']):
+        return 'B05'
+    if any(keyword in fault_lower for keyword in ['frame', 'architrave', 'fire stop', 'firestop', 'gap to wall']):
+        return 'B06'
+    if any(keyword in fault_lower for keyword in ['sign', 'signage', 'label']):
+        return 'B07'
+    if any(keyword in fault_lower for keyword in ['adjust', 're-hang', 'rehang', 'alignment', 'warped', 'twisted', 'gap too', 'catching', 'not closing']):
+        return 'B10'
+    if any(keyword in fault_lower for keyword in ['lipping', 'lip', 'edge damage']):
+        return 'B11'
+    if any(keyword in fault_lower for keyword in ['void', 'hole', 'insert', 'recessed']):
+        return 'B12'
+    return None
+
+
+FAULT_PHRASES = [
+    "Intumescent strip missing", "Smoke seals damaged", "Intumescent seal coming away",
+    "Closer not closing door fully", "Overhead closer leaking", "Door catching on floor",
+    "Hinges loose", "Door dropped on hinges", "Latch not engaging keep", "Handle loose",
+    "Lock seized", "Gap to wall behind architrave", "Frame not fire stopped",
+    "Fire door keep shut signage missing", "No label to leaf", "Perco chain fitted",
+    "Door held open on hook", "Gap too large at head", "Leaf warped", "Lipping damaged",
+    "Edge damage to leading edge", "Hole in leaf from old lock", "Void behind frame",
+    "Recessed hinge insert required", "Glazing bead loose", "Vision panel cracked",
+    "Ironmongery OK", "Unable to inspect - locked", "Door gaps incorrect 5mm",
+    "INTUMESCENT ONLY", "smoke and intumescent none fitted", "Re-hang required",
+]
+
+
+def synthetic_faults(count: int, seed: int = 42) -> list:
+    """Synthetic Type 2 fault cells: 1-3 phrases joined like a surveyor's notes."""
+    rng = random.Random(seed)
+    faults = []
+    for _ in range(count):
+        faults.append("; ".join(rng.sample(FAULT_PHRASES, rng.randint(1, 3))))
+    return faults
+
+
+def adversarial_faults(count: int, seed: int = 7) -> list:
+    """Keyword fragments run together, so keywords overlap and nest inside each other."""
+    rng = random.Random(seed)
+    keywords = [kw for _, kws in fdp.FAULT_KEYWORD_RULES for kw in kws] + ['smoke']
+    faults = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(1, 4)):
+            kw = rng.choice(keywords)
+            start = rng.randint(0, len(kw) - 1)
+            parts.append(kw[start:] if rng.random() < 0.5 else kw)
+        faults.append(''.join(parts))
+    return faults
+
+
+def _best_of(func, repeats: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_classifier(args):
+    faults = synthetic_faults(args.faults)
+
+    legacy = [legacy_map_fault_to_bcode(f) for f in faults]
+    compiled = [fdp.map_fault_to_bcode(f) for f in faults]
+    batch = fdp.classify_faults(faults)
+    assert compiled == legacy, "map_fault_to_bcode disagrees with the legacy if-chain"
+    assert batch == legacy, "classify_faults disagrees with the legacy if-chain"
+    tricky = adversarial_faults(50_000)
+    assert [fdp.map_fault_to_bcode(f) for f in tricky] == [legacy_map_fault_to_bcode(f) for f in tricky], \
+        "map_fault_to_bcode disagrees with the legacy if-chain on overlapping keywords"
+
+    results = [
+        ("legacy if-chain", _best_of(lambda: [legacy_map_fault_to_bcode(f) for f in faults])),
+        ("map_fault_to_bcode", _best_of(lambda: [fdp.map_fault_to_bcode(f) for f in faults])),
+        ("classify_faults (batch)", _best_of(lambda: fdp.classify_faults(faults))),
+    ]
+    baseline = results[0][1]
+    print(f"Fault classifier: {len(faults):,} faults (outputs identical)")
+    for name, seconds in results:
+        print(f"  {name:<26} {seconds * 1000:8.1f} ms  {len(faults) / seconds:>12,.0f} faults/s  x{baseline / seconds:.2f}")
+
+
+# ============================================================================
+# QUOTE WORKBOOK (populate_excel_template)
+# ============================================================================
+
+ART_CODES = ['ART01', 'ART02', 'ART03', 'ART04', 'ART05', 'ART08', 'ART10', 'ART11',
+             'ART14', 'ART17', 'ART18', 'ART19', 'ART20', 'ART23']
+
+
+def synthetic_doors(count: int, seed: int = 3) -> list:
+    """Synthetic Type 1 doors as extraction returns them (ART codes, rating, config, faults)."""
+    rng = random.Random(seed)
+    doors = []
+    for i in range(count):
+        doors.append({
+            'door_id': f"D{i:05d}",
+            'location': f"Block {i % 12} Level {i % 9}",
+            'faults': rng.sample(FAULT_PHRASES, rng.randint(0, 3)),
+            'art_codes': rng.sample(ART_CODES, rng.randint(0, 3)),
+            'fire_rating': rng.choice(['FD30', 'FD30S', 'FD60', 'NOMINAL', 'Unknown']),
+            'door_config': rng.choice(['Single Leaf', 'Double Leaf']),
+            'door_height_mm': rng.choice([None, 2000, 2300, 2600]),
+            'is_replacement': rng.random() < 0.1,
+            'has_unable': rng.random() < 0.05,
+            'format_type': 'TYPE_1',
+        })
+    return doors
+
+
+def csv_snapshot():
+    """Rate card snapshot from the bundled CSV (no database needed)."""
+    import rate_card
+
+    rows = rate_card._load_rows_from_csv()
+    return rate_card.RateCardSnapshot(
+        version="benchmark",
+        source='csv',
+        art_to_codes={row['art_code']: rate_card._mapped_codes(row['rate_card_code']) for row in rows}
+    )
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss is KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def _populate_once(count: int, renderer: str) -> dict:
+    """Runs in a fresh process so peak RSS belongs to this door count alone."""
+    import logging
+    from openpyxl import load_workbook
+
+    logging.disable(logging.CRITICAL)
+    snapshot = csv_snapshot()
+    doors = synthetic_doors(count)
+    fdp.load_template_workbook(str(fdp.TEMPLATE_PATH))  # warm the template cache, as in the server
+    rss_before = _max_rss_mb()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, "quote.xlsx")
+        start = time.perf_counter()
+        fdp.populate_excel_template(doors, "Benchmark", str(fdp.TEMPLATE_PATH), output_path, snapshot,
+                                    renderer=renderer)
+        seconds = time.perf_counter() - start
+        rss_after = _max_rss_mb()
+
+        wb = load_workbook(output_path, read_only=True)
+        door_rows = sum(1 for (value,) in wb["Door Schedule"].iter_rows(min_row=4, max_col=1, values_only=True)
+                        if value is not None)
+        wb.close()
+
+    return {'doors': count, 'seconds': seconds, 'rss_mb': rss_after, 'rss_delta_mb': rss_after - rss_before,
+            'door_rows': door_rows}
+
+
+def bench_populate(args):
+    print(f"populate_excel_template (template: {fdp.TEMPLATE_PATH.name})")
+    ctx = multiprocessing.get_context("spawn")
+    for renderer in args.renderer:
+        print(f"  renderer: {renderer}")
+        previous = None
+        for count in args.doors:
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                result = pool.submit(_populate_once, count, renderer).result()
+            assert result['door_rows'] == count, f"Door Schedule has {result['door_rows']} rows for {count} doors"
+            scaling = ""
+            if previous:
+                scaling = f"  time x{result['seconds'] / previous['seconds']:.1f} for doors x{count / previous['doors']:.0f}"
+            print(f"    {count:>6,} doors  {result['seconds']:7.2f} s  {count / result['seconds']:>8,.0f} doors/s  "
+                  f"peak RSS {result['rss_mb']:6.0f} MB (+{result['rss_delta_mb']:.0f} MB){scaling}")
+            previous = result
+
+
+# ============================================================================
+# TYPE 2 EXCEL EXTRACTION
+# ============================================================================
+
+TYPE2_HEADERS = ['Door No', 'Location', 'Door Type', 'Gaps', 'Seals', 'Hinges', 'Closer', 'Frame',
+                 'Glass', 'Ironmongery']
+TYPE2_CELLS = ['OK', 'OK', 'OK', 'N/A', None, '-', 'Unable to inspect'] + FAULT_PHRASES
+
+
+def write_type2_survey(path: str, sheets: int, rows: int, seed: int = 5):
+    """Synthetic Type 2 survey: one sheet per floor, one row per door."""
+    from openpyxl import Workbook
+
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    for sheet_num in range(sheets):
+        ws = wb.create_sheet(f"Floor {sheet_num + 1}")
+        ws.append(TYPE2_HEADERS)
+        for door_num in range(1, rows + 1):
+            ws.append([door_num, f"Flat {door_num}", "FD30"] +
+                      [rng.choice(TYPE2_CELLS) for _ in range(len(TYPE2_HEADERS) - 3)])
+    wb.save(path)
+
+
+def _children_max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def _extract_type2_once(path: str, mode: str) -> dict:
+    """One extraction in this (fresh) process; prints nothing, returns timings and memory."""
+    import logging
+    from openpyxl import load_workbook
+    from survey_files import SurveyFile
+
+    logging.disable(logging.CRITICAL)
+    rss_before = _max_rss_mb()
+    start = time.perf_counter()
+    if mode == 'full':
+        # Previous behaviour: full-mode workbook, every sheet in this process
+        doors = fdp.extract_type2_workbook(load_workbook(path))
+    elif mode == 'streaming':
+        with SurveyFile(path) as survey:
+            doors = fdp.extract_type2_workbook(survey.workbook)
+    else:
+        from executors import shutdown_executors
+
+        fdp.TYPE2_PARALLEL_MIN_BYTES = 0  # always split, whatever the survey size
+        with SurveyFile(path) as survey:
+            sheet_groups = fdp.plan_type2_sheets(survey.workbook)
+            sheet_names = survey.workbook.sheetnames
+        doors = fdp.extract_type2_parallel(path, sheet_groups, sheet_names)
+    seconds = time.perf_counter() - start
+    if mode == 'parallel':
+        shutdown_executors()  # workers only show up in RUSAGE_CHILDREN once reaped
+    digest = hashlib.sha256(json.dumps(doors, sort_keys=True).encode()).hexdigest()
+    return {'mode': mode, 'seconds': seconds, 'doors': len(doors), 'digest': digest,
+            'rss_mb': _max_rss_mb(), 'rss_delta_mb': _max_rss_mb() - rss_before,
+            'worker_rss_mb': _children_max_rss_mb()}
+
+
+def bench_type2(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "type2_survey.xlsx")
+        start = time.perf_counter()
+        write_type2_survey(path, args.sheets, args.rows)
+        print(f"Type 2 extraction: {args.sheets} sheets x {args.rows:,} rows, {args.workers} workers "
+              f"({os.path.getsize(path) / 1e6:.1f} MB, generated in {time.perf_counter() - start:.1f}s)")
+
+        digests = set()
+        for mode in args.mode:
+            # Fresh interpreter per mode: peak RSS is per run, and 'parallel' needs to be a
+            # top-level process (extraction stays serial inside pool workers)
+            # PYTHONHASHSEED: b_codes come from a set, so the digests only match with a fixed seed
+            env = dict(os.environ, PYTHONHASHSEED="0", FIREDOOR_PROCESS_WORKERS=str(args.workers))
+            output = subprocess.run(
+                [sys.executable, __file__, "type2-once", path, mode],
+                check=True, capture_output=True, text=True, env=env
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            digests.add(result['digest'])
+            workers = f", worker peak {result['worker_rss_mb']:.0f} MB" if mode == 'parallel' else ""
+            print(f"  {mode:<10} {result['seconds']:7.2f} s  {result['doors']:>8,} doors  "
+                  f"peak RSS {result['rss_mb']:6.0f} MB (+{result['rss_delta_mb']:.0f} MB){workers}")
+        assert len(digests) == 1, "Extraction modes returned different doors"
+
+# ============================================================================
+# STAGE SUITE (regression gate)
+# ============================================================================
+
+TEST_FILES = Path(__file__).parent / "test_files"
+THAMES_COURT = TEST_FILES / "Alpha Sights - Thames Court-Fire Door Survey-March 2026.txt"
+THRESHOLDS_PATH = Path(__file__).parent / "benchmark_thresholds.json"
+
+def scale_survey_text(text: str, scale: int) -> str:
+    """The survey's door sections repeated scale times, with door ids made unique per copy."""
+    starts = [m.start() for m in fdp.DOOR_BOUNDARY_PATTERN.finditer(text)]
+    overview, doors = text[:starts[0]], text[starts[0]:]
+    copies = [doors] + [
+        re.sub(r'(ID/Location Ref:\s*)', rf'\1X{copy}-', doors) for copy in range(2, scale + 1)
+    ]
+    return overview + "".join(copies)
+
+
+def write_survey_pdf(text: str, path: str):
+    """Lay survey text out as a PDF, one page per '--- Page N ---' block."""
+    import fitz
+
+    doc = fitz.open()
+    for page_text in fdp.PAGE_BOUNDARY_PATTERN.split(text):
+        if page_text.strip():
+            page = doc.new_page()
+            page.insert_textbox(page.rect + (36, 36, -36, -36), page_text.strip(), fontsize=6)
+    doc.save(path)
+    doc.close()
+
+
+def _percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _measure_stage(func, repeats: int, setup=None) -> dict:
+    """
+    Time func repeats times (after one warm-up) and trace its peak Python allocations once.
+
+    setup, if given, runs untimed before every call and its result is passed to func.
+    """
+    import gc
+    import tracemalloc
+
+    def call():
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        func(arg) if setup else func()
+        return time.perf_counter() - start
+
+    call()  # warm-up: imports, template cache, compiled regexes
+    samples = [call() for _ in range(repeats)]
+    gc.collect()
+    arg = setup() if setup else None
+    tracemalloc.start()
+    func(arg) if setup else func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'p50_ms': _percentile(samples, 50) * 1000,
+        'p95_ms': _percentile(samples, 95) * 1000,
+        'peak_mb': peak / (1024 * 1024),
+    }
+
+
+def run_stages(scale: int, repeats: int, claude_latency: float = 0.0) -> dict:
+    """
+    Benchmark every pipeline stage on the test_files fixtures scaled up scale times.
+
+    Returns:
+        Stage name -> {'p50_ms', 'p95_ms', 'peak_mb'}
+    """
+    import logging
+    from quote_model import QuoteModel, QuoteRates
+
+    logging.disable(logging.CRITICAL)
+    llm_backend.set_backend(SyntheticBackend(StubConfig(latency=claude_latency)))
+    snapshot = csv_snapshot()
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        text = scale_survey_text(THAMES_COURT.read_text(encoding='utf-8'), scale)
+        txt_path = os.path.join(tmp, "survey.txt")
+        Path(txt_path).write_text(text, encoding='utf-8')
+        pdf_path = os.path.join(tmp, "survey.pdf")
+        write_survey_pdf(text, pdf_path)
+        xlsx_path = os.path.join(tmp, "survey.xlsx")
+        write_type2_survey(xlsx_path, sheets=5, rows=40 * scale)
+
+        def stage(name, func, setup=None):
+            results[name] = _measure_stage(func, repeats, setup)
+            r = results[name]
+            print(f"  {name:<26} p50 {r['p50_ms']:9.1f} ms  p95 {r['p95_ms']:9.1f} ms  peak {r['peak_mb']:7.1f} MB")
+
+        for kind, path in (('txt', txt_path), ('pdf', pdf_path), ('xlsx', xlsx_path)):
+            stage(f"detect_format.{kind}", lambda path=path: fdp.detect_format(path, Path(path).name))
+        stage("text_extraction.txt", lambda: fdp.read_survey_text(txt_path))
+        stage("text_extraction.pdf", lambda: fdp.read_survey_text(pdf_path))
+        stage("survey_preprocess", lambda: preprocess_survey_text(text))
+        preprocessed = preprocess_survey_text(text).text
+        stage("firedna_parse", lambda: firedna_parser.parse_door_sections(*fdp.split_door_sections(preprocessed)))
+        stage("claude_extraction.stub", lambda: fdp.extract_type1_from_text(text))
+        stage("type2_extraction", lambda: fdp.extract_type2_excel(xlsx_path))
+
+        doors = fdp.extract_type1_from_text(text)
+        art_codes = [door['art_codes'] for door in doors]
+        faults = [fault for door in doors for fault in door['faults']] + synthetic_faults(200 * scale)
+        stage("map_art_to_rate_card", lambda: [fdp.map_art_to_rate_card(codes, snapshot) for codes in art_codes])
+        stage("map_fault_to_bcode", lambda: [fdp.map_fault_to_bcode(fault) for fault in faults])
+
+        template = str(fdp.TEMPLATE_PATH)
+        rates = QuoteRates.from_workbook(fdp.load_template_workbook(template))
+        stage("quote_model", lambda: QuoteModel.build(doors, rates, snapshot))
+
+        def render(_=None):
+            wb = fdp.load_template_workbook(template)
+            fdp.render_quote_workbook(wb, QuoteModel.build(doors, rates, snapshot), "Benchmark")
+            return wb
+        stage("workbook_render", render)
+        stage("workbook_save", lambda wb: wb.save(os.path.join(tmp, "saved.xlsx")), setup=render)
+        stage("populate_excel_template", lambda: fdp.populate_excel_template(
+            doors, "Benchmark", template, os.path.join(tmp, "quote.xlsx"), snapshot))
+
+    return results
+
+
+def check_thresholds(results: dict, thresholds: dict) -> list:
+    """Regressions: (stage, metric, measured, limit) for every metric over its threshold."""
+    failures = []
+    for name, limits in thresholds.items():
+        measured = results.get(name)
+        if measured is None:
+            failures.append((name, 'missing', None, None))
+            continue
+        for metric, limit in limits.items():
+            if measured[metric] > limit:
+                failures.append((name, metric, measured[metric], limit))
+    return failures
+
+
+def bench_stages(args):
+    print(f"Pipeline stages: fixtures x{args.scale}, {args.repeats} runs each"
+          + (f", Claude stub latency {args.claude_latency * 1000:.0f} ms" if args.claude_latency else ""))
+    results = run_stages(args.scale, args.repeats, args.claude_latency)
+    print(f"  process peak RSS {_max_rss_mb():.0f} MB")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({'scale': args.scale, 'stages': results}, indent=2))
+
+    thresholds_path = Path(args.thresholds)
+    if args.update_thresholds:
+        stages = {
+            name: {'p95_ms': round(r['p95_ms'] * args.headroom + 1, 1),
+                   'peak_mb': round(r['peak_mb'] * args.headroom + 1, 1)}
+            for name, r in results.items()
+        }
+        thresholds_path.write_text(json.dumps({'scale': args.scale, 'stages': stages}, indent=2) + "\n")
+        print(f"Wrote thresholds ({args.headroom}x headroom) to {thresholds_path}")
+        return
+
+    if not thresholds_path.exists():
+        print(f"No thresholds at {thresholds_path} - run with --update-thresholds to create them")
+        return
+    thresholds = json.loads(thresholds_path.read_text())
+    if thresholds.get('scale') != args.scale:
+        print(f"Thresholds are for x{thresholds.get('scale')} fixtures - not checked at x{args.scale}")
+        return
+    failures = check_thresholds(results, thresholds['stages'])
+    for name, metric, measured, limit in failures:
+        if metric == 'missing':
+            print(f"REGRESSION {name}: stage not measured")
+        else:
+            print(f"REGRESSION {name}: {metric} {measured:.1f} > {limit}")
+    if failures:
+        sys.exit(1)
+    print(f"All {len(thresholds['stages'])} stages within thresholds")
+
+
+# ============================================================================
+# EXTRACTION THROUGHPUT (against the local Anthropic stub server)
+# ============================================================================
+
+def bench_extraction(args):
+    """
+    Type 1 extraction end to end over HTTP - prompt building, the real Anthropic
+    client, streamed response parsing and merging - against llm_stub_server with
+    fixed latency and token throughput, at each concurrency setting. "first door"
+    is when the first door object closed, against the whole extraction.
+    """
+    import logging
+    import metrics
+
+    logging.disable(logging.CRITICAL)
+    text = scale_survey_text(THAMES_COURT.read_text(encoding='utf-8'), args.scale)
+    config = StubConfig(latency=args.latency, tokens_per_second=args.tokens_per_second)
+    print(f"Type 1 extraction: fixtures x{args.scale}, stub latency {args.latency * 1000:.0f} ms, "
+          f"{args.tokens_per_second or 'unlimited'} tokens/s")
+
+    with start_stub_server(config) as server:
+        previous = llm_backend.set_backend(llm_backend.AnthropicBackend(api_key="stub", base_url=server.url, max_retries=0))
+        try:
+            for concurrency in args.concurrency:
+                fdp.EXTRACTION_MAX_CONCURRENCY = concurrency
+                with server.lock:
+                    server.peak_in_flight = 0
+                requests_before = server.requests
+                start = time.perf_counter()
+                with metrics.collect_spans() as spans:
+                    doors = fdp.extract_type1_from_text(text)
+                seconds = time.perf_counter() - start
+                stats = server.stats()
+                first_door = min(duration for name, duration in spans if name == "llm_first_door")
+                print(f"  concurrency {concurrency:>3}: {seconds:7.2f} s  first door {first_door:5.2f} s  "
+                      f"{len(doors):5d} doors  {stats['requests'] - requests_before:4d} calls  "
+                      f"peak in flight {stats['peak_in_flight']}")
+        finally:
+            llm_backend.set_backend(previous)
+
+
+# ============================================================================
+# OUTBOUND HTTP (pooled clients vs a connection per call)
+# ============================================================================
+
+def bench_http(args):
+    """
+    Per-call overhead of a one-shot httpx.post (new client, new connection each
+    call) against the shared pooled client, on small Messages API calls to
+    llm_stub_server. Localhost has no DNS or TLS, so this is the floor of what
+    pooling saves; against the real APIs the handshake cost comes on top.
+    """
+    import httpx
+    import logging
+    import http_clients
+
+    logging.disable(logging.CRITICAL)
+    body = {"model": fdp.CLAUDE_MODEL, "max_tokens": 16, "messages": [{"role": "user", "content": "ping"}]}
+    print(f"Outbound HTTP: {args.calls} sequential calls to the local stub")
+
+    with start_stub_server(StubConfig()) as server:
+        url = f"{server.url}/v1/messages"
+        client = http_clients.get_client("anthropic")
+        modes = [
+            ("one-shot httpx.post", lambda: httpx.post(url, json=body, timeout=60.0)),
+            ("pooled http_clients", lambda: client.post(url, json=body)),
+        ]
+        baseline = None
+        for name, call in modes:
+            call()  # Warm-up (the pooled client opens its connection here)
+            connections_before = server.stats()['connections']
+            timings = []
+            for _ in range(args.calls):
+                start = time.perf_counter()
+                call().raise_for_status()
+                timings.append(time.perf_counter() - start)
+            mean = sum(timings) / len(timings)
+            baseline = baseline or mean
+            print(f"  {name:<22} mean {mean * 1000:6.2f} ms  p50 {_percentile(timings, 50) * 1000:6.2f} ms  "
+                  f"p95 {_percentile(timings, 95) * 1000:6.2f} ms  "
+                  f"{server.stats()['connections'] - connections_before:4d} connections  x{baseline / mean:.2f}")
+    http_clients.close_clients()
+
+
+# ============================================================================
+# SURVEY PRE-PROCESSING (input token reduction)
+# ============================================================================
+
+def bench_preprocess(args):
+    """What pre-processing takes out of a Type 1 survey before it reaches Claude."""
+    import logging
+
+    logging.disable(logging.CRITICAL)
+    text = Path(args.survey).read_text(encoding='utf-8')
+    start = time.perf_counter()
+    result = preprocess_survey_text(text)
+    seconds = time.perf_counter() - start
+
+    tokens_before = fdp.estimate_extraction_tokens(text)
+    tokens_after = fdp.estimate_extraction_tokens(result.text)
+    chunks_before = len(fdp.split_survey_text(text)[1])
+    chunks_after = len(fdp.split_survey_text(result.text)[1])
+    print(f"Survey pre-processing: {Path(args.survey).name}")
+    print(f"  text            {result.original_chars:8d} -> {len(result.text):8d} chars "
+          f"(-{result.chars_removed / result.original_chars:.0%}) in {seconds * 1000:.1f} ms")
+    print(f"  pages removed   {result.pages_removed:8d} of {result.pages}")
+    print(f"  header lines    {result.lines_removed:8d} removed")
+    print(f"  prompt tokens   {tokens_before:8d} -> {tokens_after:8d} "
+          f"(~{tokens_before - tokens_after} saved, -{(tokens_before - tokens_after) / tokens_before:.0%})")
+    print(f"  Claude calls    {chunks_before:8d} -> {chunks_after:8d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    classifier = subparsers.add_parser("classifier", help="Fault text -> B-code classifier")
+    classifier.add_argument("--faults", type=int, default=100_000)
+    classifier.set_defaults(func=bench_classifier)
+
+    populate = subparsers.add_parser("populate", help="Quote workbook generation for large surveys")
+    populate.add_argument("--doors", type=int, nargs="+", default=[100, 1_000, 5_000])
+    populate.add_argument("--renderer", nargs="+", choices=fdp.DOOR_SCHEDULE_RENDERERS,
+                          default=list(fdp.DOOR_SCHEDULE_RENDERERS))
+    populate.set_defaults(func=bench_populate)
+
+    type2 = subparsers.add_parser("type2", help="Type 2 Excel extraction: full vs read-only streaming vs sheet-parallel")
+    type2.add_argument("--sheets", type=int, default=50)
+    type2.add_argument("--rows", type=int, default=400, help="Door rows per sheet")
+    type2.add_argument("--mode", nargs="+", choices=["full", "streaming", "parallel"],
+                       default=["full", "streaming", "parallel"])
+    type2.add_argument("--workers", type=int, default=4, help="Process pool size for the parallel mode")
+    type2.set_defaults(func=bench_type2)
+
+    stages = subparsers.add_parser("stages", help="Every pipeline stage: p50/p95 and peak memory, checked against thresholds")
+    stages.add_argument("--scale", type=int, default=5, help="Multiply the test_files fixtures this many times")
+    stages.add_argument("--repeats", type=int, default=5)
+    stages.add_argument("--claude-latency", type=float, default=0.0, help="Seconds per stubbed Claude call")
+    stages.add_argument("--thresholds", default=str(THRESHOLDS_PATH))
+    stages.add_argument("--update-thresholds", action="store_true", help="Write thresholds from this run instead of checking")
+    stages.add_argument("--headroom", type=float, default=2.5, help="Threshold = measured x headroom (with --update-thresholds)")
+    stages.add_argument("--json", help="Also write the results to this file")
+    stages.set_defaults(func=bench_stages)
+
+    preprocess = subparsers.add_parser("preprocess", help="Input tokens removed by survey pre-processing")
+    preprocess.add_argument("--survey", default=str(THAMES_COURT), help="Type 1 survey text (default: Thames Court)")
+    preprocess.set_defaults(func=bench_preprocess)
+
+    extraction = subparsers.add_parser("extraction", help="Type 1 extraction over HTTP against the local Anthropic stub")
+    extraction.add_argument("--scale", type=int, default=5, help="Multiply the Thames Court fixture this many times")
+    extraction.add_argument("--latency", type=float, default=0.5, help="Stub seconds before the first token")
+    extraction.add_argument("--tokens-per-second", type=float, default=80.0, help="Stub output throughput (0 = instant)")
+    extraction.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    extraction.set_defaults(func=bench_extraction)
+
+    http = subparsers.add_parser("http", help="Pooled HTTP clients vs a new connection per call, against the local stub")
+    http.add_argument("--calls", type=int, default=200)
+    http.set_defaults(func=bench_http)
+
+    type2_once = subparsers.add_parser("type2-once")  # internal: one run of bench_type2
+    type2_once.add_argument("path")
+    type2_once.add_argument("mode")
+    type2_once.set_defaults(func=lambda args: print(json.dumps(_extract_type2_once(args.path, args.mode))))
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Vercel Blob storage helpers.
+Used for generated fire door quotes (API request handlers and job workers).
+"""
+
+import os
+import logging
+from typing import Optional
+
+import http_clients
+
+logger = logging.getLogger(__name__)
+
+BLOB_API_URL = "https://blob.vercel-storage.com"
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+BLOB_READ_WRITE_TOKEN = os.getenv("BLOB_READ_WRITE_TOKEN")
+
+
+def check_token() -> bool:
+    """Log an error at startup if BLOB_READ_WRITE_TOKEN is missing. Returns whether it is set."""
+    if not BLOB_READ_WRITE_TOKEN:
+        logger.error("BLOB_READ_WRITE_TOKEN is not set - uploads to Vercel Blob (quotes, photos) will fail")
+    return bool(BLOB_READ_WRITE_TOKEN)
+
+
+def upload_to_blob(pathname: str, content: bytes, content_type: str = "application/octet-stream") -> Optional[str]:
+    """
+    PUT content to Vercel Blob.
+
+    Returns:
+        Public URL of the uploaded blob, or None if the upload was rejected
+
+    Raises:
+        RuntimeError: If BLOB_READ_WRITE_TOKEN is not set
+    """
+    if not BLOB_READ_WRITE_TOKEN:
+        raise RuntimeError("BLOB_READ_WRITE_TOKEN is not set")
+    response = http_clients.get_client("blob").put(
+        f"{BLOB_API_URL}/{pathname}",
+        content=content,
+        headers={
+            "Content-Type": content_type,
+            "Authorization": f"Bearer {BLOB_READ_WRITE_TOKEN}"
+        }
+    )
+    
+    if response.status_code != 200:
+        logger.error(f"Blob upload failed: {response.status_code} {response.text}")
+        return None
+    
+    url = response.json().get("url")
+    logger.info(f"Uploaded to Blob: {url}")
+    return url
@@ -0,0 +1,49 @@
+"""
+Shared pytest setup for the backend tests.
+
+Every test module runs against one throwaway SQLite database (or TEST_DATABASE_URL,
+e.g. a scratch Postgres for the SKIP LOCKED path), never DATABASE_URL from the
+shell or .env, with the job workers off and no Anthropic API key, so nothing
+talks to the real Claude API.
+"""
+import os
+import tempfile
+
+import pytest
+
+# Must be set before database.py is imported by any test module
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ["FIREDOOR_JOB_WORKERS"] = "0"
+os.environ.pop("ANTHROPIC_API_KEY", None)
+
+
+@pytest.fixture
+def login():
+    """
+    Authenticate API requests as a test user (created on first use).
+
+    login() logs in the default admin; login(email, role) another user. Returns the
+    User. The auth overrides are removed when the test ends.
+    """
+    from main import app
+    from auth import get_current_user, get_current_user_required
+    from database import SessionLocal
+    from models import User
+
+    def _login(email: str = "test@example.com", role: str = "admin") -> User:
+        db = SessionLocal()
+        try:
+            user = db.query(User).filter(User.email == email).first()
+            if not user:
+                user = User(email=email, password_hash="x", full_name="Test User", role=role)
+                db.add(user)
+                db.commit()
+                db.refresh(user)
+        finally:
+            db.close()
+        app.dependency_overrides[get_current_user] = lambda: user
+        app.dependency_overrides[get_current_user_required] = lambda: user
+        return user
+
+    yield _login
+    app.dependency_overrides.clear()
@@ -1,10 +1,12 @@
 from sqlalchemy.orm import Session
 from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy import or_, func
-from models import Checklist, User
+from models import Checklist, User, FireDoorQuote
 from schemas import ChecklistCreate, ChecklistUpdate, UserCreate
 from auth import get_password_hash
-from typing import Optional, List
+from typing import Dict, Optional, List
+import gzip
+import json
 
 
 # ============ User CRUD ============
@@ -139,3 +141,60 @@ def add_photo_to_checklist(db: Session, checklist_id: int, photo_path: str, orig
         db.commit()
         db.refresh(db_checklist)
     return db_checklist
+
+
+# ============ Fire Door Quote CRUD ============
+
+def pack_doors(doors: List[Dict]) -> bytes:
+    """Extracted doors as gzip JSON (FireDoorQuote.doors_gz)."""
+    return gzip.compress(json.dumps(doors, separators=(',', ':')).encode('utf-8'))
+
+
+def unpack_doors(doors_gz: bytes) -> List[Dict]:
+    return json.loads(gzip.decompress(doors_gz).decode('utf-8'))
+
+
+def create_firedoor_quote(
+    db: Session,
+    user_id: int,
+    client_name: str,
+    survey_type: str,
+    door_count: int,
+    excel_url: str,
+    comments: str = "",
+    doors: Optional[List[Dict]] = None,
+    doors_gz: Optional[bytes] = None,
+    target_margin: Optional[float] = None,
+    rate_card_version: Optional[str] = None,
+    requoted_from_id: Optional[int] = None,
+    commit: bool = True
+) -> FireDoorQuote:
+    """
+    Save a generated quote to the history.
+
+    The extracted doors are stored with it (pass doors, or doors_gz if they are
+    already packed) so the quote can be regenerated without the survey.
+    With commit=False the row is only flushed (it gets its id) and the caller
+    commits it together with its own changes.
+    """
+    if doors_gz is None and doors is not None:
+        doors_gz = pack_doors(doors)
+    quote = FireDoorQuote(
+        user_id=user_id,
+        client_name=client_name,
+        survey_type=survey_type,
+        door_count=door_count,
+        excel_url=excel_url,
+        comments=comments,
+        doors_gz=doors_gz,
+        target_margin=target_margin,
+        rate_card_version=rate_card_version,
+        requoted_from_id=requoted_from_id
+    )
+    db.add(quote)
+    if not commit:
+        db.flush()
+        return quote
+    db.commit()
+    db.refresh(quote)
+    return quote
@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -19,3 +19,114 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def init_db():
+    """
+    Create the tables and run the column migrations. Called at startup by the API
+    (main.py) and by standalone job workers (python firedoor_jobs.py), so either
+    can be the first to start against an existing database.
+    """
+    import models  # noqa: F401 - registers the tables on Base
+
+    # Create tables
+    Base.metadata.create_all(bind=engine)
+
+    # Migration: Add new columns if they don't exist
+    columns_to_add = [
+        ("monday_item_id", "VARCHAR(50)"),
+        ("goods_lift_notes", "TEXT"),
+        ("staircase_access_notes", "TEXT"),
+        ("wall_deflection_notes", "TEXT"),
+        ("door_finish_other", "TEXT"),
+        ("frame_type_other", "TEXT"),
+        ("acoustic_baffles_notes", "TEXT"),
+        ("fire_stopping_notes", "TEXT"),
+        ("is_draft", "BOOLEAN DEFAULT TRUE"),
+    ]
+    for col_name, col_type in columns_to_add:
+        try:
+            with engine.connect() as conn:
+                conn.execute(text(f"ALTER TABLE checklists ADD COLUMN {col_name} {col_type}"))
+                conn.commit()
+                print(f"Migration: added {col_name} column")
+        except Exception as e:
+            if "already exists" in str(e).lower() or "duplicate column" in str(e).lower():
+                pass  # Column already exists, silently continue
+            else:
+                print(f"Migration skipped for {col_name}: column likely exists")
+
+    # Migration: Add rate_card_description column to rate_card_items table
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("ALTER TABLE rate_card_items ADD COLUMN rate_card_description TEXT"))
+            conn.commit()
+            print("Migration: added rate_card_description column to rate_card_items")
+    except Exception as e:
+        if "already exists" in str(e).lower() or "duplicate column" in str(e).lower():
+            pass  # Column already exists
+        else:
+            print(f"Migration skipped for rate_card_description: {e}")
+
+    # Migration: Store extracted doors with fire door quotes (re-quotes without re-extraction)
+    firedoor_quote_columns = [
+        ("doors_gz", "BYTEA"),
+        ("target_margin", "DOUBLE PRECISION"),
+        ("rate_card_version", "VARCHAR(16)"),
+        ("requoted_from_id", "INTEGER REFERENCES firedoor_quotes(id)"),
+    ]
+    for col_name, col_type in firedoor_quote_columns:
+        try:
+            with engine.connect() as conn:
+                conn.execute(text(f"ALTER TABLE firedoor_quotes ADD COLUMN {col_name} {col_type}"))
+                conn.commit()
+                print(f"Migration: added {col_name} column to firedoor_quotes")
+        except Exception as e:
+            if "already exists" in str(e).lower() or "duplicate column" in str(e).lower():
+                pass  # Column already exists
+            else:
+                print(f"Migration skipped for firedoor_quotes.{col_name}: {e}")
+
+    # Migration: Job kinds (background quote uploads) and retry backoff on the fire door job queue
+    firedoor_job_columns = [
+        ("kind", "VARCHAR(20) NOT NULL DEFAULT 'quote'"),
+        ("doors_gz", "BYTEA"),
+        ("rate_card_version", "VARCHAR(16)"),
+        ("run_after", "TIMESTAMP WITH TIME ZONE"),
+    ]
+    for col_name, col_type in firedoor_job_columns:
+        try:
+            with engine.connect() as conn:
+                conn.execute(text(f"ALTER TABLE firedoor_jobs ADD COLUMN {col_name} {col_type}"))
+                conn.commit()
+                print(f"Migration: added {col_name} column to firedoor_jobs")
+        except Exception as e:
+            if "already exists" in str(e).lower() or "duplicate column" in str(e).lower():
+                pass  # Column already exists
+            else:
+                print(f"Migration skipped for firedoor_jobs.{col_name}: {e}")
+
+    # Migration: Convert numeric building spec columns to text (VARCHAR)
+    # This fixes the "numeric field overflow" error when users enter large values
+    numeric_to_text_columns = [
+        "ceiling_height",
+        "skirting_size",
+        "ceiling_void_depth",
+        "floor_void_depth",
+        "building_level",
+        "service_penetrations_scale",
+    ]
+    for col_name in numeric_to_text_columns:
+        try:
+            with engine.connect() as conn:
+                # Try with USING clause to convert existing numeric data
+                conn.execute(text(f"ALTER TABLE checklists ALTER COLUMN {col_name} TYPE VARCHAR(100) USING {col_name}::TEXT"))
+                conn.commit()
+                print(f"Migration: converted {col_name} from NUMERIC to VARCHAR(100)")
+        except Exception as e:
+            error_str = str(e).lower()
+            if "does not exist" in error_str or "already" in error_str:
+                # Column doesn't exist or already correct type
+                pass
+            else:
+                print(f"Migration note for {col_name}: {str(e)[:100]}")
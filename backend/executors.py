@@ -0,0 +1,69 @@
+"""
+Executors for running blocking work off the asyncio event loop.
+
+CPU-bound stages (PDF text extraction, Excel parsing, workbook population) run in a
+process pool so they don't hold the GIL of the API worker. Blocking I/O (Claude
+calls, Blob uploads, file writes) runs in the thread pool.
+
+Timing spans (metrics.span) recorded inside a pool task are returned with its
+result and recorded in the calling request, as if the stage had run in-process.
+"""
+
+import os
+import asyncio
+import logging
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 0 = run CPU-bound stages in the thread pool instead (no extra processes)
+FIREDOOR_PROCESS_WORKERS = int(os.getenv("FIREDOOR_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Get or create the shared process pool (lazy initialization)."""
+    global _process_pool
+    if _process_pool is None:
+        # spawn, not fork: the API process has running threads (job workers, thread pool)
+        # and forking while they hold locks can deadlock the child
+        _process_pool = ProcessPoolExecutor(
+            max_workers=FIREDOOR_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        logger.info(f"Started process pool with {FIREDOOR_PROCESS_WORKERS} workers")
+    return _process_pool
+
+
+async def run_cpu_bound(func: Callable, *args, **kwargs) -> Any:
+    """Run a CPU-bound function in the process pool. Arguments and result must be picklable."""
+    if FIREDOOR_PROCESS_WORKERS <= 0:
+        return await run_in_threadpool(func, *args, **kwargs)
+    loop = asyncio.get_running_loop()
+    result, spans = await loop.run_in_executor(
+        get_process_pool(), functools.partial(metrics.run_collecting_spans, func, *args, **kwargs)
+    )
+    for name, seconds in spans:
+        metrics.record_span(name, seconds)
+    return result
+
+
+async def run_io_bound(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking I/O function in the thread pool."""
+    return await run_in_threadpool(func, *args, **kwargs)
+
+
+def shutdown_executors():
+    """Shut down the process pool (called on app shutdown)."""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True, cancel_futures=True)
+        _process_pool = None
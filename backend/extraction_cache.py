@@ -0,0 +1,112 @@
+"""
+Extraction cache for fire door surveys.
+Maps a hash of the uploaded survey bytes (plus extractor prompt/model version) to the
+extracted doors list, so re-uploading the same file skips the Claude round-trip.
+Entries live in the extraction_cache table and are evicted least-recently-used
+once the total stored size exceeds EXTRACTION_CACHE_MAX_BYTES.
+"""
+
+import os
+import json
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+
+from database import SessionLocal
+from models import ExtractionCacheEntry
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() != "false"
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+
+def compute_cache_key(file_path: str, version: str) -> str:
+    """Hash the survey file contents together with the extractor version."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return cache_key_for_digest(digest.hexdigest(), version)
+
+
+def cache_key_for_digest(sha256_hex: str, version: str) -> str:
+    """Cache key for a survey whose SHA-256 is already known (e.g. SurveyFile.sha256)."""
+    return f"{sha256_hex}:{version}"
+
+
+def get_cached_doors(cache_key: str) -> Optional[List[Dict]]:
+    """Return the cached doors list for this key, or None on a miss."""
+    if not EXTRACTION_CACHE_ENABLED:
+        return None
+    
+    db = SessionLocal()
+    try:
+        entry = db.query(ExtractionCacheEntry).filter(ExtractionCacheEntry.cache_key == cache_key).first()
+        if entry is None:
+            return None
+        entry.hit_count = (entry.hit_count or 0) + 1
+        entry.last_used_at = func.now()
+        db.commit()
+        logger.info(f"Extraction cache HIT: {cache_key[:16]}... ({len(entry.doors)} doors)")
+        return entry.doors
+    except Exception as e:
+        logger.warning(f"Extraction cache lookup failed: {e}")
+        db.rollback()
+        return None
+    finally:
+        db.close()
+
+
+def store_doors(cache_key: str, survey_type: str, doors: List[Dict]):
+    """Store an extracted doors list and evict old entries if over the size limit."""
+    if not EXTRACTION_CACHE_ENABLED:
+        return
+    
+    size_bytes = len(json.dumps(doors, default=str).encode('utf-8'))
+    if size_bytes > EXTRACTION_CACHE_MAX_BYTES:
+        logger.info(f"Extraction result too large to cache ({size_bytes} bytes)")
+        return
+    
+    db = SessionLocal()
+    try:
+        entry = db.query(ExtractionCacheEntry).filter(ExtractionCacheEntry.cache_key == cache_key).first()
+        if entry is None:
+            entry = ExtractionCacheEntry(cache_key=cache_key, hit_count=0)
+            db.add(entry)
+        entry.survey_type = survey_type
+        entry.doors = doors
+        entry.size_bytes = size_bytes
+        entry.last_used_at = func.now()
+        db.commit()
+        logger.info(f"Extraction cache STORE: {cache_key[:16]}... ({len(doors)} doors, {size_bytes} bytes)")
+        _evict(db)
+    except Exception as e:
+        logger.warning(f"Extraction cache store failed: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def _evict(db):
+    """Delete least-recently-used entries until the cache fits in EXTRACTION_CACHE_MAX_BYTES."""
+    total = db.query(func.coalesce(func.sum(ExtractionCacheEntry.size_bytes), 0)).scalar() or 0
+    if total <= EXTRACTION_CACHE_MAX_BYTES:
+        return
+    
+    evicted = 0
+    oldest_first = (
+        db.query(ExtractionCacheEntry.id, ExtractionCacheEntry.size_bytes)
+        .order_by(ExtractionCacheEntry.last_used_at.asc(), ExtractionCacheEntry.id.asc())
+        .all()
+    )
+    for entry_id, size_bytes in oldest_first:
+        if total <= EXTRACTION_CACHE_MAX_BYTES:
+            break
+        db.query(ExtractionCacheEntry).filter(ExtractionCacheEntry.id == entry_id).delete()
+        total -= size_bytes or 0
+        evicted += 1
+    db.commit()
+    logger.info(f"Extraction cache evicted {evicted} entries (now {total} bytes)")
@@ -0,0 +1,177 @@
+"""
+Door Extraction Schema
+The typed model for a door extracted by Claude, and the record_doors tool Claude
+is made to call with the doors it found (its input_schema is generated from the
+model, so the schema Claude sees and the validation applied are the same):
+
+    {"doors": [{"door_id": "A01-L2", "location": "...", "art_codes": ["ART04"], ...}, ...]}
+
+Validation coerces rather than rejects: an unrecognised door_config becomes
+"Single Leaf", an unreadable dimension None, ART codes are picked out of whatever
+text they came in. Every such change is kept in the door's extraction_warnings,
+which the Door Schedule flags for manual review. Only a door with no door_id (or
+an element that isn't an object at all) can't be used.
+"""
+
+import re
+import json
+import hashlib
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, ValidationInfo, field_validator
+
+ART_CODE_PATTERN = re.compile(r'ART\s*-?\s*(\d{1,2})(?!\d)', re.IGNORECASE)
+DIMENSION_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(?:mm)?\s*$', re.IGNORECASE)
+
+
+def _warn(info: ValidationInfo, message: str):
+    if info.context is not None:
+        info.context.setdefault('warnings', []).append(message)
+
+
+class ExtractedDoor(BaseModel):
+    """One door as Claude extracted it from a Type 1 survey."""
+
+    model_config = ConfigDict(extra='ignore')
+
+    door_id: str = Field(min_length=1, description="Door ID exactly as in the survey, with the floor suffix "
+                                                   "if the survey has one (e.g. A01-L2)")
+    location: str = Field("", description="Location/description (building name, floor level)")
+    faults: List[str] = Field(default_factory=list, description="Faults found (issues or deficiencies noted)")
+    art_codes: List[str] = Field(default_factory=list, description="ART codes mentioned, e.g. ART04")
+    fire_rating: str = Field("Unknown", description="FD30, FD30S, FD60, FD60S, FD90, FD120...; "
+                                                    "Unknown only if truly not mentioned")
+    door_config: Literal["Single Leaf", "Double Leaf"] = "Single Leaf"
+    door_height_mm: Optional[int] = Field(None, gt=0)
+    door_width_mm: Optional[int] = Field(None, gt=0)
+    is_replacement: bool = Field(False, description="True only if ART17, ART18 or ART20 is present")
+
+    @field_validator('door_id', 'location', 'fire_rating', mode='before')
+    @classmethod
+    def strip_text(cls, v):
+        if v is None:
+            return ""
+        return str(v).strip()
+
+    @field_validator('fire_rating')
+    @classmethod
+    def default_rating(cls, v: str) -> str:
+        return v or "Unknown"
+
+    @field_validator('faults', mode='before')
+    @classmethod
+    def fault_list(cls, v):
+        if v is None:
+            return []
+        if isinstance(v, str):
+            return [v] if v.strip() else []
+        return [str(fault) for fault in v if fault is not None]
+
+    @field_validator('art_codes', mode='before')
+    @classmethod
+    def normalize_art_codes(cls, v, info: ValidationInfo):
+        """"ART 4", "art04", "ART04 (replace)" -> "ART04"; text with no ART code is dropped (and flagged)."""
+        if isinstance(v, str):
+            v = [v]
+        codes = []
+        for item in v or []:
+            found = [f"ART{int(number):02d}" for number in ART_CODE_PATTERN.findall(str(item))]
+            if not found:
+                _warn(info, f"ignored ART code {str(item)[:40]!r}")
+            codes.extend(code for code in found if code not in codes)
+        return codes
+
+    @field_validator('door_config', mode='before')
+    @classmethod
+    def normalize_config(cls, v, info: ValidationInfo):
+        """"double", "Double leaf", "pair" -> "Double Leaf"; anything else unrecognised -> "Single Leaf" (flagged)."""
+        text = str(v or "").lower()
+        if 'double' in text or 'pair' in text:
+            return "Double Leaf"
+        if text and 'single' not in text:
+            _warn(info, f"door config {str(v)[:40]!r} not recognised, assumed Single Leaf")
+        return "Single Leaf"
+
+    @field_validator('door_height_mm', 'door_width_mm', mode='before')
+    @classmethod
+    def dimension(cls, v, info: ValidationInfo):
+        """Millimetres from a number or "2040mm"; anything else (or not positive) -> None (flagged)."""
+        if v is None or v == "":
+            return None
+        if isinstance(v, bool):
+            number = None
+        elif isinstance(v, (int, float)):
+            number = v
+        else:
+            match = DIMENSION_PATTERN.match(str(v))
+            number = float(match.group(1)) if match else None
+        if number is None or number <= 0:
+            _warn(info, f"{info.field_name} {str(v)[:40]!r} not a size in mm, ignored")
+            return None
+        return int(round(number))
+
+    @field_validator('is_replacement', mode='before')
+    @classmethod
+    def replacement_flag(cls, v, info: ValidationInfo):
+        if isinstance(v, bool) or v is None:
+            return bool(v)
+        text = str(v).strip().lower()
+        if text in ('true', 'yes', '1'):
+            return True
+        if text not in ('false', 'no', '0', ''):
+            _warn(info, f"is_replacement {str(v)[:40]!r} not true/false, assumed false")
+        return False
+
+
+EXTRACTION_TOOL = {
+    "name": "record_doors",
+    "description": "Record every fire door found in the survey text, in survey order.",
+    "input_schema": {
+        "type": "object",
+        "properties": {"doors": {"type": "array", "items": ExtractedDoor.model_json_schema()}},
+        "required": ["doors"],
+    },
+}
+
+
+def validate_door(item: Any) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Validate one extracted door, coercing what it can.
+
+    Returns:
+        (door dict, None) - with extraction_warnings listing anything coerced - or
+        (None, a one-line reason) if the door can't be used (no door_id, not an object)
+    """
+    if not isinstance(item, dict):
+        return None, f"not a door object: {json.dumps(item)[:80]}"
+    context = {'warnings': []}
+    try:
+        door = ExtractedDoor.model_validate(item, context=context).model_dump()
+    except ValidationError as e:
+        reasons = "; ".join(f"{'.'.join(str(part) for part in error['loc']) or 'door'}: {error['msg']}"
+                            for error in e.errors())
+        return None, f"door {str(item.get('door_id') or '').strip() or '?'}: {reasons}"
+    if context['warnings']:
+        door['extraction_warnings'] = context['warnings']
+    return door, None
+
+
+def unreadable_door(item: Any, reason: str) -> Dict:
+    """
+    A placeholder for an extracted element that couldn't be used, so it still
+    appears in the Door Schedule, flagged for manual review, instead of vanishing.
+    """
+    digest = hashlib.sha256(json.dumps(item, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:6]
+    location = item.get('location') if isinstance(item, dict) else None
+    return {
+        'door_id': f"UNIDENTIFIED-{digest.upper()}",
+        'location': str(location or ''),
+        'faults': [],
+        'art_codes': [],
+        'fire_rating': "Unknown",
+        'door_config': "Single Leaf",
+        'door_height_mm': None,
+        'door_width_mm': None,
+        'is_replacement': False,
+        'extraction_warnings': [f"unreadable door data ({reason})"],
+    }
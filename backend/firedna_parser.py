@@ -0,0 +1,345 @@
+"""
+FireDNA Survey Parser
+Rule-based door extraction for FireDNA/RiskBase Type 1 reports. Their layout is
+regular enough to read with regexes and a small line state machine:
+
+    Fire Door summary table   one row per door: floor, door ref, fire rating, ...
+    door detail sections      "Product ID/Location Ref: A01 - Core 1 riser | Level 2",
+                              "Status: Failed", then Component / Reason for failure /
+                              Actions blocks and an "N issues to action ARTs 01 & 04"
+                              work summary
+
+Every parsed door gets a confidence score: 1.0 less a penalty for each check that
+failed (CONFIDENCE_PENALTIES), with the reasons kept as issues. Doors scoring at least
+FIREDNA_MIN_CONFIDENCE are used as they are; extract_type1_from_text sends only the
+rest to Claude. Parsing a whole survey takes a few milliseconds.
+"""
+
+import os
+import re
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FIREDNA_MIN_CONFIDENCE = float(os.getenv("FIREDNA_MIN_CONFIDENCE", "0.75"))
+
+# Bump when parsing changes so cached extractions are not reused
+FIREDNA_PARSER_VERSION = "v1"
+
+DOOR_HEADER_PATTERN = re.compile(
+    r'^[ \t]*(?:Product|Door) ID/Location Ref:\s*((?:X\d+-)?[A-Z]+\d+[A-Z]?)\s*-?\s*(.*?)\s*'
+    r'(?:\|\s*Level\s*(\w+))?\s*$',
+    re.MULTILINE
+)
+PAGE_MARKER_PATTERN = re.compile(r'^--- Page \d+ ---$')
+STATUS_PATTERN = re.compile(r'^Status:\s*(\w+)', re.IGNORECASE)
+COMPONENT_PATTERN = re.compile(r'^Component:\s*(.*)$', re.IGNORECASE)
+REASON_PATTERN = re.compile(r'^Reason for failure:\s*(.*)$', re.IGNORECASE)
+ACTIONS_PATTERN = re.compile(r'^Actions:\s*(.*)$', re.IGNORECASE)
+WORK_SUMMARY_PATTERN = re.compile(r'^Inspection work summary:\s*(.*)$', re.IGNORECASE)
+# "4 issues to action ARTs 01, 02, 04 & 19" - the heading above it is often stripped as page furniture
+ISSUES_TO_ACTION_PATTERN = re.compile(r'\bissues? to action\b(.*)$', re.IGNORECASE)
+SUMMARY_ART_LIST_PATTERN = re.compile(r'\bARTs?\s*((?:\d{2}\b[\s,&-]*(?:and\s+)?)+)', re.IGNORECASE)
+ART_PATTERN = re.compile(r'\bART\s?(\d{2})\b', re.IGNORECASE)
+NUMBERED_ITEM_PATTERN = re.compile(r'^\d+\.\s*')
+# Lines with nothing to extract: the date under the header, photo and note headings
+IGNORED_LINE_PATTERN = re.compile(
+    r'^(?:\w+day, \d{1,2} \w+ \d{4}|Last Inspection Detail|Inspection Items|Inspection summary photos:?'
+    r'|Compliant|Please (?:Note|check)\b.*|Approx\b.*|Replace full Doorset\b.*)$',
+    re.IGNORECASE
+)
+
+# Summary table: a row starts with "Level" then the floor on the next line, the door
+# ref (possibly wrapped) and the rating, which may share the ref's last line
+RATING_PATTERN = re.compile(r'(?:^|\s)(FD\s?\d{2,3}\s?S?|NOMINAL|N/?A)\s*$', re.IGNORECASE)
+TEXT_RATING_PATTERN = re.compile(r'\bFD\s?\d{2,3}S?\b', re.IGNORECASE)
+SUMMARY_DOOR_PATTERN = re.compile(r'^((?:X\d+-)?[A-Z]+\d+[A-Z]?)\b')
+SUMMARY_ROW_MAX_LINES = 4
+
+DOUBLE_LEAF_PATTERN = re.compile(
+    r'\b(?:meeting stiles?|passive (?:door )?leaf|active (?:door )?leaf|double (?:leaf|doors?)|'
+    r'pair of doors|set of doors|leaf pair)\b',
+    re.IGNORECASE
+)
+# "Approx SO: 2650mm h x 1810 x 135mm d", "SO: 2650mm h x 950mm w x 70mm d"
+DIMENSIONS_PATTERN = re.compile(r'\b(\d{3,4})\s*(?:mm)?\s*h\s*x\s*(\d{3,4})(?!\d)', re.IGNORECASE)
+HEIGHT_RANGE_MM = (1500, 3500)
+WIDTH_RANGE_MM = (400, 3000)
+
+REPLACEMENT_ART_CODES = {'ART17', 'ART18', 'ART20'}
+
+CONFIDENCE_PENALTIES = {
+    'no_status': 0.2,                # No "Status:" line
+    'failed_without_faults': 0.5,    # Status Failed but no reasons for failure found
+    'passed_with_faults': 0.3,       # Status Passed but reasons for failure found
+    'component_without_reason': 0.2,
+    'component_without_art': 0.25,   # A failed component with no ART code in its actions
+    'summary_art_mismatch': 0.3,     # Work summary lists different ARTs from the actions
+    'rating_from_text': 0.1,         # Fire rating not in the summary table, found in the section
+    'no_rating': 0.3,                # Fire rating in neither
+    'unrecognised_text': 0.2,        # Lines outside every block the parser knows
+}
+
+
+@dataclass
+class ParsedDoor:
+    """
+    A door read by the parser.
+
+    Attributes:
+        door: Door dict with the same keys Claude's extraction returns (None if the
+            section header could not be read)
+        confidence: 0.0-1.0; below FIREDNA_MIN_CONFIDENCE the section goes to Claude
+        issues: Why points were taken off
+    """
+    door: Optional[Dict]
+    confidence: float
+    issues: List[str] = field(default_factory=list)
+
+    @property
+    def resolved(self) -> bool:
+        return self.door is not None and self.confidence >= FIREDNA_MIN_CONFIDENCE
+
+
+@dataclass
+class _Component:
+    name: str
+    reason: List[str] = field(default_factory=list)
+    actions: List[str] = field(default_factory=list)
+    has_reason: bool = False
+
+
+def normalize_rating(rating: str) -> Optional[str]:
+    """FD30 / FD60S / Nominal from a summary table cell; None for N/A."""
+    rating = re.sub(r'\s+', '', rating).upper()
+    if rating in ('NA', 'N/A'):
+        return None
+    if rating == 'NOMINAL':
+        return 'Nominal'
+    return rating
+
+
+def parse_summary_table(text: str) -> Dict[Tuple[str, Optional[str]], Optional[str]]:
+    """
+    Fire ratings from the "Fire Door summary" table.
+
+    Returns:
+        {(door ref, floor): rating} - e.g. {('A01', '2'): 'FD30'}; rating is None for N/A
+    """
+    lines = [line.strip() for line in text.splitlines()]
+    lines = [line for line in lines if line and not PAGE_MARKER_PATTERN.match(line)]
+    ratings = {}
+    i = 0
+    while i < len(lines) - 2:
+        if lines[i] != 'Level' or not lines[i + 1].isalnum() or len(lines[i + 1]) > 3:
+            i += 1
+            continue
+        level = lines[i + 1]
+        name_lines = []
+        rating = None
+        for j in range(i + 2, min(i + 2 + SUMMARY_ROW_MAX_LINES, len(lines))):
+            match = RATING_PATTERN.search(lines[j])
+            if match:
+                name_lines.append(lines[j][:match.start()].strip())
+                rating = match.group(1)
+                break
+            name_lines.append(lines[j])
+        door_match = SUMMARY_DOOR_PATTERN.match(" ".join(name_lines))
+        if rating is not None and door_match:
+            ratings[(door_match.group(1), level)] = normalize_rating(rating)
+            i = j + 1
+        else:
+            i += 2
+    return ratings
+
+
+def _art_codes(lines: List[str]) -> List[str]:
+    codes = []
+    for line in lines:
+        for number in ART_PATTERN.findall(line):
+            code = f"ART{number}"
+            if code not in codes:
+                codes.append(code)
+    return codes
+
+
+def _faults(reason_lines: List[str]) -> List[str]:
+    """
+    Reason for failure text as fault strings: one per numbered item ("1.Lipping Damaged,"),
+    otherwise the whole reason (wrapped lines and comma-separated details) as one fault.
+    """
+    items = []
+    for line in reason_lines:
+        if NUMBERED_ITEM_PATTERN.match(line) or not items:
+            items.append(NUMBERED_ITEM_PATTERN.sub('', line))
+        else:
+            items[-1] += " " + line
+    faults = []
+    for item in items:
+        fault = re.sub(r'\s+,', ',', ' '.join(item.split())).strip(' ,')
+        if fault:
+            faults.append(fault)
+    return faults
+
+
+def _dimensions(text: str) -> Tuple[Optional[int], Optional[int]]:
+    """(height, width) in mm from "2650mm h x 1810" style dimensions, if plausible."""
+    match = DIMENSIONS_PATTERN.search(text)
+    if not match:
+        return None, None
+    height, width = int(match.group(1)), int(match.group(2))
+    if not HEIGHT_RANGE_MM[0] <= height <= HEIGHT_RANGE_MM[1]:
+        return None, None
+    return height, width if WIDTH_RANGE_MM[0] <= width <= WIDTH_RANGE_MM[1] else None
+
+
+def parse_door_section(section: str, ratings: Dict[Tuple[str, Optional[str]], Optional[str]]) -> ParsedDoor:
+    """
+    Parse one door detail section (from its "Product ID/Location Ref:" line up to the next door's).
+
+    Args:
+        section: The section text
+        ratings: parse_summary_table() of the survey overview
+
+    Returns:
+        ParsedDoor - door is None (confidence 0) if the header line can't be read
+    """
+    header = DOOR_HEADER_PATTERN.search(section)
+    if not header:
+        return ParsedDoor(door=None, confidence=0.0, issues=["door header not recognised"])
+    door_ref, description, level = header.group(1), header.group(2).strip(' -'), header.group(3)
+
+    status = None
+    components: List[_Component] = []
+    summary_lines: List[str] = []
+    unrecognised: List[str] = []
+    state = None  # None, 'reason', 'actions' or 'summary'
+    for raw_line in section[header.end():].splitlines():
+        line = raw_line.strip()
+        if not line or PAGE_MARKER_PATTERN.match(line):
+            continue
+        match = STATUS_PATTERN.match(line)
+        if match and status is None:
+            status = match.group(1).capitalize()
+            state = None
+            continue
+        match = COMPONENT_PATTERN.match(line)
+        if match:
+            components.append(_Component(name=match.group(1).strip()))
+            state = 'component'
+            continue
+        match = REASON_PATTERN.match(line)
+        if match and components:
+            components[-1].has_reason = True
+            state = 'reason'
+            line = match.group(1).strip()
+            if not line:
+                continue
+        match = ACTIONS_PATTERN.match(line)
+        if match and components:
+            state = 'actions'
+            line = match.group(1).strip()
+            if not line:
+                continue
+        match = WORK_SUMMARY_PATTERN.match(line)
+        if match:
+            state = 'summary'
+            line = match.group(1).strip()
+            if not line:
+                continue
+        if ISSUES_TO_ACTION_PATTERN.search(line):
+            state = 'summary'
+        if line in ('Failed', 'Passed'):
+            state = None
+        elif state == 'component':
+            components[-1].name += " " + line  # Wrapped component name
+        elif state == 'reason':
+            components[-1].reason.append(line)
+        elif state == 'actions':
+            components[-1].actions.append(line)
+        elif state == 'summary':
+            summary_lines.append(line)
+        elif not IGNORED_LINE_PATTERN.match(line):
+            unrecognised.append(line)
+
+    penalties = []
+    issues = []
+
+    def penalise(reason: str, detail: str = ""):
+        penalties.append(CONFIDENCE_PENALTIES[reason])
+        issues.append(reason.replace('_', ' ') + (f": {detail}" if detail else ""))
+
+    faults = [fault for component in components for fault in _faults(component.reason)]
+    art_codes = _art_codes([line for component in components for line in component.actions])
+
+    if status is None:
+        penalise('no_status')
+    elif status == 'Failed' and not faults:
+        penalise('failed_without_faults')
+    elif status == 'Passed' and faults:
+        penalise('passed_with_faults')
+    for component in components:
+        if not component.has_reason or not component.reason:
+            penalise('component_without_reason', component.name)
+        elif not _art_codes(component.actions):
+            penalise('component_without_art', component.name)
+
+    summary_art_numbers = [number for match in SUMMARY_ART_LIST_PATTERN.finditer(" ".join(summary_lines))
+                           for number in re.findall(r'\d{2}', match.group(1))]
+    if summary_art_numbers and {f"ART{n}" for n in summary_art_numbers} != set(art_codes):
+        penalise('summary_art_mismatch',
+                 f"summary ARTs {', '.join(sorted(set(summary_art_numbers)))} vs actions {', '.join(art_codes)}")
+
+    if (door_ref, level) in ratings:
+        fire_rating = ratings[(door_ref, level)] or 'Unknown'
+    else:
+        text_rating = TEXT_RATING_PATTERN.search(section)  # e.g. "Replace full Doorset for fully certified FD30"
+        if text_rating:
+            fire_rating = normalize_rating(text_rating.group(0))
+            penalise('rating_from_text', fire_rating)
+        else:
+            fire_rating = 'Unknown'
+            penalise('no_rating')
+
+    if unrecognised:
+        penalise('unrecognised_text', unrecognised[0][:60])
+
+    height, width = _dimensions(section)
+    door = {
+        'door_id': f"{door_ref}-L{level}" if level else door_ref,
+        'location': f"Level {level} - {description}" if level else description,
+        'faults': faults,
+        'art_codes': art_codes,
+        'fire_rating': fire_rating,
+        'door_config': 'Double Leaf' if DOUBLE_LEAF_PATTERN.search(section) else 'Single Leaf',
+        'door_height_mm': height,
+        'door_width_mm': width,
+        'is_replacement': bool(REPLACEMENT_ART_CODES & set(art_codes)),
+    }
+    confidence = round(max(1.0 - sum(penalties), 0.0), 2)
+    return ParsedDoor(door=door, confidence=confidence, issues=issues)
+
+
+def parse_door_sections(overview: str, sections: List[str]) -> List[ParsedDoor]:
+    """
+    Parse every door section of a survey.
+
+    Args:
+        overview: Text before the first door section (holds the summary table)
+        sections: Door detail sections, in survey order
+
+    Returns:
+        One ParsedDoor per section, in the same order
+    """
+    ratings = parse_summary_table(overview)
+    parsed = [parse_door_section(section, ratings) for section in sections]
+    resolved = sum(1 for door in parsed if door.resolved)
+    logger.info(f"FireDNA parser: {resolved}/{len(parsed)} doors resolved "
+                f"({len(ratings)} summary table rows)")
+    for door in parsed:
+        if not door.resolved:
+            door_id = door.door['door_id'] if door.door else '?'
+            logger.info(f"FireDNA parser: {door_id} confidence {door.confidence:.2f} - {'; '.join(door.issues)}")
+    return parsed
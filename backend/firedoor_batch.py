@@ -0,0 +1,150 @@
+"""
+Fire Door Batch Quoting
+ZIP handling for POST /api/firedoor/batch: a portfolio of surveys comes in as one
+ZIP, each survey is quoted independently, and the quotes go back as one ZIP with a
+manifest.json describing every input file.
+
+The archive is untrusted input. Members are extracted by basename only (no path
+from the archive ever reaches the filesystem), and the member count and total
+uncompressed size are capped before anything is written.
+"""
+
+import os
+import json
+import zipfile
+import logging
+from dataclasses import dataclass, asdict
+from pathlib import Path, PurePosixPath
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Surveys quoted at once (extraction + workbook population) per batch request
+FIREDOOR_BATCH_PARALLELISM = int(os.getenv("FIREDOOR_BATCH_PARALLELISM", "4"))
+BATCH_MAX_FILES = int(os.getenv("FIREDOOR_BATCH_MAX_FILES", "200"))
+BATCH_MAX_UNCOMPRESSED_BYTES = int(os.getenv("FIREDOOR_BATCH_MAX_BYTES", str(500 * 1024 * 1024)))
+
+MANIFEST_NAME = "manifest.json"
+ZIP_CONTENT_TYPE = "application/zip"
+
+
+@dataclass
+class BatchEntry:
+    """One survey in a batch and what happened to it (a manifest.json row)."""
+    filename: str            # Name inside the uploaded ZIP
+    path: str = ""           # Extracted copy on disk (not in the manifest)
+    status: str = "pending"  # 'ok' or 'error'
+    survey_type: Optional[str] = None
+    door_count: int = 0
+    quote_filename: Optional[str] = None  # Set before processing; cleared if it fails
+    quote_id: Optional[int] = None
+    excel_url: Optional[str] = None
+    error: Optional[str] = None
+
+    def to_manifest(self) -> dict:
+        entry = asdict(self)
+        del entry['path']
+        return entry
+
+
+def _skip_member(info: zipfile.ZipInfo) -> bool:
+    """Directories, macOS resource forks and hidden files aren't surveys."""
+    parts = PurePosixPath(info.filename.replace('\\', '/')).parts
+    return info.is_dir() or not parts or '__MACOSX' in parts or parts[-1].startswith('.')
+
+
+def _unique_name(name: str, taken: set) -> str:
+    """name, or name (2), name (3)... if another member already used it."""
+    stem, suffix = os.path.splitext(name)
+    candidate, n = name, 1
+    while candidate.lower() in taken:
+        n += 1
+        candidate = f"{stem} ({n}){suffix}"
+    taken.add(candidate.lower())
+    return candidate
+
+
+def extract_batch_archive(zip_path: str, dest_dir: str) -> List[BatchEntry]:
+    """
+    Safely extract the surveys in an uploaded ZIP.
+
+    Args:
+        zip_path: Uploaded archive
+        dest_dir: Directory to extract into (flat - archive folders are dropped)
+
+    Returns:
+        One BatchEntry per survey, in archive order
+
+    Raises:
+        ValueError: If the upload isn't a ZIP, holds no files, or exceeds the batch limits
+    """
+    try:
+        archive = zipfile.ZipFile(zip_path)
+    except (zipfile.BadZipFile, OSError) as e:
+        raise ValueError(f"Batch upload is not a valid ZIP file: {e}")
+
+    with archive:
+        members = [info for info in archive.infolist() if not _skip_member(info)]
+        if not members:
+            raise ValueError("The ZIP file contains no survey files")
+        if len(members) > BATCH_MAX_FILES:
+            raise ValueError(f"Too many files in batch ({len(members)}); the limit is {BATCH_MAX_FILES}")
+        # Declared sizes are checked up front and enforced again while copying
+        if sum(info.file_size for info in members) > BATCH_MAX_UNCOMPRESSED_BYTES:
+            raise ValueError(f"Batch is larger than {BATCH_MAX_UNCOMPRESSED_BYTES // (1024 * 1024)} MB uncompressed")
+
+        entries = []
+        taken = set()
+        budget = BATCH_MAX_UNCOMPRESSED_BYTES
+        for info in members:
+            name = _unique_name(PurePosixPath(info.filename.replace('\\', '/')).name, taken)
+            path = Path(dest_dir) / name
+            with archive.open(info) as src, open(path, 'wb') as dst:
+                while True:
+                    chunk = src.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    budget -= len(chunk)
+                    if budget < 0:
+                        raise ValueError(f"Batch is larger than {BATCH_MAX_UNCOMPRESSED_BYTES // (1024 * 1024)} MB uncompressed")
+                    dst.write(chunk)
+            entries.append(BatchEntry(filename=info.filename, path=str(path)))
+
+    logger.info(f"Extracted {len(entries)} survey(s) from batch upload")
+    return entries
+
+
+def assign_quote_filenames(entries: List[BatchEntry], client_name: str):
+    """
+    Give each entry a unique quote filename, named after its survey
+    (survey.pdf and survey.xlsx become survey_... and survey_... (2)).
+    """
+    taken = set()
+    for entry in entries:
+        stem = Path(entry.path).stem.replace(' ', '_')
+        entry.quote_filename = _unique_name(f"{stem}_{client_name.replace(' ', '_')}_FireDoor_Quote.xlsx", taken)
+
+
+def write_batch_archive(zip_path: str, entries: List[BatchEntry], client_name: str, output_dir: str):
+    """
+    Write the response ZIP: every generated quote plus manifest.json.
+
+    Args:
+        zip_path: Archive to create
+        entries: Processed batch entries (quotes are read from output_dir)
+        client_name: Client the batch was quoted for
+        output_dir: Directory holding the generated quote workbooks
+    """
+    manifest = {
+        'client_name': client_name,
+        'total': len(entries),
+        'succeeded': sum(1 for entry in entries if entry.status == 'ok'),
+        'failed': sum(1 for entry in entries if entry.status != 'ok'),
+        'files': [entry.to_manifest() for entry in entries],
+    }
+    # Quotes are already deflated xlsx packages - store them as-is
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as archive:
+        for entry in entries:
+            if entry.status == 'ok':
+                archive.write(Path(output_dir) / entry.quote_filename, entry.quote_filename)
+        archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2), compress_type=zipfile.ZIP_DEFLATED)
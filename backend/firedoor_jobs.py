@@ -0,0 +1,345 @@
+"""
+Fire Door Quote Job Queue
+Postgres-backed queue for asynchronous quote generation.
+
+Jobs are rows in the firedoor_jobs table. Workers claim the oldest queued job with
+SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers (threads in the API
+process or separate `python firedoor_jobs.py` processes) can drain the queue
+without handing the same job out twice.
+
+Two kinds of job share the queue:
+    quote         Generate a quote from an uploaded survey (POST /api/firedoor/jobs)
+    quote_upload  Store a quote /api/firedoor/process already returned and save it to
+                  the quote history, retried with backoff until storage accepts it
+"""
+
+import os
+import uuid
+import socket
+import shutil
+import logging
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import FireDoorJob
+import blob_storage
+import quote_storage
+import crud
+import metrics
+import llm_backend
+import http_clients
+
+logger = logging.getLogger(__name__)
+
+FIREDOOR_JOB_WORKERS = int(os.getenv("FIREDOOR_JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("FIREDOOR_JOB_POLL_INTERVAL", "1.0"))
+# Jobs left 'running' longer than this (e.g. worker crashed) are handed out again
+JOB_STALE_AFTER = timedelta(seconds=int(os.getenv("FIREDOOR_JOB_STALE_SECONDS", "900")))
+JOB_MAX_ATTEMPTS = int(os.getenv("FIREDOOR_JOB_MAX_ATTEMPTS", "3"))
+# Uploads are cheap to retry and the quote is already with the user, so keep trying for longer
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("FIREDOOR_UPLOAD_MAX_ATTEMPTS", "8"))
+# Backoff before retry n is UPLOAD_RETRY_SECONDS * 2^(n-1), capped at UPLOAD_RETRY_MAX_SECONDS
+UPLOAD_RETRY_SECONDS = float(os.getenv("FIREDOOR_UPLOAD_RETRY_SECONDS", "5"))
+UPLOAD_RETRY_MAX_SECONDS = float(os.getenv("FIREDOOR_UPLOAD_RETRY_MAX_SECONDS", "900"))
+
+_workers: List[threading.Thread] = []
+_stop_event = threading.Event()
+
+
+def enqueue_job(db: Session, user_id: int, client_name: str, filename: str, content: bytes) -> FireDoorJob:
+    """Insert a queued job for an uploaded survey and return it."""
+    job = FireDoorJob(
+        id=str(uuid.uuid4()),
+        user_id=user_id,
+        status="queued",
+        client_name=client_name,
+        filename=filename,
+        input_file=content,
+        attempts=0
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    logger.info(f"Queued fire door job {job.id} ({filename}, {len(content)} bytes)")
+    return job
+
+
+def enqueue_quote_upload(db: Session, job_id: str, user_id: int, client_name: str, filename: str,
+                         result_filename: str, content: bytes, survey_type: str, doors: List[dict],
+                         rate_card_version: Optional[str]) -> FireDoorJob:
+    """
+    Queue storing a generated quote and saving it to the quote history.
+
+    Args:
+        job_id: Id for the job (already sent to the client in X-Quote-Job-Id)
+        filename: Survey the quote was generated from
+        result_filename: Quote workbook filename
+        content: Quote workbook bytes
+    """
+    job = FireDoorJob(
+        id=job_id,
+        user_id=user_id,
+        kind="quote_upload",
+        status="queued",
+        client_name=client_name,
+        filename=filename,
+        result_file=content,
+        result_filename=result_filename,
+        survey_type=survey_type,
+        door_count=len(doors),
+        doors_gz=crud.pack_doors(doors),
+        rate_card_version=rate_card_version,
+        attempts=0
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    logger.info(f"Queued quote upload {job.id} ({result_filename}, {len(content)} bytes)")
+    return job
+
+
+def claim_next_job(db: Session, worker_id: str) -> Optional[FireDoorJob]:
+    """
+    Claim the oldest runnable job for this worker.
+
+    Uses FOR UPDATE SKIP LOCKED so concurrent workers skip rows another worker
+    is claiming instead of blocking on them.
+    """
+    now = datetime.now(timezone.utc)
+    stale_cutoff = now - JOB_STALE_AFTER
+    job = (
+        db.query(FireDoorJob)
+        .filter(
+            or_(
+                (FireDoorJob.status == "queued") & (or_(FireDoorJob.run_after.is_(None), FireDoorJob.run_after <= now)),
+                (FireDoorJob.status == "running") & (FireDoorJob.started_at < stale_cutoff)
+            )
+        )
+        .order_by(FireDoorJob.created_at)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if job is None:
+        db.rollback()
+        return None
+
+    job.status = "running"
+    job.worker_id = worker_id
+    job.started_at = datetime.now(timezone.utc)
+    job.attempts = (job.attempts or 0) + 1
+    db.commit()
+    return job
+
+
+def run_job(db: Session, job: FireDoorJob):
+    """Generate the quote for a claimed job and record the result."""
+    import firedoor_processor as fdp
+
+    if job.kind == "quote_upload":
+        run_upload_job(db, job)
+        return
+
+    if job.attempts > JOB_MAX_ATTEMPTS:
+        _finish_job(db, job, "failed", error=f"Gave up after {JOB_MAX_ATTEMPTS} attempts")
+        return
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        input_path = Path(temp_dir) / Path(job.filename).name
+        with open(input_path, 'wb') as f:
+            f.write(job.input_file)
+
+        try:
+            result = fdp.generate_quote(str(input_path), job.filename, job.client_name, temp_dir)
+        except ValueError as e:
+            # User-facing problem with the survey - retrying won't help
+            _finish_job(db, job, "failed", error=str(e))
+            return
+
+        with open(result['output_path'], 'rb') as f:
+            excel_content = f.read()
+
+        job.result_file = excel_content
+        job.result_filename = result['output_filename']
+        job.survey_type = result['file_format']
+        job.door_count = len(result['doors'])
+
+        # Upload to Blob and save to quote history (don't fail the job if this fails)
+        try:
+            with metrics.span("blob_upload"):
+                blob_url = quote_storage.get_storage().save(
+                    f"firedoor-quotes/{uuid.uuid4()}_{result['output_filename']}",
+                    excel_content,
+                    blob_storage.XLSX_CONTENT_TYPE
+                )
+            if blob_url:
+                quote = crud.create_firedoor_quote(
+                    db,
+                    user_id=job.user_id,
+                    client_name=job.client_name,
+                    survey_type=result['file_format'],
+                    door_count=len(result['doors']),
+                    excel_url=blob_url,
+                    comments=fdp.quote_comments(result['file_format']),
+                    doors=result['doors'],
+                    rate_card_version=result['rate_card_version']
+                )
+                job.quote_id = quote.id
+        except Exception as e:
+            logger.error(f"Job {job.id}: error uploading to Blob or saving to database: {e}")
+
+        _finish_job(db, job, "done")
+    except Exception as e:
+        logger.error(f"Job {job.id} failed: {type(e).__name__}: {e}", exc_info=True)
+        db.rollback()
+        if job.attempts >= JOB_MAX_ATTEMPTS:
+            _finish_job(db, job, "failed", error=f"Error generating quote: {str(e)}")
+        else:
+            # Put it back on the queue for another attempt (after Claude's retry-after if it was overloaded)
+            job.status = "queued"
+            job.error = str(e)
+            if isinstance(e, llm_backend.LLMUnavailable):
+                job.run_after = datetime.now(timezone.utc) + timedelta(seconds=e.retry_after or JOB_POLL_INTERVAL)
+            db.commit()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def run_upload_job(db: Session, job: FireDoorJob):
+    """
+    Store a quote_upload job's workbook and save it to the quote history.
+    Failures are retried with exponential backoff (run_after) up to UPLOAD_MAX_ATTEMPTS;
+    the workbook stays on the job until it has been stored.
+    """
+    import firedoor_processor as fdp
+
+    if job.attempts > UPLOAD_MAX_ATTEMPTS:
+        _finish_job(db, job, "failed", error=f"Gave up after {UPLOAD_MAX_ATTEMPTS} attempts")
+        return
+
+    try:
+        # Same pathname on every attempt, so a retry after a half-finished attempt overwrites it
+        with metrics.span("blob_upload"):
+            excel_url = quote_storage.get_storage().save(
+                f"firedoor-quotes/{job.id}_{job.result_filename}",
+                job.result_file,
+                blob_storage.XLSX_CONTENT_TYPE
+            )
+        if not excel_url:
+            raise RuntimeError("Quote storage rejected the upload")
+
+        quote = crud.create_firedoor_quote(
+            db,
+            user_id=job.user_id,
+            client_name=job.client_name,
+            survey_type=job.survey_type,
+            door_count=job.door_count,
+            excel_url=excel_url,
+            comments=fdp.quote_comments(job.survey_type),
+            doors_gz=job.doors_gz,
+            rate_card_version=job.rate_card_version,
+            commit=False
+        )
+        # One commit for the quote row and the finished job, so a job reclaimed after
+        # a crash never inserts the quote a second time
+        job.quote_id = quote.id
+        job.result_file = None  # Stored now; the job row only keeps the bookkeeping
+        job.doors_gz = None
+        _finish_job(db, job, "done")
+    except Exception as e:
+        logger.error(f"Quote upload {job.id} failed (attempt {job.attempts}): {type(e).__name__}: {e}")
+        db.rollback()
+        if job.attempts >= UPLOAD_MAX_ATTEMPTS:
+            _finish_job(db, job, "failed", error=f"Error storing quote: {str(e)}")
+        else:
+            delay = min(UPLOAD_RETRY_MAX_SECONDS, UPLOAD_RETRY_SECONDS * 2 ** (job.attempts - 1))
+            job.status = "queued"
+            job.error = str(e)
+            job.run_after = datetime.now(timezone.utc) + timedelta(seconds=delay)
+            db.commit()
+            logger.info(f"Quote upload {job.id} will be retried in {delay:.0f}s")
+
+
+def _finish_job(db: Session, job: FireDoorJob, status: str, error: Optional[str] = None):
+    job.status = status
+    job.error = error
+    job.input_file = None  # Survey no longer needed once the job is finished
+    job.finished_at = datetime.now(timezone.utc)
+    db.commit()
+    logger.info(f"Job {job.id} {status}" + (f": {error}" if error else ""))
+
+
+def process_next_job(worker_id: str) -> bool:
+    """Claim and run one job. Returns True if a job was processed."""
+    db = SessionLocal()
+    try:
+        job = claim_next_job(db, worker_id)
+        if job is None:
+            return False
+        logger.info(f"Worker {worker_id} claimed job {job.id} (attempt {job.attempts})")
+        run_job(db, job)
+        return True
+    finally:
+        db.close()
+
+
+def worker_loop(worker_id: str, stop_event: threading.Event):
+    """Drain the queue until stop_event is set, sleeping when it is empty."""
+    logger.info(f"Fire door job worker {worker_id} started")
+    while not stop_event.is_set():
+        try:
+            if process_next_job(worker_id):
+                continue
+        except Exception as e:
+            logger.error(f"Worker {worker_id} error: {e}", exc_info=True)
+        stop_event.wait(JOB_POLL_INTERVAL)
+    logger.info(f"Fire door job worker {worker_id} stopped")
+
+
+def start_workers(count: int = FIREDOOR_JOB_WORKERS):
+    """Start worker threads in this process."""
+    _stop_event.clear()
+    host = f"{socket.gethostname()}-{os.getpid()}"
+    for i in range(count):
+        thread = threading.Thread(
+            target=worker_loop,
+            args=(f"{host}-{i}", _stop_event),
+            name=f"firedoor-job-worker-{i}",
+            daemon=True
+        )
+        thread.start()
+        _workers.append(thread)
+    logger.info(f"Started {count} fire door job worker(s)")
+
+
+def stop_workers(timeout: float = 10.0):
+    """Signal worker threads to stop and wait for the current jobs to finish."""
+    _stop_event.set()
+    for thread in _workers:
+        thread.join(timeout=timeout)
+    _workers.clear()
+
+
+if __name__ == "__main__":
+    # Standalone worker process: python firedoor_jobs.py
+    # Scale throughput by running more of these (FIREDOOR_JOB_WORKERS threads each)
+    logging.basicConfig(level=logging.INFO)
+    blob_storage.check_token()
+    from database import init_db
+    init_db()
+    start_workers(max(1, FIREDOOR_JOB_WORKERS))
+    try:
+        while any(thread.is_alive() for thread in _workers):
+            for thread in _workers:
+                thread.join(timeout=1.0)
+    except KeyboardInterrupt:
+        stop_workers()
+    finally:
+        http_clients.close_clients()
@@ -9,20 +9,20 @@ import os
 import re
 import csv
 import json
+import time
+import pickle
+import operator
+import functools
+import hashlib
 import logging
-import fitz  # pymupdf
-import httpx
+import threading
+import contextvars
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from openpyxl import load_workbook
 from openpyxl.styles import PatternFill, Font
-try:
-    from anthropic import Anthropic
-    import anthropic
-    ANTHROPIC_SDK_AVAILABLE = True
-except Exception as e:
-    ANTHROPIC_SDK_AVAILABLE = False
-    anthropic = None
-    Anthropic = None
-    
+from openpyxl.styles.cell_style import StyleArray
+from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
@@ -33,277 +33,76 @@ logger = logging.getLogger(__name__)
 try:
     from sqlalchemy import create_engine
     from sqlalchemy.orm import sessionmaker
-    from database import get_db
-    from models import RateCardItem
+    import extraction_cache
     DATABASE_AVAILABLE = True
 except Exception as e:
-    logger.warning(f"Database import failed: {e}. Will use CSV fallback.")
+    logger.warning(f"Database import failed: {e}. Extraction cache disabled.")
     DATABASE_AVAILABLE = False
-    get_db = None
-    RateCardItem = None
-if ANTHROPIC_SDK_AVAILABLE and anthropic:
-    logger.info(f"Anthropic SDK version: {anthropic.__version__}")
-logger.info(f"httpx version: {httpx.__version__}")
+    extraction_cache = None
 
-# Lazy initialization of Anthropic client
-_anthropic_client = None
-_use_raw_http = False
+import metrics
+import rate_card
+import llm_backend
+import firedna_parser
+from executors import FIREDOOR_PROCESS_WORKERS, get_process_pool
+from json_stream import JSONArrayStream
+from extraction_schema import EXTRACTION_TOOL, unreadable_door, validate_door
+from sheet_streaming import SheetRowStreamer
+from survey_preprocess import PAGE_BOUNDARY_PATTERN, SURVEY_PREPROCESS_VERSION, preprocess_survey_text
+from survey_files import SurveyFile, header_values
+from quote_model import (
+    QuoteModel, QuoteRates, DoorLine, BCODE_ROWS, ACODE_ROWS,
+    get_priority_bcode, get_aseries_description, map_to_aseries_code
+)
 
-def call_anthropic_api(prompt: str, max_tokens: int = 4096) -> str:
-    """
-    Call Anthropic API directly via HTTP (fallback when SDK fails).
-    
-    Args:
-        prompt: The prompt to send
-        max_tokens: Maximum tokens in response
-        
-    Returns:
-        The text response from Claude
-    """
-    api_key = os.getenv("ANTHROPIC_API_KEY")
-    if not api_key:
-        raise ValueError("ANTHROPIC_API_KEY environment variable not set")
-    
-    logger.info("Using raw HTTP API call to Anthropic (SDK unavailable or failed)")
-    
-    response = httpx.post(
-        "https://api.anthropic.com/v1/messages",
-        headers={
-            "x-api-key": api_key,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json"
-        },
-        json={
-            "model": "claude-sonnet-4-20250514",
-            "max_tokens": max_tokens,
-            "messages": [{"role": "user", "content": prompt}]
-        },
-        timeout=60.0
-    )
-    response.raise_for_status()
-    result = response.json()
-    return result["content"][0]["text"]
-
-def get_anthropic_client():
-    """Get or create Anthropic client (lazy initialization with fallback to raw HTTP)."""
-    global _anthropic_client, _use_raw_http
-    
-    if _use_raw_http:
-        return None  # Signal to use raw HTTP
-    
-    if _anthropic_client is None:
-        if not ANTHROPIC_SDK_AVAILABLE:
-            logger.warning("Anthropic SDK not available, using raw HTTP API")
-            _use_raw_http = True
-            return None
-        
-        try:
-            logger.info("Attempting to initialize Anthropic SDK client")
-            _anthropic_client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-            logger.info("Anthropic SDK client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize Anthropic SDK: {str(e)}")
-            logger.info("Falling back to raw HTTP API")
-            _use_raw_http = True
-            return None
-    
-    return _anthropic_client
+CLAUDE_MODEL = "claude-sonnet-4-20250514"
 
-# Load ART code mapping
-ART_MAPPING = {}
 SCRIPT_DIR = Path(__file__).parent
-MAPPING_CSV_PATH = SCRIPT_DIR / "reference_files" / "BMTrada_ART_Codes_RateCard_Mapping.csv"
+TEMPLATE_PATH = SCRIPT_DIR / "reference_files" / "WestPark_FireDoor_CostSheet_v3_AlphaSights.xlsx"
 
-def load_art_mapping_from_db():
-    """
-    Load ART code to rate card mapping from database.
-    Returns True if successful, False if database is empty or unavailable.
-    """
-    global ART_MAPPING
-    
-    if not DATABASE_AVAILABLE:
-        return False
-    
-    try:
-        db = next(get_db())
-        items = db.query(RateCardItem).all()
-        
-        if not items:
-            logger.info("Rate card database is empty. Will load from CSV.")
-            return False
-        
-        for item in items:
-            ART_MAPPING[item.art_code] = {
-                'description': item.description,
-                'rate_card_code': item.rate_card_code,
-                'unit_price': item.unit_price,
-                'notes': f"Last updated: {item.updated_at}" if item.updated_at else ""
-            }
-        
-        logger.info(f"Loaded {len(items)} rate card items from database")
-        db.close()
-        return True
-        
-    except Exception as e:
-        logger.error(f"Failed to load from database: {e}. Will fallback to CSV.")
-        return False
-
-
-def load_art_mapping_from_csv():
-    """Load ART code to rate card mapping from CSV (fallback)."""
-    global ART_MAPPING
-    with open(MAPPING_CSV_PATH, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            art_code = row['ART Code']
-            ART_MAPPING[art_code] = {
-                'description': row['Description'],
-                'rate_card_code': row['WestPark Rate Card Code'],
-                'unit_price': None,  # CSV doesn't have prices
-                'notes': row['Notes']
-            }
-    logger.info(f"Loaded {len(ART_MAPPING)} rate card items from CSV")
-
-
-def load_art_mapping():
-    """
-    Load ART code mapping. Try database first, fallback to CSV.
-    Database contains user-editable prices. CSV is the default reference.
-    """
-    global ART_MAPPING
-    
-    # Try database first
-    if load_art_mapping_from_db():
-        logger.info("Using rate card from database (with user-edited prices)")
-        return
-    
-    # Fallback to CSV
-    logger.info("Using rate card from CSV (default prices)")
-    load_art_mapping_from_csv()
-
-
-# Load mapping on module import
-load_art_mapping()
+# Door Schedule renderer: 'openpyxl' (cells in memory) or 'streaming' (rows streamed into the
+# saved file - flat memory for large surveys). Both produce the same workbook.
+DOOR_SCHEDULE_RENDERERS = ('openpyxl', 'streaming')
+FIREDOOR_RENDERER = os.getenv("FIREDOOR_RENDERER", "openpyxl")
 
 
 def detect_format(file_path: str, filename: str) -> str:
     """
-    Detect survey format type.
+    Detect survey format type from the file's magic bytes and a bounded prefix.
     
     Returns:
         'TYPE_1' - PDF/TXT with FireDNA/RiskBase/BM TRADA/ART codes
         'TYPE_2' - Excel with door/gaps/seals fault columns
         'UNKNOWN' - Cannot determine format
     """
-    ext = Path(filename).suffix.lower()
-    
-    if ext == '.pdf':
-        # Try to read first few pages and look for TYPE_1 indicators
-        try:
-            doc = fitz.open(file_path)
-            first_page_text = doc[0].get_text() if doc.page_count > 0 else ""
-            second_page_text = doc[1].get_text() if doc.page_count > 1 else ""
-            combined_text = (first_page_text + " " + second_page_text).lower()
-            doc.close()
-            
-            # Check for TYPE_1 indicators
-            type1_keywords = ['firedna', 'riskbase', 'bm trada', 'art', 'fire door survey']
-            if any(keyword in combined_text for keyword in type1_keywords):
-                return 'TYPE_1'
-        except Exception as e:
-            print(f"Error detecting PDF format: {e}")
-            return 'UNKNOWN'
-    
-    elif ext == '.txt':
-        # Handle pre-extracted PDF text files
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                # Read first 5000 chars
-                text_sample = f.read(5000).lower()
-                
-                # Check for TYPE_1 indicators
-                type1_keywords = ['firedna', 'riskbase', 'bm trada', 'art', 'fire door survey']
-                if any(keyword in text_sample for keyword in type1_keywords):
-                    return 'TYPE_1'
-        except Exception as e:
-            print(f"Error detecting TXT format: {e}")
-            return 'UNKNOWN'
-    
-    elif ext in ['.xlsx', '.xls']:
-        # Try to read and check for TYPE_2 column structure
-        try:
-            wb = load_workbook(file_path, read_only=True)
-            ws = wb.active
-            
-            # Get header row (usually row 1)
-            headers = [cell.value.lower() if cell.value else "" for cell in ws[1]]
-            
-            # Check for TYPE_2 indicators (door, gaps, seals, etc.)
-            type2_keywords = ['door', 'gap', 'seal', 'fault', 'remedial']
-            if any(any(keyword in header for keyword in type2_keywords) for header in headers):
-                return 'TYPE_2'
-        except Exception as e:
-            print(f"Error detecting Excel format: {e}")
-            return 'UNKNOWN'
-    
-    return 'UNKNOWN'
+    with SurveyFile(file_path, filename) as survey:
+        return survey.file_format
 
 
-def extract_type1_pdf(file_path: str) -> List[Dict]:
-    """
-    Extract door data from Type 1 PDF/TXT using Claude API.
-    Supports both PDF files and pre-extracted text files.
-    
-    Returns:
-        List of door dictionaries with keys: door_id, location, faults, art_codes
-    
-    Raises:
-        ValueError: If file format is unsupported or text extraction fails
-    """
-    # Extract full text from PDF or TXT
-    full_text = ""
-    ext = Path(file_path).suffix.lower()
-    
-    if ext == '.txt':
-        # Read text file directly
-        logger.info(f"Reading text file: {file_path}")
-        with open(file_path, 'r', encoding='utf-8') as f:
-            full_text = f.read()
-        logger.info(f"Text file read: {len(full_text)} characters")
-    elif ext == '.pdf':
-        # Extract from PDF using pymupdf (recommended by Mauricio)
-        logger.info(f"Extracting text from PDF: {file_path}")
-        try:
-            doc = fitz.open(file_path)
-            logger.info(f"PDF opened: {doc.page_count} pages")
-            for page_num in range(doc.page_count):
-                page = doc[page_num]
-                page_text = page.get_text()
-                if page_text:
-                    full_text += page_text + "\n\n"
-                    logger.info(f"Page {page_num + 1}: extracted {len(page_text)} characters")
-                else:
-                    logger.warning(f"Page {page_num + 1}: no text extracted (may be image-only)")
-            doc.close()
-            logger.info(f"PDF extraction complete: {len(full_text)} total characters")
-        except Exception as e:
-            logger.error(f"PDF extraction failed: {e}")
-            raise ValueError(f"Failed to extract text from PDF. Error: {str(e)}. If this is an image-heavy PDF, please use a PDF-to-text converter first and upload the .txt file instead.")
-    else:
-        raise ValueError(f"Unsupported file extension for Type 1: {ext}. Please upload a PDF or TXT file.")
-    
-    # Check if we got any text
-    if not full_text or len(full_text.strip()) < 100:
-        logger.error(f"Insufficient text extracted from {file_path}: {len(full_text)} characters")
-        raise ValueError(
-            "Could not extract sufficient text from the uploaded file. "
-            "This may be an image-only PDF or scanned document. "
-            "Please use a PDF-to-text converter (or Claude Code) to extract the text first, "
-            "then upload the resulting .txt file instead."
-        )
-    
-    # Use Claude to extract structured data
-    prompt = f"""Extract all fire door data from this survey report. For each door, extract:
+# Chunked extraction settings for large Type 1 surveys.
+# Each chunk is extracted by its own Claude call so output never hits max_tokens,
+# and chunks run concurrently with a bounded number of calls in flight.
+EXTRACTION_MAX_TOKENS = 8192
+EXTRACTION_CHUNK_CHARS = int(os.getenv("EXTRACTION_CHUNK_CHARS", "12000"))
+EXTRACTION_CHUNK_MAX_DOORS = int(os.getenv("EXTRACTION_CHUNK_MAX_DOORS", "10"))
+EXTRACTION_MAX_CONCURRENCY = int(os.getenv("EXTRACTION_MAX_CONCURRENCY", "4"))
+# Strip page furniture and non-door pages before extraction (see survey_preprocess)
+EXTRACTION_PREPROCESS = os.getenv("EXTRACTION_PREPROCESS", "true").lower() != "false"
+# Read FireDNA door sections with the rule-based parser; only low-confidence doors go to Claude
+FIREDNA_PARSER = os.getenv("FIREDNA_PARSER", "true").lower() != "false"
+# Have Claude return doors through the record_doors tool (extraction_schema) rather than as a JSON array in text
+EXTRACTION_TOOL_USE = os.getenv("EXTRACTION_TOOL_USE", "true").lower() != "false"
+# How many times a truncated or invalid chunk is re-requested (split in half each time)
+EXTRACTION_CHUNK_RETRIES = int(os.getenv("EXTRACTION_CHUNK_RETRIES", "2"))
+
+# Bump when the prompt or parsing changes so cached extractions are not reused
+TYPE1_EXTRACTOR_VERSION = "chunked-v5"
+TYPE2_EXTRACTOR_VERSION = "v1"
+
+# FireDNA/RiskBase reports start every door's detail section with this line
+DOOR_BOUNDARY_PATTERN = re.compile(r'^[ \t]*(?:Product|Door) ID/Location Ref:', re.MULTILINE)
+
+EXTRACTION_INSTRUCTIONS = """For each door, extract:
 1. Door ID/Number - MUST include floor suffix if present in survey (e.g. A01-L2, A02-L3)
 2. Location/Description (building name, floor level)
 3. List of faults found (any issues or deficiencies noted)
@@ -325,11 +124,13 @@ def extract_type1_pdf(file_path: str) -> List[Dict]:
 8. Door width in millimeters if mentioned (extract from dimensions - look for "w" or "width" near numbers)
 9. Whether this is a replacement door (true ONLY if ART17, ART18, or ART20 present)
 
-CRITICAL: Door IDs MUST match survey exactly. If survey shows "A01" for Level 2, extract as "A01-L2".
+CRITICAL: Door IDs MUST match survey exactly. If survey shows "A01" for Level 2, extract as "A01-L2"."""
+
+EXTRACTION_OUTPUT_TOOL = f"Record every door with a single call to the {EXTRACTION_TOOL['name']} tool, in survey order."
 
-Return as JSON array with this structure:
+EXTRACTION_OUTPUT_JSON = """Return as JSON array with this structure:
 [
-  {{
+  {
     "door_id": "A01-L2",
     "location": "Level 2 - Main Corridor",
     "faults": ["Gap too large", "Seal missing"],
@@ -339,95 +140,645 @@ Return as JSON array with this structure:
     "door_height_mm": 2100,
     "door_width_mm": 900,
     "is_replacement": false
-  }},
+  },
   ...
 ]
 
-Survey text:
-{full_text}
-
 Return ONLY the JSON array, no other text."""
 
-    client = get_anthropic_client()
+
+def read_survey_text(file_path: str) -> str:
+    """
+    Read the full survey text from a Type 1 PDF or pre-extracted TXT file.
+
+    Raises:
+        ValueError: If file format is unsupported or text extraction fails
+    """
+    with SurveyFile(file_path) as survey:
+        return survey_text(survey)
+
+
+def survey_text(survey: SurveyFile) -> str:
+    """
+    Full survey text of an opened Type 1 PDF or TXT survey (reuses the sniffed document).
+
+    Raises:
+        ValueError: If file format is unsupported or text extraction fails
+    """
+    full_text = ""
+    content_chars = 0  # Text excluding page markers
+    file_path = survey.path
     
-    # Use SDK if available, otherwise raw HTTP
-    # Increased max_tokens to 8192 to handle large surveys (39+ doors)
-    if client is not None:
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=8192,
-            messages=[{"role": "user", "content": prompt}]
+    if survey.kind == 'text':
+        # Read text file directly
+        logger.info(f"Reading text file: {file_path}")
+        try:
+            full_text = survey.text
+        except UnicodeDecodeError as e:
+            raise ValueError(f"Text file is not UTF-8 encoded: {e}")
+        content_chars = len(full_text.strip())
+        logger.info(f"Text file read: {len(full_text)} characters")
+    elif survey.kind == 'pdf':
+        # Extract from PDF using pymupdf (recommended by Mauricio) - same document as detection
+        logger.info(f"Extracting text from PDF: {file_path}")
+        try:
+            doc = survey.document
+            logger.info(f"PDF opened: {doc.page_count} pages")
+            page_texts = []
+            for page_num in range(doc.page_count):
+                page_text = survey.page_text(page_num)
+                if page_text.strip():
+                    # Same page markers as pre-extracted .txt surveys (page-level pre-processing and chunking)
+                    page_texts.append(f"--- Page {page_num + 1} ---\n{page_text}\n\n")
+                    content_chars += len(page_text.strip())
+                    logger.info(f"Page {page_num + 1}: extracted {len(page_text)} characters")
+                else:
+                    logger.warning(f"Page {page_num + 1}: no text extracted (may be image-only)")
+            full_text = "".join(page_texts)
+            logger.info(f"PDF extraction complete: {len(full_text)} total characters")
+        except Exception as e:
+            logger.error(f"PDF extraction failed: {e}")
+            raise ValueError(f"Failed to extract text from PDF. Error: {str(e)}. If this is an image-heavy PDF, please use a PDF-to-text converter first and upload the .txt file instead.")
+    else:
+        ext = Path(survey.filename).suffix.lower()
+        raise ValueError(f"Unsupported file type for Type 1: {ext or survey.kind}. Please upload a PDF or TXT file.")
+    
+    # Check if we got any text
+    if content_chars < 100:
+        logger.error(f"Insufficient text extracted from {file_path}: {len(full_text)} characters")
+        raise ValueError(
+            "Could not extract sufficient text from the uploaded file. "
+            "This may be an image-only PDF or scanned document. "
+            "Please use a PDF-to-text converter (or Claude Code) to extract the text first, "
+            "then upload the resulting .txt file instead."
         )
-        response_text = response.content[0].text
-        logger.info(f"Claude response received: {len(response_text)} chars, stop_reason={response.stop_reason}")
-        
-        # Check if response was truncated
-        if response.stop_reason == "max_tokens":
-            logger.warning("Claude response was truncated due to max_tokens limit!")
-            logger.warning("Survey may be too large - consider increasing max_tokens or splitting the survey")
+    
+    return full_text
+
+
+def _pack_sections(sections: List[str], max_chars: int, max_items: int) -> List[str]:
+    """Greedily pack consecutive text sections into chunks of at most max_chars / max_items."""
+    chunks = []
+    current = []
+    current_len = 0
+    for section in sections:
+        if current and (current_len + len(section) > max_chars or len(current) >= max_items):
+            chunks.append("".join(current))
+            current = []
+            current_len = 0
+        current.append(section)
+        current_len += len(section)
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def split_door_sections(full_text: str) -> Tuple[str, List[str]]:
+    """
+    Split survey text at door boundaries.
+
+    Returns:
+        (overview, sections) - the text before the first door section and one
+        section per door, in survey order; ("", []) if there are no door boundaries
+    """
+    starts = [m.start() for m in DOOR_BOUNDARY_PATTERN.finditer(full_text)]
+    if not starts:
+        return "", []
+    sections = [full_text[start:end] for start, end in zip(starts, starts[1:] + [len(full_text)])]
+    return full_text[:starts[0]], sections
+
+
+def split_survey_text(full_text: str, max_chars: int = None, max_doors: int = None) -> Tuple[str, List[str]]:
+    """
+    Split survey text at door boundaries into chunks for extraction.
+
+    Returns:
+        (overview, chunks) - overview is the text before the first door section
+        (cover pages, summary table) and is shared by every chunk as context.
+        If no door boundaries are found, overview is empty and the text is split
+        at page boundaries instead; doors spanning two chunks are merged later.
+    """
+    max_chars = max_chars or EXTRACTION_CHUNK_CHARS
+    max_doors = max_doors or EXTRACTION_CHUNK_MAX_DOORS
+    
+    overview, sections = split_door_sections(full_text)
+    if sections:
+        return overview, _pack_sections(sections, max_chars, max_doors)
+    
+    # No door markers - fall back to page (or paragraph) boundaries
+    page_starts = [m.start() for m in PAGE_BOUNDARY_PATTERN.finditer(full_text)]
+    if page_starts:
+        starts = [0] + [s for s in page_starts if s > 0]
+        pages = [full_text[start:end] for start, end in zip(starts, starts[1:] + [len(full_text)])]
     else:
-        response_text = call_anthropic_api(prompt, max_tokens=8192)
-        logger.info(f"Claude response received: {len(response_text)} chars")
+        pages = [p + "\n\n" for p in full_text.split("\n\n")]
+    return "", _pack_sections(pages, max_chars, len(pages))
+
+
+def extraction_system_prompt() -> str:
+    """The extraction instructions, ending with how to return the doors (tool call or JSON array)."""
+    output = EXTRACTION_OUTPUT_TOOL if EXTRACTION_TOOL_USE else EXTRACTION_OUTPUT_JSON
+    return f"""You extract fire door data from fire door survey reports.
+
+{EXTRACTION_INSTRUCTIONS}
+
+{output}"""
+
+
+def _build_extraction_request(chunk_text: str, overview: str = "") -> Tuple[List[str], str]:
+    """
+    Build the Claude request for one chunk of survey text.
+
+    Returns:
+        (system blocks, user prompt) - the system blocks (instructions, then the
+        survey overview) are the same for every chunk of a survey, so they are the
+        prompt-cached prefix; only the chunk's door sections vary
+    """
+    system_prompt = extraction_system_prompt()
+    reminder = (f"Record the doors with the {EXTRACTION_TOOL['name']} tool." if EXTRACTION_TOOL_USE
+                else "Return ONLY the JSON array, no other text.")
+    if overview.strip():
+        survey_context = f"""Only extract doors whose detail sections appear under "Door sections" in the user message.
+Use this survey overview (summary table, floor levels) to look up fire ratings and door configuration for those doors.
+
+Survey overview:
+{overview}"""
+        return [system_prompt, survey_context], f"""Door sections:
+{chunk_text}
+
+{reminder}"""
     
-    # Parse JSON response
+    return [system_prompt], f"""Extract all fire door data from this survey report.
+
+Survey text:
+{chunk_text}
+
+{reminder}"""
+
+
+def _normalize_type1_door(door: Dict) -> Dict:
+    """Apply Type 1 post-processing to a door extracted by Claude."""
+    # FIX #2: Mark all Type 1 doors with format_type
+    door['format_type'] = 'TYPE_1'
+    
+    # ROUND 6 FIX: Infer door_config from width if available
+    # Typical single doors: 700-1000mm, Double doors: 1400-1800mm+
+    door_width = door.get('door_width_mm')
+    if door_width and isinstance(door_width, (int, float)):
+        if door_width > 1400:
+            # Wide door - likely double
+            if door.get('door_config') != 'Double Leaf':
+                logger.info(f"Door {door.get('door_id')}: Inferred Double Leaf from width {door_width}mm (was: {door.get('door_config')})")
+                door['door_config'] = 'Double Leaf'
+    return door
+
+
+def estimate_extraction_tokens(full_text: str) -> int:
+    """Estimated input tokens of every extraction prompt for this text (the overview is sent with each chunk)."""
+    overview, chunks = split_survey_text(full_text)
+    total = 0
+    tool_tokens = llm_backend.estimate_tokens(json.dumps(EXTRACTION_TOOL)) if EXTRACTION_TOOL_USE else 0
+    for chunk in chunks:
+        system, prompt = _build_extraction_request(chunk, overview)
+        total += llm_backend.estimate_tokens("".join(system) + prompt) + tool_tokens
+    return total
+
+
+@dataclass
+class ChunkResponse:
+    """The usable doors from one Claude extraction call, and what was wrong with the response."""
+    doors: List[Dict]
+    rejected: List[Tuple[object, str]] = field(default_factory=list)  # Unusable elements, with the reason
+    malformed: Optional[str] = None     # JSON error that stopped parsing
+    found_array: bool = True
+    truncated: bool = False
+
+    @property
+    def result(self) -> str:
+        """'ok', or why the chunk should be re-requested: 'no_array', 'truncated' (or malformed) or 'invalid'."""
+        if not self.found_array:
+            return 'no_array'
+        if self.truncated or self.malformed:
+            return 'truncated'
+        return 'invalid' if self.rejected else 'ok'
+
+
+def _request_chunk(chunk_text: str, overview: str = "", max_tokens: int = EXTRACTION_MAX_TOKENS,
+                   first_text: Optional[threading.Event] = None) -> ChunkResponse:
+    """
+    One Claude call extracting the doors of a chunk of survey text.
+    
+    The response (the record_doors tool input, or a JSON array in text without
+    EXTRACTION_TOOL_USE) is streamed through the configured LLM backend (see
+    llm_backend) and each door is parsed and validated (extraction_schema) as soon
+    as its object closes, so a truncated response still yields every complete door
+    and time to first door is recorded. Prompt cache use and input tokens are
+    recorded per call (metrics.LLM_*).
+    
+    Args:
+        first_text: Set when the first text of the response arrives
+    """
+    parser = JSONArrayStream()
+    chunk = ChunkResponse(doors=[])
+    start = time.perf_counter()
+    first_token_seconds = None
+
+    def on_text(text: str):
+        nonlocal first_token_seconds
+        if first_token_seconds is None:
+            first_token_seconds = time.perf_counter() - start
+            if first_text is not None:
+                first_text.set()
+        if chunk.malformed:
+            return
+        try:
+            elements = parser.feed(text)
+        except ValueError as e:
+            chunk.malformed = str(e)  # Stop parsing; the doors so far are kept
+            return
+        for element in elements:
+            door, problem = validate_door(element)
+            if door is None:
+                chunk.rejected.append((element, problem))
+                continue
+            if not chunk.doors:
+                metrics.record_span("llm_first_door", time.perf_counter() - start)
+            chunk.doors.append(door)
+
+    system, prompt = _build_extraction_request(chunk_text, overview)
+    with metrics.span("llm_call"):
+        response = llm_backend.get_backend().stream(
+            prompt, max_tokens=max_tokens, model=CLAUDE_MODEL, on_text=on_text, system=system,
+            tool=EXTRACTION_TOOL if EXTRACTION_TOOL_USE else None
+        )
+    record_llm_usage(response, time.perf_counter() - start, first_token_seconds)
+
+    chunk.found_array = parser.started
+    chunk.truncated = response.stop_reason == "max_tokens" or not (parser.complete or chunk.malformed)
+    metrics.EXTRACTION_CHUNK_DOORS.observe(len(chunk.doors), result=chunk.result)
+    logger.info(f"Claude response received: {len(response.text)} chars, {len(chunk.doors)} doors "
+                f"({chunk.result}), stop_reason={response.stop_reason}, prompt cache {response.cache_status} "
+                f"(input tokens: {response.input_tokens} uncached, {response.cache_creation_input_tokens} written, "
+                f"{response.cache_read_input_tokens} read)")
+    if not chunk.found_array:
+        logger.error(f"No JSON array in Claude response. First 500 chars: {response.text[:500]}")
+    if chunk.malformed:
+        logger.warning(f"Malformed Claude extraction output: {chunk.malformed}")
+    for _, problem in chunk.rejected:
+        logger.warning(f"Unusable door in Claude extraction output: {problem}")
+    return chunk
+
+
+def _split_chunk(chunk_text: str) -> List[str]:
+    """Halve a chunk at door boundaries (else page, else paragraph boundaries); [chunk_text] if it can't be split."""
+    lead, pieces = split_door_sections(chunk_text)
+    if len(pieces) > 1:
+        pieces[0] = lead + pieces[0]
+    else:
+        starts = [0] + [m.start() for m in PAGE_BOUNDARY_PATTERN.finditer(chunk_text) if m.start() > 0]
+        pieces = [chunk_text[start:end] for start, end in zip(starts, starts[1:] + [len(chunk_text)])]
+        if len(pieces) < 2:
+            pieces = [p + "\n\n" for p in chunk_text.split("\n\n") if p.strip()]
+    if len(pieces) < 2:
+        return [chunk_text]
+    half = len(pieces) // 2
+    return ["".join(pieces[:half]), "".join(pieces[half:])]
+
+
+def _extract_chunk(chunk_text: str, overview: str = "", max_tokens: int = EXTRACTION_MAX_TOKENS,
+                   first_text: Optional[threading.Event] = None, retries: int = None) -> List[Dict]:
+    """
+    Extract doors from a single chunk of survey text (see _request_chunk).
+    
+    If the response is truncated or malformed, has a door that can't be used
+    (no door_id) or no door array at all, only this chunk is re-requested: split
+    in half (at door boundaries) so each half's output is smaller, up to
+    EXTRACTION_CHUNK_RETRIES times. The halves run one after the other on this
+    chunk's worker. Doors that are still unusable after that are kept as
+    UNIDENTIFIED placeholders flagged for manual review.
+
+    If Claude fails part-way through the stream (e.g. an overloaded_error event
+    after some doors), the chunk is requested again once, whole, and parsed afresh.
+
+    Raises:
+        ValueError: If the response still has no JSON array, or is still cut off
+            (the quote would silently be missing doors), after the retries
+        LLMUnavailable: If Claude fails before the stream starts, or fails part-way twice
+    """
+    retries = EXTRACTION_CHUNK_RETRIES if retries is None else retries
     try:
-        doors = json.loads(response_text)
-        # FIX #2: Mark all Type 1 doors with format_type
+        chunk = _request_chunk(chunk_text, overview, max_tokens, first_text)
+    except llm_backend.LLMUnavailable as e:
+        if not e.partial:
+            raise
+        logger.warning(f"Claude failed part-way through a chunk's response ({e}); re-requesting the chunk")
+        chunk = _request_chunk(chunk_text, overview, max_tokens, first_text)
+    if chunk.result == 'ok':
+        return chunk.doors
+
+    if retries > 0:
+        parts = _split_chunk(chunk_text)
+        logger.warning(f"Re-requesting {chunk.result} chunk as {len(parts)} part(s) "
+                       f"({retries - 1} retries left after this)")
+        return [door for part in parts for door in _extract_chunk(part, overview, max_tokens, retries=retries - 1)]
+
+    if not chunk.found_array:
+        raise ValueError(
+            "Claude did not return a valid JSON array. "
+            "Response may be truncated or formatted incorrectly."
+        )
+    if chunk.result == 'truncated':
+        door_count = len(DOOR_BOUNDARY_PATTERN.findall(chunk_text))
+        raise ValueError(
+            f"Claude's response was {'malformed' if chunk.malformed else 'cut off'} after "
+            f"{len(chunk.doors)} door(s)" + (f" of {door_count}" if door_count else "") +
+            ", even after re-requesting it in smaller parts, so the quote would be missing doors. "
+            "Try again, or lower EXTRACTION_CHUNK_MAX_DOORS."
+        )
+    logger.warning(f"Keeping {len(chunk.rejected)} unusable door(s) as placeholders flagged for manual review")
+    return chunk.doors + [unreadable_door(element, problem) for element, problem in chunk.rejected]
+
+
+def record_llm_usage(response: llm_backend.LLMResponse, seconds: float, first_token_seconds: Optional[float]):
+    """Observe a Claude call's input tokens and its latency by prompt cache result (hit/miss/none)."""
+    cache = response.cache_status
+    metrics.LLM_INPUT_TOKENS.observe(response.input_tokens, kind='uncached')
+    metrics.LLM_INPUT_TOKENS.observe(response.cache_creation_input_tokens, kind='cache_write')
+    metrics.LLM_INPUT_TOKENS.observe(response.cache_read_input_tokens, kind='cache_read')
+    metrics.LLM_CALL_SECONDS.observe(seconds, cache=cache)
+    if first_token_seconds is not None:
+        metrics.LLM_FIRST_TOKEN_SECONDS.observe(first_token_seconds, cache=cache)
+
+
+def merge_door_lists(door_lists: List[List[Dict]]) -> List[Dict]:
+    """
+    Merge per-chunk door lists, deduplicating by door_id.
+
+    Order of first appearance is preserved. When a door appears in more than one
+    chunk (e.g. it straddles a page split), faults and ART codes are combined and
+    missing details are filled in from the later occurrence.
+    """
+    merged = {}
+    for doors in door_lists:
         for door in doors:
-            door['format_type'] = 'TYPE_1'
-            
-            # ROUND 6 FIX: Infer door_config from width if available
-            # Typical single doors: 700-1000mm, Double doors: 1400-1800mm+
-            door_width = door.get('door_width_mm')
-            if door_width and isinstance(door_width, (int, float)):
-                if door_width > 1400:
-                    # Wide door - likely double
-                    if door.get('door_config') != 'Double Leaf':
-                        logger.info(f"Door {door.get('door_id')}: Inferred Double Leaf from width {door_width}mm (was: {door.get('door_config')})")
-                        door['door_config'] = 'Double Leaf'
-        
-        logger.info(f"Successfully extracted {len(doors)} doors from Type 1 survey")
-        return doors
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON parse error: {e}")
-        logger.error(f"Response text length: {len(response_text)} chars")
-        logger.error(f"First 500 chars: {response_text[:500]}")
-        logger.error(f"Last 500 chars: {response_text[-500:]}")
-        
-        # Try to extract JSON from response
-        json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-        if json_match:
-            json_str = json_match.group()
-            logger.info(f"Found JSON array in response, attempting to parse...")
-            try:
-                doors = json.loads(json_str)
-                # FIX #2: Mark all Type 1 doors with format_type
-                for door in doors:
-                    door['format_type'] = 'TYPE_1'
-                    
-                    # ROUND 6 FIX: Infer door_config from width if available
-                    door_width = door.get('door_width_mm')
-                    if door_width and isinstance(door_width, (int, float)):
-                        if door_width > 1400:
-                            if door.get('door_config') != 'Double Leaf':
-                                logger.info(f"Door {door.get('door_id')}: Inferred Double Leaf from width {door_width}mm (was: {door.get('door_config')})")
-                                door['door_config'] = 'Double Leaf'
-                
-                logger.info(f"Successfully extracted {len(doors)} doors after regex cleanup")
-                return doors
-            except json.JSONDecodeError as e2:
-                logger.error(f"Regex extraction also failed: {e2}")
-                logger.error(f"JSON string: {json_str[:1000]}...")
-                raise ValueError(
-                    f"Claude returned invalid JSON. Error: {str(e)}. "
-                    "This may be due to a large survey - try splitting into smaller sections."
-                )
-        else:
-            logger.error("No JSON array found in Claude response")
-            raise ValueError(
-                "Claude did not return a valid JSON array. "
-                "Response may be truncated or formatted incorrectly."
-            )
+            door_id = str(door.get('door_id', '')).strip()
+            if not door_id:
+                continue
+            existing = merged.get(door_id)
+            if existing is None:
+                merged[door_id] = door
+                continue
+            for key in ('faults', 'art_codes', 'extraction_warnings'):
+                for value in door.get(key) or []:
+                    if value not in existing.setdefault(key, []):
+                        existing[key].append(value)
+            for key, value in door.items():
+                if existing.get(key) in (None, '', 'Unknown') and value not in (None, ''):
+                    existing[key] = value
+            existing['is_replacement'] = bool(existing.get('is_replacement')) or bool(door.get('is_replacement'))
+    return list(merged.values())
+
+
+def _extract_chunks(chunks: List[str], overview: str) -> List[List[Dict]]:
+    """
+    Extract chunks with Claude, concurrently when there are several (one door list per chunk).
+
+    With LLM_PROMPT_CACHE the other chunks wait until the first chunk's response
+    starts: its prompt cache entry for the shared system prefix (instructions and
+    overview) is readable from then on, so they read it instead of each writing it.
+    """
+    if len(chunks) == 1:
+        return [_extract_chunk(chunks[0], overview)]
+    max_workers = max(1, min(EXTRACTION_MAX_CONCURRENCY, len(chunks)))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="claude-extract") as executor:
+        # Each chunk runs in a copy of this context so its llm_call span reaches the request's timings
+        first_text = threading.Event()
+        futures = [executor.submit(contextvars.copy_context().run, _extract_chunk, chunks[0], overview,
+                                   EXTRACTION_MAX_TOKENS, first_text)]
+        if llm_backend.LLM_PROMPT_CACHE:
+            with metrics.span("llm_cache_warmup"):
+                while not first_text.wait(0.05) and not futures[0].done():
+                    pass
+        futures += [executor.submit(contextvars.copy_context().run, _extract_chunk, chunk, overview)
+                    for chunk in chunks[1:]]
+        return [future.result() for future in futures]
+
+
+def _extract_mixed(overview: str, sections: List[str]) -> List[List[Dict]]:
+    """
+    Door lists in survey order: the FireDNA parser's doors where it is confident,
+    Claude's for the sections it isn't (packed into chunks as usual). Every door
+    is tagged with extraction_source, extraction_confidence and extraction_issues.
+    """
+    with metrics.span("rule_parse"):
+        parsed = firedna_parser.parse_door_sections(overview, sections)
+
+    slots = {}
+    for idx, result in enumerate(parsed):
+        if result.resolved:
+            result.door.update(extraction_source='parser', extraction_confidence=result.confidence,
+                               extraction_issues=result.issues)
+            slots[idx] = [result.door]
+        metrics.EXTRACTION_DOOR_CONFIDENCE.observe(result.confidence,
+                                                   source='parser' if result.resolved else 'claude')
+
+    unresolved = [idx for idx, result in enumerate(parsed) if not result.resolved]
+    if unresolved:
+        chunks = _pack_sections([sections[idx] for idx in unresolved], EXTRACTION_CHUNK_CHARS,
+                                EXTRACTION_CHUNK_MAX_DOORS)
+        logger.info(f"Sending {len(unresolved)} of {len(sections)} doors to Claude in {len(chunks)} chunk(s)")
+        # Claude's doors go where the parser found the same door id (else where their chunk starts),
+        # with the parser's confidence and issues saying why they were sent
+        section_index = {parsed[idx].door['door_id']: idx for idx in unresolved if parsed[idx].door}
+        position = 0
+        for chunk, doors in zip(chunks, _extract_chunks(chunks, overview)):
+            for door in doors:
+                idx = section_index.get(str(door.get('door_id', '')).strip(), unresolved[position])
+                door.update(extraction_source='claude', extraction_confidence=parsed[idx].confidence,
+                            extraction_issues=parsed[idx].issues)
+                slots.setdefault(idx, []).append(door)
+            position += len(DOOR_BOUNDARY_PATTERN.findall(chunk))
+    return [slots[idx] for idx in sorted(slots)]
+
+
+def extract_type1_from_text(full_text: str) -> List[Dict]:
+    """
+    Extract door data from Type 1 survey text using Claude API.
+    
+    The text is pre-processed first (EXTRACTION_PREPROCESS) to cut input tokens.
+    FireDNA door sections are read by the rule-based parser (FIREDNA_PARSER, see
+    firedna_parser) and only the doors it can't resolve confidently go to Claude.
+    Those are split at door boundaries and the chunks are extracted concurrently
+    (at most EXTRACTION_MAX_CONCURRENCY calls in flight), so wall-clock time
+    scales with the largest chunk rather than the whole survey.
+    
+    Returns:
+        List of door dictionaries with keys: door_id, location, faults, art_codes
+        (and extraction_source 'parser' or 'claude' when the parser ran)
+    
+    Raises:
+        ValueError: If a chunk's response is still unparseable or invalid after
+            EXTRACTION_CHUNK_RETRIES re-requests
+    """
+    if EXTRACTION_PREPROCESS:
+        with metrics.span("preprocess"):
+            preprocessed = preprocess_survey_text(full_text)
+            tokens_before = estimate_extraction_tokens(full_text)
+            tokens_after = estimate_extraction_tokens(preprocessed.text)
+        metrics.LLM_INPUT_TOKENS_SAVED.observe(tokens_before - tokens_after)
+        logger.info(f"Pre-processing saved ~{tokens_before - tokens_after} input tokens "
+                    f"(~{tokens_before} -> ~{tokens_after} across all extraction prompts)")
+        full_text = preprocessed.text
+    
+    overview, sections = split_door_sections(full_text)
+    if FIREDNA_PARSER and sections:
+        door_lists = _extract_mixed(overview, sections)
+    else:
+        overview, chunks = split_survey_text(full_text)
+        logger.info(f"Split survey into {len(chunks)} chunk(s) for extraction (overview: {len(overview)} chars)")
+        door_lists = _extract_chunks(chunks, overview)
+        for idx, chunk_doors in enumerate(door_lists):
+            logger.info(f"Chunk {idx + 1}/{len(door_lists)}: {len(chunk_doors)} doors")
+    
+    doors = [_normalize_type1_door(door) for door in merge_door_lists(door_lists)]
+    logger.info(f"Successfully extracted {len(doors)} doors from Type 1 survey")
+    return doors
+
+
+def flagged_door_count(doors: List[Dict]) -> int:
+    """Doors with extraction_warnings (values coerced, or unreadable placeholders) - flagged for manual review."""
+    return sum(1 for door in doors if door.get('extraction_warnings'))
+
+
+def extraction_sources(doors: List[Dict]) -> str:
+    """How many doors each extractor supplied, e.g. "parser=33, claude=6" ("" if untagged)."""
+    counts = {}
+    for door in doors:
+        source = door.get('extraction_source')
+        if source:
+            counts[source] = counts.get(source, 0) + 1
+    return ", ".join(f"{source}={count}" for source, count in counts.items())
+
+
+def extract_type1_pdf(file_path: str) -> List[Dict]:
+    """
+    Extract door data from Type 1 PDF/TXT using Claude API.
+    Supports both PDF files and pre-extracted text files.
+    
+    Returns:
+        List of door dictionaries with keys: door_id, location, faults, art_codes
+    
+    Raises:
+        ValueError: If file format is unsupported or text extraction fails
+    """
+    return extract_type1_from_text(read_survey_text(file_path))
+
+
+# Fault keyword rules, checked in priority order (first matching rule wins).
+# B01/B03 have sub-rules applied in _classify_fault_keywords.
+FAULT_KEYWORD_RULES = [
+    ('B08', ['hold open', 'hold-open', 'perco', 'chain', 'hook']),
+    # Broader seal matching for Type 2 Excel surveys ("coming away", "worn", "none fitted", ...)
+    ('B01', ['seal', 'strip', 'coming away', 'worn', 'damage', 'missing', 'none fitted', 'not fitted']),
+    ('B02', ['intumescent']),
+    ('B03', ['closer', 'closing']),
+    ('B04', ['hinge', 'dropped', 'drop']),
+    ('B05', ['latch', 'handle', 'lock', 'keep']),
+    ('B06', ['frame', 'architrave', 'fire stop', 'firestop', 'gap to wall']),
+    ('B07', ['sign', 'signage', 'label']),
+    ('B10', ['adjust', 're-hang', 'rehang', 'alignment', 'warped', 'twisted', 'gap too', 'catching', 'not closing']),
+    ('B11', ['lipping', 'lip', 'edge damage']),
+    ('B12', ['void', 'hole', 'insert', 'recessed']),
+]
+_FAULT_KEYWORDS = sorted({kw for _, kws in FAULT_KEYWORD_RULES for kw in kws} | {'smoke'})
+
+
+def _keyword_trie_pattern(keywords: List[str]) -> str:
+    """Regex alternation factored as a trie (e.g. 'sign(?:age)?'), matching the longest keyword at each position."""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+    
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+    
+    return build(trie)
+
+
+# Keyword sets are tracked as bitmasks: one bit per rule, plus flags for the sub-rules
+_RULE_BITS = {code: 1 << i for i, (code, _) in enumerate(FAULT_KEYWORD_RULES)}
+_SMOKE_BIT = 1 << len(FAULT_KEYWORD_RULES)
+_CLOSER_EXCLUDE_BIT = _SMOKE_BIT << 1  # "not closing" / "catching" turn B03 into B10
+
+
+def _keyword_mask(keyword: str) -> int:
+    mask = 0
+    for code, keywords in FAULT_KEYWORD_RULES:
+        if keyword in keywords:
+            mask |= _RULE_BITS[code]
+    if keyword == 'smoke':
+        mask |= _SMOKE_BIT
+    if keyword in ('not closing', 'catching'):
+        mask |= _CLOSER_EXCLUDE_BIT
+    return mask
+
+
+# One non-overlapping scan finds the keywords in a fault. Keywords inside a match
+# ("closing" in "not closing") are folded into that match's mask; the few that can
+# start inside a match and run past its end ("gap too" after "closing") are checked
+# directly from _FAULT_KEYWORD_OVERLAPS, so the result is exact.
+FAULT_KEYWORD_PATTERN = re.compile(_keyword_trie_pattern(_FAULT_KEYWORDS))
+_FAULT_KEYWORD_MASKS = {
+    kw: functools.reduce(operator.or_, (_keyword_mask(other) for other in _FAULT_KEYWORDS if other in kw))
+    for kw in _FAULT_KEYWORDS
+}
+_FAULT_KEYWORD_OVERLAPS = {
+    kw: tuple(
+        (other, _FAULT_KEYWORD_MASKS[other]) for other in _FAULT_KEYWORDS
+        if other not in kw and any(other.startswith(kw[i:]) for i in range(1, len(kw)))
+    )
+    for kw in _FAULT_KEYWORDS
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _classify_fault_mask(mask: int) -> Optional[str]:
+    """Apply the B-code priority rules to the keywords (as a bitmask) found in one fault."""
+    intumescent_only = bool(mask & _RULE_BITS['B02']) and not mask & _SMOKE_BIT
+    for code, _ in FAULT_KEYWORD_RULES:
+        if not mask & _RULE_BITS[code]:
+            continue
+        if code == 'B01':
+            # If it mentions intumescent only (no smoke), it's B02
+            return 'B02' if intumescent_only else 'B01'
+        if code == 'B02':
+            if intumescent_only:
+                return 'B02'
+            continue
+        if code == 'B03' and mask & _CLOSER_EXCLUDE_BIT:
+            # Exclude "not closing" which is B10
+            return 'B10'
+        return code
+    return None
+
+
+def _classify_fault_lower(fault_lower: str) -> Optional[str]:
+    mask = 0
+    matches = FAULT_KEYWORD_PATTERN.findall(fault_lower)
+    for match in matches:
+        mask |= _FAULT_KEYWORD_MASKS[match]
+    for match in matches:
+        for other, other_mask in _FAULT_KEYWORD_OVERLAPS[match]:
+            if other_mask & ~mask and other in fault_lower:
+                mask |= other_mask
+    return _classify_fault_mask(mask)
 
 
 def map_fault_to_bcode(fault_text: str) -> Optional[str]:
@@ -449,356 +800,749 @@ def map_fault_to_bcode(fault_text: str) -> Optional[str]:
     B11 - Hardwood re-lip
     B12 - Timber insert for voids
     """
-    fault_lower = fault_text.lower()
-    
-    # B08 - Hold-open devices (Perco chains, etc.)
-    if any(keyword in fault_lower for keyword in ['hold open', 'hold-open', 'perco', 'chain', 'hook']):
-        return 'B08'
-    
-    # B01 - Seals (broader matching for Type 2 Excel surveys)
-    # Matches: "seal", "strip", "coming away", "worn", "damaged", "missing", "fitted" (in seal context)
-    seal_keywords = ['seal', 'strip', 'coming away', 'worn', 'damage', 'missing', 'none fitted', 'not fitted']
-    if any(keyword in fault_lower for keyword in seal_keywords):
-        # If it mentions intumescent only (no smoke), it's B02
-        if 'intumescent' in fault_lower and 'smoke' not in fault_lower:
-            return 'B02'
-        # Otherwise assume B01 (intumescent + smoke seals, or general seal issue)
-        return 'B01'
-    
-    # B02 - Intumescent only (explicit)
-    if 'intumescent' in fault_lower and 'smoke' not in fault_lower:
-        return 'B02'
-    
-    # B03 - Door closer
-    if any(keyword in fault_lower for keyword in ['closer', 'closing']):
-        # Exclude "not closing" which is B10
-        if 'not closing' in fault_lower or 'catching' in fault_lower:
-            return 'B10'
-        return 'B03'
-    
-    # B04 - Hinges
-    if any(keyword in fault_lower for keyword in ['hinge', 'dropped', 'drop']):
-        return 'B04'
-    
-    # B05 - Latch/handles
-    if any(keyword in fault_lower for keyword in ['latch', 'handle', 'lock', 'keep']):
-        return 'B05'
-    
-    # B06 - Frame/architrave
-    if any(keyword in fault_lower for keyword in ['frame', 'architrave', 'fire stop', 'firestop', 'gap to wall']):
-        return 'B06'
-    
-    # B07 - Signage
-    if any(keyword in fault_lower for keyword in ['sign', 'signage', 'label']):
-        return 'B07'
-    
-    # B10 - Re-hang/adjust (catches "not closing", "catching on floor", etc.)
-    if any(keyword in fault_lower for keyword in ['adjust', 're-hang', 'rehang', 'alignment', 'warped', 'twisted', 'gap too', 'catching', 'not closing']):
-        return 'B10'
-    
-    # B11 - Re-lip
-    if any(keyword in fault_lower for keyword in ['lipping', 'lip', 'edge damage']):
-        return 'B11'
-    
-    # B12 - Timber insert
-    if any(keyword in fault_lower for keyword in ['void', 'hole', 'insert', 'recessed']):
-        return 'B12'
+    return _classify_fault_lower(fault_text.lower())
+
+
+def classify_faults(fault_texts: List[str]) -> List[Optional[str]]:
+    """
+    Map a batch of fault descriptions to B-series codes.
     
-    return None
+    Equivalent to [map_fault_to_bcode(t) for t in fault_texts], but each distinct
+    fault text (surveyors repeat the same phrases across doors) is classified once.
+    """
+    codes = {}
+    results = []
+    for text in fault_texts:
+        fault_lower = text.lower()
+        code = codes.get(fault_lower, codes)
+        if code is codes:
+            code = codes[fault_lower] = _classify_fault_lower(fault_lower)
+        results.append(code)
+    return results
+
+
+# Type 2 extraction streams rows (read-only, values only) and classifies faults in
+# batches of this many doors. Workbooks whose sheets add up to TYPE2_PARALLEL_MIN_BYTES
+# of sheet XML are split by sheet across the process pool.
+TYPE2_CLASSIFY_BATCH = int(os.getenv("TYPE2_CLASSIFY_BATCH", "2000"))
+TYPE2_PARALLEL_MIN_BYTES = int(os.getenv("TYPE2_PARALLEL_MIN_BYTES", str(4 * 1024 * 1024)))
 
 
 def extract_type2_excel(file_path: str) -> List[Dict]:
     """
     Extract door data from Type 2 Excel file and map faults to B-codes.
     
+    Large multi-sheet workbooks are extracted sheet-parallel in the process pool.
+    
     Returns:
         List of door dictionaries with keys: door_id, location, faults, b_codes
     """
-    wb = load_workbook(file_path)
-    all_doors = []
+    with SurveyFile(file_path) as survey:
+        sheet_groups = plan_type2_sheets(survey.workbook)
+        if len(sheet_groups) == 1 or not parallel_extraction_allowed():
+            return extract_type2_workbook(survey.workbook)
+        sheet_names = survey.workbook.sheetnames
+    return extract_type2_parallel(file_path, sheet_groups, sheet_names)
+
+
+def extract_type2_workbook(wb) -> List[Dict]:
+    """
+    Extract door data from an opened Type 2 workbook (read-only is fine) and map faults to B-codes.
+    
+    Returns:
+        List of door dictionaries with keys: door_id, location, faults, b_codes
+    """
+    return list(iter_type2_doors(wb))
+
+
+def iter_type2_doors(wb, sheet_names: Optional[List[str]] = None):
+    """
+    Lazily yield Type 2 doors from a workbook, sheet by sheet.
     
+    Args:
+        wb: Workbook (read-only keeps memory bounded by TYPE2_CLASSIFY_BATCH doors)
+        sheet_names: Only these sheets, in workbook order (default: all)
+    """
     # Process all sheets (some surveys have Floor 1, Floor 2, etc.)
     for sheet in wb.worksheets:
-        # Find header row (usually row 1 or 2)
-        # Look for row with multiple fault-related columns
-        header_row = 1
-        headers = [cell.value.lower() if cell.value else "" for cell in sheet[1]]
-        
-        # Count how many columns look like fault columns
-        fault_keywords = ['gap', 'seal', 'frame', 'hinge', 'lock', 'glass', 'strip', 'closer', 'ironmongery']
+        if sheet_names is None or sheet.title in sheet_names:
+            yield from iter_type2_sheet_doors(sheet)
+
+
+def iter_type2_sheet_doors(sheet):
+    """Yield the doors of one Type 2 worksheet, streaming its rows."""
+    # Find header row (usually row 1 or 2)
+    # Look for row with multiple fault-related columns
+    header_row = 1
+    headers = header_values(sheet, 1)
+    
+    # Count how many columns look like fault columns
+    fault_keywords = ['gap', 'seal', 'frame', 'hinge', 'lock', 'glass', 'strip', 'closer', 'ironmongery']
+    fault_col_count = sum(1 for h in headers if any(keyword in h for keyword in fault_keywords))
+    
+    # If row 1 doesn't have multiple fault columns, try row 2
+    if fault_col_count < 2:
+        header_row = 2
+        headers = header_values(sheet, 2)
         fault_col_count = sum(1 for h in headers if any(keyword in h for keyword in fault_keywords))
+    
+    # Find column indices
+    door_col = next((i for i, h in enumerate(headers) if 'door' in h and ('no' in h or 'number' in h or 'ref' in h)), None)
+    
+    # Fault columns: any column with door-related keywords, excluding the door number column
+    fault_cols = [i for i, h in enumerate(headers) if i != door_col and any(
+        keyword in h for keyword in ['gap', 'seal', 'frame', 'hinge', 'lock', 'glass', 'strip', 'closer', 'ironmongery', 'wall']
+    )]
+    
+    # If no specific fault columns found, use all columns except first 3 (usually ID/ref columns).
+    # Read-only rows are only as wide as their last value, so this is resolved per row below.
+    all_columns_from = 3 if not fault_cols else None
+    
+    # Extract doors (faults are classified in batches of TYPE2_CLASSIFY_BATCH doors)
+    batch = []
+    for row_idx, row in enumerate(sheet.iter_rows(min_row=header_row+1, values_only=True), start=header_row+1):
+        if not row or not any(row):  # Skip empty rows
+            continue
+            
+        door_id = row[door_col] if door_col is not None and door_col < len(row) else None
         
-        # If row 1 doesn't have multiple fault columns, try row 2
-        if fault_col_count < 2:
-            header_row = 2
-            headers = [cell.value.lower() if cell.value else "" for cell in sheet[2]]
-            fault_col_count = sum(1 for h in headers if any(keyword in h for keyword in fault_keywords))
-        
-        # Find column indices
-        door_col = next((i for i, h in enumerate(headers) if 'door' in h and ('no' in h or 'number' in h or 'ref' in h)), None)
-        
-        # Fault columns: any column with door-related keywords, excluding the door number column
-        fault_cols = [i for i, h in enumerate(headers) if i != door_col and any(
-            keyword in h for keyword in ['gap', 'seal', 'frame', 'hinge', 'lock', 'glass', 'strip', 'closer', 'ironmongery', 'wall']
-        )]
-        
-        # If no specific fault columns found, use all columns except first 3 (usually ID/ref columns)
-        if not fault_cols:
-            fault_cols = list(range(3, len(headers)))
+        # Skip rows where door_id is not a valid integer (filters out #VALUE!, headers, etc.)
+        if door_id is None:
+            continue
         
-        # Extract doors
-        for row_idx, row in enumerate(sheet.iter_rows(min_row=header_row+1, values_only=True), start=header_row+1):
-            if not row or not any(row):  # Skip empty rows
-                continue
+        # Try to convert to integer - if it fails, skip this row
+        try:
+            # Check if it's numeric (could be int or float)
+            if isinstance(door_id, (int, float)):
+                door_number = int(door_id)
+            else:
+                # Try to parse string as integer
+                door_number = int(str(door_id).strip())
+        except (ValueError, TypeError):
+            # Not a valid integer - skip this row (likely #VALUE! or header)
+            continue
+        
+        # Collect faults from relevant columns
+        faults = []
+        has_unable = False  # Track if any column contains "Unable"
+        
+        for col_idx in (fault_cols if all_columns_from is None else range(all_columns_from, len(row))):
+            if col_idx < len(row) and row[col_idx]:
+                fault_text = str(row[col_idx]).strip()
                 
-            door_id = row[door_col] if door_col is not None and door_col < len(row) else None
-            
-            # Skip rows where door_id is not a valid integer (filters out #VALUE!, headers, etc.)
-            if door_id is None:
-                continue
-            
-            # Try to convert to integer - if it fails, skip this row
-            try:
-                # Check if it's numeric (could be int or float)
-                if isinstance(door_id, (int, float)):
-                    door_number = int(door_id)
-                else:
-                    # Try to parse string as integer
-                    door_number = int(str(door_id).strip())
-            except (ValueError, TypeError):
-                # Not a valid integer - skip this row (likely #VALUE! or header)
-                continue
-            
-            # Collect faults from relevant columns
-            faults = []
-            b_codes = []
-            has_unable = False  # Track if any column contains "Unable"
+                # Check for "Unable" keyword (triggers orange flag)
+                if 'unable' in fault_text.lower():
+                    has_unable = True
+                
+                # Skip "OK", "None", "N/A", "NO", empty values
+                if fault_text and fault_text.upper() not in ['OK', 'NONE', 'N/A', 'NO', 'YES', '-']:
+                    faults.append(fault_text)
+        
+        if faults:  # Only add doors with actual faults
+            # FIX #2 (CORRECTED): Try to infer fire rating and door config from Excel data
+            # For Type 2, these are usually Unknown unless specified in the Excel
+            fire_rating = 'Unknown'
+            door_config = 'Single Leaf'  # Default assumption
+            is_replacement = False
             
-            for col_idx in fault_cols:
-                if col_idx < len(row) and row[col_idx]:
-                    fault_text = str(row[col_idx]).strip()
-                    
-                    # Check for "Unable" keyword (triggers orange flag)
-                    if 'unable' in fault_text.lower():
-                        has_unable = True
-                    
-                    # Skip "OK", "None", "N/A", "NO", empty values
-                    if fault_text and fault_text.upper() not in ['OK', 'NONE', 'N/A', 'NO', 'YES', '-']:
-                        faults.append(fault_text)
-                        # Map to B-code
-                        b_code = map_fault_to_bcode(fault_text)
-                        if b_code:
-                            b_codes.append(b_code)
+            # TODO: Check if Excel has columns for fire rating, dimensions, or config
+            # For now, use placeholders - will be PENDING in Quote Sheet
             
-            if faults:  # Only add doors with actual faults
-                # FIX #2 (CORRECTED): Try to infer fire rating and door config from Excel data
-                # For Type 2, these are usually Unknown unless specified in the Excel
-                fire_rating = 'Unknown'
-                door_config = 'Single Leaf'  # Default assumption
-                is_replacement = False
-                
-                # TODO: Check if Excel has columns for fire rating, dimensions, or config
-                # For now, use placeholders - will be PENDING in Quote Sheet
-                
-                all_doors.append({
-                    'door_id': f"{sheet.title}-{door_number}",  # Use validated integer door number
-                    'location': sheet.title,  # Use sheet name as location
-                    'faults': faults,
-                    'b_codes': list(set(b_codes)),  # Remove duplicates
-                    'has_unable': has_unable,  # Flag for orange highlighting
-                    'format_type': 'TYPE_2',  # Mark as Type 2 for PENDING logic
-                    'fire_rating': fire_rating,  # FIX #2: Add fire rating
-                    'door_config': door_config,  # FIX #2: Add door config
-                    'is_replacement': is_replacement  # FIX #2: Add replacement flag
-                })
-    
-    return all_doors
-
-
-def map_art_to_rate_card(art_codes: List[str]) -> List[str]:
-    """Map ART codes to WestPark rate card codes using the CSV mapping."""
-    rate_card_codes = []
-    for art_code in art_codes:
-        if art_code in ART_MAPPING:
-            rc_code = ART_MAPPING[art_code]['rate_card_code']
-            if rc_code and rc_code.strip() and rc_code not in ['FLAG FOR MANUAL REVIEW', 'NO EQUIVALENT']:
-                # Handle multi-code entries like "B01 / B02"
-                codes = [c.strip() for c in rc_code.split('/')]
-                rate_card_codes.extend(codes)
-    
-    return list(set(rate_card_codes))  # Remove duplicates
-
-
-def get_priority_bcode(codes: List[str]) -> str:
+            batch.append({
+                'door_id': f"{sheet.title}-{door_number}",  # Use validated integer door number
+                'location': sheet.title,  # Use sheet name as location
+                'faults': faults,
+                'b_codes': [],
+                'has_unable': has_unable,  # Flag for orange highlighting
+                'format_type': 'TYPE_2',  # Mark as Type 2 for PENDING logic
+                'fire_rating': fire_rating,  # FIX #2: Add fire rating
+                'door_config': door_config,  # FIX #2: Add door config
+                'is_replacement': is_replacement  # FIX #2: Add replacement flag
+            })
+            if len(batch) >= TYPE2_CLASSIFY_BATCH:
+                yield from _classify_type2_doors(batch)
+                batch = []
+    
+    yield from _classify_type2_doors(batch)
+
+
+def _classify_type2_doors(doors: List[Dict]) -> List[Dict]:
+    """Map a batch of doors' faults to B-codes (one classify_faults call per batch)."""
+    codes = iter(classify_faults([fault for door in doors for fault in door['faults']]))
+    for door in doors:
+        b_codes = [code for code in (next(codes) for _ in door['faults']) if code]
+        door['b_codes'] = list(set(b_codes))  # Remove duplicates
+    return doors
+
+
+def plan_type2_sheets(wb, workers: Optional[int] = None) -> List[List[str]]:
+    """
+    Split a read-only workbook's sheets into groups for parallel extraction.
+    
+    Sheets are balanced across groups by the size of their XML in the package
+    (largest first), so one group per worker finishes at about the same time.
+    Small workbooks, single sheets and a disabled process pool get one group.
+    
+    Args:
+        wb: Read-only workbook (sheet sizes come from its zip archive)
+        workers: Number of groups to aim for (default: process pool size)
+    
+    Returns:
+        Lists of sheet titles; a single group means extract serially
+    """
+    sheet_names = [ws.title for ws in wb.worksheets]
+    workers = FIREDOOR_PROCESS_WORKERS if workers is None else workers
+    archive = getattr(wb, '_archive', None)
+    if workers < 2 or len(sheet_names) < 2 or archive is None:
+        return [sheet_names]
+    
+    sizes = {ws.title: archive.getinfo(ws._worksheet_path).file_size for ws in wb.worksheets}
+    if sum(sizes.values()) < TYPE2_PARALLEL_MIN_BYTES:
+        return [sheet_names]
+    
+    groups = [[] for _ in range(min(workers, len(sheet_names)))]
+    loads = [0] * len(groups)
+    for name in sorted(sheet_names, key=lambda n: sizes[n], reverse=True):
+        smallest = loads.index(min(loads))
+        groups[smallest].append(name)
+        loads[smallest] += sizes[name]
+    return groups
+
+
+def parallel_extraction_allowed() -> bool:
+    """False inside a process-pool worker (no nested pools) or when the process pool is disabled."""
+    return FIREDOOR_PROCESS_WORKERS > 0 and multiprocessing.parent_process() is None
+
+
+def extract_type2_sheets(file_path: str, sheet_names: List[str]) -> Dict[str, List[Dict]]:
+    """
+    Extract the doors of some sheets of a Type 2 workbook (process-pool task).
+    
+    Returns:
+        Sheet title -> doors
+    """
+    with metrics.span("type2_extraction"), SurveyFile(file_path) as survey:
+        doors_by_sheet = {name: [] for name in sheet_names}
+        for door in iter_type2_doors(survey.workbook, sheet_names):
+            doors_by_sheet[door['location']].append(door)
+        return doors_by_sheet
+
+
+def merge_type2_sheets(sheet_names: List[str], results: List[Dict[str, List[Dict]]]) -> List[Dict]:
+    """Combine extract_type2_sheets results in workbook sheet order."""
+    merged = {}
+    for result in results:
+        merged.update(result)
+    return [door for name in sheet_names if name in merged for door in merged[name]]
+
+
+def extract_type2_parallel(file_path: str, sheet_groups: List[List[str]], sheet_names: List[str]) -> List[Dict]:
+    """Extract sheet groups concurrently in the shared process pool (blocking)."""
+    results = get_process_pool().map(extract_type2_sheets, [file_path] * len(sheet_groups), sheet_groups)
+    return merge_type2_sheets(sheet_names, list(results))
+
+
+def extraction_version(file_format: str) -> str:
+    """Version string for an extractor - part of the extraction cache key."""
+    if file_format == 'TYPE_1':
+        prompt = extraction_system_prompt() + (json.dumps(EXTRACTION_TOOL) if EXTRACTION_TOOL_USE else "")
+        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]
+        version = f"TYPE_1:{TYPE1_EXTRACTOR_VERSION}:{CLAUDE_MODEL}:{prompt_hash}"
+        # Claude sees different text with pre-processing on, off or changed
+        version += f":preprocess-{SURVEY_PREPROCESS_VERSION}" if EXTRACTION_PREPROCESS else ":raw"
+        if FIREDNA_PARSER:
+            version += f":firedna-{firedna_parser.FIREDNA_PARSER_VERSION}"
+        return version
+    return f"{file_format}:{TYPE2_EXTRACTOR_VERSION}"
+
+
+def lookup_cached_doors(file_path: str, file_format: str,
+                        sha256: Optional[str] = None) -> Tuple[Optional[str], Optional[List[Dict]]]:
+    """
+    Look up a survey file in the extraction cache.
+    
+    Args:
+        file_path: Survey file
+        file_format: 'TYPE_1' or 'TYPE_2'
+        sha256: File digest if already known (LoadedSurvey.sha256) - skips re-reading the file
+    
+    Returns:
+        (cache_key, doors) - doors is None on a miss; cache_key is None when
+        the cache is unavailable
+    """
+    if not DATABASE_AVAILABLE or extraction_cache is None:
+        return None, None
+    if sha256:
+        cache_key = extraction_cache.cache_key_for_digest(sha256, extraction_version(file_format))
+    else:
+        try:
+            cache_key = extraction_cache.compute_cache_key(file_path, extraction_version(file_format))
+        except OSError as e:
+            logger.warning(f"Could not hash survey file for extraction cache: {e}")
+            return None, None
+    return cache_key, extraction_cache.get_cached_doors(cache_key)
+
+
+def store_cached_doors(cache_key: Optional[str], file_format: str, doors: List[Dict]):
+    """Store an extraction result under the key returned by lookup_cached_doors."""
+    if cache_key and doors and extraction_cache is not None:
+        extraction_cache.store_doors(cache_key, file_format, doors)
+
+
+@dataclass
+class LoadedSurvey:
+    """
+    An upload after its single parse (picklable, so it can come back from the process pool).
+    
+    Attributes:
+        path: Survey file
+        file_format: 'TYPE_1', 'TYPE_2' or 'UNKNOWN'
+        sha256: File digest (extraction cache key)
+        text: Full survey text (Type 1) - goes to Claude on a cache miss
+        doors: Extracted doors (Type 2), or None if the sheets are to be extracted in parallel
+        sheet_names: Type 2 worksheets, in workbook order
+        sheet_groups: Type 2 sheet groups for parallel extraction (see plan_type2_sheets)
+    """
+    path: str
+    file_format: str
+    sha256: str
+    text: Optional[str] = None
+    doors: Optional[List[Dict]] = None
+    sheet_names: Optional[List[str]] = None
+    sheet_groups: Optional[List[List[str]]] = None
+
+
+def load_survey(file_path: str, filename: str) -> LoadedSurvey:
+    """
+    Sniff, hash and parse an upload in one pass: Type 1 text comes from the same
+    PDF document used for detection, Type 2 doors from the same read-only workbook.
+    
+    Large multi-sheet Type 2 workbooks are only planned here (doors=None, sheet_groups
+    set): this usually runs in a process-pool worker, so the caller fans the sheet
+    groups out across the pool (extract_type2_sheets) instead.
+    
+    Raises:
+        ValueError: If text extraction fails
+    """
+    with SurveyFile(file_path, filename) as survey:
+        with metrics.span("detect_format"):
+            file_format = survey.file_format
+        loaded = LoadedSurvey(path=str(file_path), file_format=file_format, sha256=survey.sha256)
+        if loaded.file_format == 'TYPE_1':
+            with metrics.span("text_extraction"):
+                loaded.text = survey_text(survey)
+        elif loaded.file_format == 'TYPE_2':
+            loaded.sheet_names = survey.workbook.sheetnames
+            loaded.sheet_groups = plan_type2_sheets(survey.workbook)
+            if len(loaded.sheet_groups) == 1:
+                with metrics.span("type2_extraction"):
+                    loaded.doors = extract_type2_workbook(survey.workbook)
+        return loaded
+
+
+def extract_loaded_doors(survey: LoadedSurvey) -> List[Dict]:
     """
-    Get the priority B-code from a list of codes.
-    Priority order: B01 > B03 > B04 > B10 > B05 > B02 > B06 > B07
+    Doors for a loaded survey, using the extraction cache (Type 1 goes to Claude on a miss).
+    
+    Raises:
+        ValueError: If the format is unsupported or extraction fails
+    """
+    if survey.file_format not in ('TYPE_1', 'TYPE_2'):
+        raise ValueError(f"Unsupported format: {survey.file_format}")
+    
+    cache_key, cached_doors = lookup_cached_doors(survey.path, survey.file_format, survey.sha256)
+    if cached_doors is not None:
+        return cached_doors
+    
+    if survey.file_format == 'TYPE_1':
+        doors = extract_type1_from_text(survey.text)
+    elif survey.doors is not None:
+        doors = survey.doors
+    elif parallel_extraction_allowed():
+        doors = extract_type2_parallel(survey.path, survey.sheet_groups, survey.sheet_names)
+    else:
+        doors = merge_type2_sheets(survey.sheet_names, [extract_type2_sheets(survey.path, survey.sheet_names)])
+    store_cached_doors(cache_key, survey.file_format, doors)
+    return doors
+
+
+def extract_doors(file_path: str, file_format: str) -> List[Dict]:
+    """
+    Extract doors for a detected survey format, using the extraction cache.
+    
+    A repeat upload of the same file (same bytes, same extractor version) returns
+    the cached doors list and skips extract_type1_pdf/extract_type2_excel entirely.
+    
+    Raises:
+        ValueError: If the format is unsupported or extraction fails
+    """
+    if file_format == 'TYPE_1':
+        extractor = extract_type1_pdf
+    elif file_format == 'TYPE_2':
+        extractor = extract_type2_excel
+    else:
+        raise ValueError(f"Unsupported format: {file_format}")
     
-    BUG 2 FIX: This ensures the primary B-code follows the correct priority
-    for Quote Sheet COUNTIF formulas.
+    cache_key, cached_doors = lookup_cached_doors(file_path, file_format)
+    if cached_doors is not None:
+        return cached_doors
+    
+    doors = extractor(file_path)
+    store_cached_doors(cache_key, file_format, doors)
+    return doors
+
+
+def map_art_to_rate_card(art_codes: List[str], snapshot: Optional[rate_card.RateCardSnapshot] = None) -> List[str]:
+    """Map ART codes to WestPark rate card codes using the rate card snapshot."""
+    if snapshot is None:
+        snapshot = rate_card.get_snapshot()
+    return snapshot.rate_card_codes(art_codes)
+
+
+# Parsed template workbooks, pickled, keyed by path: {path: ((mtime_ns, size), bytes)}
+# load_workbook on the cost sheet is one of the slowest steps of a quote; unpickling
+# the snapshot gives each request its own independent copy in a fraction of the time.
+_template_cache: Dict[str, Tuple[Tuple[int, int], bytes]] = {}
+_template_cache_lock = threading.Lock()
+
+
+def load_template_workbook(template_path: str):
     """
-    if not codes:
-        return ''
+    Load a template workbook via the in-process snapshot cache.
     
-    priority_order = ['B01', 'B03', 'B04', 'B10', 'B05', 'B02', 'B06', 'B07', 'B11', 'B12']
+    The template is parsed once per process and re-parsed only when the file's
+    mtime or size changes. Every call returns a fresh copy that can be modified
+    freely without affecting other requests.
     
-    for priority_code in priority_order:
-        if priority_code in codes:
-            return priority_code
+    Raises:
+        FileNotFoundError: If the template does not exist
+    """
+    path = str(Path(template_path).resolve())
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    
+    with _template_cache_lock:
+        cached = _template_cache.get(path)
+        if cached is None or cached[0] != signature:
+            logger.info(f"Parsing template workbook (cache {'stale' if cached else 'empty'}): {path}")
+            snapshot = pickle.dumps(load_workbook(path), protocol=pickle.HIGHEST_PROTOCOL)
+            cached = (signature, snapshot)
+            _template_cache[path] = cached
+    
+    return pickle.loads(cached[1])
+
+
+# Door Schedule row colours by DoorLine.status
+DOOR_STATUS_FILLS = {
+    'compliant': PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid"),  # Light green
+    'remedial': PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid"),  # Light yellow
+    'replacement': PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid"),  # Light red
+    'manual_review': PatternFill(start_color="FED8B1", end_color="FED8B1", fill_type="solid"),  # Light orange
+}
+
+# Material Call-Off rows: (row, B-code, multiplier). B07 (signage) × 2 because each door needs 2 signs
+MATERIAL_CALLOFF_ROWS = [
+    (13, 'B03', 1),  # Closers
+    (14, 'B04', 1),  # Hinges
+    (15, 'B01', 1),  # Seals
+    (16, 'B02', 1),  # Intumescent only
+    (17, 'B07', 2),  # Signage
+    (18, 'B09', 1),  # Drop seal
+    (19, 'B05', 1),  # Lever handles/latch
+    (20, 'B06', 1),  # Intumescent mastic
+    (22, 'B10', 1),  # MAURICIO FIX: Re-hang / adjust door leaf (DEVVIE FIX: moved from row 20)
+    (21, 'B11', 1),  # Hardwood lipping
+    (22, 'B12', 1),  # Hardwood void infill (written last - shares row 22 with B10)
+]
+
+TYPE1_COMPLIANCE_NOTE = (
+    "This report identifies fire doors requiring remedial works to achieve compliance with "
+    "Approved Document B and the Regulatory Reform (Fire Safety) Order 2005. Works are categorized "
+    "as Option A (remedial works) or Option B (full replacement). All prices exclude VAT and are "
+    "subject to site survey confirmation."
+)
+TYPE2_COMPLIANCE_NOTE = (
+    "This report identifies fire doors requiring remedial works based on visual inspection. "
+    "Option A provides remedial works to address identified faults. Option B (full replacement) "
+    "cannot be priced without fire strategy drawings - please request these from the client if "
+    "replacement doors are required. All prices exclude VAT and are subject to site survey confirmation."
+)
+
+
+# Excel's limit on characters in one cell - longer text makes Excel "repair" the file
+EXCEL_CELL_MAX_CHARS = 32767
+
+
+def join_door_ids(door_ids: List[str], limit: int = EXCEL_CELL_MAX_CHARS) -> str:
+    """Comma-separated door IDs for a Quote Sheet DOOR IDs cell, truncated to fit in one cell."""
+    text = ', '.join(door_ids)
+    if len(text) <= limit:
+        return text
+    shown = []
+    length = 0
+    for i, door_id in enumerate(door_ids):
+        suffix = f", … (+{len(door_ids) - i} more)"
+        if length + len(door_id) + 2 + len(suffix) > limit:
+            return ', '.join(shown) + suffix
+        shown.append(door_id)
+        length += len(door_id) + 2
+    return text
+
+
+def register_fills(wb, fills: Dict[str, PatternFill]) -> Dict[str, int]:
+    """
+    Add fills to the workbook's style table once and return their ids.
     
-    # If none match priority list, return first code
-    return codes[0]
+    Assigning cell.fill hashes the PatternFill and looks it up on every assignment;
+    on a 5,000-door survey that was most of the Door Schedule render time.
+    """
+    return {key: wb._fills.add(fill) for key, fill in fills.items()}
+
+
+def set_fill_id(cell, fill_id: int):
+    """Set a cell's fill to a registered fill id (what assigning cell.fill does, minus the lookup)."""
+    if not cell._style:
+        cell._style = StyleArray()
+    cell._style.fillId = fill_id
+
 
+# Door Schedule columns written per door (A-X)
+DOOR_SCHEDULE_COLUMNS = 24
 
-def get_aseries_description(a_code: str) -> str:
+
+def door_schedule_values(line: DoorLine) -> list:
+    """Cell values for a door's Door Schedule row, columns A-X."""
+    # Column mapping based on Door Schedule template (updated Mar 2026 - 9 FIXES):
+    # A=DOOR ID, B=LOCATION, C=DOOR TYPE, D=CURRENT RATING, E=LEAF CONFIG,
+    # F=LEAF SIZE, G=FINISH, H=SEALS, I=CLOSER, J=VISION PANEL,
+    # K=ACTION DESCRIPTION, L=SEVERITY, M=DUE DATE,
+    # N=OPT A REMEDIAL?, O=OPT B REPLACE?, P=OPT A BASE ITEM (primary B-code),
+    # Q=QTY (1 or 0), R-U=E/O (OVERSIZE/HARDWOOD/EXTERNAL/VISION), V=NOTES/FLAGS,
+    # W=ALL B CODES (comma-separated, ISSUE 1 FIX), X=OPT B REPLACEMENT CODE (A-series)
+    return [
+        line.door_id, line.location, 'From Survey', line.fire_rating, line.door_config,
+        'Unknown', 'Paint', 'To Check', 'To Check', 'To Check',  # F-J placeholders
+        line.faults, line.severity, None,
+        line.opt_a, line.opt_b, line.primary_code, line.qty,
+        'NO', 'NO', 'NO', 'NO',  # E/O flags
+        line.flags or None, line.all_b_codes, line.a_code,
+    ]
+
+
+def write_door_schedule_row(ws, row_num: int, line: DoorLine, fill_id: int):
     """
-    Get the description for an A-series replacement code.
+    Write one DoorLine to a Door Schedule row (columns A-X) and colour it.
     
     Args:
-        a_code: A-series code (A01-A15)
-    
-    Returns:
-        Description string with format: "A01 — FD30 Single Leaf, ≤2040mm"
+        ws: Door Schedule worksheet
+        row_num: Row to write
+        line: Door to write
+        fill_id: Row fill, as returned by register_fills()
     """
-    descriptions = {
-        'A01': 'A01 — FD30 Single Leaf, ≤2040mm',
-        'A02': 'A02 — FD30 Single Leaf, 2040-2400mm',
-        'A03': 'A03 — FD30 Single Leaf, 2400-2730mm',
-        'A04': 'A04 — FD30 Double Leaf, ≤2040mm',
-        'A05': 'A05 — FD30S Single Leaf, ≤2040mm',
-        'A06': 'A06 — FD30S Single Leaf, 2040-2400mm',
-        'A07': 'A07 — FD30S Single Leaf, 2400-2730mm',
-        'A08': 'A08 — FD30S Double Leaf, ≤2040mm',
-        'A09': 'A09 — FD60S Single Leaf, ≤2040mm',
-        'A10': 'A10 — FD60S Single Leaf, 2040-2400mm',
-        'A11': 'A11 — FD60S Double Leaf, ≤2040mm',
-        'A12': 'A12 — Reserved',
-        'A13': 'A13 — Reserved',
-        'A14': 'A14 — Reserved',
-        'A15': 'A15 — Reserved',
-    }
-    return descriptions.get(a_code, '')
+    for col, value in enumerate(door_schedule_values(line), start=1):
+        cell = ws.cell(row=row_num, column=col)
+        cell.value = value
+        set_fill_id(cell, fill_id)
 
 
-def map_to_aseries_code(fire_rating: str, door_config: str, door_height: int = None, explicit_mapping: bool = False) -> str:
+def render_quote_workbook(wb, model: QuoteModel, client_name: str,
+                          renderer: str = 'openpyxl') -> Optional[SheetRowStreamer]:
     """
-    Map fire rating + door configuration + height to A-series replacement code.
+    Render a QuoteModel into the cost sheet template: Door Schedule rows, Quote Sheet
+    line items and totals, Client Summary and Material Call-Off.
+    
+    Formulas in the template are kept for manual editing; the computed values are
+    written alongside so they display immediately.
     
     Args:
-        fire_rating: Fire rating (FD60, FD60S, FD30, FD30S, Nominal, etc.)
-        door_config: Door configuration ("Single Leaf" or "Double Leaf")
-        door_height: Door height in mm (optional, defaults to ≤2040 range)
-        explicit_mapping: If True, use exact FD30 → A01/A02/A03/A04 (no smoke seals default)
-                         If False (default), use FD30 → A05/A06/A07/A08 (with smoke seals)
+        wb: Template workbook
+        model: Quote to render
+        client_name: Client name for the header
+        renderer: 'openpyxl' writes Door Schedule rows as cells; 'streaming' leaves them
+            to the returned SheetRowStreamer, to be written after wb.save()
     
     Returns:
-        A-series code (A01-A15) or empty string if no match
-    
-    Full mapping table (from Mauricio 2026-03-27):
-        FD30 Single ≤2040 → A01 (explicit) or A05 (default with smoke)
-        FD30 Single 2040–2400 → A02 (explicit) or A06 (default with smoke)
-        FD30 Single 2400–2730 → A03 (explicit) or A07 (default with smoke)
-        FD30 Double ≤2040 → A04 (explicit) or A08 (default with smoke)
-        FD30S Single ≤2040 → A05
-        FD30S Single 2040–2400 → A06
-        FD30S Single 2400–2730 → A07
-        FD30S Double ≤2040 → A08
-        FD60S Single ≤2040 → A09
-        FD60S Single 2040–2400 → A10
-        FD60S Double ≤2040 → A11
-        Nominal Single → A05 (default to FD30S)
-        Nominal Double → A08 (default to FD30S)
-    
-    Note: S suffix = smoke seals. FD30 ≠ FD30S
-    ISSUE 2 FIX: explicit_mapping=True for mandatory replacement doors (ART17/18/20)
+        The Door Schedule streamer for the 'streaming' renderer, otherwise None
     """
-    if not fire_rating or not door_config:
-        return ''
-    
-    rating_upper = str(fire_rating).upper()
-    config_lower = str(door_config).lower()
-    
-    # Normalize config
-    is_single = 'single' in config_lower
-    is_double = 'double' in config_lower
-    
-    # Default to ≤2040 range if height not provided
-    if door_height is None or door_height <= 2040:
-        height_range = 1  # ≤2040
-    elif door_height <= 2400:
-        height_range = 2  # 2040-2400
-    elif door_height <= 2730:
-        height_range = 3  # 2400-2730
+    # Update client name in Quote Sheet
+    try:
+        quote_sheet = wb["Quote Sheet"]
+    except KeyError as e:
+        error_msg = f"Quote Sheet not found in template. Available sheets: {wb.sheetnames}"
+        logger.error(error_msg)
+        raise RuntimeError(error_msg) from e
+    quote_sheet['B4'] = client_name  # B4 is the Client field
+    quote_sheet['R2'] = model.target_margin  # Margin the template formulas use (differs on re-quotes)
+    if model.is_type2:
+        # BUG 4 FIX: Clear site/building for Type 2 surveys (no site address in Excel files)
+        quote_sheet['B5'] = ''
+        quote_sheet['B6'] = ''
+    
+    try:
+        ws = wb["Door Schedule"]
+    except KeyError as e:
+        error_msg = f"Door Schedule sheet not found in template. Available sheets: {wb.sheetnames}"
+        logger.error(error_msg)
+        raise RuntimeError(error_msg) from e
+    
+    # Data starts at row 4 (row 3 is headers)
+    start_row = 4
+    
+    fill_ids = register_fills(wb, dict(DOOR_STATUS_FILLS, none=PatternFill()))
+    streamer = None
+    if renderer == 'streaming':
+        # Rows are generated from the model after save - same cells, no Cell objects
+        streamer = SheetRowStreamer(
+            ws, start_row, DOOR_SCHEDULE_COLUMNS,
+            row_fill_ids=[fill_ids[line.status] for line in model.doors],
+            clear_fill_id=fill_ids['none']
+        )
     else:
-        height_range = 1  # Fallback to base code
-    
-    # Map based on rating + config + height
-    # ISSUE 2 FIX: For explicit_mapping=True, use exact FD30 codes (A01-A04) without smoke seal default
-    # For explicit_mapping=False (default), FD30 defaults to FD30S (A05-A08) per Mauricio's brief
-    if rating_upper == 'FD30':
-        if explicit_mapping:
-            # Exact mapping for replacement doors (ART17/18/20) - no smoke seal default
-            if is_single:
-                if height_range == 1:
-                    return 'A01'  # FD30 single ≤2040mm (exact, no smoke)
-                elif height_range == 2:
-                    return 'A02'  # FD30 single 2040-2400mm (exact, no smoke)
-                elif height_range == 3:
-                    return 'A03'  # FD30 single 2400-2730mm (exact, no smoke)
-            elif is_double:
-                return 'A04'  # FD30 double ≤2040mm (exact, no smoke)
-        else:
-            # Default mapping with smoke seals for remedial doors
-            if is_single:
-                if height_range == 1:
-                    return 'A05'  # FD30 defaults to FD30S single ≤2040mm (with smoke)
-                elif height_range == 2:
-                    return 'A06'  # FD30 defaults to FD30S single 2040-2400mm (with smoke)
-                elif height_range == 3:
-                    return 'A07'  # FD30 defaults to FD30S single 2400-2730mm (with smoke)
-            elif is_double:
-                return 'A08'  # FD30 defaults to FD30S double ≤2040mm (with smoke)
-    
-    # Check for FD30S (with S)
-    elif 'FD30S' in rating_upper:
-        if is_single:
-            if height_range == 1:
-                return 'A05'
-            elif height_range == 2:
-                return 'A06'
-            elif height_range == 3:
-                return 'A07'
-        elif is_double:
-            return 'A08'  # FD30S double (with smoke seals)
-    
-    # Check for FD60 or FD60S (treat FD60 same as FD60S)
-    elif 'FD60' in rating_upper:  # Matches both FD60 and FD60S
-        if is_single:
-            if height_range == 1:
-                return 'A09'
-            elif height_range == 2:
-                return 'A10'
-            elif height_range == 3:
-                # Height > 2400mm - outside standard range, use A10 (largest available)
-                logger.warning(f"FD60 single door height > 2400mm - using A10 (standard range exceeded)")
-                return 'A10'
-        elif is_double:
-            return 'A11'
-    
-    # Nominal defaults to FD30S
-    elif 'NOMINAL' in rating_upper:
-        if is_single:
-            return 'A05'  # Default to FD30S single ≤2040
-        elif is_double:
-            return 'A08'  # Default to FD30S double
-    
-    return ''  # No match
-
-
-def populate_excel_template(doors: List[Dict], client_name: str, template_path: str, output_path: str):
+        for idx, line in enumerate(model.doors):
+            write_door_schedule_row(ws, start_row + idx, line, fill_ids[line.status])
+        
+        # BUG 5 FIX + 9 FIXES: Clear template/example rows below the doors, columns A-X (24).
+        # Rows holding doors were fully overwritten above, so any survey size fits.
+        end_row = start_row + len(model.doors)
+        for row in ws.iter_rows(min_row=end_row, max_row=ws.max_row, max_col=DOOR_SCHEDULE_COLUMNS):
+            for cell in row:
+                cell.value = None
+                set_fill_id(cell, fill_ids['none'])  # Clear fill
+    
+    logger.info(f"Option A B-code counts: {model.b_code_counts}")
+    logger.info(f"Option B A-code counts: {model.a_code_counts}")
+    opt_a_yes_count = model.opt_a_yes_count
+    if opt_a_yes_count > 0 and not model.b_code_counts:
+        logger.error(f"VALIDATION ERROR: {opt_a_yes_count} doors have OptA=YES but 0 B-codes counted!")
+    
+    # ISSUE 4: B12 Verification - log door IDs to verify against source
+    if 'B12' in model.b_code_counts:
+        logger.info(f"🔍 B12 (void infill) count: {model.b_code_counts['B12']}, "
+                    f"doors: {', '.join(model.b_code_door_ids.get('B12', []))}")
+    
+    # DEVVIE FIX: Clear T&J and Hump header cells (excluded from calculations)
+    for row in [8, 9, 10]:
+        for col in range(1, 20):
+            val = quote_sheet.cell(row=row, column=col).value
+            if val and ('T&J' in str(val) or 'T & J' in str(val) or 'HUMP' in str(val).upper()):
+                quote_sheet.cell(row=row, column=col).value = None
+    
+    # FIX #8: Clear ALL prelim quantities - rows 43-47 in Quote Sheet
+    # Prelims must be left blank for Matt to fill in manually per job
+    for prelim_row in [43, 44, 45, 46, 47]:  # Mobilisation + P.01-P.04
+        quote_sheet.cell(row=prelim_row, column=3).value = None  # Column C (QTY) = blank
+    
+    # Option A line items (FIX #6: MATS/LAB totals, TOTAL COST, TOTAL with margin)
+    for line in model.option_a_lines:
+        row_num = BCODE_ROWS[line.code]
+        quote_sheet.cell(row=row_num, column=3).value = line.qty               # Column C (QTY)
+        quote_sheet.cell(row=row_num, column=4).value = line.materials_rate    # Column D (MAT'S rate)
+        quote_sheet.cell(row=row_num, column=5).value = line.labour_rate       # Column E (LAB rate)
+        quote_sheet.cell(row=row_num, column=7).value = line.materials_total   # Column G (MAT'S TOTAL)
+        quote_sheet.cell(row=row_num, column=9).value = line.labour_total      # Column I (LAB TOTAL)
+        quote_sheet.cell(row=row_num, column=15).value = line.cost_total       # Column O (TOTAL COST)
+        quote_sheet.cell(row=row_num, column=16).value = line.client_total     # Column P (TOTAL with margin)
+        # FIX #3: Zero T&J and Humping rates so column O = Materials + Labour only
+        quote_sheet.cell(row=row_num, column=11).value = 0                     # Column K (T&J rate)
+        quote_sheet.cell(row=row_num, column=13).value = 0                     # Column M (Humping rate)
+        quote_sheet.cell(row=row_num, column=19).value = join_door_ids(line.door_ids)  # Column S (DOOR IDs)
+    
+    option_a_cost = float(model.option_a_cost)
+    option_a_client = model.option_a_client
+    option_b_cost = float(model.option_b_cost)
+    option_b_client = model.option_b_client
+    logger.info(f"Option A cost: £{option_a_cost}, client price (with {model.target_margin*100}% margin): £{option_a_client}")
+    logger.info(f"Option B cost: £{option_b_cost}, client price (with {model.target_margin*100}% margin): £{option_b_client}")
+    
+    # Quote Sheet shows COST totals (no margin); Client Summary shows CLIENT PRICE (with margin)
+    quote_sheet.cell(row=23, column=6).value = option_a_cost  # F23 (Option A subtotal)
+    quote_sheet.cell(row=49, column=6).value = option_a_cost  # F49 (DEVVIE FIX: OPTION A TOTAL row)
+    
+    # Option B line items (rows 26-40)
+    for line in model.option_b_lines:
+        row_num = ACODE_ROWS[line.code]
+        quote_sheet.cell(row=row_num, column=1).value = line.code              # Column A (ITEM CODE)
+        quote_sheet.cell(row=row_num, column=3).value = line.qty               # Column C (QTY)
+        quote_sheet.cell(row=row_num, column=4).value = line.description       # Column D (DESCRIPTION with A-code)
+        quote_sheet.cell(row=row_num, column=5).value = line.rate              # Column E (RATE = Rate Card Total)
+        quote_sheet.cell(row=row_num, column=6).value = line.cost_total        # Column F (TOTAL = QTY × RATE)
+        quote_sheet.cell(row=row_num, column=11).value = 0                     # Column K (T&J rate)
+        quote_sheet.cell(row=row_num, column=13).value = 0                     # Column M (Humping rate)
+        quote_sheet.cell(row=row_num, column=19).value = join_door_ids(line.door_ids)  # Column S (DOOR IDs)
+    
+    option_b_total = option_b_cost if option_b_cost > 0 else 0.0
+    quote_sheet.cell(row=42, column=6).value = option_b_total  # F42 (Option B subtotal)
+    quote_sheet.cell(row=50, column=6).value = option_b_total  # F50 (DEVVIE FIX: OPTION B TOTAL row)
+    
+    # Client Summary (FIX #5: CLIENT PRICES with margin)
+    client_summary = wb['Client Summary']
+    # HIGH FIX #4: Column label "NET COST" -> "Internal Cost (ex margin)"
+    if client_summary.cell(row=9, column=3).value:
+        client_summary.cell(row=9, column=3).value = "Internal Cost (ex margin)"
+    client_summary.cell(row=10, column=3).value = option_a_cost    # C10 = Internal Cost (ex margin)
+    client_summary.cell(row=10, column=4).value = option_a_client  # D10 = OPTION A CLIENT PRICE
+    if option_b_client > 0:
+        client_summary.cell(row=11, column=5).value = option_b_client  # E11 = Option B CLIENT PRICE
+    
+    # URGENT FIX #5: Option A and B are mutually exclusive - TOTAL INVESTMENT shows each separately
+    client_summary.cell(row=13, column=4).value = option_a_client  # D13 = Option A only
+    client_summary.cell(row=13, column=5).value = option_b_client if option_b_client > 0 else ""  # E13 = Option B only
+    
+    # Header values from Quote Sheet: Client, Site, Building, Date, Quote Ref
+    client_summary.cell(row=3, column=2).value = quote_sheet['B4'].value
+    client_summary.cell(row=4, column=2).value = quote_sheet['B5'].value  # may be blank for Type 2
+    client_summary.cell(row=5, column=2).value = quote_sheet['B6'].value  # may be blank for Type 2
+    client_summary.cell(row=6, column=5).value = quote_sheet['B3'].value
+    client_summary.cell(row=7, column=2).value = quote_sheet['B2'].value
+    
+    # Option B is PENDING for Type 2 surveys (no fire strategy) unless it could be priced
+    if model.is_type2 and option_b_client == 0:
+        client_summary.cell(row=11, column=5).value = "PENDING — fire strategy required"
+    
+    # ISSUE #5 FIX: Compliance note (column A, rows 15-25) depends on survey type
+    compliance_note = TYPE2_COMPLIANCE_NOTE if model.is_type2 else TYPE1_COMPLIANCE_NOTE
+    for row in range(15, 26):
+        cell_value = client_summary.cell(row=row, column=1).value
+        if cell_value and isinstance(cell_value, str):
+            lowered = cell_value.lower()
+            if ('compliance' in lowered or 'approved document' in lowered or
+                    'fire safety order' in lowered or 'remedial works' in lowered):
+                client_summary.cell(row=row, column=1).value = compliance_note
+                break
+    else:
+        logger.error("ISSUE #5: Could not find compliance note cell in Client Summary rows 15-25")
+    
+    # Verification notes for every door mapped to an A-series code
+    verification_notes = model.verification_notes
+    if verification_notes:
+        notes_start_row = 18
+        client_summary.cell(row=notes_start_row, column=1).value = "VERIFICATION NOTES"
+        for i, note in enumerate(verification_notes):
+            client_summary.cell(row=notes_start_row + 1 + i, column=1).value = note
+        logger.info(f"Added {len(verification_notes)} verification note(s) to Client Summary")
+    
+    # FIX #9: Material Call-Off counts (same per-door B-code counts as Option A)
+    if "Material Call-Off" in wb.sheetnames:
+        material_calloff = wb["Material Call-Off"]
+        component_counts = model.material_counts
+        for row_num, b_code, multiplier in MATERIAL_CALLOFF_ROWS:
+            material_calloff.cell(row=row_num, column=4).value = component_counts.get(b_code, 0) * multiplier
+        material_calloff.cell(row=22, column=2).value = "Re-hang / adjust door leaf — carpenter"
+        logger.info(f"Material Call-Off populated: {component_counts}")
+    
+    logger.info("=== Line item numbers + header values written ===")
+    return streamer
+
+
+def populate_excel_template(doors: List[Dict], client_name: str, template_path: str, output_path: str,
+                            snapshot: Optional[rate_card.RateCardSnapshot] = None,
+                            renderer: Optional[str] = None, target_margin: Optional[float] = None):
     """
     Populate Excel template with door data and color code rows.
     
+    The quote itself (codes, counts, totals, margins) is computed by QuoteModel;
+    this loads the template, applies rate card prices and renders the model.
+    
     9 FIXES IMPLEMENTATION (Westley Harnett feedback, 28 Mar 2026):
     
     FIX #1-2: Door Schedule Column Restructure
@@ -828,6 +1572,9 @@ def populate_excel_template(doors: List[Dict], client_name: str, template_path:
         client_name: Client name for the header
         template_path: Path to template Excel file
         output_path: Path to save output file
+        snapshot: Rate card snapshot to price with (defaults to the current one)
+        renderer: Door Schedule renderer, 'openpyxl' or 'streaming' (defaults to FIREDOOR_RENDERER)
+        target_margin: Gross margin override, e.g. 0.3 (defaults to the template's Quote Sheet R2)
     """
     import logging
     from pathlib import Path
@@ -846,215 +1593,37 @@ def populate_excel_template(doors: List[Dict], client_name: str, template_path:
     logger.info(f"Processing {len(doors)} doors for client: {client_name}")
     
     try:
-        wb = load_workbook(template_path)
+        with metrics.span("workbook_load"):
+            wb = load_template_workbook(template_path)
         logger.info(f"Template loaded successfully. Sheets: {wb.sheetnames}")
     except Exception as e:
         error_msg = f"Failed to load template workbook: {str(e)}"
         logger.error(error_msg)
         raise RuntimeError(error_msg) from e
     
-    # Update Rate Card sheet with database prices
-    if DATABASE_AVAILABLE:
-        try:
-            db = next(get_db())
-            rate_items = db.query(RateCardItem).all()
-            
-            # Always extract template prices for backfilling
-            template_prices = {}
-            if "Rate Card" in wb.sheetnames:
-                rate_card_sheet = wb["Rate Card"]
-                for row_num in range(6, 40):
-                    code = rate_card_sheet.cell(row=row_num, column=1).value
-                    if code:
-                        # FIX #4: Use Materials + Labour only (not T&J or Humping)
-                        mat = rate_card_sheet.cell(row=row_num, column=4).value or 0
-                        lab = rate_card_sheet.cell(row=row_num, column=5).value or 0
-                        # tj = rate_card_sheet.cell(row=row_num, column=6).value or 0  # Removed
-                        # hump = rate_card_sheet.cell(row=row_num, column=7).value or 0  # Removed
-                        total = mat + lab  # Materials + Labour only
-                        if total > 0:
-                            template_prices[str(code)] = f"£{total:.2f}"
-                logger.info(f"Extracted {len(template_prices)} prices from template")
-            
-            if not rate_items:
-                # Database is empty - seed ALL codes from template
-                logger.info("Database empty - auto-seeding ALL codes from template...")
-                import csv
-                
-                # First, create a map of ART code descriptions from CSV
-                art_descriptions = {}
-                csv_path = Path(__file__).parent / "reference_files" / "BMTrada_ART_Codes_RateCard_Mapping.csv"
-                if csv_path.exists():
-                    with open(csv_path, 'r', encoding='utf-8') as f:
-                        reader = csv.DictReader(f)
-                        for row in reader:
-                            art_code = row['ART Code']
-                            description = row['Description']
-                            rate_card_code = row['WestPark Rate Card Code']
-                            
-                            # Map rate card code to ART description
-                            if rate_card_code and rate_card_code.strip() not in ['', 'FLAG FOR MANUAL REVIEW', 'NO EQUIVALENT']:
-                                codes = [c.strip() for c in rate_card_code.split('/')]
-                                for code in codes:
-                                    if code not in art_descriptions:
-                                        art_descriptions[code] = (art_code, description)
-                
-                # Now seed ALL B-codes from template (rows 22-33 in Rate Card sheet)
-                if "Rate Card" in wb.sheetnames:
-                    rate_card_sheet = wb["Rate Card"]
-                    seeded_count = 0
-                    
-                    for row_num in range(22, 34):  # B01-B12
-                        code = rate_card_sheet.cell(row=row_num, column=1).value
-                        rate_card_desc = rate_card_sheet.cell(row=row_num, column=2).value  # B-code description
-                        
-                        if code and str(code).startswith('B'):
-                            # Get price from template
-                            unit_price = template_prices.get(str(code), "£0.00")
-                            
-                            # Get ART code mapping if exists
-                            art_info = art_descriptions.get(str(code), (str(code), rate_card_desc or ""))
-                            art_code, art_desc = art_info
-                            
-                            # Create database entry
-                            new_item = RateCardItem(
-                                art_code=art_code,
-                                description=art_desc[:500] if art_desc else "",  # ART description
-                                rate_card_code=str(code),
-                                rate_card_description=rate_card_desc[:500] if rate_card_desc else "",  # B-code description
-                                unit_price=unit_price,
-                                category="From template"
-                            )
-                            db.add(new_item)
-                            seeded_count += 1
-                    
-                    db.commit()
-                    logger.info(f"Auto-seeded {seeded_count} B-codes from template with prices")
-                    
-                    # Re-query to get the seeded items
-                    rate_items = db.query(RateCardItem).all()
-                else:
-                    logger.warning("Rate Card sheet not found - cannot auto-seed")
+    # Update Rate Card sheet with rate card prices (one consistent snapshot for the whole quote)
+    if snapshot is None:
+        snapshot = rate_card.get_snapshot()
+    logger.info(f"Using rate card snapshot v{snapshot.version} ({snapshot.source}, {len(snapshot.prices)} prices)")
+    
+    if snapshot.prices:
+        if "Rate Card" in wb.sheetnames:
+            rate_card_sheet = wb["Rate Card"]
+            updated_count = 0
             
-            if rate_items:
-                # Backfill template prices and descriptions for any items missing them
-                backfill_count = 0
-                desc_backfill_count = 0
-                
-                # First, create a map of B-codes to their descriptions from template
-                bcode_descriptions = {}
-                if "Rate Card" in wb.sheetnames:
-                    rate_card_sheet = wb["Rate Card"]
-                    for row_num in range(22, 34):  # B01-B12
-                        code = rate_card_sheet.cell(row=row_num, column=1).value
-                        rate_card_desc = rate_card_sheet.cell(row=row_num, column=2).value
-                        if code and str(code).startswith('B'):
-                            bcode_descriptions[str(code)] = rate_card_desc
-                
-                for item in rate_items:
-                    # Backfill unit_price if missing
-                    if not item.unit_price or item.unit_price == "£0.00" or item.unit_price.strip() == "":
-                        codes = [c.strip() for c in item.rate_card_code.split('/')]
-                        template_price = template_prices.get(codes[0], None) if codes else None
-                        
-                        if template_price:
-                            item.unit_price = template_price
-                            backfill_count += 1
-                    
-                    # Backfill rate_card_description if missing
-                    if not item.rate_card_description or item.rate_card_description.strip() == "":
-                        codes = [c.strip() for c in item.rate_card_code.split('/')]
-                        bcode_desc = bcode_descriptions.get(codes[0], None) if codes else None
-                        
-                        if bcode_desc:
-                            item.rate_card_description = bcode_desc
-                            desc_backfill_count += 1
-                
-                # Also add any missing B-codes from template
-                existing_rate_codes = set()
-                for item in rate_items:
-                    codes = [c.strip() for c in item.rate_card_code.split('/')]
-                    existing_rate_codes.update(codes)
-                
-                missing_count = 0
-                if "Rate Card" in wb.sheetnames:
-                    rate_card_sheet = wb["Rate Card"]
-                    for row_num in range(22, 34):  # B01-B12
-                        code = rate_card_sheet.cell(row=row_num, column=1).value
-                        rate_card_desc = rate_card_sheet.cell(row=row_num, column=2).value
-                        
-                        if code and str(code).startswith('B') and str(code) not in existing_rate_codes:
-                            # Missing B-code - add it
-                            unit_price = template_prices.get(str(code), "£0.00")
-                            
-                            new_item = RateCardItem(
-                                art_code=str(code),  # Use code as art_code for standalone items
-                                description=rate_card_desc[:500] if rate_card_desc else f"Template item {code}",  # Use B-code desc as ART desc for standalone
-                                rate_card_code=str(code),
-                                rate_card_description=rate_card_desc[:500] if rate_card_desc else "",
-                                unit_price=unit_price,
-                                category="Added from template"
-                            )
-                            db.add(new_item)
-                            missing_count += 1
-                
-                if backfill_count > 0 or desc_backfill_count > 0 or missing_count > 0:
-                    db.commit()
-                    if backfill_count > 0:
-                        logger.info(f"Backfilled {backfill_count} missing prices from template")
-                    if desc_backfill_count > 0:
-                        logger.info(f"Backfilled {desc_backfill_count} missing rate card descriptions from template")
-                    if missing_count > 0:
-                        logger.info(f"Added {missing_count} missing B-codes from template")
-                    
-                    # Re-query to get all items including newly added ones
-                    rate_items = db.query(RateCardItem).all()
-                
-                # Create mapping: rate_card_code -> unit_price
-                price_map = {}
-                for item in rate_items:
-                    # One ART code can map to multiple rate card codes (e.g., "B01 / B02")
-                    codes = [c.strip() for c in item.rate_card_code.split('/')]
-                    for code in codes:
-                        if code and code not in price_map and item.unit_price:
-                            price_map[code] = item.unit_price
-                
-                logger.info(f"Loaded {len(price_map)} rate card prices from database")
-                
-                # Update Rate Card sheet
-                if "Rate Card" in wb.sheetnames:
-                    rate_card_sheet = wb["Rate Card"]
-                    updated_count = 0
-                    
-                    # Scan rows 6-39 (where rate card codes live)
-                    for row_num in range(6, 40):
-                        code_cell = rate_card_sheet.cell(row=row_num, column=1)  # Column A
-                        code = code_cell.value
-                        
-                        if code and str(code) in price_map:
-                            price_str = price_map[str(code)]
-                            # Parse price (e.g., "£45.00" -> 45.00)
-                            try:
-                                price_value = float(price_str.replace('£', '').replace(',', '').strip())
-                                # Write to column H (TOTAL RATE)
-                                total_cell = rate_card_sheet.cell(row=row_num, column=8)
-                                total_cell.value = price_value
-                                updated_count += 1
-                                logger.info(f"Updated {code} price to £{price_value}")
-                            except (ValueError, AttributeError) as e:
-                                logger.warning(f"Could not parse price for {code}: {price_str}")
-                    
-                    logger.info(f"Updated {updated_count} rate card prices in Excel template")
-                else:
-                    logger.warning("Rate Card sheet not found in template")
-            else:
-                logger.info("No rate card items in database - using template defaults")
+            # Scan rows 6-39 (where rate card codes live)
+            for row_num in range(6, 40):
+                code = rate_card_sheet.cell(row=row_num, column=1).value  # Column A
+                if code and str(code) in snapshot.prices:
+                    # Write to column H (TOTAL RATE)
+                    rate_card_sheet.cell(row=row_num, column=8).value = snapshot.prices[str(code)]
+                    updated_count += 1
             
-            db.close()
-        except Exception as e:
-            logger.warning(f"Failed to load database prices: {e}. Using template defaults.")
+            logger.info(f"Updated {updated_count} rate card prices in Excel template")
+        else:
+            logger.warning("Rate Card sheet not found in template")
     else:
-        logger.info("Database not available - using template default prices")
+        logger.info("No rate card prices available - using template defaults")
     
     # FIX: Replace Rate Card column H formulas with calculated numeric values
     # This MUST happen AFTER database updates to ensure calculated values from template always win
@@ -1096,845 +1665,13 @@ def populate_excel_template(doors: List[Dict], client_name: str, template_path:
         import traceback
         logger.error(traceback.format_exc())
     
-    # Update client name in Quote Sheet
-    try:
-        quote_sheet = wb["Quote Sheet"]
-        quote_sheet['B4'] = client_name  # B4 is the Client field
-        logger.info(f"Updated Quote Sheet with client name: {client_name}")
-        
-        # BUG 4 FIX: Clear site/building for Type 2 surveys (no site address in Excel files)
-        # Check if this is a Type 2 survey by looking at first door's format_type
-        is_type2 = doors and doors[0].get('format_type') == 'TYPE_2'
-        if is_type2:
-            # Clear site and building fields
-            quote_sheet['B5'] = ''  # Site field
-            quote_sheet['B6'] = ''  # Building field
-            logger.info("Cleared site/building fields for Type 2 survey")
-    except KeyError as e:
-        error_msg = f"Quote Sheet not found in template. Available sheets: {wb.sheetnames}"
-        logger.error(error_msg)
-        raise RuntimeError(error_msg) from e
-    
-    # Get Door Schedule sheet for populating door data
-    try:
-        ws = wb["Door Schedule"]
-        logger.info("Door Schedule sheet found")
-    except KeyError as e:
-        error_msg = f"Door Schedule sheet not found in template. Available sheets: {wb.sheetnames}"
-        logger.error(error_msg)
-        raise RuntimeError(error_msg) from e
-    
-    # Define color fills
-    green_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")  # Light green
-    yellow_fill = PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid")  # Light yellow
-    red_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")  # Light red
-    orange_fill = PatternFill(start_color="FED8B1", end_color="FED8B1", fill_type="solid")  # Light orange (for manual review)
-    
-    # Data starts at row 4 (row 3 is headers)
-    start_row = 4
-    
-    # BUG 5 FIX + 9 FIXES: Clear existing data (rows 4-100) - extended to column X (24)
-    for row_num in range(4, 100):
-        for col in range(1, 25):  # Columns A-X (1-24)
-            ws.cell(row=row_num, column=col).value = None
-            ws.cell(row=row_num, column=col).fill = PatternFill()  # Clear fill
-    
-    # Populate door data
-    for idx, door in enumerate(doors):
-        row_num = start_row + idx
-        
-        # ISSUE 3 FIX: Check for replacement doors FIRST, before B-code processing
-        # ART17 = leaf replacement, ART18 = full doorset replacement, ART20 = frame replacement
-        art_codes = door.get('art_codes', [])
-        codes = door.get('b_codes', [])
-        
-        needs_replacement = (
-            any(art in ['ART17', 'ART18', 'ART20'] for art in art_codes) or
-            'A-series' in codes or  # CSV mapping returns 'A-series' for replacement codes
-            door.get('is_replacement', False)  # Claude's explicit flag
-        )
-        
-        # Process codes differently based on door type
-        if needs_replacement:
-            # Replacement doors: Skip B-code logic entirely
-            codes = []  # No remedial codes
-            # ISSUE 3 FIX: Calculate A-series code FIRST for replacement doors
-            fire_rating = door.get('fire_rating', 'Unknown')
-            door_config = door.get('door_config', 'Single Leaf')
-            door_height = door.get('door_height_mm', None)
-            # ISSUE 2 FIX: Use explicit_mapping=True for replacement doors (no smoke seal default)
-            a_series_code_replacement = map_to_aseries_code(fire_rating, door_config, door_height, explicit_mapping=True)
-            primary_code = a_series_code_replacement  # ISSUE 3 FIX: Column P = A-series code (was '')
-            all_codes_str = ''  # Empty ALL B CODES (Column W)
-        else:
-            # Remedial doors: Continue with B-code logic
-            if not codes and 'art_codes' in door:
-                codes = map_art_to_rate_card(door['art_codes'])
-            
-            # BUG 2 FIX: Get primary code using priority order
-            primary_code = get_priority_bcode(codes)
-            all_codes_str = ', '.join(codes) if codes else 'MANUAL REVIEW'
-            
-            # FINAL FIX: For unable-to-inspect doors with no detectable codes,
-            # assign B01 (seals) as provisional primary code
-            # Column P must NEVER be empty for a YES door
-            if not primary_code and door.get('has_unable'):
-                primary_code = 'B01'  # Provisional code for reinspection
-        
-        # Column mapping based on Door Schedule template (updated Mar 2026 - 9 FIXES):
-        # A=DOOR ID, B=LOCATION, C=DOOR TYPE, D=CURRENT RATING, E=LEAF CONFIG,
-        # F=LEAF SIZE, G=FINISH, H=SEALS, I=CLOSER, J=VISION PANEL,
-        # K=ACTION DESCRIPTION, L=SEVERITY, M=DUE DATE,
-        # N=OPT A REMEDIAL?, O=OPT B REPLACE?, P=OPT A BASE ITEM (primary B-code),
-        # Q=QTY (1 or 0), R=ALL B CODES (comma-separated), S=OPT B REPLACEMENT CODE (A-series),
-        # T-W=E/O (OVERSIZE/HARDWOOD/EXTERNAL/VISION), X=NOTES/FLAGS
-        
-        door_id = door['door_id']
-        
-        ws[f'A{row_num}'] = door_id
-        ws[f'B{row_num}'] = door.get('location', '')
-        ws[f'C{row_num}'] = 'From Survey'  # Door type placeholder
-        
-        # FIX #2 (CORRECTED): Get fire rating and config from door data (extracted by Claude or Excel)
-        fire_rating = door.get('fire_rating', 'Unknown')
-        door_config = door.get('door_config', 'Single Leaf')
-        
-        ws[f'D{row_num}'] = fire_rating
-        ws[f'E{row_num}'] = door_config
-        
-        ws[f'F{row_num}'] = 'Unknown'  # Size placeholder
-        ws[f'G{row_num}'] = 'Paint'  # Finish placeholder
-        ws[f'H{row_num}'] = 'To Check'  # Seals placeholder
-        ws[f'I{row_num}'] = 'To Check'  # Closer placeholder
-        ws[f'J{row_num}'] = 'To Check'  # Vision panel placeholder
-        
-        # Column K: ACTION DESCRIPTION (fault details)
-        faults_str = '; '.join(door.get('faults', []))
-        ws[f'K{row_num}'] = faults_str[:500]  # Longer field for faults
-        
-        # Column L: SEVERITY (based on number of codes/faults)
-        severity = 'HIGH' if len(codes) > 3 else 'MEDIUM' if codes else 'LOW'
-        ws[f'L{row_num}'] = severity
-        
-        # Column M: DUE DATE (leave empty for now)
-        # ws[f'M{row_num}'] = ''
-        
-        # Column N: OPT A REMEDIAL? (YES/NO/COMPLIANT)
-        # Column O: OPT B REPLACE? (YES/NO/PENDING)
-        # BUG 1 FIX: Door is compliant ONLY if no codes AND no faults
-        # Rule: any detected fault = Opt A YES
-        is_compliant = not codes and not faults_str
-        
-        # Check if this is Type 2 format (no fire strategy, so Option B = PENDING)
-        is_type2 = door.get('format_type') == 'TYPE_2'
-        
-        # 9 FIXES - NEW OPTION B LOGIC:
-        # Option B = client can choose to replace ALL non-compliant doors with new certified sets
-        # So we need to calculate an A-series code for EVERY non-compliant door (not just mandatory replacements)
-        # Mandatory replacements (ART17/18/20) still show Opt B = YES in column O
-        # But ALL non-compliant doors get an A-series code in column S for Option B pricing
-        
-        a_series_code = ''  # For column S (OPT B REPLACEMENT CODE)
-        
-        # Calculate A-series code for ANY non-compliant door
-        if not is_compliant and not is_type2:
-            # Get door height (from extraction or default)
-            door_height = door.get('door_height_mm', None)
-            
-            logger.info(f"Door {door_id}: Non-compliant door - fire_rating='{fire_rating}', door_config='{door_config}', door_height={door_height}")
-            
-            if fire_rating != 'Unknown':
-                # ISSUE 2 FIX: Use explicit_mapping=True for replacement doors (ART17/18/20)
-                # This ensures A14-L3 (FD30 double) maps to A04 (no smoke) not A08 (with smoke)
-                use_explicit = needs_replacement  # True for ART17/18/20 doors
-                a_series_code = map_to_aseries_code(fire_rating, door_config, door_height, explicit_mapping=use_explicit)
-                if a_series_code:
-                    height_str = f"{door_height}mm" if door_height else "≤2040mm (default)"
-                    mapping_type = "explicit (no smoke)" if use_explicit else "default (with smoke)"
-                    logger.info(f"Door {door_id}: MAPPED {fire_rating} {door_config} {height_str} → {a_series_code} ({mapping_type})")
-                else:
-                    logger.error(f"Door {door_id}: MAPPING FAILED - rating='{fire_rating}', config='{door_config}', height={door_height}")
-                    logger.error(f"Door {door_id}: This should NEVER happen - check map_to_aseries_code function")
-            else:
-                # Default mapping for doors with Unknown fire rating
-                logger.warning(f"Door {door_id}: Fire rating Unknown - using default FD30S single → A05")
-                a_series_code = 'A05'  # Default: FD30S single ≤2040mm
-        
-        # Set Option A/B columns
-        # CRITICAL: Priority order matters!
-        # 1. Replacement (ART17/18/20) → OptA=NO, OptB=YES
-        # 2. Type 2 → OptA=YES/COMPLIANT, OptB=PENDING
-        # 3. Compliant (no faults) → OptA=COMPLIANT, OptB=NO
-        # 4. Has faults → OptA=YES, OptB=NO
-        
-        if needs_replacement:
-            # Replacement door (ART17, ART18, or ART20)
-            ws[f'N{row_num}'] = 'NO'   # No remedial work - full replacement
-            ws[f'O{row_num}'] = 'YES'  # Option B replacement
-            logger.info(f"Door {door_id}: Replacement needed (ART17/18/20) → OptA=NO, OptB=YES")
-        elif is_type2:
-            # Type 2 Excel surveys without replacement data: Option B = PENDING
-            if is_compliant:
-                ws[f'N{row_num}'] = 'COMPLIANT'
-            else:
-                ws[f'N{row_num}'] = 'YES'  # Has faults, needs remedial work
-            ws[f'O{row_num}'] = 'PENDING'  # All Type 2 doors get PENDING (no fire strategy)
-        elif is_compliant:
-            # Door passed inspection - no work needed
-            ws[f'N{row_num}'] = 'COMPLIANT'
-            ws[f'O{row_num}'] = 'NO'
-            logger.info(f"Door {door_id}: Compliant → OptA=COMPLIANT, OptB=NO")
-        else:
-            # Door has faults - needs remedial work
-            ws[f'N{row_num}'] = 'YES'
-            ws[f'O{row_num}'] = 'NO'
-            logger.info(f"Door {door_id}: Has faults → OptA=YES, OptB=NO")
-        
-        # ISSUE 1 FIX - CORRECTED COLUMN STRUCTURE:
-        # Column P: OPT A BASE ITEM (primary B-code for Option A)
-        # Column Q: QTY (1 for non-compliant, 0 for compliant)
-        # Columns R-U: E/O flags (OVERSIZE/HARDWOOD/EXTERNAL/VISION) - RESTORED to original position
-        # Column V: NOTES/FLAGS - RESTORED to original position
-        # Column W: ALL B CODES (comma-separated list for wildcard COUNTIF) - MOVED from R
-        # Column X: OPT B REPLACEMENT CODE (A-series code for ALL non-compliant doors) - MOVED from S
-        
-        # Column P: OPT A BASE ITEM (primary B-code)
-        ws[f'P{row_num}'] = primary_code if primary_code else ''
-        
-        # Column Q: QTY (1 or 0)
-        qty_value = 1 if not is_compliant else 0
-        ws[f'Q{row_num}'] = qty_value
-        
-        # Columns R-U: E/O flags (Extra Over costs) - RESTORED to original position
-        ws[f'R{row_num}'] = 'NO'  # E/O OVERSIZE
-        ws[f'S{row_num}'] = 'NO'  # E/O HARDWOOD
-        ws[f'T{row_num}'] = 'NO'  # E/O EXTERNAL
-        ws[f'U{row_num}'] = 'NO'  # E/O VISION
-        
-        # Column V: NOTES / FLAGS - RESTORED to original position
-        # MAURICIO FIX: Human-readable flags only, no raw ART codes (ART codes → B-codes in col W)
-        flag_notes = []
-        
-        # Add flag notes for special cases requiring manual review
-        if door.get('has_unable'):
-            flag_notes.append("⚠️ Unable to inspect - needs revisit")
-        
-        # Check for ambiguous or placeholder codes that need manual review
-        if any(c in ['MANUAL REVIEW', 'A-series', 'FLAG FOR MANUAL REVIEW'] for c in codes):
-            flag_notes.append("⚠️ Manual review required")
-        
-        # Add specific manual review notes for known problematic ARTs
-        if 'art_codes' in door:
-            art_codes = door.get('art_codes', [])
-            if 'ART14' in art_codes:
-                flag_notes.append("ART14 — damaged glazing, manual review required")
-            if 'ART23' in art_codes:
-                flag_notes.append("ART23 — no repair technique, manual review required")
-        
-        if flag_notes:
-            ws[f'V{row_num}'] = ' | '.join(flag_notes)
-        
-        # Column W: ALL B CODES (comma-separated) - MOVED from R (ISSUE 1 FIX)
-        ws[f'W{row_num}'] = all_codes_str if all_codes_str != 'MANUAL REVIEW' else ''
-        
-        # Column X: OPT B REPLACEMENT CODE (A-series) - MOVED from S (ISSUE 1 FIX)
-        ws[f'X{row_num}'] = a_series_code if a_series_code else ''
-        
-        # Color code based on status
-        # Priority: Orange (manual review) > Red (replacement) > Yellow (remedial) > Green (compliant)
-        color_fill = None
-        needs_manual_review = door.get('has_unable') or any(note.startswith('⚠️') for note in flag_notes)
-        
-        if needs_manual_review:
-            color_fill = orange_fill  # Orange - needs manual review (Unable to inspect or flag notes)
-        elif is_compliant:
-            color_fill = green_fill  # Green - compliant
-        elif needs_replacement:
-            color_fill = red_fill  # Red - mandatory replacement
-        else:
-            color_fill = yellow_fill  # Yellow - remedial work
-        
-        # Apply color to all data columns A-X (extended for new columns)
-        if color_fill:
-            for col_letter in 'ABCDEFGHIJKLMNOPQRSTUVWX':
-                ws[f'{col_letter}{row_num}'].fill = color_fill
-    
-    # PYTHON-SIDE CALCULATION: Keep formulas but write cached values
-    # Formulas stay for manual editing, cached values display immediately
-    logger.info("=== Calculating Quote Sheet cached values ===")
-    
-    # Step 1: Count B-codes AND A-series codes from Door Schedule
-    # 9 FIXES - NEW COUNTING LOGIC:
-    # - Option A (B-codes): Wildcard match against column W (ALL B CODES) - ISSUE 1 FIX
-    # - Option B (A-series): Count from column X (OPT B REPLACEMENT CODE) for ALL non-compliant doors - ISSUE 1 FIX
-    door_schedule = wb['Door Schedule']
-    b_code_counts = {}
-    b_code_door_ids = {}
-    a_code_counts = {}
-    a_code_door_ids = {}
-    
-    for row in range(4, 200):  # Check up to row 200
-        door_id = door_schedule.cell(row=row, column=1).value
-        if not door_id:
-            break
-        
-        opt_a = door_schedule.cell(row=row, column=14).value  # Column N (Option A)
-        opt_b = door_schedule.cell(row=row, column=15).value  # Column O (Option B)
-        base_item = door_schedule.cell(row=row, column=16).value  # Column P (Primary B-code)
-        qty = door_schedule.cell(row=row, column=17).value  # Column Q (QTY: 1 or 0)
-        all_b_codes_str = door_schedule.cell(row=row, column=23).value  # Column W (ALL B CODES) - ISSUE 1 FIX
-        opt_b_code = door_schedule.cell(row=row, column=24).value  # Column X (OPT B REPLACEMENT CODE) - ISSUE 1 FIX
-        
-        # FIX #3: Count Option A B-codes using EXACT match against column W (ALL B CODES) - ISSUE 1 FIX
-        # This correctly counts B07, B10, B11 which appear on multiple doors but aren't always primary
-        # MAURICIO FIX: Use set to deduplicate B-codes per door (count each door once per B-code)
-        if opt_a == 'YES' and all_b_codes_str:
-            all_codes_list = [c.strip() for c in str(all_b_codes_str).split(',')]
-            unique_codes = set(all_codes_list)  # Deduplicate codes for this door
-            for b_code in unique_codes:
-                if b_code and b_code.startswith('B'):
-                    b_code_counts[b_code] = b_code_counts.get(b_code, 0) + 1
-                    if b_code not in b_code_door_ids:
-                        b_code_door_ids[b_code] = []
-                    if str(door_id) not in b_code_door_ids[b_code]:
-                        b_code_door_ids[b_code].append(str(door_id))
-            logger.debug(f"Door {door_id}: Counted B-codes from ALL B CODES: {list(unique_codes)}")
-        
-        # FIX #4-5: Count Option B A-series codes from column S for ALL non-compliant doors
-        # Option B = replace ALL non-compliant doors, not just mandatory replacements
-        if opt_b_code and str(opt_b_code).startswith('A'):
-            a_code = str(opt_b_code).strip()
-            a_code_counts[a_code] = a_code_counts.get(a_code, 0) + 1
-            if a_code not in a_code_door_ids:
-                a_code_door_ids[a_code] = []
-            a_code_door_ids[a_code].append(str(door_id))
-            logger.debug(f"Door {door_id}: Counted A-code from OPT B REPLACEMENT CODE: {a_code}")
-    
-    logger.info(f"Option A B-code counts: {b_code_counts}")
-    logger.info(f"Option A door IDs: {b_code_door_ids}")
-    logger.info(f"Option B A-code counts: {a_code_counts}")
-    logger.info(f"Option B door IDs: {a_code_door_ids}")
-    
-    # ISSUE #2 VALIDATION: Count total doors with OptA=YES for reconciliation
-    opt_a_yes_count = sum(1 for row in range(4, 200) 
-                          if door_schedule.cell(row=row, column=14).value == 'YES')
-    total_b_code_instances = sum(b_code_counts.values())
-    logger.info(f"VALIDATION: {opt_a_yes_count} doors with OptA=YES")
-    logger.info(f"VALIDATION: {total_b_code_instances} total B-code instances counted")
-    logger.info(f"VALIDATION: Average {total_b_code_instances/opt_a_yes_count if opt_a_yes_count > 0 else 0:.1f} B-codes per door")
-    
-    if opt_a_yes_count > 0 and total_b_code_instances == 0:
-        logger.error(f"VALIDATION ERROR: {opt_a_yes_count} doors have OptA=YES but 0 B-codes counted!")
-    
-    # ISSUE 4: B12 Verification - Log count and door IDs for Mauricio to verify against source
-    if 'B12' in b_code_counts:
-        b12_count = b_code_counts['B12']
-        b12_doors = b_code_door_ids.get('B12', [])
-        logger.info(f"🔍 ISSUE 4 - B12 VERIFICATION:")
-        logger.info(f"   B12 (void infill) count: {b12_count}")
-        logger.info(f"   Door IDs with B12: {', '.join(b12_doors)}")
-        logger.info(f"   ⚠️ Mauricio - please verify these {b12_count} doors against source PDF")
-    else:
-        logger.info(f"🔍 ISSUE 4 - B12 VERIFICATION: No B12 codes found in this survey")
-    
-    # Step 2: Get rates from Rate Card
-    # FIX #4: Read rates from Rate Card Total column (Column G)
-    # MAURICIO FIX: Also read Materials (D) and Labour (E) for breakdown
-    rate_card_sheet = wb['Rate Card']
-    rates = {}
-    materials_rates = {}
-    labour_rates = {}
-    for row_num in range(22, 34):  # B01-B12
-        code = rate_card_sheet.cell(row=row_num, column=1).value
-        # Read Total from Column G (calculated numeric value: Materials + Labour + Humping)
-        rate = rate_card_sheet.cell(row=row_num, column=7).value or 0  # Column G (Total)
-        mat_rate = rate_card_sheet.cell(row=row_num, column=4).value or 0  # Column D (Materials)
-        lab_rate = rate_card_sheet.cell(row=row_num, column=5).value or 0  # Column E (Labour)
-        if code and rate and isinstance(rate, (int, float)):
-            rates[str(code)] = rate
-            materials_rates[str(code)] = mat_rate
-            labour_rates[str(code)] = lab_rate
-    
-    logger.info(f"Rates from Rate Card Total column (G): {rates}")
-    
-    # Step 3: Calculate Option A totals (cost and client price)
-    option_a_cost = sum(b_code_counts.get(code, 0) * rates.get(code, 0) for code in rates.keys())
-    
-    # FIX #5: Get target margin and calculate client price
-    target_margin = quote_sheet['R2'].value or 0
-    option_a_client = option_a_cost / (1 - target_margin) if (1 - target_margin) > 0 else option_a_cost
-    
-    # ISSUE #3 VALIDATION: Ensure totals are never None
-    if option_a_cost is None:
-        logger.error("ISSUE #3: option_a_cost is None - setting to 0")
-        option_a_cost = 0
-    if option_a_client is None:
-        logger.error("ISSUE #3: option_a_client is None - setting to 0")
-        option_a_client = 0
-    
-    logger.info(f"Option A cost: £{option_a_cost}")
-    logger.info(f"Option A client price (with {target_margin*100}% margin): £{option_a_client}")
-    
-    # Step 4: Write numbers to Quote Sheet
-    # FIX #5: Get target margin from R2 and apply gross margin formula
-    quote_sheet = wb['Quote Sheet']
-    target_margin = quote_sheet['R2'].value or 0  # Default to 0 if not set
-    logger.info(f"Target margin from R2: {target_margin} ({target_margin*100}%)")
-    
-    # MAURICIO FIX: Log all Quote Sheet column headers (Issue #2 verification)
-    # DEVVIE FIX: Check BOTH row 8 and row 10 for headers
-    logger.info("🔍 QUOTE SHEET COLUMN HEADERS:")
-    for header_row in [8, 10]:
-        logger.info(f"  Row {header_row}:")
-        for col_idx in range(1, 20):  # Check columns A-S
-            header = quote_sheet.cell(row=header_row, column=col_idx).value
-            if header:
-                logger.info(f"    Column {chr(64 + col_idx)} ({col_idx}): {header}")
-        
-    # Check specifically for T&J and Hump columns
-    tj_found = []
-    hump_found = []
-    for row in [8, 9, 10]:
-        for col in range(1, 20):
-            val = quote_sheet.cell(row=row, column=col).value
-            if val and ('T&J' in str(val) or 'T & J' in str(val)):
-                tj_found.append(f"Row {row}, Col {chr(64 + col)}")
-            if val and 'HUMP' in str(val).upper():
-                hump_found.append(f"Row {row}, Col {chr(64 + col)}")
-    
-    if tj_found:
-        logger.warning(f"⚠️ T&J column headers found: {', '.join(tj_found)}")
-        # DEVVIE FIX: Clear T&J header cells
-        for row in [8, 9, 10]:
-            for col in range(1, 20):
-                val = quote_sheet.cell(row=row, column=col).value
-                if val and ('T&J' in str(val) or 'T & J' in str(val)):
-                    quote_sheet.cell(row=row, column=col).value = None
-                    logger.info(f"  Cleared T&J header at Row {row}, Col {chr(64 + col)}")
-    
-    if hump_found:
-        logger.warning(f"⚠️ HUMP column headers found: {', '.join(hump_found)}")
-        # DEVVIE FIX: Clear Hump header cells
-        for row in [8, 9, 10]:
-            for col in range(1, 20):
-                val = quote_sheet.cell(row=row, column=col).value
-                if val and 'HUMP' in str(val).upper():
-                    quote_sheet.cell(row=row, column=col).value = None
-                    logger.info(f"  Cleared HUMP header at Row {row}, Col {chr(64 + col)}")
-    
-    # FIX #8: Clear ALL prelim quantities - rows 43-47 in Quote Sheet
-    # Prelims must be left blank for Matt to fill in manually per job
-    # Row 43: Mobilisation, Row 44-47: P.01-P.04 prelims, Row 48: P.05 (already blank in template)
-    prelim_rows = [43, 44, 45, 46, 47]  # Mobilisation + P.01-P.04
-    for prelim_row in prelim_rows:
-        quote_sheet.cell(row=prelim_row, column=3).value = None  # Column C (QTY) = blank
-        logger.info(f"Quote Sheet row {prelim_row}: Cleared prelim quantity (set to None)")
-    
-    bcode_to_row = {
-        'B01': 11, 'B02': 12, 'B03': 13, 'B04': 14, 'B05': 15, 'B06': 16,
-        'B07': 17, 'B08': 18, 'B09': 19, 'B10': 20, 'B11': 21, 'B12': 22,
-    }
-    
-    for b_code, row_num in bcode_to_row.items():
-        qty = b_code_counts.get(b_code, 0)
-        cost_rate = rates.get(b_code, 0)  # Rate Card Total (cost price)
-        cost_total = qty * cost_rate  # Line item cost subtotal (no margin)
-        
-        # MAURICIO FIX: Calculate materials and labour breakdown
-        mat_rate = materials_rates.get(b_code, 0)
-        lab_rate = labour_rates.get(b_code, 0)
-        mat_total = qty * mat_rate  # MAT'S TOTAL
-        lab_total = qty * lab_rate  # LAB TOTAL
-        total_cost = mat_total + lab_total  # TOTAL COST (should equal cost_total)
-        
-        door_ids = b_code_door_ids.get(b_code, [])
-        door_ids_str = ', '.join(door_ids) if door_ids else ''
-        
-        # URGENT FIX #2: Debug logging for Quote Sheet quantities
-        # Check what the Quote Sheet template label is for this row
-        template_label = quote_sheet.cell(row=row_num, column=2).value  # Column B (Description/Label)
-        logger.info(f"Row {row_num}: Template label='{template_label}', Writing {b_code} with QTY={qty}, Doors={door_ids_str}")
-        
-        # MAURICIO FIX: Calculate client total with margin
-        client_total = total_cost / (1 - target_margin) if (1 - target_margin) > 0 else total_cost
-        
-        # Write values to Quote Sheet
-        quote_sheet.cell(row=row_num, column=3).value = qty           # Column C (QTY)
-        quote_sheet.cell(row=row_num, column=4).value = mat_rate      # Column D (MAT'S rate)
-        quote_sheet.cell(row=row_num, column=5).value = lab_rate      # Column E (LAB rate)
-        quote_sheet.cell(row=row_num, column=7).value = mat_total     # Column G (MAT'S TOTAL)
-        quote_sheet.cell(row=row_num, column=9).value = lab_total     # Column I (LAB TOTAL)
-        quote_sheet.cell(row=row_num, column=15).value = total_cost   # Column O (TOTAL COST)
-        quote_sheet.cell(row=row_num, column=16).value = client_total # Column P (TOTAL with margin)
-        
-        # FIX #3: Write zero to T&J and Humping rate columns to exclude from breakdown
-        quote_sheet.cell(row=row_num, column=11).value = 0            # Column K (T&J rate) = 0
-        quote_sheet.cell(row=row_num, column=13).value = 0            # Column M (Humping rate) = 0
-        # This makes columns L and N = 0, so column O = columns H + J only (Materials + Labour = COST)
-        
-        # FIX #1: Door IDs reference column (use column S, after all existing columns)
-        quote_sheet.cell(row=row_num, column=19).value = door_ids_str # Column S (DOOR IDs)
-        
-        if qty > 0:
-            logger.info(f"Quote Sheet {b_code}: QTY={qty}, MAT={mat_rate}×{qty}={mat_total}, LAB={lab_rate}×{qty}={lab_total}, COST={total_cost}, CLIENT={client_total}")
-    
-    # Step 5: Write calculated NUMBERs to Client Summary
-    # FIX #5: Client Summary shows CLIENT PRICES (with margin), not costs
-    client_summary = wb['Client Summary']
-    
-    # HIGH FIX #4: Update column label from "NET COST" to "Internal Cost (ex margin)"
-    # Check if row 9 has column headers
-    if client_summary.cell(row=9, column=3).value:
-        client_summary.cell(row=9, column=3).value = "Internal Cost (ex margin)"
-        logger.info("Updated Client Summary C9 label to 'Internal Cost (ex margin)'")
-    
-    # C10 = Internal Cost (ex margin) - internal cost for reference
-    client_summary.cell(row=10, column=3).value = option_a_cost
-    
-    # D10 = OPTION A TOTAL (CLIENT PRICE with margin)
-    client_summary.cell(row=10, column=4).value = option_a_client
-    
-    # D13 = TOTAL INVESTMENT - Option A only (mutually exclusive with Option B)
-    client_summary.cell(row=13, column=4).value = option_a_client
-    
-    logger.info(f"Client Summary C10 (Internal Cost ex margin): £{option_a_cost}")
-    logger.info(f"Client Summary D10 (OPTION A CLIENT PRICE): £{option_a_client}")
-    logger.info(f"Client Summary D13 (TOTAL INVESTMENT - Option A): £{option_a_client}")
-    
-    # Step 6: Write Option A TOTAL to Quote Sheet row 23 and 49
-    # Quote Sheet shows COST totals (no margin)
-    # Client Summary shows CLIENT PRICE (with margin)
-    # CRITICAL: Ensure we write a NUMBER, not None
-    if option_a_cost is None or not isinstance(option_a_cost, (int, float)):
-        logger.error(f"CRITICAL: option_a_cost is {type(option_a_cost)} with value {option_a_cost} - forcing to 0")
-        option_a_cost = 0
-    
-    option_a_total_to_write = float(option_a_cost)  # Write COST to Quote Sheet
-    quote_sheet.cell(row=23, column=6).value = option_a_total_to_write  # F23 (COST TOTAL)
-    logger.info(f"Quote Sheet F23 (Option A TOTAL - COST): £{option_a_total_to_write}")
-    
-    # DEVVIE FIX: Write to ACTUAL TOTAL row (Row 49, not 23)
-    quote_sheet.cell(row=49, column=6).value = option_a_total_to_write  # F49 (OPTION A COST TOTAL)
-    logger.info(f"Quote Sheet F49 (OPTION A TOTAL - COST): £{option_a_total_to_write}")
-    
-    # IMMEDIATE VERIFICATION: Read back what we just wrote
-    written_value_23 = quote_sheet.cell(row=23, column=6).value
-    written_value_49 = quote_sheet.cell(row=49, column=6).value
-    logger.info(f"VERIFICATION: Read back Quote Sheet F23 = {written_value_23} (type: {type(written_value_23)})")
-    logger.info(f"VERIFICATION: Read back Quote Sheet F49 = {written_value_49} (type: {type(written_value_49)})")
-    
-    # Step 6b: FIX #2 - Calculate and write Option B totals (replacement doors)
-    # Get A-series rates from Rate Card Total column (Column G)
-    a_series_rates = {}
-    for row_num in range(6, 40):  # Check all rows in Rate Card
-        code = rate_card_sheet.cell(row=row_num, column=1).value
-        if code and str(code).startswith('A'):
-            # Read Total from Column G (calculated numeric value: Materials + Labour + Humping)
-            rate = rate_card_sheet.cell(row=row_num, column=7).value or 0  # Column G (Total)
-            a_series_rates[str(code)] = rate
-    
-    logger.info(f"A-series rates from Rate Card Total column (G): {a_series_rates}")
-    
-    # Calculate Option B totals (cost and client price)
-    option_b_cost = sum(a_code_counts.get(code, 0) * a_series_rates.get(code, 0) for code in a_series_rates.keys())
-    
-    # FIX #5: Apply margin to Option B
-    option_b_client = option_b_cost / (1 - target_margin) if (1 - target_margin) > 0 else option_b_cost
-    
-    # ISSUE #3 VALIDATION: Ensure totals are never None
-    if option_b_cost is None:
-        logger.error("ISSUE #3: option_b_cost is None - setting to 0")
-        option_b_cost = 0
-    if option_b_client is None:
-        logger.error("ISSUE #3: option_b_client is None - setting to 0")
-        option_b_client = 0
-    
-    logger.info(f"Option B cost: £{option_b_cost}")
-    logger.info(f"Option B client price (with {target_margin*100}% margin): £{option_b_client}")
-    
-    # Write Option B line items to Quote Sheet (rows 26-40)
-    acode_to_row = {
-        'A01': 26, 'A02': 27, 'A03': 28, 'A04': 29, 'A05': 30, 'A06': 31,
-        'A07': 32, 'A08': 33, 'A09': 34, 'A10': 35, 'A11': 36, 'A12': 37,
-        'A13': 38, 'A14': 39, 'A15': 40,
-    }
-    
-    for a_code, row_num in acode_to_row.items():
-        qty = a_code_counts.get(a_code, 0)
-        cost_rate = a_series_rates.get(a_code, 0)  # Rate Card Total (cost price)
-        cost_total = qty * cost_rate  # Line item cost subtotal (no margin)
-        
-        door_ids = a_code_door_ids.get(a_code, [])
-        door_ids_str = ', '.join(door_ids) if door_ids else ''
-        
-        # ISSUE 2 FIX: Get description with A-code prefix
-        description = get_aseries_description(a_code)
-        
-        # Write Option B COST values (no margin on line items)
-        quote_sheet.cell(row=row_num, column=1).value = a_code         # Column A (ITEM CODE - A01, A05, etc.)
-        quote_sheet.cell(row=row_num, column=3).value = qty            # Column C (QTY)
-        quote_sheet.cell(row=row_num, column=4).value = description    # Column D (DESCRIPTION with A-code)
-        quote_sheet.cell(row=row_num, column=5).value = cost_rate      # Column E (RATE = Rate Card Total, plain cost)
-        quote_sheet.cell(row=row_num, column=6).value = cost_total     # Column F (TOTAL = QTY × RATE, cost subtotal)
-        quote_sheet.cell(row=row_num, column=11).value = 0             # Column K (T&J rate) = 0
-        quote_sheet.cell(row=row_num, column=13).value = 0             # Column M (Humping rate) = 0
-        quote_sheet.cell(row=row_num, column=19).value = door_ids_str  # Column S (DOOR IDs)
-        
-        if qty > 0:
-            logger.info(f"Quote Sheet {a_code}: {description}, QTY={qty}, RATE={cost_rate}, TOTAL={cost_total}, DOOR_IDs={door_ids_str}")
-    
-    # ISSUE #3 FIX: Write Option B TOTAL to Quote Sheet
-    # Try common locations for Option B TOTAL row
-    # Most templates have Option B section starting around row 26, so TOTAL might be around row 42-45
-    # Write to row 42 as a best guess (can adjust if template differs)
-    option_b_total_row = 42
-    
-    # Quote Sheet shows COST totals (no margin)
-    # Client Summary shows CLIENT PRICE (with margin)
-    # CRITICAL: Ensure we write a NUMBER, not None
-    if option_b_cost is None or not isinstance(option_b_cost, (int, float)):
-        logger.error(f"CRITICAL: option_b_cost is {type(option_b_cost)} with value {option_b_cost} - forcing to 0")
-        option_b_cost = 0
-    
-    option_b_total_to_write = float(option_b_cost) if option_b_cost > 0 else 0.0
-    quote_sheet.cell(row=option_b_total_row, column=6).value = option_b_total_to_write
-    logger.info(f"Quote Sheet F{option_b_total_row} (Option B TOTAL - COST): £{option_b_total_to_write}")
-    
-    # DEVVIE FIX: Write to ACTUAL TOTAL row (Row 50, not 42)
-    quote_sheet.cell(row=50, column=6).value = option_b_total_to_write  # F50 (OPTION B COST TOTAL)
-    logger.info(f"Quote Sheet F50 (OPTION B TOTAL - COST): £{option_b_total_to_write}")
-    
-    # IMMEDIATE VERIFICATION: Read back what we just wrote
-    written_value_42 = quote_sheet.cell(row=option_b_total_row, column=6).value
-    written_value_50 = quote_sheet.cell(row=50, column=6).value
-    logger.info(f"VERIFICATION: Read back Quote Sheet F{option_b_total_row} = {written_value_42} (type: {type(written_value_42)})")
-    logger.info(f"VERIFICATION: Read back Quote Sheet F50 = {written_value_50} (type: {type(written_value_50)})")
-    
-    # VALIDATION: Ensure TOTAL rows are NEVER None (check both 23/42 and 49/50)
-    if quote_sheet.cell(row=23, column=6).value is None:
-        logger.error("VALIDATION ERROR: Quote Sheet F23 (Option A subtotal) is None - writing 0 as fallback")
-        quote_sheet.cell(row=23, column=6).value = 0
-    if quote_sheet.cell(row=49, column=6).value is None:
-        logger.error("VALIDATION ERROR: Quote Sheet F49 (Option A TOTAL) is None - writing 0 as fallback")
-        quote_sheet.cell(row=49, column=6).value = 0
-    if quote_sheet.cell(row=option_b_total_row, column=6).value is None:
-        logger.error(f"VALIDATION ERROR: Quote Sheet F{option_b_total_row} (Option B subtotal) is None - writing 0 as fallback")
-        quote_sheet.cell(row=option_b_total_row, column=6).value = 0
-    if quote_sheet.cell(row=50, column=6).value is None:
-        logger.error("VALIDATION ERROR: Quote Sheet F50 (Option B TOTAL) is None - writing 0 as fallback")
-        quote_sheet.cell(row=50, column=6).value = 0
-    
-    # Write Option B total to Client Summary E11
-    if option_b_client > 0:
-        client_summary.cell(row=11, column=5).value = option_b_client  # E11 (Option B CLIENT PRICE)
-        logger.info(f"Client Summary E11 (Option B CLIENT PRICE): £{option_b_client}")
-    
-    # URGENT FIX #5: TOTAL INVESTMENT should NOT add Option A + Option B (mutually exclusive)
-    # Show Option A in column D, Option B in column E
-    # Matt chooses one, not both
-    client_summary.cell(row=13, column=4).value = option_a_client  # D13 = Option A only
-    client_summary.cell(row=13, column=5).value = option_b_client if option_b_client > 0 else ""  # E13 = Option B only
-    logger.info(f"Client Summary D13 (TOTAL INVESTMENT - Option A): £{option_a_client}")
-    logger.info(f"Client Summary E13 (TOTAL INVESTMENT - Option B): £{option_b_client}")
-    
-    # Step 7: Copy header values from Quote Sheet to Client Summary
-    # Client Summary pulls these from Quote Sheet via formulas, but we need to write them
-    # Correct row mapping:
-    # - Row 3: Client (B3)
-    # - Row 4: Site (B4)
-    # - Row 5: Building (B5)
-    # - Row 6: Date (E6)
-    # - Row 7: Quote Ref (B7)
-    client_summary.cell(row=3, column=2).value = quote_sheet['B4'].value  # B3 = Client
-    client_summary.cell(row=4, column=2).value = quote_sheet['B5'].value  # B4 = Site (may be blank for Type 2)
-    client_summary.cell(row=5, column=2).value = quote_sheet['B6'].value  # B5 = Building (may be blank for Type 2)
-    client_summary.cell(row=6, column=5).value = quote_sheet['B3'].value  # E6 = Date
-    client_summary.cell(row=7, column=2).value = quote_sheet['B2'].value  # B7 = Quote Ref
-    logger.info(f"Client Summary headers: Client={quote_sheet['B4'].value}, Date={quote_sheet['B3'].value}, Ref={quote_sheet['B2'].value}")
-    
-    # Step 8: Set Option B to "PENDING" for Type 2 surveys (no fire strategy)
-    # UNLESS we already calculated Option B client price above (replacement doors with specs)
-    is_type2 = doors and doors[0].get('format_type') == 'TYPE_2'
-    if is_type2 and option_b_client == 0:
-        client_summary.cell(row=11, column=5).value = "PENDING — fire strategy required"  # E11 (Option B)
-        logger.info("Client Summary E11 (Option B): PENDING — fire strategy required (Type 2)")
-    
-    # ISSUE #5 FIX: Set correct compliance note based on survey type
-    # is_type2 already set above (around line 1497)
-    logger.info(f"Survey type for compliance note: is_type2={is_type2}, first door format_type={doors[0].get('format_type') if doors else None}")
-    
-    # Compliance note is typically in Client Summary around row 15-25
-    # Type 1: Full FireDNA survey with fire strategy
-    # Type 2: Excel survey without fire strategy
-    if is_type2:
-        compliance_note = (
-            "This report identifies fire doors requiring remedial works based on visual inspection. "
-            "Option A provides remedial works to address identified faults. Option B (full replacement) "
-            "cannot be priced without fire strategy drawings - please request these from the client if "
-            "replacement doors are required. All prices exclude VAT and are subject to site survey confirmation."
-        )
-    else:
-        # Type 1 compliance note
-        compliance_note = (
-            "This report identifies fire doors requiring remedial works to achieve compliance with "
-            "Approved Document B and the Regulatory Reform (Fire Safety) Order 2005. Works are categorized "
-            "as Option A (remedial works) or Option B (full replacement). All prices exclude VAT and are "
-            "subject to site survey confirmation."
-        )
-    
-    # ISSUE #5 FIX: Find and update compliance note cell
-    # Check rows 15-25 for compliance note (expanded range)
-    # BUG FIX: Compliance note is in column A (not B)
-    found_compliance_note = False
-    for row in range(15, 26):
-        cell_value = client_summary.cell(row=row, column=1).value
-        logger.debug(f"Client Summary row {row} column A: '{cell_value}'")
-        if cell_value and isinstance(cell_value, str):
-            if ('compliance' in cell_value.lower() or 
-                'approved document' in cell_value.lower() or
-                'fire safety order' in cell_value.lower() or
-                'remedial works' in cell_value.lower()):
-                client_summary.cell(row=row, column=1).value = compliance_note
-                logger.info(f"Updated compliance note at Client Summary row {row} to Type {'2' if is_type2 else '1'} note")
-                found_compliance_note = True
-                break
-    
-    if not found_compliance_note:
-        logger.error("ISSUE #5: Could not find compliance note cell in Client Summary rows 15-25")
-        logger.error("Cell values checked:")
-        for row in range(15, 26):
-            val = client_summary.cell(row=row, column=1).value
-            logger.error(f"  Row {row}: '{val}'")
-    
-    # VERIFICATION NOTES: Scan Door Schedule for A-series codes and add verification warnings
-    # This ensures we flag any door where dimensions were extracted and need confirmation
-    verification_notes = []
-    
-    # 9 FIXES: Scan Door Schedule column X (OPT B REPLACEMENT CODE) for A-series codes - ISSUE 1 FIX
-    door_schedule = wb["Door Schedule"]
-    # Door data starts at row 4 (row 3 is headers)
-    for row_num in range(4, 4 + len(doors)):
-        door_id = door_schedule.cell(row=row_num, column=1).value  # Column A
-        opt_b_code = door_schedule.cell(row=row_num, column=24).value  # Column X (OPT B REPLACEMENT CODE) - ISSUE 1 FIX
-        
-        # Check if this is an A-series code (A01-A15 pattern)
-        if opt_b_code and isinstance(opt_b_code, str) and opt_b_code.startswith('A') and len(opt_b_code) >= 3:
-            # Extract A-series number (e.g., "A10" -> "10")
-            try:
-                a_num = int(opt_b_code[1:])
-                if 1 <= a_num <= 15:
-                    # This is an A-series code - add verification note
-                    fire_rating = door_schedule.cell(row=row_num, column=4).value  # Column D
-                    door_config = door_schedule.cell(row=row_num, column=5).value  # Column E
-                    
-                    note = f"⚠️ {door_id}: Door dimensions extracted from survey. Mapped to {opt_b_code} ({fire_rating} {door_config}). Please verify actual door height before ordering to confirm correct A-series code."
-                    verification_notes.append(note)
-                    logger.info(f"Added verification note for {door_id}: A-series code {opt_b_code} needs confirmation")
-            except (ValueError, IndexError):
-                pass  # Not a valid A-series code
-    
-    # Write verification notes to Client Summary if any exist
-    if verification_notes:
-        # Find a good place to add notes (after compliance note, around row 17-20)
-        notes_start_row = 18
-        client_summary.cell(row=notes_start_row, column=1).value = "VERIFICATION NOTES"
-        
-        for i, note in enumerate(verification_notes):
-            client_summary.cell(row=notes_start_row + 1 + i, column=1).value = note
-        
-        logger.info(f"Added {len(verification_notes)} verification note(s) to Client Summary")
-    else:
-        logger.info("No A-series codes found in Door Schedule - no verification notes needed")
-    
-    # Step 9 (FIX #9): Populate Material Call-Off sheet with B-code counts
-    # 9 FIXES: Material Call-Off uses wildcard match against column W (ALL B CODES) - ISSUE 1 FIX
-    # B07 (signage) × 2 because each door needs 2 signs
-    if "Material Call-Off" in wb.sheetnames:
-        material_calloff = wb["Material Call-Off"]
-        door_schedule = wb["Door Schedule"]
-        
-        # FIX #9: Count B-codes from column W (ALL B CODES) using EXACT matching - ISSUE 1 FIX
-        # This matches the Quote Sheet logic (FIX #3)
-        # MAURICIO FIX: Deduplicate B-codes per door (count each door once per B-code)
-        # DEVVIE FIX: Count ALL rows until empty, not just len(doors)
-        component_counts = {}
-        for row_num in range(4, 200):  # Scan up to row 200
-            door_id = door_schedule.cell(row=row_num, column=1).value
-            if not door_id:  # Stop at first empty door_id
-                break
-            all_b_codes_str = door_schedule.cell(row=row_num, column=23).value  # Column W (ALL B CODES) - ISSUE 1 FIX
-            if all_b_codes_str:
-                all_codes_list = [c.strip() for c in str(all_b_codes_str).split(',')]
-                unique_codes = set(all_codes_list)  # Deduplicate codes for this door
-                for b_code in unique_codes:
-                    if b_code and b_code.startswith('B'):
-                        component_counts[b_code] = component_counts.get(b_code, 0) + 1
-        
-        logger.info("Material Call-Off counts (from ALL B CODES column R):")
-        for code, count in sorted(component_counts.items()):
-            logger.info(f"  {code} = {count}")
-        
-        # Row 13: Closers (B03)
-        closers_count = component_counts.get('B03', 0)
-        material_calloff.cell(row=13, column=4).value = closers_count
-        
-        # Row 14: Hinges (B04)
-        hinges_count = component_counts.get('B04', 0)
-        material_calloff.cell(row=14, column=4).value = hinges_count
-        
-        # Row 15: Seals (B01)
-        seals_count = component_counts.get('B01', 0)
-        material_calloff.cell(row=15, column=4).value = seals_count
-        
-        # Row 16: Intumescent only (B02)
-        intumescent_count = component_counts.get('B02', 0)
-        material_calloff.cell(row=16, column=4).value = intumescent_count
-        
-        # Row 17: Signage (B07 × 2) - each door needs 2 signs
-        signage_count = component_counts.get('B07', 0) * 2
-        material_calloff.cell(row=17, column=4).value = signage_count
-        
-        # Row 18: Drop seal (B09)
-        drop_seal_count = component_counts.get('B09', 0)
-        material_calloff.cell(row=18, column=4).value = drop_seal_count
-        
-        # Row 19: Lever handles/latch (B05)
-        latch_count = component_counts.get('B05', 0)
-        material_calloff.cell(row=19, column=4).value = latch_count
-        
-        # Row 20: Intumescent mastic (B06)
-        mastic_count = component_counts.get('B06', 0)
-        material_calloff.cell(row=20, column=4).value = mastic_count
-        
-        # MAURICIO FIX: Row 22: Re-hang / adjust door leaf (B10)
-        # DEVVIE FIX: Moved from row 20 to avoid conflict with B06
-        rehang_count = component_counts.get('B10', 0)
-        material_calloff.cell(row=22, column=4).value = rehang_count
-        # Set label
-        material_calloff.cell(row=22, column=2).value = "Re-hang / adjust door leaf — carpenter"
-        logger.info(f"Material Call-Off B10 (re-hang): {rehang_count} doors")
-        
-        # Row 21: Hardwood lipping (B11)
-        lipping_count = component_counts.get('B11', 0)
-        material_calloff.cell(row=21, column=4).value = lipping_count
-        
-        # Row 22: Hardwood void infill (B12)
-        void_infill_count = component_counts.get('B12', 0)
-        material_calloff.cell(row=22, column=4).value = void_infill_count
-        
-        logger.info(f"Material Call-Off populated (FIX #9 - wildcard matching):")
-        logger.info(f"  Closers (B03) = {closers_count}")
-        logger.info(f"  Hinges (B04) = {hinges_count}")
-        logger.info(f"  Seals (B01) = {seals_count}")
-        logger.info(f"  Intumescent only (B02) = {intumescent_count}")
-        logger.info(f"  Signage (B07×2) = {signage_count}")
-        logger.info(f"  Lever handles/latch (B05) = {latch_count}")
-        logger.info(f"  Drop seal (B09) = {drop_seal_count}")
-        logger.info(f"  Intumescent mastic (B06) = {mastic_count}")
-        logger.info(f"  Hardwood lipping (B11) = {lipping_count}")
-        logger.info(f"  Hardwood void infill (B12) = {void_infill_count}")
-    
-    logger.info("=== Line item numbers + header values written ===")
+    with metrics.span("mapping"):
+        model = QuoteModel.build(doors, QuoteRates.from_workbook(wb), snapshot, target_margin)
+    renderer = renderer or FIREDOOR_RENDERER
+    if renderer not in DOOR_SCHEDULE_RENDERERS:
+        raise ValueError(f"Unknown renderer '{renderer}' (expected one of {', '.join(DOOR_SCHEDULE_RENDERERS)})")
+    with metrics.span("population"):
+        door_schedule_streamer = render_quote_workbook(wb, model, client_name, renderer)
     
     # Save workbook
     try:
@@ -1944,7 +1681,10 @@ def populate_excel_template(doors: List[Dict], client_name: str, template_path:
         wb.calculation.calcMode = 'auto'
         wb.calculation.fullCalcOnLoad = True
         
-        wb.save(output_path)
+        with metrics.span("workbook_save"):
+            wb.save(output_path)
+            if door_schedule_streamer:
+                door_schedule_streamer.write(output_path, (door_schedule_values(line) for line in model.doors))
         logger.info("Workbook saved successfully")
     except Exception as e:
         error_msg = f"Failed to save workbook: {str(e)}"
@@ -1966,3 +1706,56 @@ def populate_excel_template(doors: List[Dict], client_name: str, template_path:
     logger.info("Formulas preserved with calculated cached values")
     
     return output_path
+
+
+def quote_output_filename(client_name: str) -> str:
+    """Download filename for a generated quote."""
+    return f"{client_name.replace(' ', '_')}_FireDoor_Quote.xlsx"
+
+
+def quote_comments(file_format: str) -> str:
+    """Comments stored with a quote in the history (e.g. Option B warning for Type 2)."""
+    if file_format == 'TYPE_2':
+        return "⚠️ Type 2 Survey: Review Option B requirements carefully"
+    return ""
+
+
+def generate_quote(input_path: str, filename: str, client_name: str, output_dir: str) -> Dict:
+    """
+    Run the full pipeline for one survey file: detect format, extract doors, populate template.
+    
+    Args:
+        input_path: Path to the saved survey file
+        filename: Original upload filename (used for format detection)
+        client_name: Client name for the quote header
+        output_dir: Directory to write the quote workbook to
+    
+    Returns:
+        Dict with file_format, doors, output_path, output_filename and rate_card_version
+    
+    Raises:
+        ValueError: If the file format is unsupported or no doors could be extracted
+    """
+    survey = load_survey(input_path, filename)
+    file_format = survey.file_format
+    logger.info(f"Detected format: {file_format} for file: {filename}")
+    if file_format == 'UNKNOWN':
+        raise ValueError("Unsupported file format. Please upload a FireDNA/RiskBase PDF or Excel survey.")
+    
+    doors = extract_loaded_doors(survey)
+    logger.info(f"Extracted {len(doors)} doors from survey")
+    if not doors:
+        raise ValueError("No door data could be extracted from the file. Please check the file format.")
+    
+    output_filename = quote_output_filename(client_name)
+    output_path = str(Path(output_dir) / output_filename)
+    snapshot = rate_card.get_snapshot()
+    populate_excel_template(doors, client_name, str(TEMPLATE_PATH), output_path, snapshot)
+    
+    return {
+        'file_format': file_format,
+        'doors': doors,
+        'output_path': output_path,
+        'output_filename': output_filename,
+        'rate_card_version': snapshot.version,
+    }
@@ -0,0 +1,111 @@
+"""
+Shared HTTP clients for outbound API calls (Anthropic, Vercel Blob, Monday.com).
+
+One pooled httpx.Client per service keeps connections alive between calls, so
+only the first request to a host pays for DNS, TCP and TLS setup. HTTP/2 is used
+when the h2 package is installed (httpx[http2]) and HTTP2_ENABLED isn't "false";
+requests to a service then share one multiplexed connection.
+
+    response = http_clients.get_client("blob").put(url, content=data)
+
+Clients are opened at app startup and closed on shutdown (main.py). Anything
+that runs outside the app - job worker processes, scripts, tests - gets one
+created on first use. The clients are thread-safe; calls run in the thread pool.
+"""
+
+import os
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict
+
+import httpx
+try:
+    import h2  # noqa: F401 - httpx needs it for http2=True
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() != "false"
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "20"))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "10"))
+# Seconds an idle connection is kept (providers drop idle connections after ~60s)
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+
+@dataclass(frozen=True)
+class ClientSettings:
+    """Per-service timeouts (seconds). read is the longest wait for the next bytes of a response."""
+    connect: float = 10.0
+    read: float = 30.0
+    write: float = 30.0
+    pool: float = 10.0  # Waiting for a free connection when the pool is full
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(connect=self.connect, read=self.read, write=self.write, pool=self.pool)
+
+
+CLIENT_SETTINGS: Dict[str, ClientSettings] = {
+    # Streamed extraction responses can pause between events, but never this long
+    'anthropic': ClientSettings(read=120.0),
+    # Quote workbooks and site photos can be several MB
+    'blob': ClientSettings(read=60.0, write=120.0),
+    'monday': ClientSettings(read=10.0, write=10.0),
+}
+
+_clients: Dict[str, httpx.Client] = {}
+_clients_lock = threading.Lock()
+
+
+def _create_client(name: str) -> httpx.Client:
+    settings = CLIENT_SETTINGS[name]
+    http2 = HTTP2_ENABLED and HTTP2_AVAILABLE
+    client = httpx.Client(
+        http2=http2,
+        timeout=settings.timeout(),
+        limits=httpx.Limits(
+            max_connections=HTTP_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+    logger.info(f"Opened HTTP client '{name}' (http2={http2}, pool {HTTP_POOL_MAX_CONNECTIONS})")
+    return client
+
+
+def get_client(name: str) -> httpx.Client:
+    """
+    The shared client for a service (created on first use).
+
+    Raises:
+        KeyError: If the service has no CLIENT_SETTINGS entry
+    """
+    client = _clients.get(name)
+    if client is not None and not client.is_closed:
+        return client
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None or client.is_closed:
+            client = _clients[name] = _create_client(name)
+        return client
+
+
+def open_clients():
+    """Create every service's client up front (app startup)."""
+    if not HTTP2_AVAILABLE and HTTP2_ENABLED:
+        logger.info("h2 not installed - outbound HTTP uses HTTP/1.1 keep-alive only")
+    for name in CLIENT_SETTINGS:
+        get_client(name)
+
+
+def close_clients():
+    """Close every client and its pooled connections (app shutdown)."""
+    with _clients_lock:
+        clients = list(_clients.items())
+        _clients.clear()
+    for name, client in clients:
+        client.close()
+        logger.info(f"Closed HTTP client '{name}'")
+
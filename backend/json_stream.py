@@ -0,0 +1,125 @@
+"""
+Incremental JSON Array Parsing
+Parses a JSON array as it streams in, returning each top-level element as soon
+as its closing brace arrives, so Claude's door list can be consumed while the
+rest of it is still being generated:
+
+    parser = JSONArrayStream()
+    for text in deltas:
+        for door in parser.feed(text):
+            ...
+    parser.close()
+
+Text before the opening '[' (a ```json fence, a sentence of preamble) and after
+the closing ']' is ignored. Only object and array elements are returned; doors
+are always objects. If the stream stops mid-array (max_tokens), the elements
+that closed are kept and complete is False.
+"""
+
+import re
+import json
+from typing import Any, List
+
+# Characters that matter outside strings
+_STRUCTURE = re.compile(r'[\[\]{}"]')
+# The rest of a string body, up to (not including) its closing quote or a trailing lone backslash
+_STRING_BODY = re.compile(r'(?:[^"\\]|\\.)*', re.DOTALL)
+
+
+class JSONArrayStream:
+    """Feed it text deltas; get back the array elements completed by each one."""
+
+    def __init__(self):
+        self.started = False    # Seen the opening '['
+        self.complete = False   # Seen the closing ']'
+        self.count = 0          # Elements returned so far
+        self._depth = 0         # Nesting depth inside the array (0 = between elements)
+        self._in_string = False
+        self._escape = False    # A string's backslash was the last character fed
+        self._pending = []      # Text of the element in progress
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        Consume the next piece of the response.
+
+        Returns:
+            Elements (parsed) that closed within this piece, in order
+
+        Raises:
+            ValueError: If an element isn't valid JSON or the brackets don't balance
+        """
+        elements = []
+        if self.complete or not text:
+            return elements
+
+        i, n = 0, len(text)
+        if not self.started:
+            i = text.find('[')
+            if i < 0:
+                return elements
+            self.started = True
+            i += 1
+        start = 0 if self._depth else None  # Where the element in progress begins in this text
+
+        while i < n:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                i = _STRING_BODY.match(text, i).end()
+                if i >= n:
+                    break
+                if text[i] == '\\':  # Escape split across deltas
+                    self._escape = True
+                    i = n
+                    break
+                self._in_string = False
+                i += 1
+                continue
+
+            match = _STRUCTURE.search(text, i)
+            if match is None:
+                break
+            char, i = match.group(), match.end()
+            if char == '"':
+                self._in_string = True
+            elif char in '[{':
+                if self._depth == 0:
+                    start = match.start()
+                self._depth += 1
+            elif self._depth == 0:
+                if char == '}':
+                    raise ValueError("Unbalanced '}' in JSON array")
+                self.complete = True
+                break
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._pending.append(text[start:i])
+                    elements.append(self._parse_pending())
+                    start = None
+
+        if start is not None and self._depth:
+            self._pending.append(text[start:])
+        return elements
+
+    def _parse_pending(self) -> Any:
+        element_text = "".join(self._pending)
+        self._pending = []
+        try:
+            element = json.loads(element_text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON in array element {self.count + 1}: {e}")
+        self.count += 1
+        return element
+
+    def close(self):
+        """
+        Check the stream once the response has ended.
+
+        Raises:
+            ValueError: If no JSON array was found at all
+        """
+        if not self.started:
+            raise ValueError("No JSON array found in response")
@@ -0,0 +1,520 @@
+"""
+LLM Backends
+Every Claude call in the pipeline goes through get_backend().complete() (or
+.stream(), which hands over text as it is generated), so what answers it can be
+swapped without touching the extraction code. LLM_BACKEND picks the backend:
+
+    anthropic   Claude API (SDK, raw HTTP fallback) - the default
+    record      Claude API, with every response saved under LLM_RECORDINGS_DIR
+    replay      Saved responses only - offline and deterministic; unrecorded prompts fail
+    auto        Replay when a recording exists, otherwise call Claude and record it
+    stub        Synthetic responses built from the prompt (llm_stub_server), no network
+
+A call is a system prompt (a list of text blocks) plus the user prompt. With
+LLM_PROMPT_CACHE the last system block is marked for Anthropic prompt caching, so
+the instructions and survey overview sent with every chunk are processed once and
+read from the cache by later calls (LLMResponse.cache_status says which happened).
+A call can also pass a tool (name, description, input_schema) that Claude must
+call: the reply text is then the tool input as JSON, streamed as it is generated.
+
+Recordings are keyed by a hash of (model, max_tokens, system, tool, prompt), one JSON file each.
+ANTHROPIC_BASE_URL points the anthropic backend somewhere else, e.g. at
+llm_stub_server.py for load tests with controlled latency and token throughput.
+Calls to the API go through llm_limiter (concurrency and token caps, retries,
+circuit breaker) unless LLM_LIMITER=false.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+import http_clients
+try:
+    from anthropic import Anthropic
+    import anthropic
+    ANTHROPIC_SDK_AVAILABLE = True
+except Exception as e:
+    ANTHROPIC_SDK_AVAILABLE = False
+    anthropic = None
+    Anthropic = None
+
+logger = logging.getLogger(__name__)
+
+if ANTHROPIC_SDK_AVAILABLE and anthropic:
+    logger.info(f"Anthropic SDK version: {anthropic.__version__}")
+logger.info(f"httpx version: {httpx.__version__}")
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "anthropic")
+LLM_RECORDINGS_DIR = os.getenv("LLM_RECORDINGS_DIR", str(Path(__file__).parent / "test_files" / "llm_recordings"))
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com")
+ANTHROPIC_VERSION = "2023-06-01"
+# Mark the system prompt for provider-side prompt caching (5-minute TTL, refreshed on every hit)
+LLM_PROMPT_CACHE = os.getenv("LLM_PROMPT_CACHE", "true").lower() != "false"
+
+LLM_BACKENDS = ('anthropic', 'record', 'replay', 'auto', 'stub')
+
+# Rough English-text ratio, for estimates where a tokenizer round trip isn't worth it
+CHARS_PER_TOKEN = 4
+
+
+class RecordingNotFound(LookupError):
+    """Replay mode was asked for a prompt that has no recorded response."""
+
+
+class LLMUnavailable(RuntimeError):
+    """
+    The Claude API is failing or throttling and retries are exhausted (or the circuit breaker is open).
+    partial is True when a streamed reply failed after some of its text was handed over.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, partial: bool = False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.partial = partial
+
+
+class LLMStreamError(RuntimeError):
+    """The API sent an error event in the middle of a streamed reply (e.g. overloaded_error)."""
+
+    def __init__(self, error_type: Optional[str], message: Optional[str]):
+        super().__init__(f"Anthropic stream error ({error_type}): {message}")
+        self.error_type = error_type
+
+    @classmethod
+    def from_event(cls, event) -> "LLMStreamError":
+        """From an error event's data: {"type": "error", "error": {"type": ..., "message": ...}}."""
+        error = (event.get("error") if isinstance(event, dict) else None) or {}
+        return cls(error.get("type"), error.get("message"))
+
+
+@dataclass
+class LLMResponse:
+    """
+    One model reply, as recorded and replayed. For a tool call, text is the
+    tool input JSON and stop_reason is 'tool_use' (or 'max_tokens' if cut off).
+
+    input_tokens counts only the uncached input; the prompt cache reports the rest
+    as cache_creation_input_tokens (written) and cache_read_input_tokens (read).
+    """
+    text: str
+    stop_reason: Optional[str] = None
+    input_tokens: int = 0
+    output_tokens: int = 0
+    model: Optional[str] = None
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+
+    @property
+    def cache_status(self) -> str:
+        """'hit' (prefix read from the prompt cache), 'miss' (prefix written to it) or 'none'."""
+        if self.cache_read_input_tokens:
+            return 'hit'
+        if self.cache_creation_input_tokens:
+            return 'miss'
+        return 'none'
+
+    @property
+    def total_input_tokens(self) -> int:
+        return self.input_tokens + self.cache_creation_input_tokens + self.cache_read_input_tokens
+
+
+class LLMBackend(ABC):
+    """Answers a single-turn prompt. Implementations must be thread-safe."""
+
+    name = "base"
+
+    @abstractmethod
+    def complete(self, prompt: str, max_tokens: int, model: str, system: Optional[List[str]] = None,
+                 tool: Optional[Dict] = None) -> LLMResponse:
+        """
+        Args:
+            prompt: The user message
+            system: System prompt blocks, in order (the stable part of the request)
+            tool: A tool definition Claude must call; the reply text is its input JSON
+        """
+
+    def stream(self, prompt: str, max_tokens: int, model: str, on_text: Callable[[str], None],
+               system: Optional[List[str]] = None, tool: Optional[Dict] = None) -> LLMResponse:
+        """
+        Like complete(), but calls on_text with each piece of the reply as it arrives.
+        Backends that can't stream hand over the whole text in one piece.
+        """
+        response = self.complete(prompt, max_tokens, model, system=system, tool=tool)
+        if response.text:
+            on_text(response.text)
+        return response
+
+
+class AnthropicBackend(LLMBackend):
+    """
+    Claude via the Anthropic SDK, falling back to raw HTTP when the SDK is
+    unavailable or fails to initialise.
+    """
+
+    name = "anthropic"
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 max_retries: Optional[int] = None):
+        """
+        Args:
+            api_key: Defaults to ANTHROPIC_API_KEY
+            base_url: Defaults to ANTHROPIC_BASE_URL (the real API unless overridden)
+            max_retries: SDK retry count (default: the SDK's own)
+        """
+        self.api_key = api_key
+        self.base_url = (base_url or ANTHROPIC_BASE_URL).rstrip('/')
+        self.max_retries = max_retries
+        self._client = None
+        self._http_client = None  # The shared pooled client the SDK client was built on
+        self._use_raw_http = False
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        """Get or create the SDK client (None means use raw HTTP)."""
+        with self._lock:
+            if self._use_raw_http:
+                return None
+            # Rebuild if the shared HTTP client was closed (app shutdown) and reopened since
+            if self._client is not None and not self._http_client.is_closed:
+                return self._client
+
+            if not ANTHROPIC_SDK_AVAILABLE:
+                logger.warning("Anthropic SDK not available, using raw HTTP API")
+                self._use_raw_http = True
+                return None
+
+            try:
+                logger.info("Attempting to initialize Anthropic SDK client")
+                self._http_client = http_clients.get_client("anthropic")
+                kwargs = {'api_key': self.api_key or os.getenv("ANTHROPIC_API_KEY"), 'base_url': self.base_url,
+                          'http_client': self._http_client}
+                if self.max_retries is not None:
+                    kwargs['max_retries'] = self.max_retries
+                self._client = Anthropic(**kwargs)
+                logger.info("Anthropic SDK client initialized successfully")
+            except Exception as e:
+                logger.error(f"Failed to initialize Anthropic SDK: {str(e)}")
+                logger.info("Falling back to raw HTTP API")
+                self._use_raw_http = True
+            return self._client
+
+    @staticmethod
+    def request_body(prompt: str, max_tokens: int, model: str, system: Optional[List[str]] = None,
+                     tool: Optional[Dict] = None) -> dict:
+        """
+        Messages API request parameters. The last system block ends the cached prefix
+        (LLM_PROMPT_CACHE), which also covers the tool definition (tools come first).
+        """
+        body = {"model": model, "max_tokens": max_tokens, "messages": [{"role": "user", "content": prompt}]}
+        if tool:
+            body["tools"] = [tool]
+            body["tool_choice"] = {"type": "tool", "name": tool["name"]}
+        if system:
+            blocks = [{"type": "text", "text": text} for text in system]
+            if LLM_PROMPT_CACHE:
+                blocks[-1]["cache_control"] = {"type": "ephemeral"}
+            body["system"] = blocks
+        return body
+
+    @staticmethod
+    def _usage(usage, response: LLMResponse) -> LLMResponse:
+        """Copy token counts from an SDK usage object or a raw API usage dict."""
+        for name in ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"):
+            value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+            setattr(response, name, value or 0)
+        return response
+
+    @staticmethod
+    def _content_text(content) -> str:
+        """Reply text from SDK content blocks or raw API block dicts: text blocks, or tool input as JSON."""
+        parts = []
+        for block in content:
+            if not isinstance(block, dict):
+                block = block.model_dump()
+            if block.get("type") == "text":
+                parts.append(block["text"])
+            elif block.get("type") == "tool_use":
+                parts.append(json.dumps(block.get("input") or {}))
+        return "".join(parts)
+
+    def complete(self, prompt: str, max_tokens: int, model: str, system: Optional[List[str]] = None,
+                 tool: Optional[Dict] = None) -> LLMResponse:
+        client = self._get_client()
+        if client is None:
+            return self._complete_raw_http(prompt, max_tokens, model, system, tool)
+
+        response = client.messages.create(**self.request_body(prompt, max_tokens, model, system, tool))
+        return self._usage(response.usage, LLMResponse(
+            text=self._content_text(response.content),
+            stop_reason=response.stop_reason,
+            output_tokens=response.usage.output_tokens,
+            model=response.model
+        ))
+
+    def stream(self, prompt: str, max_tokens: int, model: str, on_text: Callable[[str], None],
+               system: Optional[List[str]] = None, tool: Optional[Dict] = None) -> LLMResponse:
+        client = self._get_client()
+        if client is None:
+            return self._stream_raw_http(prompt, max_tokens, model, on_text, system, tool)
+
+        parts = []
+        try:
+            with client.messages.stream(**self.request_body(prompt, max_tokens, model, system, tool)) as stream:
+                for event in stream:
+                    # Text deltas, or the tool input JSON as it is generated
+                    piece = event.text if event.type == "text" else \
+                        event.partial_json if event.type == "input_json" else ""
+                    if piece:
+                        parts.append(piece)
+                        on_text(piece)
+                message = stream.get_final_message()
+        except anthropic.APIStatusError as e:
+            # The SDK raises an error event as a status error with the stream's own (200) status
+            if e.status_code != 200:
+                raise
+            raise LLMStreamError.from_event(e.body) from e
+        return self._usage(message.usage, LLMResponse(
+            text="".join(parts),
+            stop_reason=message.stop_reason,
+            output_tokens=message.usage.output_tokens,
+            model=message.model
+        ))
+
+    def _raw_http_headers(self) -> dict:
+        api_key = self.api_key or os.getenv("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise ValueError("ANTHROPIC_API_KEY environment variable not set")
+        return {
+            "x-api-key": api_key,
+            "anthropic-version": ANTHROPIC_VERSION,
+            "content-type": "application/json"
+        }
+
+    def _complete_raw_http(self, prompt: str, max_tokens: int, model: str,
+                           system: Optional[List[str]] = None, tool: Optional[Dict] = None) -> LLMResponse:
+        """Call the Messages API directly via HTTP (fallback when the SDK fails)."""
+        headers = self._raw_http_headers()
+        logger.info("Using raw HTTP API call to Anthropic (SDK unavailable or failed)")
+
+        response = http_clients.get_client("anthropic").post(
+            f"{self.base_url}/v1/messages",
+            headers=headers,
+            json=self.request_body(prompt, max_tokens, model, system, tool)
+        )
+        response.raise_for_status()
+        result = response.json()
+        usage = result.get("usage") or {}
+        return self._usage(usage, LLMResponse(
+            text=self._content_text(result["content"]),
+            stop_reason=result.get("stop_reason"),
+            output_tokens=usage.get("output_tokens", 0),
+            model=result.get("model")
+        ))
+
+    def _stream_raw_http(self, prompt: str, max_tokens: int, model: str,
+                         on_text: Callable[[str], None], system: Optional[List[str]] = None,
+                         tool: Optional[Dict] = None) -> LLMResponse:
+        """Streaming Messages API call over raw HTTP, reading the server-sent events."""
+        headers = self._raw_http_headers()
+        logger.info("Using raw HTTP streaming call to Anthropic (SDK unavailable or failed)")
+
+        parts = []
+        result = LLMResponse(text="", model=model)
+        with http_clients.get_client("anthropic").stream(
+            "POST",
+            f"{self.base_url}/v1/messages",
+            headers=headers,
+            json={**self.request_body(prompt, max_tokens, model, system, tool), "stream": True}
+        ) as response:
+            if response.is_error:
+                response.read()
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                event_type = event.get("type")
+                if event_type == "message_start":
+                    message = event["message"]
+                    result.model = message.get("model", model)
+                    self._usage(message.get("usage") or {}, result)
+                elif event_type == "content_block_delta":
+                    delta = event["delta"]
+                    piece = delta.get("text") if delta.get("type") == "text_delta" else \
+                        delta.get("partial_json") if delta.get("type") == "input_json_delta" else None
+                    if piece:
+                        parts.append(piece)
+                        on_text(piece)
+                elif event_type == "message_delta":
+                    result.stop_reason = event["delta"].get("stop_reason")
+                    result.output_tokens = (event.get("usage") or {}).get("output_tokens", 0)
+                elif event_type == "error":
+                    raise LLMStreamError.from_event(event)
+        result.text = "".join(parts)
+        return result
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of text (CHARS_PER_TOKEN characters per token)."""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def prompt_key(prompt: str, max_tokens: int, model: str, system: Optional[List[str]] = None,
+               tool: Optional[Dict] = None) -> str:
+    """Recording key: hash of everything that determines the reply."""
+    parts = [model, max_tokens]
+    if system:
+        parts.append(list(system))
+    if tool:
+        parts.append(tool)
+    parts.append(prompt)
+    return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+
+class RecordReplayBackend(LLMBackend):
+    """
+    Saves responses from an inner backend and plays them back by prompt hash.
+
+    Modes:
+        'record' - always call the inner backend, (re)writing the recording
+        'replay' - recordings only; RecordingNotFound for anything unrecorded
+        'auto'   - replay if recorded, otherwise call the inner backend and record
+    """
+
+    def __init__(self, mode: str, directory: str = LLM_RECORDINGS_DIR, inner: Optional[LLMBackend] = None):
+        if mode not in ('record', 'replay', 'auto'):
+            raise ValueError(f"Unknown record/replay mode '{mode}'")
+        if mode != 'replay' and inner is None:
+            raise ValueError(f"Mode '{mode}' needs a backend to record from")
+        self.mode = mode
+        self.name = mode
+        self.directory = Path(directory)
+        self.inner = inner
+
+    def path_for(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def load(self, prompt: str, max_tokens: int, model: str, system: Optional[List[str]] = None,
+             tool: Optional[Dict] = None) -> Optional[LLMResponse]:
+        """The recorded response for this prompt, or None."""
+        path = self.path_for(prompt_key(prompt, max_tokens, model, system, tool))
+        try:
+            recording = json.loads(path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return None
+        return LLMResponse(**recording['response'])
+
+    def save(self, prompt: str, max_tokens: int, model: str, response: LLMResponse,
+             system: Optional[List[str]] = None, tool: Optional[Dict] = None):
+        key = prompt_key(prompt, max_tokens, model, system, tool)
+        recording = {
+            'key': key,
+            'model': model,
+            'max_tokens': max_tokens,
+            'system_chars': sum(len(text) for text in system or []),
+            'tool': tool["name"] if tool else None,
+            'prompt_chars': len(prompt),
+            'prompt_start': prompt[:200],
+            'response': asdict(response),
+        }
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename so concurrent replays never see a half-written file
+        fd, tmp_path = tempfile.mkstemp(suffix='.json', dir=self.directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(recording, f, indent=1)
+        os.replace(tmp_path, self.path_for(key))
+        logger.info(f"Recorded LLM response {key[:12]} ({response.output_tokens} output tokens)")
+
+    def _recorded(self, prompt: str, max_tokens: int, model: str, system: Optional[List[str]] = None,
+                  tool: Optional[Dict] = None) -> Optional[LLMResponse]:
+        """The response to replay, or None if the inner backend should be called."""
+        if self.mode == 'record':
+            return None
+        response = self.load(prompt, max_tokens, model, system, tool)
+        if response is None and self.mode == 'replay':
+            key = prompt_key(prompt, max_tokens, model, system, tool)
+            raise RecordingNotFound(
+                f"No recorded LLM response for prompt {key[:12]} in {self.directory} "
+                f"(record it with LLM_BACKEND=record or auto)"
+            )
+        return response
+
+    def complete(self, prompt: str, max_tokens: int, model: str, system: Optional[List[str]] = None,
+                 tool: Optional[Dict] = None) -> LLMResponse:
+        response = self._recorded(prompt, max_tokens, model, system, tool)
+        if response is not None:
+            return response
+
+        response = self.inner.complete(prompt, max_tokens, model, system=system, tool=tool)
+        self.save(prompt, max_tokens, model, response, system, tool)
+        return response
+
+    def stream(self, prompt: str, max_tokens: int, model: str, on_text: Callable[[str], None],
+               system: Optional[List[str]] = None, tool: Optional[Dict] = None) -> LLMResponse:
+        response = self._recorded(prompt, max_tokens, model, system, tool)
+        if response is not None:
+            on_text(response.text)
+            return response
+
+        # Saved only once the stream has finished, so a failed call leaves no partial recording
+        response = self.inner.stream(prompt, max_tokens, model, on_text, system=system, tool=tool)
+        self.save(prompt, max_tokens, model, response, system, tool)
+        return response
+
+
+def _limited_anthropic_backend() -> LLMBackend:
+    """The Anthropic backend behind the shared limiter (llm_limiter), which then owns retries."""
+    from llm_limiter import LLM_LIMITER, LimitedBackend
+    if not LLM_LIMITER:
+        return AnthropicBackend()
+    return LimitedBackend(AnthropicBackend(max_retries=0))
+
+
+def create_backend(name: str = LLM_BACKEND) -> LLMBackend:
+    """
+    Build a backend by LLM_BACKEND name.
+
+    Raises:
+        ValueError: If the name is not one of LLM_BACKENDS
+    """
+    if name == 'anthropic':
+        return _limited_anthropic_backend()
+    if name in ('record', 'auto'):
+        return RecordReplayBackend(name, LLM_RECORDINGS_DIR, _limited_anthropic_backend())
+    if name == 'replay':
+        return RecordReplayBackend('replay', LLM_RECORDINGS_DIR)
+    if name == 'stub':
+        from llm_stub_server import SyntheticBackend
+        return SyntheticBackend()
+    raise ValueError(f"Unknown LLM_BACKEND '{name}' (expected one of {', '.join(LLM_BACKENDS)})")
+
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> LLMBackend:
+    """The process-wide backend, created from LLM_BACKEND on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+            logger.info(f"LLM backend: {_backend.name}")
+        return _backend
+
+
+def set_backend(backend: Optional[LLMBackend]) -> Optional[LLMBackend]:
+    """Replace the process-wide backend (None: recreate from LLM_BACKEND). Returns the previous one."""
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+    return previous
@@ -0,0 +1,329 @@
+"""
+LLM Call Limiting
+Every Claude call from this process goes through one LimitedBackend (create_backend
+wraps the Anthropic backend in it), which:
+
+    - caps calls in flight (LLM_MAX_IN_FLIGHT), halving the cap when the API
+      answers 429/529 and growing it back by one per window of successes
+    - caps estimated tokens per minute (LLM_TOKENS_PER_MINUTE, 0 = no cap)
+    - retries 429/5xx/529, timeouts and connection errors with jittered
+      exponential backoff, waiting at least as long as retry-after says; a 429
+      with retry-after holds back every caller, not just the one that got it
+    - opens a circuit breaker after LLM_BREAKER_THRESHOLD failed attempts in a
+      row, failing calls immediately (LLMUnavailable) for LLM_BREAKER_COOLDOWN_SECONDS,
+      then lets one trial call through to see if the API has recovered
+
+Queueing and backoff waits are recorded as llm_queue and llm_backoff spans.
+A streamed call is only retried if it failed before any text was handed over;
+after that the LLMUnavailable it raises is marked partial.
+"""
+
+import os
+import json
+import time
+import random
+import logging
+import threading
+import email.utils
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+import metrics
+from llm_backend import LLMBackend, LLMResponse, LLMStreamError, LLMUnavailable, estimate_tokens
+try:
+    import anthropic
+except Exception:
+    anthropic = None
+
+logger = logging.getLogger(__name__)
+
+LLM_LIMITER = os.getenv("LLM_LIMITER", "true").lower() != "false"
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1.0"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "30"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504, 529}
+# The API is telling us to slow down, not just failing
+THROTTLE_STATUS = {429, 529}
+# An error event in a stream carries the error type the API would have answered with this status
+STREAM_ERROR_STATUS = {
+    'invalid_request_error': 400,
+    'authentication_error': 401,
+    'permission_error': 403,
+    'not_found_error': 404,
+    'request_too_large': 413,
+    'rate_limit_error': 429,
+    'api_error': 500,
+    'overloaded_error': 529,
+}
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a retry-after header (delta-seconds or an HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def classify_error(error: Exception) -> Tuple[bool, Optional[int], Optional[float]]:
+    """
+    Whether an LLM call error is worth retrying.
+
+    An error event part-way through a stream counts as the status its error type
+    stands for, so an overloaded_error is retried (if no text was delivered) and
+    counts against the circuit breaker like an HTTP 529.
+
+    Returns:
+        (retryable, HTTP status or None, retry-after seconds or None)
+    """
+    if isinstance(error, LLMStreamError):
+        status = STREAM_ERROR_STATUS.get(error.error_type)
+        return status in RETRYABLE_STATUS, status, None
+    response = getattr(error, 'response', None)
+    status = getattr(error, 'status_code', None) or getattr(response, 'status_code', None)
+    if isinstance(status, int) and (isinstance(error, httpx.HTTPStatusError) or
+                                    (anthropic is not None and isinstance(error, anthropic.APIStatusError))):
+        retry_after = _parse_retry_after(response.headers.get("retry-after")) if response is not None else None
+        return status in RETRYABLE_STATUS, status, retry_after
+    if isinstance(error, (httpx.TimeoutException, httpx.TransportError)):
+        return True, None, None
+    if anthropic is not None and isinstance(error, (anthropic.APITimeoutError, anthropic.APIConnectionError)):
+        return True, None, None
+    return False, None, None
+
+
+class CircuitBreaker:
+    """closed -> open after `threshold` failures in a row -> half-open (one trial) after `cooldown`."""
+
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, cooldown: float = LLM_BREAKER_COOLDOWN_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Raises:
+            LLMUnavailable: While open, or half-open with the trial call still running
+        """
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self._opened_at + self.cooldown - self.clock()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                logger.info("LLM circuit breaker half-open: sending a trial call")
+                return
+            raise LLMUnavailable(
+                f"Claude API unavailable after {self.failures} failed calls; not retrying for {max(remaining, 1):.0f}s",
+                retry_after=max(remaining, 1.0)
+            )
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info("LLM circuit breaker closed: Claude API has recovered")
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """A call ended without telling us anything about the API: let another call be the trial."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+                logger.warning(f"LLM circuit breaker open after {self.failures} failed calls "
+                               f"(cooldown {self.cooldown:.0f}s)")
+                self.state = "open"
+                self._opened_at = self.clock()
+                self._trial_in_flight = False
+
+
+class LLMLimiter:
+    """Adaptive in-flight cap plus a tokens-per-minute bucket, shared by every caller."""
+
+    def __init__(self, max_in_flight: int = LLM_MAX_IN_FLIGHT, tokens_per_minute: int = LLM_TOKENS_PER_MINUTE):
+        self.max_in_flight = max(1, max_in_flight)
+        self.limit = float(self.max_in_flight)  # Current cap, adapted between 1 and max_in_flight
+        self.in_flight = 0
+        self.tokens_per_minute = tokens_per_minute
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float):
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute,
+                               self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60)
+        self._refilled_at = now
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        """Seconds until this call may start (0 = now)."""
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.in_flight >= int(self.limit):
+            return 1.0  # Until notified by a finishing call
+        if self.tokens_per_minute:
+            needed = min(tokens, self.tokens_per_minute)  # A prompt bigger than a minute's budget waits for a full bucket
+            if self._tokens < needed:
+                return (needed - self._tokens) * 60 / self.tokens_per_minute
+        return 0.0
+
+    @contextmanager
+    def slot(self, tokens: int):
+        """
+        Hold an in-flight slot and `tokens` of the minute's budget for the with block.
+        Yields a function to report the tokens actually used (input + output).
+        """
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._wait_time(tokens, now)
+                if wait <= 0:
+                    break
+                self._cond.wait(wait)
+            self.in_flight += 1
+            self._tokens -= tokens
+        waited = time.monotonic() - start
+        if waited > 0.001:
+            metrics.record_span("llm_queue", waited)
+
+        reserved = tokens
+
+        def used(actual: int):
+            nonlocal reserved
+            with self._cond:
+                self._tokens -= actual - reserved
+                reserved = actual
+
+        try:
+            yield used
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def throttled(self, retry_after: Optional[float] = None):
+        """The API said slow down: halve the in-flight cap and hold everyone for retry_after."""
+        with self._cond:
+            self.limit = max(1.0, self.limit / 2)
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        logger.warning(f"Claude API throttling: in-flight cap now {int(self.limit)}"
+                       + (f", pausing {retry_after:.1f}s" if retry_after else ""))
+
+    def succeeded(self):
+        """Additive increase: about one more slot per `limit` successful calls."""
+        with self._cond:
+            if self.limit < self.max_in_flight:
+                self.limit = min(float(self.max_in_flight), self.limit + 1 / self.limit)
+                self._cond.notify_all()
+
+
+class LimitedBackend(LLMBackend):
+    """Wraps a backend with the limiter, retries and circuit breaker."""
+
+    def __init__(self, inner: LLMBackend, limiter: Optional[LLMLimiter] = None,
+                 breaker: Optional[CircuitBreaker] = None, max_retries: int = LLM_MAX_RETRIES,
+                 backoff_base: float = LLM_BACKOFF_BASE_SECONDS, backoff_max: float = LLM_BACKOFF_MAX_SECONDS,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.inner = inner
+        self.name = inner.name
+        self.limiter = limiter or LLMLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sleep = sleep
+        self._random = random.Random()
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff for retry `attempt` (0-based), never shorter than retry_after."""
+        delay = self._random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after + self._random.uniform(0, self.backoff_base / 4))
+        return delay
+
+    def _call(self, func: Callable[[], LLMResponse], prompt: str, system: Optional[List[str]],
+              tool: Optional[Dict], streamed: Callable[[], bool]) -> LLMResponse:
+        tokens = estimate_tokens(prompt + "".join(system or []) + (json.dumps(tool) if tool else ""))
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            with self.limiter.slot(tokens) as used:
+                try:
+                    response = func()
+                except Exception as e:
+                    retryable, status, retry_after = classify_error(e)
+                    if not retryable:
+                        if status is not None and 400 <= status < 500:
+                            self.breaker.record_success()  # The API answered; the request itself was bad
+                        else:
+                            self.breaker.release_trial()  # Our own bug, not an API outage or recovery
+                        raise
+                    self.breaker.record_failure()
+                    if status in THROTTLE_STATUS:
+                        self.limiter.throttled(retry_after)
+                    description = f"stream {e.error_type}" if isinstance(e, LLMStreamError) else \
+                        f"HTTP {status}" if status else type(e).__name__
+                    if streamed() or attempt == self.max_retries:
+                        raise LLMUnavailable(f"Claude API call failed ({description}) after {attempt + 1} attempt(s)",
+                                             retry_after=retry_after, partial=streamed()) from e
+                    delay = self.backoff(attempt, retry_after)
+                    logger.warning(f"Claude API call failed ({description}), retry {attempt + 1}/{self.max_retries} "
+                                   f"in {delay:.1f}s")
+                else:
+                    self.breaker.record_success()
+                    self.limiter.succeeded()
+                    # Cache reads don't count towards the API's input token rate limit
+                    used((response.input_tokens + response.cache_creation_input_tokens + response.output_tokens)
+                         or tokens)
+                    return response
+            with metrics.span("llm_backoff"):
+                self.sleep(delay)
+
+    def complete(self, prompt: str, max_tokens: int, model: str, system: Optional[List[str]] = None,
+                 tool: Optional[Dict] = None) -> LLMResponse:
+        return self._call(lambda: self.inner.complete(prompt, max_tokens, model, system=system, tool=tool), prompt,
+                          system, tool, lambda: False)
+
+    def stream(self, prompt: str, max_tokens: int, model: str, on_text: Callable[[str], None],
+               system: Optional[List[str]] = None, tool: Optional[Dict] = None) -> LLMResponse:
+        delivered = False
+
+        def forward(text: str):
+            nonlocal delivered
+            delivered = True
+            on_text(text)
+
+        return self._call(lambda: self.inner.stream(prompt, max_tokens, model, forward, system=system, tool=tool),
+                          prompt, system, tool, lambda: delivered)
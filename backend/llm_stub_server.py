@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+Local Anthropic Messages API stub for offline, reproducible pipeline runs.
+
+Answers POST /v1/messages the way Claude would shape it (a JSON message, or
+server-sent events with "stream": true): recorded responses
+(llm_backend.RecordReplayBackend files) when --recordings has one for the prompt,
+otherwise a synthetic extraction of the prompt's door sections. Latency, token
+throughput and error injection (HTTP errors, or error events part-way through a
+stream) are configurable, so extraction concurrency and chunk sizes can be tuned
+against a fixed, repeatable "API".
+
+Usage:
+    python llm_stub_server.py --port 8787 --latency 0.8 --tokens-per-second 60 --input-tokens-per-second 5000
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8787 ANTHROPIC_API_KEY=stub uvicorn main:app
+
+Response time is latency + uncached input tokens / input-tokens-per-second +
+output_tokens / tokens-per-second (~4 chars per token); streamed responses send
+their first text after the input part and the rest at the output rate.
+
+Prompt caching works like the API's: a system prompt marked with cache_control is
+written to the cache on first use (readable once that response starts) and read
+back by later calls with the same prefix, if it is at least PROMPT_CACHE_MIN_TOKENS.
+Cache reads cost no input time and are reported in the usage like the real API.
+
+A request with a forced tool call (tool_choice {"type": "tool"}) is answered with a
+tool_use block whose input holds the synthetic door array under the schema's first
+required property; streamed, it arrives as input_json_delta events.
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import llm_backend
+from llm_backend import CHARS_PER_TOKEN, LLMBackend, LLMResponse, RecordReplayBackend, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+STUB_DOOR_RE = re.compile(r'(?:Product|Door) ID/Location Ref:\s*((?:X\d+-)?[A-Z]+\d+)\s*-?\s*(.*?)\s*(?:\|\s*Level\s*(\d+))?\s*$',
+                          re.MULTILINE)
+STUB_ART_RE = re.compile(r'ART\s?(\d{2})')
+STUB_FAULT_RE = re.compile(r'Reason for failure:\s*\n(.+)')
+
+# Streamed text goes out in pieces of this many tokens
+STREAM_PIECE_TOKENS = 8
+
+# Shorter prefixes aren't cached (the API's minimum for Sonnet models)
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_TTL_SECONDS = 300
+
+
+def synthesize_response(prompt: str) -> str:
+    """
+    The JSON array a correct extraction of the prompt's door sections would return
+    (door id, location, ART codes, faults). Deterministic for a given prompt.
+    """
+    sections = prompt.split("Door sections:", 1)[-1]
+    matches = list(STUB_DOOR_RE.finditer(sections))
+    doors = []
+    for match, following in zip(matches, matches[1:] + [None]):
+        body = sections[match.end():following.start() if following else len(sections)]
+        door_id = match.group(1).strip()
+        if match.group(3):
+            door_id += f"-L{match.group(3)}"  # Floor suffix, as the extraction instructions ask
+        doors.append({
+            'door_id': door_id,
+            'location': match.group(2).strip(),
+            'faults': [fault.strip(' ,') for fault in STUB_FAULT_RE.findall(body)],
+            'art_codes': sorted({f"ART{code}" for code in STUB_ART_RE.findall(body)}),
+            'fire_rating': 'FD30',
+            'door_config': 'Single Leaf',
+            'is_replacement': 'ART 23' in body,
+        })
+    return json.dumps(doors)
+
+
+@dataclass
+class StubConfig:
+    """How the stub API behaves."""
+    latency: float = 0.0            # Seconds before the first token
+    tokens_per_second: float = 0.0  # Output throughput; 0 = instant
+    error_rate: float = 0.0         # Fraction of requests answered with error_status
+    error_status: int = 529         # 529 overloaded or 429 rate limited
+    retry_after: float = 1.0        # retry-after header on injected errors
+    recordings_dir: Optional[str] = None
+    seed: Optional[int] = None      # Makes error injection repeatable
+    input_tokens_per_second: float = 0.0  # Uncached input processing before the first token; 0 = instant
+    stream_error_rate: float = 0.0  # Fraction of streamed responses cut off by an error event (error_status's type)
+    stream_error_after: int = 1     # Text pieces sent before that error event
+
+
+class PromptCache:
+    """Cached system prompt prefixes: key -> (readable from, expires at)."""
+
+    def __init__(self, ttl: float = PROMPT_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def read_or_write(self, key: str, write_seconds: float) -> bool:
+        """
+        True on a hit (the entry's TTL is refreshed). On a miss the prefix is written,
+        readable by other calls write_seconds from now (when this response starts).
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] <= now < entry[1]:
+                self._entries[key] = (entry[0], now + self.ttl)
+                return True
+            if not entry or entry[1] <= now:
+                self._entries[key] = (now + write_seconds, now + write_seconds + self.ttl)
+            return False
+
+
+def _input_time(tokens: int, config: StubConfig) -> float:
+    return tokens / config.input_tokens_per_second if config.input_tokens_per_second else 0.0
+
+
+def _count_input_tokens(response: LLMResponse, prompt: str, model: str, config: StubConfig,
+                        system: List[str], cached_blocks: int, cache: Optional[PromptCache]):
+    """Fill in the usage: system blocks up to cached_blocks are read from or written to the cache."""
+    prefix_tokens = estimate_tokens("".join(system[:cached_blocks])) if cached_blocks else 0
+    uncached_tokens = estimate_tokens(prompt) + (estimate_tokens("".join(system[cached_blocks:]))
+                                                 if system[cached_blocks:] else 0)
+    response.cache_creation_input_tokens = response.cache_read_input_tokens = 0
+    if cache is None or prefix_tokens < PROMPT_CACHE_MIN_TOKENS:
+        response.input_tokens = uncached_tokens + prefix_tokens
+        return
+    response.input_tokens = uncached_tokens
+    key = llm_backend.prompt_key("", 0, model, system[:cached_blocks])
+    if cache.read_or_write(key, _input_time(prefix_tokens + uncached_tokens, config) + config.latency):
+        response.cache_read_input_tokens = prefix_tokens
+    else:
+        response.cache_creation_input_tokens = prefix_tokens
+
+
+def synthesize_tool_input(prompt: str, tool: Dict) -> str:
+    """synthesize_response()'s array as the tool input JSON, under the schema's first required property."""
+    key = (tool.get("input_schema", {}).get("required") or ["doors"])[0]
+    return f'{{"{key}": {synthesize_response(prompt)}}}'
+
+
+def stub_completion(prompt: str, max_tokens: int, model: str, config: StubConfig,
+                    system: Optional[List[str]] = None, cached_blocks: int = 0,
+                    cache: Optional[PromptCache] = None, tool: Optional[Dict] = None) -> LLMResponse:
+    """
+    The response the stub gives, with output truncated at max_tokens like the real API.
+    Doesn't sleep - callers apply response_delay().
+
+    Args:
+        system: System prompt blocks
+        cached_blocks: How many leading system blocks end at a cache_control breakpoint (0 = none)
+        cache: Prompt cache for those blocks
+        tool: The tool Claude is made to call (the text is then its input JSON)
+    """
+    response = None
+    if config.recordings_dir:
+        response = RecordReplayBackend('replay', config.recordings_dir).load(prompt, max_tokens, model, system, tool)
+    if response is None:
+        text = synthesize_tool_input(prompt, tool) if tool else synthesize_response(prompt)
+        response = LLMResponse(text=text, stop_reason="tool_use" if tool else "end_turn",
+                               output_tokens=estimate_tokens(text))
+    if response.output_tokens > max_tokens:
+        response = LLMResponse(text=response.text[:max_tokens * CHARS_PER_TOKEN], stop_reason="max_tokens",
+                               output_tokens=max_tokens)
+    if system:
+        _count_input_tokens(response, prompt, model, config, system, cached_blocks, cache)
+    else:
+        response.input_tokens = response.input_tokens or estimate_tokens(prompt)
+    response.model = model
+    return response
+
+
+def first_token_delay(response: LLMResponse, config: StubConfig) -> float:
+    """Latency plus processing the input that wasn't read from the prompt cache."""
+    return config.latency + _input_time(response.input_tokens + response.cache_creation_input_tokens, config)
+
+
+def response_delay(response: LLMResponse, config: StubConfig) -> float:
+    if config.tokens_per_second:
+        return first_token_delay(response, config) + response.output_tokens / config.tokens_per_second
+    return first_token_delay(response, config)
+
+
+def stream_pieces(response: LLMResponse, config: StubConfig) -> Iterator[str]:
+    """The response text in STREAM_PIECE_TOKENS pieces, paced like response_delay() overall."""
+    delay = first_token_delay(response, config)
+    if delay:
+        time.sleep(delay)
+    size = STREAM_PIECE_TOKENS * CHARS_PER_TOKEN
+    for start in range(0, len(response.text), size):
+        piece = response.text[start:start + size]
+        if config.tokens_per_second:
+            time.sleep(len(piece) / CHARS_PER_TOKEN / config.tokens_per_second)
+        yield piece
+
+
+class SyntheticBackend(LLMBackend):
+    """The stub's responses in-process (LLM_BACKEND=stub) - no HTTP, no API key."""
+
+    name = "stub"
+
+    def __init__(self, config: Optional[StubConfig] = None):
+        self.config = config or StubConfig()
+        self.prompt_cache = PromptCache()
+
+    def _completion(self, prompt: str, max_tokens: int, model: str, system: Optional[List[str]],
+                    tool: Optional[Dict]) -> LLMResponse:
+        # The whole system prompt is the cached prefix, as AnthropicBackend marks it
+        cached_blocks = len(system) if system and llm_backend.LLM_PROMPT_CACHE else 0
+        return stub_completion(prompt, max_tokens, model, self.config, system, cached_blocks, self.prompt_cache,
+                               tool)
+
+    def complete(self, prompt: str, max_tokens: int, model: str, system: Optional[List[str]] = None,
+                 tool: Optional[Dict] = None) -> LLMResponse:
+        response = self._completion(prompt, max_tokens, model, system, tool)
+        delay = response_delay(response, self.config)
+        if delay:
+            time.sleep(delay)
+        return response
+
+    def stream(self, prompt: str, max_tokens: int, model: str, on_text: Callable[[str], None],
+               system: Optional[List[str]] = None, tool: Optional[Dict] = None) -> LLMResponse:
+        response = self._completion(prompt, max_tokens, model, system, tool)
+        for piece in stream_pieces(response, self.config):
+            on_text(piece)
+        return response
+
+
+class StubServer(ThreadingHTTPServer):
+    """HTTP server holding the stub config and request stats."""
+
+    daemon_threads = True
+
+    def __init__(self, address, config: StubConfig):
+        super().__init__(address, StubRequestHandler)
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.prompt_cache = PromptCache()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'requests': self.requests, 'connections': self.connections, 'errors': self.errors,
+                    'peak_in_flight': self.peak_in_flight}
+
+
+def _system_blocks(system) -> Tuple[List[str], int]:
+    """A request's system prompt as text blocks, and how many end at its last cache_control breakpoint."""
+    if not system:
+        return [], 0
+    if isinstance(system, str):
+        return [system], 0
+    blocks = [block["text"] for block in system]
+    marked = [i + 1 for i, block in enumerate(system) if block.get("cache_control")]
+    return blocks, max(marked, default=0)
+
+
+def _forced_tool(request: dict) -> Optional[Dict]:
+    """The tool a request makes Claude call (tool_choice {"type": "tool"}), or None."""
+    choice = request.get("tool_choice") or {}
+    if choice.get("type") != "tool":
+        return None
+    return next(tool for tool in request.get("tools") or [] if tool["name"] == choice["name"])
+
+
+def _content_block(response: LLMResponse, message_id: str, tool: Optional[Dict]) -> dict:
+    """The reply's content block: text, or a tool_use block with the parsed input ({} if cut off)."""
+    if tool is None:
+        return {"type": "text", "text": response.text}
+    try:
+        tool_input = json.loads(response.text)
+    except ValueError:
+        tool_input = {}
+    return {"type": "tool_use", "id": f"toolu_{message_id}", "name": tool["name"], "input": tool_input}
+
+
+def _error_body(status: int, message: str = "Injected by stub") -> dict:
+    error_type = "rate_limit_error" if status == 429 else "overloaded_error"
+    return {"type": "error", "error": {"type": error_type, "message": message}}
+
+
+def _usage(response: LLMResponse) -> dict:
+    return {"input_tokens": response.input_tokens,
+            "cache_creation_input_tokens": response.cache_creation_input_tokens,
+            "cache_read_input_tokens": response.cache_read_input_tokens}
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without this, keep-alive clients
+    # wait out delayed ACKs (~40 ms) on every response
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        logger.debug(f"stub {self.address_string()} {format % args}")
+
+    def _send_json(self, status: int, body: dict, headers: Optional[dict] = None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_event(self, event: dict):
+        """One server-sent event as an HTTP/1.1 chunk."""
+        data = f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream_response(self, response: LLMResponse, message_id: str, config: StubConfig,
+                         tool: Optional[Dict] = None, fail: bool = False):
+        """
+        The Messages API streaming event sequence, text (or tool input JSON) paced by stream_pieces().
+        With fail, an error event follows the first stream_error_after pieces, as when the API
+        overloads mid-response.
+        """
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("cache-control", "no-cache")
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+        self._send_event({"type": "message_start", "message": {
+            "id": message_id, "type": "message", "role": "assistant", "model": response.model, "content": [],
+            "stop_reason": None, "stop_sequence": None,
+            "usage": {**_usage(response), "output_tokens": 1},
+        }})
+        if tool is None:
+            block, delta = {"type": "text", "text": ""}, lambda piece: {"type": "text_delta", "text": piece}
+        else:
+            block = {"type": "tool_use", "id": f"toolu_{message_id}", "name": tool["name"], "input": {}}
+            delta = lambda piece: {"type": "input_json_delta", "partial_json": piece}
+        self._send_event({"type": "content_block_start", "index": 0, "content_block": block})
+        for sent, piece in enumerate(stream_pieces(response, config)):
+            if fail and sent == config.stream_error_after:
+                break
+            self._send_event({"type": "content_block_delta", "index": 0, "delta": delta(piece)})
+        if fail:
+            self._send_event(_error_body(config.error_status))
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        self._send_event({"type": "content_block_stop", "index": 0})
+        self._send_event({"type": "message_delta",
+                          "delta": {"stop_reason": response.stop_reason, "stop_sequence": None},
+                          "usage": {"output_tokens": response.output_tokens}})
+        self._send_event({"type": "message_stop"})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("content-length", 0)))
+        if self.path.split('?')[0] != "/v1/messages":
+            self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+            return
+
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+            failed = server.random.random() < server.config.error_rate
+            if failed:
+                server.errors += 1
+        try:
+            config = server.config
+            if failed:
+                self._send_json(config.error_status, _error_body(config.error_status),
+                                {"retry-after": str(config.retry_after)})
+                return
+
+            try:
+                request = json.loads(body)
+                prompt = request["messages"][-1]["content"]
+                if isinstance(prompt, list):
+                    prompt = "".join(block.get("text", "") for block in prompt)
+                max_tokens = int(request["max_tokens"])
+                model = request["model"]
+                streaming = bool(request.get("stream"))
+                system, cached_blocks = _system_blocks(request.get("system"))
+                tool = _forced_tool(request)
+            except (ValueError, KeyError, TypeError, IndexError, StopIteration) as e:
+                self._send_json(400, {"type": "error", "error": {"type": "invalid_request_error", "message": str(e)}})
+                return
+
+            response = stub_completion(prompt, max_tokens, model, config, system, cached_blocks, server.prompt_cache,
+                                       tool)
+            message_id = f"msg_stub_{server.requests}"
+            if streaming:
+                with server.lock:
+                    stream_failed = config.stream_error_rate > 0 and server.random.random() < config.stream_error_rate
+                    if stream_failed:
+                        server.errors += 1
+                self._stream_response(response, message_id, config, tool, stream_failed)
+                return
+            delay = response_delay(response, config)
+            if delay:
+                time.sleep(delay)
+            self._send_json(200, {
+                "id": message_id,
+                "type": "message",
+                "role": "assistant",
+                "model": response.model,
+                "content": [_content_block(response, message_id, tool)],
+                "stop_reason": response.stop_reason,
+                "stop_sequence": None,
+                "usage": {**_usage(response), "output_tokens": response.output_tokens},
+            })
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+class start_stub_server:
+    """
+    Run the stub on a background thread for the duration of a with block.
+
+        with start_stub_server(StubConfig(latency=0.5)) as server:
+            backend = AnthropicBackend(api_key="stub", base_url=server.url)
+    """
+
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.server = StubServer((host, port), config or StubConfig())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self) -> StubServer:
+        self.thread.start()
+        return self.server
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Output throughput (0 = instant)")
+    parser.add_argument("--input-tokens-per-second", type=float, default=0.0,
+                        help="Uncached input processing rate (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=529, choices=[429, 529])
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--recordings", help="Serve recorded responses from this directory when available")
+    parser.add_argument("--seed", type=int, help="Seed for error injection")
+    parser.add_argument("--stream-error-rate", type=float, default=0.0,
+                        help="Fraction of streamed responses cut off by an error event")
+    parser.add_argument("--stream-error-after", type=int, default=1, help="Text pieces sent before that error event")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config = StubConfig(args.latency, args.tokens_per_second, args.error_rate, args.error_status,
+                        args.retry_after, args.recordings, args.seed, args.input_tokens_per_second,
+                        args.stream_error_rate, args.stream_error_after)
+    server = StubServer((args.host, args.port), config)
+    print(f"Anthropic stub listening on {server.url} "
+          f"(latency {config.latency}s, {config.tokens_per_second or 'unlimited'} tokens/s, "
+          f"error rate {config.error_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served: {server.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
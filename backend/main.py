@@ -1,6 +1,9 @@
 # Westpark Surveys API - Photo uploads via Vercel Blob
 import os
+import math
+import time
 import uuid
+import asyncio
 import logging
 import shutil
 import tempfile
@@ -8,9 +11,9 @@ from pathlib import Path
 from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from starlette.background import BackgroundTask
-from sqlalchemy.orm import Session
+from fastapi.responses import FileResponse, Response, PlainTextResponse
+from starlette.background import BackgroundTask, BackgroundTasks
+from sqlalchemy.orm import Session, undefer
 from sqlalchemy.orm.attributes import flag_modified
 from typing import List, Optional
 
@@ -18,7 +21,7 @@ from typing import List, Optional
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-from database import engine, get_db, Base
+from database import get_db, SessionLocal, init_db
 from schemas import (
     ChecklistCreate, ChecklistUpdate, ChecklistResponse, ChecklistWithOwner,
     UserCreate, UserLogin, UserResponse, UserWithStats, Token
@@ -27,77 +30,23 @@ from auth import (
     get_current_user, get_current_user_required, get_admin_user,
     authenticate_user, create_access_token
 )
-from models import User, Checklist, RateCardItem, FireDoorQuote
+from models import User, Checklist, RateCardItem, FireDoorQuote, FireDoorJob
 import crud
 import monday_api
+import blob_storage
+import quote_storage
+import firedoor_jobs
+import rate_card
+import metrics
+import llm_backend
+import http_clients
+from executors import run_cpu_bound, run_io_bound, shutdown_executors
 
 # Frontend URL for generating survey links
 FRONTEND_URL = os.getenv("FRONTEND_URL", "https://site-checklist.vercel.app")
 
-# Create tables
-Base.metadata.create_all(bind=engine)
-
-# Migration: Add new columns if they don't exist
-from sqlalchemy import text
-columns_to_add = [
-    ("monday_item_id", "VARCHAR(50)"),
-    ("goods_lift_notes", "TEXT"),
-    ("staircase_access_notes", "TEXT"),
-    ("wall_deflection_notes", "TEXT"),
-    ("door_finish_other", "TEXT"),
-    ("frame_type_other", "TEXT"),
-    ("acoustic_baffles_notes", "TEXT"),
-    ("fire_stopping_notes", "TEXT"),
-    ("is_draft", "BOOLEAN DEFAULT TRUE"),
-]
-for col_name, col_type in columns_to_add:
-    try:
-        with engine.connect() as conn:
-            conn.execute(text(f"ALTER TABLE checklists ADD COLUMN {col_name} {col_type}"))
-            conn.commit()
-            print(f"Migration: added {col_name} column")
-    except Exception as e:
-        if "already exists" in str(e).lower() or "duplicate column" in str(e).lower():
-            pass  # Column already exists, silently continue
-        else:
-            print(f"Migration skipped for {col_name}: column likely exists")
-
-# Migration: Add rate_card_description column to rate_card_items table
-try:
-    with engine.connect() as conn:
-        conn.execute(text("ALTER TABLE rate_card_items ADD COLUMN rate_card_description TEXT"))
-        conn.commit()
-        print("Migration: added rate_card_description column to rate_card_items")
-except Exception as e:
-    if "already exists" in str(e).lower() or "duplicate column" in str(e).lower():
-        pass  # Column already exists
-    else:
-        print(f"Migration skipped for rate_card_description: {e}")
-
-# Migration: Convert numeric building spec columns to text (VARCHAR)
-# This fixes the "numeric field overflow" error when users enter large values
-numeric_to_text_columns = [
-    "ceiling_height",
-    "skirting_size",
-    "ceiling_void_depth",
-    "floor_void_depth",
-    "building_level",
-    "service_penetrations_scale",
-]
-for col_name in numeric_to_text_columns:
-    try:
-        with engine.connect() as conn:
-            # Try with USING clause to convert existing numeric data
-            conn.execute(text(f"ALTER TABLE checklists ALTER COLUMN {col_name} TYPE VARCHAR(100) USING {col_name}::TEXT"))
-            conn.commit()
-            print(f"Migration: converted {col_name} from NUMERIC to VARCHAR(100)")
-    except Exception as e:
-        error_str = str(e).lower()
-        if "does not exist" in error_str or "already" in error_str:
-            # Column doesn't exist or already correct type
-            pass
-        else:
-            print(f"Migration note for {col_name}: {str(e)[:100]}")
+# Create tables and add columns that existing databases are missing
+init_db()
 
 app = FastAPI(
     title="Site Visit Checklist API",
@@ -114,22 +63,45 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["X-Survey-Type"],  # Expose custom header for frontend
+    expose_headers=["X-Survey-Type", "X-Extraction-Sources", "X-Extraction-Flagged", "X-Quote-Id", "X-Quote-Job-Id", "X-Batch-Succeeded", "X-Batch-Failed", "Server-Timing"],  # Expose custom headers for frontend
 )
+# Request latency histograms for /metrics (and per-request stage spans)
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Uploads now use Vercel Blob - no local storage needed
 
 @app.on_event("startup")
 async def startup_event():
     blob_token = os.getenv("BLOB_READ_WRITE_TOKEN")
-    logger.info(f"[STARTUP] BLOB_READ_WRITE_TOKEN configured: {bool(blob_token)}")
+    logger.info(f"[STARTUP] BLOB_READ_WRITE_TOKEN configured: {blob_storage.check_token()}")
     if blob_token:
         logger.info(f"[STARTUP] Token prefix: {blob_token[:20]}...")
+    # Pooled keep-alive connections for Anthropic, Blob and Monday.com calls
+    http_clients.open_clients()
+    # Drain the fire door job queue in this process (set FIREDOOR_JOB_WORKERS=0 to
+    # leave it to dedicated `python firedoor_jobs.py` workers)
+    if firedoor_jobs.FIREDOOR_JOB_WORKERS > 0:
+        firedoor_jobs.start_workers(firedoor_jobs.FIREDOOR_JOB_WORKERS)
+    # Seed/backfill the rate card from the template and load the rate card snapshot
+    template_path = Path(__file__).parent / "reference_files" / "WestPark_FireDoor_CostSheet_v3_AlphaSights.xlsx"
+    await run_io_bound(rate_card.initialize, str(template_path))
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    firedoor_jobs.stop_workers()
+    shutdown_executors()
+    http_clients.close_clients()
 
 @app.get("/")
 def root():
     return {"message": "Site Visit Checklist API", "docs": "/docs", "version": "2.0.0"}
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Request and pipeline stage latency histograms in Prometheus text format."""
+    return PlainTextResponse(metrics.render_metrics(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
 @app.get("/debug/blob-token")
 def debug_blob_token():
     blob_token = os.getenv("BLOB_READ_WRITE_TOKEN")
@@ -343,20 +315,10 @@ async def upload_photo(
     current_user: User = Depends(get_current_user_required),
     db: Session = Depends(get_db)
 ):
-    import requests
-    
     is_admin = current_user.role == "admin"
     checklist = crud.get_checklist(db, checklist_id, user_id=current_user.id, is_admin=is_admin)
     if not checklist:
         raise HTTPException(status_code=404, detail="Checklist not found")
-
-    # Get Vercel Blob token from environment
-    # TEMPORARY: Hardcoded for testing (Railway env var not working at runtime)
-    blob_token = "vercel_blob_rw_sVwnQznFPrCYs2uq_OHVOAjS4N9DidHZPyt4nJfIntS12k7"
-    logger.info(f"[UPLOAD] Using Vercel Blob token (hardcoded for testing)")
-    if not blob_token:
-        logger.error("[UPLOAD] BLOB_READ_WRITE_TOKEN not set")
-        raise HTTPException(status_code=500, detail="Blob storage not configured")
     
     # Generate unique filename
     original_filename = file.filename or "untitled.jpg"
@@ -371,25 +333,21 @@ async def upload_photo(
         content = await file.read()
         logger.info(f"[UPLOAD] Read {len(content)} bytes from uploaded file")
         
-        # PUT request to Vercel Blob API
-        blob_url = f"https://blob.vercel-storage.com/{pathname}"
-        response = requests.put(
-            blob_url,
-            data=content,
-            headers={
-                "Content-Type": file.content_type or "application/octet-stream",
-                "Authorization": f"Bearer {blob_token}"
-            }
+        # PUT to Vercel Blob in the thread pool so the event loop keeps serving requests
+        public_url = await run_io_bound(
+            blob_storage.upload_to_blob,
+            pathname,
+            content,
+            file.content_type or "application/octet-stream"
         )
         
-        if response.status_code != 200:
-            logger.error(f"[UPLOAD] Blob upload failed: {response.status_code} {response.text}")
+        if not public_url:
             raise HTTPException(status_code=500, detail="Failed to upload to blob storage")
         
-        blob_data = response.json()
-        public_url = blob_data.get("url")
         logger.info(f"[UPLOAD] ✅ Blob uploaded: {public_url}")
-        
+    
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"[UPLOAD] Blob upload exception: {e}")
         raise HTTPException(status_code=500, detail=f"Blob upload failed: {str(e)}")
@@ -484,6 +442,68 @@ def admin_clear_photos(
 
 
 # ==================== FIRE DOOR QUOTING ENDPOINT ====================
+# Every blocking stage below is awaited off the event loop: parsing and workbook
+# population in the process pool, Claude/Blob/disk I/O in the thread pool.
+
+def _save_upload(file: UploadFile, path: Path):
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(file.file, f)
+
+
+async def _extract_doors_async(survey) -> list:
+    """
+    Async counterpart of firedoor_processor.extract_loaded_doors for request handlers.
+    
+    Args:
+        survey: firedoor_processor.LoadedSurvey (already sniffed, hashed and parsed)
+    
+    Raises:
+        ValueError: If the format is unsupported or extraction fails
+    """
+    import firedoor_processor as fdp
+    
+    if survey.file_format not in ('TYPE_1', 'TYPE_2'):
+        raise ValueError(f"Unsupported format: {survey.file_format}")
+    
+    cache_key, doors = await run_io_bound(fdp.lookup_cached_doors, survey.path, survey.file_format, survey.sha256)
+    if doors is not None:
+        return doors
+    
+    if survey.file_format == 'TYPE_1':
+        doors = await run_io_bound(fdp.extract_type1_from_text, survey.text)
+    elif survey.doors is not None:
+        doors = survey.doors
+    else:
+        # Large multi-sheet workbook: one process-pool task per sheet group
+        results = await asyncio.gather(*(
+            run_cpu_bound(fdp.extract_type2_sheets, survey.path, group) for group in survey.sheet_groups
+        ))
+        doors = fdp.merge_type2_sheets(survey.sheet_names, results)
+    
+    await run_io_bound(fdp.store_cached_doors, cache_key, survey.file_format, doors)
+    return doors
+
+
+def _enqueue_quote_upload(user_id: int, client_name: str, filename: str, output_path: Path,
+                          output_filename: str, survey_type: str, doors: list, rate_card_version: str) -> str:
+    """
+    Queue storing a generated quote and saving it to the history (a quote_upload job,
+    workbook bytes included), so it survives the process dying once the response is sent.
+
+    Returns:
+        The job id
+    """
+    db = SessionLocal()
+    try:
+        job = firedoor_jobs.enqueue_quote_upload(
+            db, str(uuid.uuid4()), user_id, client_name, filename, output_filename, output_path.read_bytes(),
+            survey_type, doors, rate_card_version
+        )
+        return job.id
+    finally:
+        db.close()
+
+
 @app.post("/api/firedoor/process")
 async def process_firedoor_survey(
     file: UploadFile = File(...),
@@ -497,12 +517,17 @@ async def process_firedoor_survey(
     Supports:
     - Type 1: PDF with FireDNA/RiskBase/BM TRADA ART codes
     - Type 2: Excel with door fault columns
+    
+    The quote is saved to storage and the quote history in the background;
+    X-Quote-Job-Id is the job to poll for its quote_id.
     """
     import firedoor_processor as fdp
     
     if not client_name:
         raise HTTPException(status_code=400, detail="Client name is required")
     
+    request_start = time.perf_counter()
+    
     def cleanup_temp_dir(dir_path: str):
         """Clean up temp directory after response is sent."""
         try:
@@ -518,11 +543,17 @@ async def process_firedoor_survey(
     try:
         # Save uploaded file
         input_path = Path(temp_dir) / file.filename
-        with open(input_path, 'wb') as f:
-            shutil.copyfileobj(file.file, f)
+        with metrics.span("upload_save"):
+            await run_io_bound(_save_upload, file, input_path)
         
-        # Detect format
-        file_format = fdp.detect_format(str(input_path), file.filename)
+        # Detect format and parse the upload in one pass (PDF text / Type 2 doors)
+        try:
+            survey = await run_cpu_bound(fdp.load_survey, str(input_path), file.filename)
+        except ValueError as e:
+            logger.error(f"Validation error during extraction: {str(e)}")
+            cleanup_temp_dir(temp_dir)
+            raise HTTPException(status_code=400, detail=str(e))
+        file_format = survey.file_format
         logger.info(f"Detected format: {file_format} for file: {file.filename}")
         
         if file_format == 'UNKNOWN':
@@ -532,17 +563,16 @@ async def process_firedoor_survey(
                 detail="Unsupported file format. Please upload a FireDNA/RiskBase PDF or Excel survey."
             )
         
-        # Extract door data
+        # Extract door data (repeat uploads are served from the extraction cache)
         try:
             if file_format == 'TYPE_1':
                 logger.info("Processing TYPE_1 (PDF with ART codes)")
-                doors = fdp.extract_type1_pdf(str(input_path))
             elif file_format == 'TYPE_2':
                 logger.info("Processing TYPE_2 (Excel with fault columns)")
-                doors = fdp.extract_type2_excel(str(input_path))
             else:
                 cleanup_temp_dir(temp_dir)
                 raise HTTPException(status_code=400, detail=f"Unsupported format: {file_format}")
+            doors = await _extract_doors_async(survey)
             
             logger.info(f"Extracted {len(doors)} doors from survey")
             
@@ -560,6 +590,15 @@ async def process_firedoor_survey(
             logger.error(f"Validation error during extraction: {str(e)}")
             cleanup_temp_dir(temp_dir)
             raise HTTPException(status_code=400, detail=str(e))
+        except llm_backend.LLMUnavailable as e:
+            # Claude is overloaded or down (retries exhausted / circuit open) - tell the client when to retry
+            logger.error(f"Claude unavailable during extraction: {str(e)}")
+            cleanup_temp_dir(temp_dir)
+            raise HTTPException(
+                status_code=503,
+                detail="The AI extraction service is busy. Please try again shortly.",
+                headers={"Retry-After": str(math.ceil(e.retry_after or 30))}
+            )
         except Exception as e:
             logger.error(f"Unexpected error extracting door data: {str(e)}")
             cleanup_temp_dir(temp_dir)
@@ -581,8 +620,12 @@ async def process_firedoor_survey(
                 detail=f"Template file not found at: {template_path}"
             )
         
+        snapshot = rate_card.get_snapshot()
         try:
-            result_path = fdp.populate_excel_template(doors, client_name, str(template_path), str(output_path))
+            result_path = await run_cpu_bound(
+                fdp.populate_excel_template, doors, client_name, str(template_path), str(output_path),
+                snapshot
+            )
             logger.info(f"populate_excel_template returned: {result_path}")
             
             # Double-check the file exists before returning
@@ -601,66 +644,41 @@ async def process_firedoor_survey(
             cleanup_temp_dir(temp_dir)
             raise HTTPException(status_code=500, detail=f"Error generating quote: {str(e)}")
         
-        # Upload Excel to Vercel Blob and save quote metadata to database
-        blob_url = None
-        comments = ""
+        # The quote_upload job row (with the workbook) is committed before the file is returned;
+        # the worker stores it and saves it to the quote history, retrying until it succeeds
         try:
-            # Prepare comments (e.g., Option B warning for Type 2)
-            if file_format == 'TYPE_2':
-                comments = "⚠️ Type 2 Survey: Review Option B requirements carefully"
-            
-            # Upload to Vercel Blob
-            blob_token = "vercel_blob_rw_sVwnQznFPrCYs2uq_OHVOAjS4N9DidHZPyt4nJfIntS12k7"
-            with open(output_path, 'rb') as excel_file:
-                excel_content = excel_file.read()
-            
-            blob_filename = f"firedoor-quotes/{uuid.uuid4()}_{output_filename}"
-            blob_upload_url = f"https://blob.vercel-storage.com/{blob_filename}"
-            
-            import requests
-            blob_response = requests.put(
-                blob_upload_url,
-                data=excel_content,
-                headers={
-                    "Content-Type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    "Authorization": f"Bearer {blob_token}"
-                }
+            upload_job_id = await run_io_bound(
+                _enqueue_quote_upload, current_user.id, client_name, file.filename or "survey",
+                output_path, output_filename, file_format, doors, snapshot.version
             )
-            
-            if blob_response.status_code == 200:
-                blob_data = blob_response.json()
-                blob_url = blob_data.get("url")
-                logger.info(f"Excel uploaded to Blob: {blob_url}")
-            else:
-                logger.error(f"Blob upload failed: {blob_response.status_code} {blob_response.text}")
-            
-            # Save quote to database
-            if blob_url:
-                from models import FireDoorQuote
-                quote = FireDoorQuote(
-                    user_id=current_user.id,
-                    client_name=client_name,
-                    survey_type=file_format,
-                    door_count=len(doors),
-                    excel_url=blob_url,
-                    comments=comments
-                )
-                db.add(quote)
-                db.commit()
-                logger.info(f"Quote saved to database: ID {quote.id}")
         except Exception as e:
-            logger.error(f"Error uploading to Blob or saving to database: {e}")
-            # Don't fail the whole request - still return the file
-        
-        # Return file with background cleanup and survey type header
+            logger.error(f"Error queueing upload of {output_filename}: {type(e).__name__}: {e}")
+            cleanup_temp_dir(temp_dir)
+            raise HTTPException(status_code=500, detail="Quote generated but could not be saved; please try again")
+        background = BackgroundTasks()
+        background.add_task(cleanup_temp_dir, temp_dir)
         response = FileResponse(
             path=str(output_path),
             filename=output_filename,
             media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            background=BackgroundTask(cleanup_temp_dir, temp_dir)
+            background=background
         )
         # Add custom header to indicate survey type (for frontend messaging)
         response.headers["X-Survey-Type"] = file_format
+        # Type 1: doors from the FireDNA parser vs Claude
+        sources = fdp.extraction_sources(doors)
+        if sources:
+            response.headers["X-Extraction-Sources"] = sources
+        # Doors whose extracted values were coerced or unreadable - flagged for manual review in the workbook
+        flagged = fdp.flagged_door_count(doors)
+        if flagged:
+            response.headers["X-Extraction-Flagged"] = str(flagged)
+        # GET /api/firedoor/jobs/{id} has the quote_id (for .../requote) once it is saved
+        response.headers["X-Quote-Job-Id"] = upload_job_id
+        # Per-stage timings for the browser's network panel (also in /metrics)
+        response.headers["Server-Timing"] = metrics.server_timing_header(
+            metrics.current_spans(), time.perf_counter() - request_start
+        )
         return response
     
     except Exception as e:
@@ -669,6 +687,250 @@ async def process_firedoor_survey(
         raise
 
 
+# ============================================================================
+# BATCH ENDPOINT
+# ============================================================================
+
+def _create_quote_record(**fields) -> int:
+    """
+    Save a quote history row in its own session (run via run_io_bound, so concurrent
+    callers never share one). A failed commit is rolled back before the error is raised.
+
+    Returns:
+        The new quote's id
+    """
+    db = SessionLocal()
+    try:
+        return crud.create_firedoor_quote(db, **fields).id
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def _quote_batch_entry(entry, client_name: str, output_dir: str, user_id: int,
+                             semaphore: asyncio.Semaphore):
+    """
+    Quote one survey from a batch, recording the outcome on the entry.
+
+    Failures are per file: they end up in the manifest instead of failing the batch.
+    """
+    import firedoor_processor as fdp
+
+    async with semaphore:
+        try:
+            survey = await run_cpu_bound(fdp.load_survey, entry.path, Path(entry.path).name)
+            entry.survey_type = survey.file_format
+            if survey.file_format == 'UNKNOWN':
+                raise ValueError("Unsupported file format. Please upload a FireDNA/RiskBase PDF or Excel survey.")
+
+            doors = await _extract_doors_async(survey)
+            entry.door_count = len(doors)
+            if not doors:
+                raise ValueError("No door data could be extracted from the file. Please check the file format.")
+
+            output_path = Path(output_dir) / entry.quote_filename
+            snapshot = rate_card.get_snapshot()
+            await run_cpu_bound(
+                fdp.populate_excel_template, doors, client_name, str(fdp.TEMPLATE_PATH), str(output_path),
+                snapshot
+            )
+            entry.status = "ok"
+        except ValueError as e:
+            entry.status, entry.error, entry.quote_filename = "error", str(e), None
+        except Exception as e:
+            logger.error(f"Batch: error quoting {entry.filename}: {type(e).__name__}: {e}", exc_info=True)
+            entry.status, entry.error, entry.quote_filename = "error", f"Error generating quote: {str(e)}", None
+
+    if entry.status != "ok":
+        logger.info(f"Batch: {entry.filename} failed: {entry.error}")
+        return
+    logger.info(f"Batch: quoted {entry.filename} ({entry.survey_type}, {entry.door_count} doors)")
+
+    # Upload to Blob and save to quote history (don't fail the file if this fails)
+    try:
+        excel_content = await run_io_bound((Path(output_dir) / entry.quote_filename).read_bytes)
+        with metrics.span("blob_upload"):
+            entry.excel_url = await run_io_bound(
+                quote_storage.get_storage().save,
+                f"firedoor-quotes/{uuid.uuid4()}_{entry.quote_filename}",
+                excel_content,
+                blob_storage.XLSX_CONTENT_TYPE
+            )
+        if entry.excel_url:
+            doors_gz = await run_io_bound(crud.pack_doors, doors)
+            entry.quote_id = await run_io_bound(
+                _create_quote_record,
+                user_id=user_id,
+                client_name=client_name,
+                survey_type=entry.survey_type,
+                door_count=entry.door_count,
+                excel_url=entry.excel_url,
+                comments=fdp.quote_comments(entry.survey_type),
+                doors_gz=doors_gz,
+                rate_card_version=snapshot.version
+            )
+    except Exception as e:
+        logger.error(f"Batch: error uploading {entry.quote_filename} to Blob or saving to database: {e}")
+
+
+@app.post("/api/firedoor/batch")
+async def process_firedoor_batch(
+    file: UploadFile = File(...),
+    client_name: str = Form(...),
+    current_user: User = Depends(get_current_user_required)
+):
+    """
+    Quote a whole portfolio of surveys uploaded as one ZIP.
+
+    Surveys are quoted concurrently (FIREDOOR_BATCH_PARALLELISM at a time) and
+    returned as a ZIP of quote workbooks plus manifest.json, which lists every
+    input file with its survey type, door count, quote id or error. Each
+    successful quote is also saved to the quote history.
+    """
+    import firedoor_batch
+
+    if not client_name:
+        raise HTTPException(status_code=400, detail="Client name is required")
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        surveys_dir = Path(temp_dir) / "surveys"
+        quotes_dir = Path(temp_dir) / "quotes"
+        surveys_dir.mkdir()
+        quotes_dir.mkdir()
+
+        upload_path = Path(temp_dir) / "batch.zip"
+        with metrics.span("upload_save"):
+            await run_io_bound(_save_upload, file, upload_path)
+        try:
+            entries = await run_io_bound(firedoor_batch.extract_batch_archive, str(upload_path), str(surveys_dir))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        firedoor_batch.assign_quote_filenames(entries, client_name)
+
+        semaphore = asyncio.Semaphore(max(1, firedoor_batch.FIREDOOR_BATCH_PARALLELISM))
+        await asyncio.gather(*(
+            _quote_batch_entry(entry, client_name, str(quotes_dir), current_user.id, semaphore)
+            for entry in entries
+        ))
+
+        output_filename = f"{client_name.replace(' ', '_')}_FireDoor_Quotes.zip"
+        output_path = Path(temp_dir) / output_filename
+        await run_io_bound(firedoor_batch.write_batch_archive, str(output_path), entries, client_name, str(quotes_dir))
+
+        succeeded = sum(1 for entry in entries if entry.status == "ok")
+        logger.info(f"Batch for {client_name}: {succeeded}/{len(entries)} surveys quoted")
+
+        response = FileResponse(
+            path=str(output_path),
+            filename=output_filename,
+            media_type=firedoor_batch.ZIP_CONTENT_TYPE,
+            background=BackgroundTask(shutil.rmtree, temp_dir, ignore_errors=True)
+        )
+        response.headers["X-Batch-Succeeded"] = str(succeeded)
+        response.headers["X-Batch-Failed"] = str(len(entries) - succeeded)
+        return response
+
+    except Exception:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+
+# ============================================================================
+# ASYNC JOB ENDPOINTS
+# ============================================================================
+
+def _get_job_for_user(db: Session, job_id: str, user: User) -> FireDoorJob:
+    job = db.query(FireDoorJob).filter(FireDoorJob.id == job_id).first()
+    if not job or (job.user_id != user.id and user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/api/firedoor/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_firedoor_job(
+    file: UploadFile = File(...),
+    client_name: str = Form(...),
+    current_user: User = Depends(get_current_user_required),
+    db: Session = Depends(get_db)
+):
+    """
+    Queue a fire door survey for quote generation and return immediately.
+    Poll GET /api/firedoor/jobs/{job_id} and download from .../result when done.
+    """
+    if not client_name:
+        raise HTTPException(status_code=400, detail="Client name is required")
+    
+    content = await file.read()
+    if not content:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    
+    job = await run_io_bound(
+        firedoor_jobs.enqueue_job, db, current_user.id, client_name, file.filename or "survey", content
+    )
+    
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/firedoor/jobs/{job.id}",
+        "result_url": f"/api/firedoor/jobs/{job.id}/result"
+    }
+
+
+@app.get("/api/firedoor/jobs/{job_id}")
+def get_firedoor_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user_required),
+    db: Session = Depends(get_db)
+):
+    """Get the status of a queued fire door quote job."""
+    job = _get_job_for_user(db, job_id, current_user)
+    
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "client_name": job.client_name,
+        "filename": job.filename,
+        "survey_type": job.survey_type,
+        "door_count": job.door_count,
+        "quote_id": job.quote_id,
+        "error": job.error,
+        "attempts": job.attempts,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        # quote_upload jobs hand their workbook to quote storage; the quote itself is quote_id
+        "result_url": f"/api/firedoor/jobs/{job.id}/result" if job.status == "done" and job.kind == "quote" else None
+    }
+
+
+@app.get("/api/firedoor/jobs/{job_id}/result")
+def get_firedoor_job_result(
+    job_id: str,
+    current_user: User = Depends(get_current_user_required),
+    db: Session = Depends(get_db)
+):
+    """Download the generated quote for a finished job."""
+    job = _get_job_for_user(db, job_id, current_user)
+    
+    if job.status == "failed":
+        raise HTTPException(status_code=400, detail=job.error or "Job failed")
+    if job.status != "done" or not job.result_file:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    
+    return Response(
+        content=job.result_file,
+        media_type=blob_storage.XLSX_CONTENT_TYPE,
+        headers={
+            "Content-Disposition": f'attachment; filename="{job.result_filename}"',
+            "X-Survey-Type": job.survey_type or ""
+        }
+    )
+
+
 # ============================================================================
 # TEST ENDPOINT (NO AUTH)
 # ============================================================================
@@ -690,21 +952,18 @@ async def process_firedoor_test(
     try:
         # Save uploaded file
         input_path = Path(temp_dir) / file.filename
-        with open(input_path, 'wb') as f:
-            shutil.copyfileobj(file.file, f)
+        await run_io_bound(_save_upload, file, input_path)
         
-        # Detect format
-        file_format = fdp.detect_format(str(input_path), file.filename)
+        # Detect format and parse the upload in one pass
+        survey = await run_cpu_bound(fdp.load_survey, str(input_path), file.filename)
+        file_format = survey.file_format
         logger.info(f"TEST: Detected format: {file_format}")
         
         if file_format == 'UNKNOWN':
             raise HTTPException(400, "Unsupported file format")
         
         # Extract doors
-        if file_format == 'TYPE_1':
-            doors = fdp.extract_type1_pdf(str(input_path))
-        else:
-            doors = fdp.extract_type2_excel(str(input_path))
+        doors = await _extract_doors_async(survey)
         
         logger.info(f"TEST: Extracted {len(doors)} doors")
         
@@ -714,7 +973,10 @@ async def process_firedoor_test(
         
         template_path = Path(__file__).parent / "reference_files" / "WestPark_FireDoor_CostSheet_v3_AlphaSights.xlsx"
         
-        fdp.populate_excel_template(doors, client_name, str(template_path), str(output_path))
+        await run_cpu_bound(
+            fdp.populate_excel_template, doors, client_name, str(template_path), str(output_path),
+            rate_card.get_snapshot()
+        )
         logger.info(f"TEST: Generated output: {output_path}")
         
         # Return file
@@ -794,6 +1056,7 @@ async def update_rate_card_item(
     
     db.commit()
     db.refresh(item)
+    await run_io_bound(rate_card.refresh_snapshot)
     
     logger.info(f"User {current_user.email} updated rate card item {item.art_code} to {unit_price}")
     
@@ -850,6 +1113,7 @@ async def seed_rate_card(
     # Bulk insert
     db.bulk_save_objects(items)
     db.commit()
+    await run_io_bound(rate_card.refresh_snapshot)
     
     logger.info(f"User {current_user.email} seeded {len(items)} rate card items")
     
@@ -870,6 +1134,7 @@ async def clear_rate_card(
     """
     count = db.query(RateCardItem).delete()
     db.commit()
+    await run_io_bound(rate_card.refresh_snapshot)
     
     logger.warning(f"User {current_user.email} cleared {count} rate card items")
     
@@ -955,6 +1220,7 @@ async def backfill_rate_card_descriptions(
         logger.info("Applied custom ART04 description for dual B01/B10 mapping")
     
     db.commit()
+    await run_io_bound(rate_card.refresh_snapshot)
     
     logger.info(f"User {current_user.email} backfilled {updated} rate card descriptions")
     
@@ -999,6 +1265,9 @@ async def list_firedoor_quotes(
             "door_count": quote.door_count,
             "excel_url": quote.excel_url,
             "comments": quote.comments,
+            "target_margin": quote.target_margin,
+            "rate_card_version": quote.rate_card_version,
+            "requoted_from_id": quote.requoted_from_id,
             "created_at": quote.created_at.isoformat() if quote.created_at else None
         })
     
@@ -1011,6 +1280,113 @@ async def list_firedoor_quotes(
     }
 
 
+def _load_requote_source(quote_id: int) -> Optional[FireDoorQuote]:
+    """
+    Load a saved quote with its stored doors, detached from its session (run via
+    run_io_bound, so neither the query nor the deferred doors_gz load block the loop).
+    """
+    db = SessionLocal()
+    try:
+        quote = db.query(FireDoorQuote).options(
+            undefer(FireDoorQuote.doors_gz)
+        ).filter(FireDoorQuote.id == quote_id).first()
+        if quote is not None:
+            db.expunge(quote)
+        return quote
+    finally:
+        db.close()
+
+
+@app.post("/api/firedoor/quotes/{quote_id}/requote")
+async def requote_firedoor_quote(
+    quote_id: int,
+    client_name: Optional[str] = Form(default=None),
+    target_margin: Optional[float] = Form(default=None),
+    current_user: User = Depends(get_current_user_required)
+):
+    """
+    Regenerate a quote from the doors stored with it - no survey upload, no extraction.
+
+    Prices with the current rate card. client_name and target_margin (e.g. 0.3)
+    default to the original quote's. The new quote is saved to the history and
+    returned like /api/firedoor/process (X-Quote-Id holds its id).
+    """
+    import firedoor_processor as fdp
+
+    original = await run_io_bound(_load_requote_source, quote_id)
+    if not original:
+        raise HTTPException(status_code=404, detail="Quote not found")
+    if original.doors_gz is None:
+        raise HTTPException(
+            status_code=409,
+            detail="This quote was created before doors were stored with quotes. Please re-upload the survey."
+        )
+    if target_margin is not None and not 0 <= target_margin < 1:
+        raise HTTPException(status_code=400, detail="Target margin must be between 0 and 1 (e.g. 0.35 for 35%)")
+
+    client_name = client_name or original.client_name
+    if target_margin is None:
+        target_margin = original.target_margin
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        doors = await run_io_bound(crud.unpack_doors, original.doors_gz)
+        output_filename = fdp.quote_output_filename(client_name)
+        output_path = Path(temp_dir) / output_filename
+        snapshot = rate_card.get_snapshot()
+        try:
+            await run_cpu_bound(
+                fdp.populate_excel_template, doors, client_name, str(fdp.TEMPLATE_PATH), str(output_path),
+                snapshot, None, target_margin
+            )
+        except Exception as e:
+            logger.error(f"Error re-quoting quote {quote_id}: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Error generating quote: {str(e)}")
+        logger.info(f"Re-quoted quote {quote_id} for {client_name} ({len(doors)} doors, rate card v{snapshot.version})")
+
+        new_quote_id = None
+        try:
+            excel_content = await run_io_bound(output_path.read_bytes)
+            with metrics.span("blob_upload"):
+                blob_url = await run_io_bound(
+                    quote_storage.get_storage().save,
+                    f"firedoor-quotes/{uuid.uuid4()}_{output_filename}",
+                    excel_content,
+                    blob_storage.XLSX_CONTENT_TYPE
+                )
+            if blob_url:
+                new_quote_id = await run_io_bound(
+                    _create_quote_record,
+                    user_id=current_user.id,
+                    client_name=client_name,
+                    survey_type=original.survey_type,
+                    door_count=original.door_count,
+                    excel_url=blob_url,
+                    comments=fdp.quote_comments(original.survey_type),
+                    doors_gz=original.doors_gz,  # Same doors - no need to re-pack
+                    target_margin=target_margin,
+                    rate_card_version=snapshot.version,
+                    requoted_from_id=original.id
+                )
+        except Exception as e:
+            logger.error(f"Error uploading re-quote to Blob or saving to database: {e}")
+
+        response = FileResponse(
+            path=str(output_path),
+            filename=output_filename,
+            media_type=blob_storage.XLSX_CONTENT_TYPE,
+            background=BackgroundTask(shutil.rmtree, temp_dir, ignore_errors=True)
+        )
+        response.headers["X-Survey-Type"] = original.survey_type or ""
+        if new_quote_id is not None:
+            response.headers["X-Quote-Id"] = str(new_quote_id)
+        return response
+
+    except Exception:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
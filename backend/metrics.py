@@ -0,0 +1,209 @@
+"""
+Metrics
+Per-stage timing spans and request latency, exposed as Prometheus histograms at
+/metrics and, per request, as a Server-Timing header.
+
+    with metrics.span("workbook_load"):
+        wb = load_template_workbook(path)
+
+Every span observes firedoor_stage_seconds{stage=...}. Inside a request it is also
+added to that request's timings (a contextvar, so concurrent requests never mix).
+Spans recorded in a process-pool worker come back with the result
+(executors.run_cpu_bound) and are recorded in the API process.
+
+Histograms are per process: with several uvicorn workers, scrape each one.
+"""
+
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Seconds: sub-millisecond regex stages up to multi-minute Claude extractions
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """A labelled Prometheus histogram (cumulative buckets, sum and count)."""
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        """Prometheus text exposition lines for this histogram."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, key))
+            prefix = f"{labels}," if labels else ""
+            suffix = f"{{{labels}}}" if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {values[-1]}')
+            lines.append(f"{self.name}_sum{suffix} {values[-2]}")
+            lines.append(f"{self.name}_count{suffix} {values[-1]}")
+        return lines
+
+    def count(self, **labels) -> int:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            return series[-1] if series else 0
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+STAGE_SECONDS = Histogram("firedoor_stage_seconds", "Fire door pipeline stage duration in seconds", ("stage",))
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request duration in seconds",
+                            ("method", "route", "status"))
+LLM_INPUT_TOKENS_SAVED = Histogram("firedoor_llm_input_tokens_saved",
+                                   "Estimated LLM input tokens removed per survey by pre-processing", (),
+                                   buckets=(500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000))
+EXTRACTION_DOOR_CONFIDENCE = Histogram("firedoor_extraction_door_confidence",
+                                       "FireDNA parser confidence per door, by which extractor's door was used",
+                                       ("source",), buckets=(0.25, 0.5, 0.75, 0.9, 1.0))
+LLM_INPUT_TOKENS = Histogram("firedoor_llm_input_tokens",
+                             "LLM input tokens per call: uncached, written to or read from the prompt cache",
+                             ("kind",), buckets=(0, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000))
+LLM_CALL_SECONDS = Histogram("firedoor_llm_call_seconds", "LLM call duration by prompt cache result (hit, miss, none)",
+                             ("cache",))
+LLM_FIRST_TOKEN_SECONDS = Histogram("firedoor_llm_first_token_seconds",
+                                    "LLM time to first token by prompt cache result (hit, miss, none)", ("cache",))
+EXTRACTION_CHUNK_DOORS = Histogram("firedoor_extraction_chunk_doors",
+                                   "Valid doors per Claude extraction response by result "
+                                   "(ok, or re-requested: truncated, invalid, no_array)",
+                                   ("result",), buckets=(0, 1, 2, 5, 10, 20, 50))
+HISTOGRAMS = [REQUEST_SECONDS, STAGE_SECONDS, LLM_INPUT_TOKENS_SAVED, EXTRACTION_DOOR_CONFIDENCE,
+              LLM_INPUT_TOKENS, LLM_CALL_SECONDS, LLM_FIRST_TOKEN_SECONDS, EXTRACTION_CHUNK_DOORS]
+
+# The current request's (or worker task's) spans; None outside one
+_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar("metrics_spans", default=None)
+
+
+def record_span(name: str, seconds: float):
+    """Record a finished stage: observe the histogram and add it to the current request's timings."""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    spans = _spans.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+@contextmanager
+def span(name: str):
+    """Time the with block as pipeline stage name (recorded even if it raises)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+@contextmanager
+def collect_spans():
+    """Start a fresh span list for this context (a request, or a pool task) and yield it."""
+    spans = []
+    token = _spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _spans.reset(token)
+
+
+def current_spans() -> List[Tuple[str, float]]:
+    return list(_spans.get() or [])
+
+
+def run_collecting_spans(func, *args, **kwargs):
+    """Process-pool entry point: run func and return (result, spans recorded while it ran)."""
+    with collect_spans() as spans:
+        result = func(*args, **kwargs)
+    return result, spans
+
+
+def server_timing_header(spans: List[Tuple[str, float]], total: Optional[float] = None) -> str:
+    """
+    Server-Timing value for a request's spans, one entry per stage in first-seen order.
+    Repeated stages (e.g. one llm_call per chunk) are summed, with the count in desc.
+    """
+    totals: Dict[str, List[float]] = {}
+    for name, seconds in spans:
+        entry = totals.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+    parts = []
+    for name, (seconds, count) in totals.items():
+        part = f"{name};dur={seconds * 1000:.1f}"
+        if count > 1:
+            part += f';desc="{count} calls"'
+        parts.append(part)
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def render_metrics() -> str:
+    """All histograms in Prometheus text format."""
+    return "\n".join(line for histogram in HISTOGRAMS for line in histogram.render()) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: times every HTTP request into http_request_duration_seconds
+    (labelled by route template, not raw path) and gives it its own span list.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with collect_spans():
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                REQUEST_SECONDS.observe(
+                    time.perf_counter() - start,
+                    method=scope["method"],
+                    route=getattr(route, "path", None) or "unmatched",
+                    status=status
+                )
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, Date, DateTime, JSON, ForeignKey, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, Boolean, Date, DateTime, Float, JSON, ForeignKey, Enum, LargeBinary
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 from database import Base
 import enum
@@ -125,6 +125,52 @@ class FireDoorQuote(Base):
     door_count = Column(Integer)
     excel_url = Column(Text, nullable=False)  # Vercel Blob URL
     comments = Column(Text)  # E.g., "Option B warning" for Type 2
+    doors_gz = deferred(Column(LargeBinary))  # gzip JSON of the extracted doors, for re-quotes
+    target_margin = Column(Float)  # Margin override (NULL = template default)
+    rate_card_version = Column(String(16))  # Rate card snapshot (content hash) the quote was priced with
+    requoted_from_id = Column(Integer, ForeignKey("firedoor_quotes.id"), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     user = relationship("User")
+
+
+class ExtractionCacheEntry(Base):
+    __tablename__ = "extraction_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(128), unique=True, index=True, nullable=False)  # sha256(file) + extractor version
+    survey_type = Column(String(20))  # TYPE_1 or TYPE_2
+    doors = Column(JSON, nullable=False)  # Extracted doors list
+    size_bytes = Column(Integer, nullable=False)  # Serialized size, used for eviction
+    hit_count = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class FireDoorJob(Base):
+    __tablename__ = "firedoor_jobs"
+
+    id = Column(String(36), primary_key=True, index=True)  # UUID returned to the client
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # quote: generate a quote from input_file; quote_upload: store result_file and save it to the history
+    kind = Column(String(20), nullable=False, default="quote", server_default="quote")
+    status = Column(String(20), nullable=False, default="queued", index=True)  # queued, running, done, failed
+    client_name = Column(String(255), nullable=False)
+    filename = Column(String(255), nullable=False)
+    input_file = Column(LargeBinary)  # Uploaded survey, cleared once the job finishes
+    result_file = Column(LargeBinary)  # Generated quote workbook
+    result_filename = Column(String(255))
+    survey_type = Column(String(20))
+    door_count = Column(Integer)
+    quote_id = Column(Integer, ForeignKey("firedoor_quotes.id"), nullable=True)
+    doors_gz = Column(LargeBinary)  # quote_upload: packed doors for the history row
+    rate_card_version = Column(String(16))  # quote_upload: rate card snapshot the quote was priced with
+    error = Column(Text)
+    attempts = Column(Integer, default=0)
+    run_after = Column(DateTime(timezone=True))  # Retry backoff: not claimed before this time
+    worker_id = Column(String(100))
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+
+    user = relationship("User")
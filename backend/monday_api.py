@@ -1,7 +1,10 @@
 import os
-import requests
 import logging
 
+import httpx
+
+import http_clients
+
 logger = logging.getLogger(__name__)
 
 MONDAY_API_URL = "https://api.monday.com/v2"
@@ -91,11 +94,10 @@ def _create_item_on_board(
     }
 
     try:
-        response = requests.post(
+        response = http_clients.get_client("monday").post(
             MONDAY_API_URL,
             json={"query": query},
-            headers=headers,
-            timeout=10
+            headers=headers
         )
         response.raise_for_status()
 
@@ -112,7 +114,7 @@ def _create_item_on_board(
         else:
             return {"success": False, "error": "No item ID returned"}
 
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"{board_label} API request failed: {e}")
         return {"success": False, "error": str(e)}
 
@@ -264,11 +266,10 @@ def update_site_survey_item(
     }
 
     try:
-        response = requests.post(
+        response = http_clients.get_client("monday").post(
             MONDAY_API_URL,
             json={"query": query},
-            headers=headers,
-            timeout=10
+            headers=headers
         )
         response.raise_for_status()
 
@@ -281,6 +282,6 @@ def update_site_survey_item(
         logger.info(f"Updated Monday.com item {item_id}")
         return {"success": True}
 
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Monday.com API request failed: {e}")
         return {"success": False, "error": str(e)}
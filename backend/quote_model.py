@@ -0,0 +1,591 @@
+"""
+Fire Door Quote Model
+Pure-Python quote computation: per-door classification, B/A-code counts, line
+totals, margins and client prices, built straight from the doors list and the
+rate card - no workbook cells involved.
+
+populate_excel_template renders a QuoteModel into the cost sheet template; the
+same model can be serialized for JSON previews, used in tests and batch runs.
+"""
+
+import logging
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from rate_card import RateCardSnapshot
+
+logger = logging.getLogger(__name__)
+
+# ART17 = leaf replacement, ART18 = full doorset replacement, ART20 = frame replacement
+REPLACEMENT_ART_CODES = ('ART17', 'ART18', 'ART20')
+
+# Quote Sheet line item rows (Option A B-codes, Option B A-codes)
+BCODE_ROWS = {
+    'B01': 11, 'B02': 12, 'B03': 13, 'B04': 14, 'B05': 15, 'B06': 16,
+    'B07': 17, 'B08': 18, 'B09': 19, 'B10': 20, 'B11': 21, 'B12': 22,
+}
+ACODE_ROWS = {
+    'A01': 26, 'A02': 27, 'A03': 28, 'A04': 29, 'A05': 30, 'A06': 31,
+    'A07': 32, 'A08': 33, 'A09': 34, 'A10': 35, 'A11': 36, 'A12': 37,
+    'A13': 38, 'A14': 39, 'A15': 40,
+}
+
+
+def get_priority_bcode(codes: List[str]) -> str:
+    """
+    Get the priority B-code from a list of codes.
+    Priority order: B01 > B03 > B04 > B10 > B05 > B02 > B06 > B07
+    
+    BUG 2 FIX: This ensures the primary B-code follows the correct priority
+    for Quote Sheet COUNTIF formulas.
+    """
+    if not codes:
+        return ''
+    
+    priority_order = ['B01', 'B03', 'B04', 'B10', 'B05', 'B02', 'B06', 'B07', 'B11', 'B12']
+    
+    for priority_code in priority_order:
+        if priority_code in codes:
+            return priority_code
+    
+    # If none match priority list, return first code
+    return codes[0]
+
+
+def get_aseries_description(a_code: str) -> str:
+    """
+    Get the description for an A-series replacement code.
+    
+    Args:
+        a_code: A-series code (A01-A15)
+    
+    Returns:
+        Description string with format: "A01 — FD30 Single Leaf, ≤2040mm"
+    """
+    descriptions = {
+        'A01': 'A01 — FD30 Single Leaf, ≤2040mm',
+        'A02': 'A02 — FD30 Single Leaf, 2040-2400mm',
+        'A03': 'A03 — FD30 Single Leaf, 2400-2730mm',
+        'A04': 'A04 — FD30 Double Leaf, ≤2040mm',
+        'A05': 'A05 — FD30S Single Leaf, ≤2040mm',
+        'A06': 'A06 — FD30S Single Leaf, 2040-2400mm',
+        'A07': 'A07 — FD30S Single Leaf, 2400-2730mm',
+        'A08': 'A08 — FD30S Double Leaf, ≤2040mm',
+        'A09': 'A09 — FD60S Single Leaf, ≤2040mm',
+        'A10': 'A10 — FD60S Single Leaf, 2040-2400mm',
+        'A11': 'A11 — FD60S Double Leaf, ≤2040mm',
+        'A12': 'A12 — Reserved',
+        'A13': 'A13 — Reserved',
+        'A14': 'A14 — Reserved',
+        'A15': 'A15 — Reserved',
+    }
+    return descriptions.get(a_code, '')
+
+
+def map_to_aseries_code(fire_rating: str, door_config: str, door_height: int = None, explicit_mapping: bool = False) -> str:
+    """
+    Map fire rating + door configuration + height to A-series replacement code.
+    
+    Args:
+        fire_rating: Fire rating (FD60, FD60S, FD30, FD30S, Nominal, etc.)
+        door_config: Door configuration ("Single Leaf" or "Double Leaf")
+        door_height: Door height in mm (optional, defaults to ≤2040 range)
+        explicit_mapping: If True, use exact FD30 → A01/A02/A03/A04 (no smoke seals default)
+                         If False (default), use FD30 → A05/A06/A07/A08 (with smoke seals)
+    
+    Returns:
+        A-series code (A01-A15) or empty string if no match
+    
+    Full mapping table (from Mauricio 2026-03-27):
+        FD30 Single ≤2040 → A01 (explicit) or A05 (default with smoke)
+        FD30 Single 2040–2400 → A02 (explicit) or A06 (default with smoke)
+        FD30 Single 2400–2730 → A03 (explicit) or A07 (default with smoke)
+        FD30 Double ≤2040 → A04 (explicit) or A08 (default with smoke)
+        FD30S Single ≤2040 → A05
+        FD30S Single 2040–2400 → A06
+        FD30S Single 2400–2730 → A07
+        FD30S Double ≤2040 → A08
+        FD60S Single ≤2040 → A09
+        FD60S Single 2040–2400 → A10
+        FD60S Double ≤2040 → A11
+        Nominal Single → A05 (default to FD30S)
+        Nominal Double → A08 (default to FD30S)
+    
+    Note: S suffix = smoke seals. FD30 ≠ FD30S
+    ISSUE 2 FIX: explicit_mapping=True for mandatory replacement doors (ART17/18/20)
+    """
+    if not fire_rating or not door_config:
+        return ''
+    
+    rating_upper = str(fire_rating).upper()
+    config_lower = str(door_config).lower()
+    
+    # Normalize config
+    is_single = 'single' in config_lower
+    is_double = 'double' in config_lower
+    
+    # Default to ≤2040 range if height not provided
+    if door_height is None or door_height <= 2040:
+        height_range = 1  # ≤2040
+    elif door_height <= 2400:
+        height_range = 2  # 2040-2400
+    elif door_height <= 2730:
+        height_range = 3  # 2400-2730
+    else:
+        height_range = 1  # Fallback to base code
+    
+    # Map based on rating + config + height
+    # ISSUE 2 FIX: For explicit_mapping=True, use exact FD30 codes (A01-A04) without smoke seal default
+    # For explicit_mapping=False (default), FD30 defaults to FD30S (A05-A08) per Mauricio's brief
+    if rating_upper == 'FD30':
+        if explicit_mapping:
+            # Exact mapping for replacement doors (ART17/18/20) - no smoke seal default
+            if is_single:
+                if height_range == 1:
+                    return 'A01'  # FD30 single ≤2040mm (exact, no smoke)
+                elif height_range == 2:
+                    return 'A02'  # FD30 single 2040-2400mm (exact, no smoke)
+                elif height_range == 3:
+                    return 'A03'  # FD30 single 2400-2730mm (exact, no smoke)
+            elif is_double:
+                return 'A04'  # FD30 double ≤2040mm (exact, no smoke)
+        else:
+            # Default mapping with smoke seals for remedial doors
+            if is_single:
+                if height_range == 1:
+                    return 'A05'  # FD30 defaults to FD30S single ≤2040mm (with smoke)
+                elif height_range == 2:
+                    return 'A06'  # FD30 defaults to FD30S single 2040-2400mm (with smoke)
+                elif height_range == 3:
+                    return 'A07'  # FD30 defaults to FD30S single 2400-2730mm (with smoke)
+            elif is_double:
+                return 'A08'  # FD30 defaults to FD30S double ≤2040mm (with smoke)
+    
+    # Check for FD30S (with S)
+    elif 'FD30S' in rating_upper:
+        if is_single:
+            if height_range == 1:
+                return 'A05'
+            elif height_range == 2:
+                return 'A06'
+            elif height_range == 3:
+                return 'A07'
+        elif is_double:
+            return 'A08'  # FD30S double (with smoke seals)
+    
+    # Check for FD60 or FD60S (treat FD60 same as FD60S)
+    elif 'FD60' in rating_upper:  # Matches both FD60 and FD60S
+        if is_single:
+            if height_range == 1:
+                return 'A09'
+            elif height_range == 2:
+                return 'A10'
+            elif height_range == 3:
+                # Height > 2400mm - outside standard range, use A10 (largest available)
+                logger.warning(f"FD60 single door height > 2400mm - using A10 (standard range exceeded)")
+                return 'A10'
+        elif is_double:
+            return 'A11'
+    
+    # Nominal defaults to FD30S
+    elif 'NOMINAL' in rating_upper:
+        if is_single:
+            return 'A05'  # Default to FD30S single ≤2040
+        elif is_double:
+            return 'A08'  # Default to FD30S double
+    
+    return ''  # No match
+
+
+def apply_margin(cost: float, margin: float) -> float:
+    """Client price for a cost at a gross margin: cost ÷ (1 - margin)."""
+    return cost / (1 - margin) if (1 - margin) > 0 else cost
+
+
+@dataclass(frozen=True)
+class QuoteRates:
+    """
+    Cost rates and target margin from the cost sheet template.
+    
+    Attributes:
+        b_rates: B-code -> total rate (Rate Card column G)
+        materials_rates: B-code -> MAT'S rate (column D)
+        labour_rates: B-code -> LABOUR rate (column E)
+        a_rates: A-code -> total rate (column G)
+        target_margin: Gross margin from Quote Sheet R2 (e.g. 0.35)
+    """
+    b_rates: Dict[str, float] = field(default_factory=dict)
+    materials_rates: Dict[str, float] = field(default_factory=dict)
+    labour_rates: Dict[str, float] = field(default_factory=dict)
+    a_rates: Dict[str, float] = field(default_factory=dict)
+    target_margin: float = 0
+    
+    @classmethod
+    def from_workbook(cls, wb) -> 'QuoteRates':
+        """Read rates from the template's Rate Card sheet and the margin from Quote Sheet R2."""
+        rate_card_sheet = wb['Rate Card']
+        b_rates = {}
+        materials_rates = {}
+        labour_rates = {}
+        # FIX #4: Read rates from Rate Card Total column (Column G)
+        # MAURICIO FIX: Also read Materials (D) and Labour (E) for breakdown
+        for row_num in range(22, 34):  # B01-B12
+            code = rate_card_sheet.cell(row=row_num, column=1).value
+            rate = rate_card_sheet.cell(row=row_num, column=7).value or 0  # Column G (Total)
+            if code and rate and isinstance(rate, (int, float)):
+                b_rates[str(code)] = rate
+                materials_rates[str(code)] = rate_card_sheet.cell(row=row_num, column=4).value or 0
+                labour_rates[str(code)] = rate_card_sheet.cell(row=row_num, column=5).value or 0
+        
+        a_rates = {}
+        for row_num in range(6, 40):
+            code = rate_card_sheet.cell(row=row_num, column=1).value
+            if code and str(code).startswith('A'):
+                a_rates[str(code)] = rate_card_sheet.cell(row=row_num, column=7).value or 0
+        
+        return cls(
+            b_rates=b_rates,
+            materials_rates=materials_rates,
+            labour_rates=labour_rates,
+            a_rates=a_rates,
+            target_margin=wb['Quote Sheet']['R2'].value or 0
+        )
+
+
+@dataclass
+class DoorLine:
+    """One Door Schedule row: the door's codes, Option A/B status and flags."""
+    door_id: str
+    location: str
+    fire_rating: str
+    door_config: str
+    faults: str                 # Column K (ACTION DESCRIPTION)
+    severity: str               # Column L
+    opt_a: str                  # Column N: YES / NO / COMPLIANT
+    opt_b: str                  # Column O: YES / NO / PENDING
+    primary_code: str           # Column P (OPT A BASE ITEM)
+    qty: int                    # Column Q (1 for non-compliant, 0 for compliant)
+    flags: str                  # Column V (NOTES / FLAGS)
+    b_codes: List[str]          # Column W (ALL B CODES), in the order written
+    a_code: str                 # Column X (OPT B REPLACEMENT CODE)
+    status: str                 # manual_review / compliant / replacement / remedial (row colour)
+    needs_replacement: bool = False
+    
+    @property
+    def all_b_codes(self) -> str:
+        return ', '.join(self.b_codes)
+
+
+@dataclass
+class LineItem:
+    """One Quote Sheet line (a B-code for Option A or an A-code for Option B)."""
+    code: str
+    qty: int
+    rate: float
+    materials_rate: float = 0
+    labour_rate: float = 0
+    materials_total: float = 0
+    labour_total: float = 0
+    cost_total: float = 0
+    client_total: float = 0
+    door_ids: List[str] = field(default_factory=list)
+    description: str = ''
+
+
+def classify_door(door: Dict, snapshot: RateCardSnapshot) -> DoorLine:
+    """
+    Work out a door's Door Schedule row from its extracted data.
+    
+    Args:
+        door: Door dictionary from extraction (Type 1 or Type 2)
+        snapshot: Rate card snapshot used to map ART codes to B-codes
+    """
+    door_id = door['door_id']
+    
+    # ISSUE 3 FIX: Check for replacement doors FIRST, before B-code processing
+    art_codes = door.get('art_codes', [])
+    codes = door.get('b_codes', [])
+    needs_replacement = (
+        any(art in REPLACEMENT_ART_CODES for art in art_codes) or
+        'A-series' in codes or  # CSV mapping returns 'A-series' for replacement codes
+        door.get('is_replacement', False)  # Claude's explicit flag
+    )
+    
+    if needs_replacement:
+        # Replacement doors: Skip B-code logic entirely
+        codes = []
+        # ISSUE 2 FIX: explicit_mapping=True for replacement doors (no smoke seal default)
+        # ISSUE 3 FIX: Column P = A-series code
+        primary_code = map_to_aseries_code(
+            door.get('fire_rating', 'Unknown'), door.get('door_config', 'Single Leaf'),
+            door.get('door_height_mm', None), explicit_mapping=True
+        )
+        all_codes = []
+    else:
+        if not codes and 'art_codes' in door:
+            codes = snapshot.rate_card_codes(door['art_codes'])
+        # BUG 2 FIX: Get primary code using priority order
+        primary_code = get_priority_bcode(codes)
+        all_codes = list(codes)
+        # FINAL FIX: Column P must NEVER be empty for a YES door - unable-to-inspect
+        # doors with no detectable codes get B01 (seals) as provisional primary code
+        if not primary_code and door.get('has_unable'):
+            primary_code = 'B01'
+    
+    fire_rating = door.get('fire_rating', 'Unknown')
+    door_config = door.get('door_config', 'Single Leaf')
+    faults_str = '; '.join(door.get('faults', []))
+    severity = 'HIGH' if len(codes) > 3 else 'MEDIUM' if codes else 'LOW'
+    
+    # BUG 1 FIX: Door is compliant ONLY if no codes AND no faults
+    is_compliant = not codes and not faults_str
+    # Type 2 surveys have no fire strategy, so Option B = PENDING
+    is_type2 = door.get('format_type') == 'TYPE_2'
+    
+    # 9 FIXES: Option B = replace ALL non-compliant doors with new certified sets, so
+    # EVERY non-compliant door gets an A-series code (column X) for Option B pricing
+    a_series_code = ''
+    if not is_compliant and not is_type2:
+        door_height = door.get('door_height_mm', None)
+        if fire_rating != 'Unknown':
+            # ISSUE 2 FIX: explicit mapping (no smoke) for ART17/18/20 doors
+            a_series_code = map_to_aseries_code(fire_rating, door_config, door_height, explicit_mapping=needs_replacement)
+            if not a_series_code:
+                logger.error(f"Door {door_id}: MAPPING FAILED - rating='{fire_rating}', config='{door_config}', height={door_height}")
+        else:
+            logger.warning(f"Door {door_id}: Fire rating Unknown - using default FD30S single → A05")
+            a_series_code = 'A05'  # Default: FD30S single ≤2040mm
+    
+    # Option A/B - priority order matters:
+    # 1. Replacement (ART17/18/20) → OptA=NO, OptB=YES
+    # 2. Type 2 → OptA=YES/COMPLIANT, OptB=PENDING
+    # 3. Compliant (no faults) → OptA=COMPLIANT, OptB=NO
+    # 4. Has faults → OptA=YES, OptB=NO
+    if needs_replacement:
+        opt_a, opt_b = 'NO', 'YES'
+    elif is_type2:
+        opt_a, opt_b = ('COMPLIANT' if is_compliant else 'YES'), 'PENDING'
+    elif is_compliant:
+        opt_a, opt_b = 'COMPLIANT', 'NO'
+    else:
+        opt_a, opt_b = 'YES', 'NO'
+    
+    # MAURICIO FIX: Human-readable flags only, no raw ART codes (ART codes → B-codes in col W)
+    flag_notes = []
+    if door.get('has_unable'):
+        flag_notes.append("⚠️ Unable to inspect - needs revisit")
+    if any(c in ['MANUAL REVIEW', 'A-series', 'FLAG FOR MANUAL REVIEW'] for c in codes):
+        flag_notes.append("⚠️ Manual review required")
+    # Values Claude returned that had to be coerced (see extraction_schema), or an unreadable door
+    for warning in door.get('extraction_warnings') or []:
+        flag_notes.append(f"⚠️ Check extraction: {warning}")
+    if 'art_codes' in door:
+        if 'ART14' in art_codes:
+            flag_notes.append("ART14 — damaged glazing, manual review required")
+        if 'ART23' in art_codes:
+            flag_notes.append("ART23 — no repair technique, manual review required")
+    
+    # Priority: Orange (manual review) > Green (compliant) > Red (replacement) > Yellow (remedial)
+    if door.get('has_unable') or any(note.startswith('⚠️') for note in flag_notes):
+        status = 'manual_review'
+    elif is_compliant:
+        status = 'compliant'
+    elif needs_replacement:
+        status = 'replacement'
+    else:
+        status = 'remedial'
+    
+    return DoorLine(
+        door_id=door_id,
+        location=door.get('location', ''),
+        fire_rating=fire_rating,
+        door_config=door_config,
+        faults=faults_str[:500],
+        severity=severity,
+        opt_a=opt_a,
+        opt_b=opt_b,
+        primary_code=primary_code or '',
+        qty=0 if is_compliant else 1,
+        flags=' | '.join(flag_notes),
+        b_codes=all_codes,
+        a_code=a_series_code or '',
+        status=status,
+        needs_replacement=needs_replacement
+    )
+
+
+class QuoteModel:
+    """
+    Quote computed from a doors list: Door Schedule rows, Option A (B-code)
+    and Option B (A-code) counts, line items, totals and client prices.
+    
+    Doors can be added incrementally with add_door(); totals are always derived
+    from the current counts.
+    """
+    
+    def __init__(self, rates: QuoteRates, snapshot: RateCardSnapshot, target_margin: Optional[float] = None):
+        self.rates = rates
+        self.snapshot = snapshot
+        self.target_margin = rates.target_margin if target_margin is None else target_margin
+        self.doors: List[DoorLine] = []
+        self.is_type2 = False
+        self.b_code_counts: Dict[str, int] = {}
+        self.b_code_door_ids: Dict[str, List[str]] = {}
+        self._b_code_door_id_sets: Dict[str, set] = {}
+        self.a_code_counts: Dict[str, int] = {}
+        self.a_code_door_ids: Dict[str, List[str]] = {}
+    
+    @classmethod
+    def build(cls, doors: List[Dict], rates: QuoteRates, snapshot: RateCardSnapshot,
+              target_margin: Optional[float] = None) -> 'QuoteModel':
+        model = cls(rates, snapshot, target_margin)
+        for door in doors:
+            model.add_door(door)
+        return model
+    
+    def add_door(self, door: Dict) -> DoorLine:
+        """Classify a door and add it to the counts."""
+        if not self.doors:
+            # BUG 4 FIX: Survey type (site/building fields, Option B PENDING) follows the first door
+            self.is_type2 = door.get('format_type') == 'TYPE_2'
+        line = classify_door(door, self.snapshot)
+        self.doors.append(line)
+        door_id = str(line.door_id)
+        
+        # FIX #3: Option A counts every B-code in ALL B CODES (not just the primary),
+        # once per door (MAURICIO FIX: deduplicated per door)
+        if line.opt_a == 'YES':
+            for b_code in set(line.b_codes):
+                if b_code and b_code.startswith('B'):
+                    self.b_code_counts[b_code] = self.b_code_counts.get(b_code, 0) + 1
+                    seen = self._b_code_door_id_sets.setdefault(b_code, set())
+                    if door_id not in seen:
+                        seen.add(door_id)
+                        self.b_code_door_ids.setdefault(b_code, []).append(door_id)
+        
+        # FIX #4-5: Option B counts the A-series code of ALL non-compliant doors
+        if line.a_code.startswith('A'):
+            a_code = line.a_code.strip()
+            self.a_code_counts[a_code] = self.a_code_counts.get(a_code, 0) + 1
+            self.a_code_door_ids.setdefault(a_code, []).append(door_id)
+        
+        return line
+    
+    @property
+    def opt_a_yes_count(self) -> int:
+        return sum(1 for line in self.doors if line.opt_a == 'YES')
+    
+    @property
+    def option_a_lines(self) -> List[LineItem]:
+        """Option A line items (Quote Sheet rows 11-22)."""
+        lines = []
+        for b_code in BCODE_ROWS:
+            qty = self.b_code_counts.get(b_code, 0)
+            # MAURICIO FIX: Materials and labour breakdown
+            mat_rate = self.rates.materials_rates.get(b_code, 0)
+            lab_rate = self.rates.labour_rates.get(b_code, 0)
+            mat_total = qty * mat_rate
+            lab_total = qty * lab_rate
+            total_cost = mat_total + lab_total
+            lines.append(LineItem(
+                code=b_code,
+                qty=qty,
+                rate=self.rates.b_rates.get(b_code, 0),
+                materials_rate=mat_rate,
+                labour_rate=lab_rate,
+                materials_total=mat_total,
+                labour_total=lab_total,
+                cost_total=total_cost,
+                client_total=apply_margin(total_cost, self.target_margin),
+                door_ids=list(self.b_code_door_ids.get(b_code, []))
+            ))
+        return lines
+    
+    @property
+    def option_b_lines(self) -> List[LineItem]:
+        """Option B line items (Quote Sheet rows 26-40)."""
+        lines = []
+        for a_code in ACODE_ROWS:
+            qty = self.a_code_counts.get(a_code, 0)
+            rate = self.rates.a_rates.get(a_code, 0)
+            lines.append(LineItem(
+                code=a_code,
+                qty=qty,
+                rate=rate,
+                cost_total=qty * rate,
+                client_total=apply_margin(qty * rate, self.target_margin),
+                door_ids=list(self.a_code_door_ids.get(a_code, [])),
+                description=get_aseries_description(a_code)
+            ))
+        return lines
+    
+    @property
+    def option_a_cost(self) -> float:
+        return sum(self.b_code_counts.get(code, 0) * rate for code, rate in self.rates.b_rates.items())
+    
+    @property
+    def option_a_client(self) -> float:
+        return apply_margin(self.option_a_cost, self.target_margin)
+    
+    @property
+    def option_b_cost(self) -> float:
+        return sum(self.a_code_counts.get(code, 0) * rate for code, rate in self.rates.a_rates.items())
+    
+    @property
+    def option_b_client(self) -> float:
+        return apply_margin(self.option_b_cost, self.target_margin)
+    
+    @property
+    def material_counts(self) -> Dict[str, int]:
+        """
+        Material Call-Off component counts. Same per-door deduplicated B-code counts
+        as Option A (ALL B CODES is only filled for Option A doors).
+        """
+        return dict(self.b_code_counts)
+    
+    @property
+    def verification_notes(self) -> List[str]:
+        """Notes asking to verify the door height for every door mapped to an A-series code."""
+        notes = []
+        for line in self.doors:
+            code = line.a_code
+            if code.startswith('A') and len(code) >= 3 and code[1:].isdigit() and 1 <= int(code[1:]) <= 15:
+                notes.append(
+                    f"⚠️ {line.door_id}: Door dimensions extracted from survey. Mapped to {code} "
+                    f"({line.fire_rating} {line.door_config}). Please verify actual door height "
+                    f"before ordering to confirm correct A-series code."
+                )
+        return notes
+    
+    def to_dict(self) -> Dict:
+        """JSON-serializable summary of the quote (for previews and APIs)."""
+        return {
+            'survey_type': 'TYPE_2' if self.is_type2 else 'TYPE_1',
+            'door_count': len(self.doors),
+            'target_margin': self.target_margin,
+            'rate_card_version': self.snapshot.version,
+            'option_a': {
+                'cost': self.option_a_cost,
+                'client_price': self.option_a_client,
+                'lines': [asdict(line) for line in self.option_a_lines if line.qty],
+            },
+            'option_b': {
+                'cost': self.option_b_cost,
+                'client_price': self.option_b_client,
+                'lines': [asdict(line) for line in self.option_b_lines if line.qty],
+            },
+            'doors': [
+                {
+                    'door_id': line.door_id,
+                    'location': line.location,
+                    'opt_a': line.opt_a,
+                    'opt_b': line.opt_b,
+                    'primary_code': line.primary_code,
+                    'b_codes': line.b_codes,
+                    'a_code': line.a_code,
+                    'status': line.status,
+                    'flags': line.flags,
+                }
+                for line in self.doors
+            ],
+        }
@@ -0,0 +1,116 @@
+"""
+Quote Storage
+Where generated quote workbooks are kept. The URL a backend returns is what the
+quote history stores as excel_url. QUOTE_STORAGE_BACKEND picks the backend:
+
+    vercel_blob   Vercel Blob (blob_storage) - the default
+    local         Files under QUOTE_STORAGE_DIR - offline development and tests
+
+Local files get a file:// URL unless QUOTE_STORAGE_PUBLIC_URL is set (e.g. a
+static file server in front of the directory).
+"""
+
+import os
+import logging
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+import blob_storage
+
+logger = logging.getLogger(__name__)
+
+QUOTE_STORAGE_BACKEND = os.getenv("QUOTE_STORAGE_BACKEND", "vercel_blob")
+QUOTE_STORAGE_DIR = os.getenv("QUOTE_STORAGE_DIR", str(Path(__file__).parent / "stored_quotes"))
+QUOTE_STORAGE_PUBLIC_URL = os.getenv("QUOTE_STORAGE_PUBLIC_URL")
+
+QUOTE_STORAGE_BACKENDS = ('vercel_blob', 'local')
+
+
+class QuoteStorage(ABC):
+    """Stores a file under a pathname and returns its URL. Implementations must be thread-safe."""
+
+    name = "base"
+
+    @abstractmethod
+    def save(self, pathname: str, content: bytes, content_type: str) -> Optional[str]:
+        """
+        Returns:
+            URL of the stored file, or None if the store rejected it
+        """
+
+
+class VercelBlobStorage(QuoteStorage):
+    name = "vercel_blob"
+
+    def save(self, pathname: str, content: bytes, content_type: str) -> Optional[str]:
+        return blob_storage.upload_to_blob(pathname, content, content_type)
+
+
+class LocalFilesystemStorage(QuoteStorage):
+    name = "local"
+
+    def __init__(self, root: str = QUOTE_STORAGE_DIR, public_url: Optional[str] = QUOTE_STORAGE_PUBLIC_URL):
+        self.root = Path(root).resolve()
+        self.public_url = public_url.rstrip('/') if public_url else None
+
+    def path_for(self, pathname: str) -> Path:
+        """
+        Raises:
+            ValueError: If pathname would land outside the storage directory
+        """
+        path = (self.root / pathname).resolve()
+        if not path.is_relative_to(self.root):
+            raise ValueError(f"Storage pathname escapes the storage directory: {pathname}")
+        return path
+
+    def save(self, pathname: str, content: bytes, content_type: str) -> Optional[str]:
+        path = self.path_for(pathname)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename so a reader never sees a half-written workbook
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        logger.info(f"Stored {len(content)} bytes at {path}")
+        if self.public_url:
+            return f"{self.public_url}/{path.relative_to(self.root).as_posix()}"
+        return path.as_uri()
+
+
+def create_storage(name: str = QUOTE_STORAGE_BACKEND) -> QuoteStorage:
+    """
+    Build a storage backend by QUOTE_STORAGE_BACKEND name.
+
+    Raises:
+        ValueError: If the name is not one of QUOTE_STORAGE_BACKENDS
+    """
+    if name == 'vercel_blob':
+        return VercelBlobStorage()
+    if name == 'local':
+        return LocalFilesystemStorage()
+    raise ValueError(f"Unknown QUOTE_STORAGE_BACKEND '{name}' (expected one of {', '.join(QUOTE_STORAGE_BACKENDS)})")
+
+
+_storage: Optional[QuoteStorage] = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> QuoteStorage:
+    """The process-wide quote storage, created from QUOTE_STORAGE_BACKEND on first use."""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage()
+            logger.info(f"Quote storage: {_storage.name}")
+        return _storage
+
+
+def set_storage(storage: Optional[QuoteStorage]) -> Optional[QuoteStorage]:
+    """Replace the process-wide storage (None: recreate from QUOTE_STORAGE_BACKEND). Returns the previous one."""
+    global _storage
+    with _storage_lock:
+        previous, _storage = _storage, storage
+    return previous
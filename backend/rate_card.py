@@ -0,0 +1,349 @@
+"""
+Rate Card Snapshot
+Process-wide, immutable view of the fire door rate card (ART -> rate card code
+mapping and rate card prices).
+
+Quotes read the current snapshot instead of querying rate_card_items and
+re-parsing "£45.00" strings on every request. The rate card endpoints call
+refresh_snapshot() after every edit, which builds a new snapshot and swaps it in
+atomically; a quote that already holds a snapshot keeps a consistent view for its
+whole run.
+
+A snapshot's version is a hash of its content, so every process (API instances,
+`python firedoor_jobs.py` workers) gives the same rate card the same version and a
+quote's rate_card_version identifies the prices it was built with. Only the process
+that served an edit (PUT/POST/DELETE /api/firedoor/rates, seed, clear, backfill)
+refreshes at once: the others keep quoting from their previous snapshot for up to
+RATE_CARD_TTL_SECONDS before they load the new one.
+"""
+
+import os
+import csv
+import json
+import time
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from database import SessionLocal
+    from models import RateCardItem
+    DATABASE_AVAILABLE = True
+except Exception as e:
+    logger.warning(f"Database import failed: {e}. Rate card will use CSV fallback.")
+    DATABASE_AVAILABLE = False
+    SessionLocal = None
+    RateCardItem = None
+
+SCRIPT_DIR = Path(__file__).parent
+MAPPING_CSV_PATH = SCRIPT_DIR / "reference_files" / "BMTrada_ART_Codes_RateCard_Mapping.csv"
+
+RATE_CARD_TTL_SECONDS = float(os.getenv("RATE_CARD_TTL_SECONDS", "60"))
+
+# rate_card_code values that don't map to a priced item
+UNMAPPED_CODES = ('FLAG FOR MANUAL REVIEW', 'NO EQUIVALENT')
+
+
+@dataclass(frozen=True)
+class RateCardSnapshot:
+    """
+    Immutable rate card view. Picklable, so it can be handed to process-pool workers.
+
+    Attributes:
+        version: Content hash (12 hex digits) - equal snapshots have equal versions, in any process
+        source: 'database' or 'csv'
+        art_mapping: ART code -> {'description', 'rate_card_code', 'unit_price', 'notes'}
+        art_to_codes: ART code -> rate card codes it maps to (e.g. ART04 -> ('B01', 'B10'))
+        prices: Rate card code -> unit price in £
+    """
+    version: str
+    source: str
+    art_mapping: Dict[str, Dict] = field(default_factory=dict)
+    art_to_codes: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+    prices: Dict[str, float] = field(default_factory=dict)
+    loaded_at: float = field(default_factory=time.monotonic)
+
+    def rate_card_codes(self, art_codes: List[str]) -> List[str]:
+        """Map ART codes to the (deduplicated) rate card codes they cover."""
+        codes = []
+        for art_code in art_codes:
+            codes.extend(self.art_to_codes.get(art_code, ()))
+        return list(set(codes))
+
+
+_snapshot: Optional[RateCardSnapshot] = None
+_lock = threading.Lock()
+
+
+def parse_price(value) -> Optional[float]:
+    """Parse a stored price like "£1,045.00" into a float. Returns None if unparseable."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace('£', '').replace(',', '').strip())
+    except ValueError:
+        return None
+
+
+def split_rate_card_code(rate_card_code: Optional[str]) -> List[str]:
+    """Split multi-code entries like "B01 / B10" into ['B01', 'B10']."""
+    if not rate_card_code:
+        return []
+    return [c.strip() for c in rate_card_code.split('/') if c.strip()]
+
+
+def _mapped_codes(rate_card_code: Optional[str]) -> Tuple[str, ...]:
+    if not rate_card_code or rate_card_code.strip() in UNMAPPED_CODES:
+        return ()
+    return tuple(split_rate_card_code(rate_card_code))
+
+
+def _load_rows_from_db() -> Optional[List[Dict]]:
+    if not DATABASE_AVAILABLE:
+        return None
+    db = SessionLocal()
+    try:
+        items = db.query(RateCardItem).all()
+        return [{
+            'art_code': item.art_code,
+            'description': item.description,
+            'rate_card_code': item.rate_card_code,
+            'unit_price': item.unit_price,
+            'notes': f"Last updated: {item.updated_at}" if item.updated_at else ""
+        } for item in items]
+    except Exception as e:
+        logger.error(f"Failed to load rate card from database: {e}. Will fallback to CSV.")
+        return None
+    finally:
+        db.close()
+
+
+def _load_rows_from_csv() -> List[Dict]:
+    rows = []
+    with open(MAPPING_CSV_PATH, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            rows.append({
+                'art_code': row['ART Code'],
+                'description': row['Description'],
+                'rate_card_code': row['WestPark Rate Card Code'],
+                'unit_price': None,  # CSV doesn't have prices
+                'notes': row['Notes']
+            })
+    return rows
+
+
+def snapshot_version(source: str, art_mapping: Dict[str, Dict], prices: Dict[str, float]) -> str:
+    """
+    Hash of what a rate card prices quotes with. Notes (last-updated timestamps) are
+    left out, so setting a price back gives back the earlier version.
+    """
+    mapping = {art_code: {k: v for k, v in item.items() if k != 'notes'} for art_code, item in art_mapping.items()}
+    content = json.dumps([source, mapping, prices], sort_keys=True, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:12]
+
+
+def build_snapshot() -> RateCardSnapshot:
+    """Build a snapshot from the database, falling back to the CSV mapping if it is empty or unavailable."""
+    rows = _load_rows_from_db()
+    source = 'database'
+    if not rows:
+        rows = _load_rows_from_csv()
+        source = 'csv'
+
+    art_mapping = {}
+    art_to_codes = {}
+    prices = {}
+    for row in rows:
+        art_code = row['art_code']
+        art_mapping[art_code] = {k: row[k] for k in ('description', 'rate_card_code', 'unit_price', 'notes')}
+        art_to_codes[art_code] = _mapped_codes(row['rate_card_code'])
+
+        if not row['unit_price']:
+            continue
+        price = parse_price(row['unit_price'])
+        if price is None:
+            logger.warning(f"Could not parse price for {art_code}: {row['unit_price']}")
+            continue
+        # One ART code can map to multiple rate card codes (e.g., "B01 / B02"); first price wins
+        for code in split_rate_card_code(row['rate_card_code']):
+            prices.setdefault(code, price)
+
+    version = snapshot_version(source, art_mapping, prices)
+    logger.info(f"Loaded rate card snapshot v{version} from {source}: "
+                f"{len(art_mapping)} items, {len(prices)} prices")
+    return RateCardSnapshot(
+        version=version,
+        source=source,
+        art_mapping=art_mapping,
+        art_to_codes=art_to_codes,
+        prices=prices
+    )
+
+
+def refresh_snapshot() -> RateCardSnapshot:
+    """Rebuild the snapshot and swap it in. Called after every rate card edit."""
+    with _lock:
+        return _refresh_locked()
+
+
+def get_snapshot() -> RateCardSnapshot:
+    """Return the current snapshot, loading it on first use or once it is older than the TTL."""
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() - snapshot.loaded_at < RATE_CARD_TTL_SECONDS:
+        return snapshot
+    with _lock:
+        if _snapshot is snapshot:
+            return _refresh_locked()
+        return _snapshot
+
+
+def _refresh_locked() -> RateCardSnapshot:
+    global _snapshot
+    _snapshot = build_snapshot()
+    return _snapshot
+
+
+def sync_with_template(wb) -> bool:
+    """
+    Seed the rate_card_items table from the quote template if it is empty, and
+    backfill prices, descriptions and missing B-codes from the template.
+
+    Runs once at startup (previously ran on every quote).
+
+    Args:
+        wb: The template workbook (openpyxl)
+
+    Returns:
+        True if the database was changed
+    """
+    if not DATABASE_AVAILABLE:
+        return False
+    if "Rate Card" not in wb.sheetnames:
+        logger.warning("Rate Card sheet not found - cannot seed or backfill rate card")
+        return False
+
+    rate_card_sheet = wb["Rate Card"]
+
+    # Template prices for backfilling
+    template_prices = {}
+    for row_num in range(6, 40):
+        code = rate_card_sheet.cell(row=row_num, column=1).value
+        if code:
+            # FIX #4: Use Materials + Labour only (not T&J or Humping)
+            mat = rate_card_sheet.cell(row=row_num, column=4).value or 0
+            lab = rate_card_sheet.cell(row=row_num, column=5).value or 0
+            total = mat + lab
+            if total > 0:
+                template_prices[str(code)] = f"£{total:.2f}"
+
+    # B-codes and their descriptions (rows 22-33: B01-B12)
+    bcode_descriptions = {}
+    for row_num in range(22, 34):
+        code = rate_card_sheet.cell(row=row_num, column=1).value
+        if code and str(code).startswith('B'):
+            bcode_descriptions[str(code)] = rate_card_sheet.cell(row=row_num, column=2).value
+
+    db = SessionLocal()
+    try:
+        rate_items = db.query(RateCardItem).all()
+        changed = False
+
+        if not rate_items:
+            # Database is empty - seed ALL B-codes from template, labelled with the
+            # first ART code that maps to each one
+            logger.info("Database empty - auto-seeding ALL codes from template...")
+            art_descriptions = {}
+            for row in _load_rows_from_csv():
+                for code in _mapped_codes(row['rate_card_code']):
+                    art_descriptions.setdefault(code, (row['art_code'], row['description']))
+
+            used_art_codes = set()
+            for code, rate_card_desc in bcode_descriptions.items():
+                art_code, art_desc = art_descriptions.get(code, (code, rate_card_desc or ""))
+                if art_code in used_art_codes:
+                    # e.g. ART04 covers both B01 and B10 - art_code is unique, so the
+                    # second B-code is stored as a standalone item
+                    art_code, art_desc = code, rate_card_desc or ""
+                used_art_codes.add(art_code)
+                db.add(RateCardItem(
+                    art_code=art_code,
+                    description=art_desc[:500] if art_desc else "",
+                    rate_card_code=code,
+                    rate_card_description=rate_card_desc[:500] if rate_card_desc else "",
+                    unit_price=template_prices.get(code, "£0.00"),
+                    category="From template"
+                ))
+            db.commit()
+            logger.info(f"Auto-seeded {len(bcode_descriptions)} B-codes from template with prices")
+            return True
+
+        # Backfill template prices and descriptions for any items missing them
+        backfill_count = 0
+        desc_backfill_count = 0
+        existing_rate_codes = set()
+        for item in rate_items:
+            codes = split_rate_card_code(item.rate_card_code)
+            existing_rate_codes.update(codes)
+
+            if not item.unit_price or item.unit_price == "£0.00" or item.unit_price.strip() == "":
+                template_price = template_prices.get(codes[0]) if codes else None
+                if template_price:
+                    item.unit_price = template_price
+                    backfill_count += 1
+
+            if not item.rate_card_description or item.rate_card_description.strip() == "":
+                bcode_desc = bcode_descriptions.get(codes[0]) if codes else None
+                if bcode_desc:
+                    item.rate_card_description = bcode_desc
+                    desc_backfill_count += 1
+
+        # Also add any missing B-codes from template
+        existing_art_codes = {item.art_code for item in rate_items}
+        missing_count = 0
+        for code, rate_card_desc in bcode_descriptions.items():
+            if code in existing_rate_codes or code in existing_art_codes:
+                continue
+            db.add(RateCardItem(
+                art_code=code,  # Use code as art_code for standalone items
+                description=rate_card_desc[:500] if rate_card_desc else f"Template item {code}",
+                rate_card_code=code,
+                rate_card_description=rate_card_desc[:500] if rate_card_desc else "",
+                unit_price=template_prices.get(code, "£0.00"),
+                category="Added from template"
+            ))
+            missing_count += 1
+
+        if backfill_count or desc_backfill_count or missing_count:
+            db.commit()
+            changed = True
+            if backfill_count:
+                logger.info(f"Backfilled {backfill_count} missing prices from template")
+            if desc_backfill_count:
+                logger.info(f"Backfilled {desc_backfill_count} missing rate card descriptions from template")
+            if missing_count:
+                logger.info(f"Added {missing_count} missing B-codes from template")
+        return changed
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Failed to sync rate card with template: {e}")
+        return False
+    finally:
+        db.close()
+
+
+def initialize(template_path: str) -> RateCardSnapshot:
+    """Seed/backfill the rate card from the template and load the first snapshot (app startup)."""
+    from openpyxl import load_workbook
+
+    try:
+        sync_with_template(load_workbook(template_path))
+    except Exception as e:
+        logger.warning(f"Rate card template sync skipped: {e}")
+    return refresh_snapshot()
@@ -0,0 +1,208 @@
+"""
+Sheet Row Streaming
+Writes a large block of worksheet rows straight into a saved .xlsx as XML, one
+row at a time, instead of building openpyxl Cell objects for them.
+
+openpyxl's normal mode keeps every cell and its style in memory until save, so a
+Door Schedule with 24 filled columns per door grows with the survey. With a
+SheetRowStreamer the workbook is rendered and saved as usual with the streamed
+rows left out, then write() rewrites that one sheet's XML in the saved file,
+generating the rows on the fly. The cell XML matches what openpyxl writes
+(inline strings, same style ids), so the result is identical to a normal render.
+
+Usage:
+    streamer = SheetRowStreamer(ws, start_row, max_col, row_fill_ids, clear_fill_id)
+    wb.save(output_path)
+    streamer.write(output_path, rows)  # rows: iterable of cell value lists
+"""
+
+import os
+import re
+import shutil
+import logging
+import zipfile
+import tempfile
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.compat import safe_string
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.utils import get_column_letter, range_boundaries
+from openpyxl.utils.exceptions import IllegalCharacterError
+
+logger = logging.getLogger(__name__)
+
+SHEET_DATA_RE = re.compile(rb'<sheetData\s*/>|</sheetData>')
+DIMENSION_RE = re.compile(rb'<dimension ref="([^"]*)"\s*/>')
+
+# Same limit openpyxl applies when a string is assigned to a cell
+MAX_CELL_CHARS = 32767
+
+
+class SheetRowStreamer:
+    """
+    Takes over columns 1..max_col from start_row down in one worksheet and
+    streams them into the saved file.
+
+    Rows that already exist in the template keep their cell styles and row
+    heights, with the fill replaced - exactly what writing and clearing those
+    cells in normal mode does. Template rows below the streamed rows are
+    cleared (no values, clear_fill_id).
+
+    Styles have to be in the workbook's style table before it is saved, so the
+    row fills are given up front; the row values are only generated in write().
+    """
+
+    def __init__(self, ws, start_row: int, max_col: int, row_fill_ids: Sequence[int], clear_fill_id: int):
+        """
+        Args:
+            ws: Worksheet to stream rows into (its cells from start_row down are removed)
+            start_row: First streamed row
+            max_col: Number of columns streamed per row
+            row_fill_ids: Fill id (workbook._fills index) for each streamed row
+            clear_fill_id: Fill id for template rows below the streamed rows
+
+        Raises:
+            ValueError: If the sheet has cells beyond max_col from start_row down
+        """
+        self.ws = ws
+        self.start_row = start_row
+        self.max_col = max_col
+        self.row_fill_ids = list(row_fill_ids)
+        self.clear_fill_id = clear_fill_id
+
+        template_end = ws.max_row
+        self._template_styles = {
+            row_num: [self._cell_style(row_num, col) for col in range(1, max_col + 1)]
+            for row_num in range(start_row, template_end + 1)
+        }
+        self._row_attrs = {
+            row_num: dict(ws.row_dimensions[row_num])
+            for row_num in list(ws.row_dimensions.keys()) if row_num >= start_row
+        }
+
+        # Remove the streamed range from the worksheet so openpyxl doesn't write it
+        for key in [key for key in ws._cells if key[0] >= start_row]:
+            if key[1] > max_col:
+                raise ValueError(f"{ws.title}!{get_column_letter(key[1])}{key[0]} is outside the streamed columns")
+            del ws._cells[key]
+        for row_num in self._row_attrs:
+            del ws.row_dimensions[row_num]
+
+        # Exclusive; covers template rows (and row heights) below the streamed rows
+        self.end_row = max(start_row + len(self.row_fill_ids), template_end + 1, max(self._row_attrs, default=0) + 1)
+        self._style_ids: Dict[Tuple[Optional[int], int, int], int] = {}
+        for row_num, fill_id in self._fill_ids():
+            for col in range(1, max_col + 1):
+                self._style_id(row_num, col, fill_id)
+
+    def _cell_style(self, row_num: int, col: int) -> StyleArray:
+        cell = self.ws._cells.get((row_num, col))
+        if cell is None or not cell._style:
+            return StyleArray()
+        return StyleArray(cell._style)
+
+    def _fill_ids(self):
+        """(row, fill id) for every streamed and cleared row."""
+        for idx, fill_id in enumerate(self.row_fill_ids):
+            yield self.start_row + idx, fill_id
+        for row_num in range(self.start_row + len(self.row_fill_ids), self.end_row):
+            yield row_num, self.clear_fill_id
+
+    def _style_id(self, row_num: int, col: int, fill_id: int) -> int:
+        """Style id (cellXfs index) for a cell; 0 means unstyled. Registers new styles with the workbook."""
+        template_row = row_num if row_num in self._template_styles else None
+        key = (template_row, col, fill_id)
+        style_id = self._style_ids.get(key)
+        if style_id is None:
+            style = StyleArray(self._template_styles[template_row][col - 1]) if template_row is not None else StyleArray()
+            style.fillId = fill_id
+            style_id = self.ws.parent._cell_styles.add(style) if any(style) else 0
+            self._style_ids[key] = style_id
+        return style_id
+
+    def _cell_xml(self, coordinate: str, value, style_id: int) -> str:
+        style = f' s="{style_id}"' if style_id else ''
+        if value is None:
+            return f'<c r="{coordinate}"{style}/>' if style_id else ''
+        if isinstance(value, bool):
+            return f'<c r="{coordinate}"{style} t="b"><v>{int(value)}</v></c>'
+        if isinstance(value, (int, float)):
+            return f'<c r="{coordinate}"{style} t="n"><v>{safe_string(value)}</v></c>'
+
+        text = str(value)[:MAX_CELL_CHARS]
+        if ILLEGAL_CHARACTERS_RE.search(text):
+            raise IllegalCharacterError(f"{text} cannot be used in worksheets.")
+        if text == '':
+            return f'<c r="{coordinate}"{style} t="inlineStr"/>'
+        stripped = text.strip()
+        space = ' xml:space="preserve"' if stripped and stripped != text else ''
+        return f'<c r="{coordinate}"{style} t="inlineStr"><is><t{space}>{escape(text)}</t></is></c>'
+
+    def _rows_xml(self, rows: Iterable[Sequence]):
+        letters = [get_column_letter(col) for col in range(1, self.max_col + 1)]
+        blank = [None] * self.max_col
+        values_iter = iter(rows)
+        for row_num, fill_id in self._fill_ids():
+            values = next(values_iter, blank) if row_num < self.start_row + len(self.row_fill_ids) else blank
+            attrs = ''.join(f' {name}={quoteattr(str(value))}' for name, value in self._row_attrs.get(row_num, {}).items())
+            cells = ''.join(
+                self._cell_xml(f"{letters[col]}{row_num}", values[col] if col < len(values) else None,
+                               self._style_id(row_num, col + 1, fill_id))
+                for col in range(self.max_col)
+            )
+            yield f'<row r="{row_num}"{attrs}>{cells}</row>'.encode('utf-8')
+
+    def _dimension(self, ref: bytes) -> bytes:
+        min_col, min_row, max_col, max_row = range_boundaries(ref.decode())
+        last_row = self.end_row - 1
+        if last_row < self.start_row:
+            return ref
+        return (f"{get_column_letter(min_col or 1)}{min_row or 1}:"
+                f"{get_column_letter(max(max_col or 1, self.max_col))}{max(max_row or 1, last_row)}").encode()
+
+    def write(self, path: str, rows: Iterable[Sequence]):
+        """
+        Stream the rows into the sheet of a workbook saved after this streamer was created.
+
+        Args:
+            path: The saved .xlsx (rewritten in place)
+            rows: Cell values (columns 1..max_col) for each row in row_fill_ids, in order
+        """
+        part = self.ws.path.lstrip('/')
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(suffix='.xlsx', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as tmp, zipfile.ZipFile(path) as zin, \
+                    zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED) as zout:
+                for info in zin.infolist():
+                    with zin.open(info) as src, zout.open(info, 'w') as dst:
+                        if info.filename == part:
+                            self._write_sheet(src.read(), dst, rows)
+                        else:
+                            shutil.copyfileobj(src, dst)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        logger.info(f"Streamed {len(self.row_fill_ids)} rows into {self.ws.title}")
+
+    def _write_sheet(self, xml: bytes, dst, rows: Iterable[Sequence]):
+        match = SHEET_DATA_RE.search(xml)
+        if not match:
+            raise ValueError(f"No sheetData in {self.ws.path}")
+        head = DIMENSION_RE.sub(lambda m: b'<dimension ref="' + self._dimension(m.group(1)) + b'"/>',
+                                xml[:match.start()], count=1)
+        dst.write(head)
+        if match.group(0) != b'</sheetData>':
+            dst.write(b'<sheetData>')  # was empty: <sheetData/>
+        batch = []
+        for row_xml in self._rows_xml(rows):
+            batch.append(row_xml)
+            if len(batch) >= 500:
+                dst.write(b''.join(batch))
+                batch.clear()
+        dst.write(b''.join(batch))
+        dst.write(b'</sheetData>')
+        dst.write(xml[match.end():])
@@ -0,0 +1,196 @@
+"""
+Survey File Sniffing
+Identifies an uploaded survey from its magic bytes and a bounded prefix, and keeps
+whatever was opened to do that (the PDF document, the workbook) so extraction
+reuses it. Each upload is read from disk once and parsed once: format detection,
+the extraction cache hash and the extractor all work from the same SurveyFile.
+
+Usage:
+    with SurveyFile(path, filename) as survey:
+        if survey.file_format == 'TYPE_2':
+            wb = survey.workbook  # read-only workbook, already open
+"""
+
+import io
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import fitz  # pymupdf
+from openpyxl import load_workbook
+
+logger = logging.getLogger(__name__)
+
+# Detection only ever looks at this much of the file
+SNIFF_BYTES = 64 * 1024
+TEXT_SNIFF_CHARS = 5000
+PDF_SNIFF_PAGES = 2
+
+TYPE1_KEYWORDS = ('firedna', 'riskbase', 'bm trada', 'art', 'fire door survey')
+TYPE2_KEYWORDS = ('door', 'gap', 'seal', 'fault', 'remedial')
+
+PDF_MAGIC = b'%PDF-'         # may follow up to 1KB of junk
+ZIP_MAGIC = b'PK\x03\x04'    # .xlsx is a zip package
+OLE_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'  # legacy .xls - not readable by openpyxl
+
+
+def sniff_kind(prefix: bytes, filename: str) -> str:
+    """
+    Work out the container type from the first bytes of a file.
+
+    Returns:
+        'pdf', 'xlsx', 'text' (only for .txt uploads) or 'unknown'
+    """
+    if PDF_MAGIC in prefix[:1024]:
+        return 'pdf'
+    if prefix.startswith(ZIP_MAGIC):
+        return 'xlsx'
+    if prefix.startswith(OLE_MAGIC):
+        return 'unknown'
+    if Path(filename).suffix.lower() == '.txt':
+        return 'text'
+    return 'unknown'
+
+
+def decode_prefix(prefix: bytes) -> Optional[str]:
+    """Decode a UTF-8 prefix, allowing a character cut off at the end. None if it isn't UTF-8 text."""
+    try:
+        return prefix.decode('utf-8')
+    except UnicodeDecodeError as e:
+        if e.start >= len(prefix) - 3 and e.reason == 'unexpected end of data':
+            return prefix[:e.start].decode('utf-8')
+        return None
+
+
+def header_values(ws, row: int) -> List[str]:
+    """Lower-cased header cells of a worksheet row ("" for empty cells)."""
+    values = next(ws.iter_rows(min_row=row, max_row=row, values_only=True), ())
+    return [str(value).lower() if value else "" for value in values]
+
+
+class SurveyFile:
+    """
+    An uploaded survey, sniffed from a bounded prefix and opened at most once.
+
+    Attributes:
+        path: File on disk
+        filename: Original upload filename
+        kind: 'pdf', 'xlsx', 'text' or 'unknown' (see sniff_kind)
+        prefix: First SNIFF_BYTES of the file
+    """
+
+    def __init__(self, path: str, filename: Optional[str] = None):
+        self.path = str(path)
+        self.filename = filename or Path(path).name
+        with open(self.path, 'rb') as f:
+            self.prefix = f.read(SNIFF_BYTES)
+        self.kind = sniff_kind(self.prefix, self.filename)
+        self._data: Optional[bytes] = None
+        self._sha256: Optional[str] = None
+        self._document = None
+        self._workbook = None
+        self._page_texts: Dict[int, str] = {}
+        self._file_format: Optional[str] = None
+
+    def __enter__(self) -> 'SurveyFile':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._document is not None:
+            self._document.close()
+            self._document = None
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+
+    @property
+    def data(self) -> bytes:
+        """The whole file, read on first use (files smaller than the prefix are never re-read)."""
+        if self._data is None:
+            if len(self.prefix) < SNIFF_BYTES:
+                self._data = self.prefix
+            else:
+                with open(self.path, 'rb') as f:
+                    self._data = f.read()
+        return self._data
+
+    @property
+    def sha256(self) -> str:
+        """Hex digest of the file contents (extraction cache key)."""
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.data).hexdigest()
+        return self._sha256
+
+    @property
+    def document(self):
+        """The PDF, opened once with pymupdf."""
+        if self._document is None:
+            self._document = fitz.open(stream=self.data, filetype='pdf')
+        return self._document
+
+    @property
+    def workbook(self):
+        """The Excel workbook, opened once in read-only mode."""
+        if self._workbook is None:
+            self._workbook = load_workbook(io.BytesIO(self.data), read_only=True)
+        return self._workbook
+
+    @property
+    def text(self) -> str:
+        """Full text of a .txt survey."""
+        return self.data.decode('utf-8')
+
+    def page_text(self, page_num: int) -> str:
+        """Text of one PDF page, extracted once (detection and extraction share the first pages)."""
+        text = self._page_texts.get(page_num)
+        if text is None:
+            text = self._page_texts[page_num] = self.document[page_num].get_text()
+        return text
+
+    @property
+    def file_format(self) -> str:
+        """
+        Survey format type.
+
+        Returns:
+            'TYPE_1' - PDF/TXT with FireDNA/RiskBase/BM TRADA/ART codes
+            'TYPE_2' - Excel with door/gaps/seals fault columns
+            'UNKNOWN' - Cannot determine format
+        """
+        if self._file_format is None:
+            self._file_format = self._detect_format()
+        return self._file_format
+
+    def _detect_format(self) -> str:
+        if self.kind == 'pdf':
+            try:
+                pages = min(self.document.page_count, PDF_SNIFF_PAGES)
+                sample = " ".join(self.page_text(i) for i in range(pages)).lower()
+            except Exception as e:
+                logger.warning(f"Error detecting PDF format for {self.filename}: {e}")
+                return 'UNKNOWN'
+            if any(keyword in sample for keyword in TYPE1_KEYWORDS):
+                return 'TYPE_1'
+
+        elif self.kind == 'text':
+            sample = decode_prefix(self.prefix)
+            if sample is None:
+                logger.warning(f"Error detecting TXT format for {self.filename}: not UTF-8 text")
+                return 'UNKNOWN'
+            if any(keyword in sample[:TEXT_SNIFF_CHARS].lower() for keyword in TYPE1_KEYWORDS):
+                return 'TYPE_1'
+
+        elif self.kind == 'xlsx':
+            try:
+                headers = header_values(self.workbook.active, 1)
+            except Exception as e:
+                logger.warning(f"Error detecting Excel format for {self.filename}: {e}")
+                return 'UNKNOWN'
+            if any(any(keyword in header for keyword in TYPE2_KEYWORDS) for header in headers):
+                return 'TYPE_2'
+
+        return 'UNKNOWN'
@@ -0,0 +1,149 @@
+"""
+Survey Text Pre-processing
+Cuts Type 1 survey text down before it goes to Claude. Input tokens drive both
+latency and cost, and the survey overview is sent with every chunk, so anything
+that isn't door data is paid for several times over:
+
+    - header/footer lines repeated on most pages (company address, copyright,
+      "Building: ...", "Page N") are dropped
+    - pages before the first and after the last page with door content (scope and
+      legal text, floorplan captions, the action-level legend appendix) are dropped;
+      the cover page is kept for the building name and address
+    - runs of spaces and blank lines are collapsed
+
+Pages are delimited by "--- Page N ---" lines (survey_text writes them for PDFs).
+Text without page markers is only whitespace-collapsed.
+"""
+
+import re
+import logging
+import functools
+import itertools
+from dataclasses import dataclass
+from typing import List, Set
+
+logger = logging.getLogger(__name__)
+
+# Bump when pre-processing changes so cached extractions are not reused
+SURVEY_PREPROCESS_VERSION = "v1"
+
+PAGE_BOUNDARY_PATTERN = re.compile(r'^--- Page \d+ ---$', re.MULTILINE)
+
+# A page with any of these has door data (detail sections, the summary table, ART actions)
+DOOR_CONTENT_PATTERN = re.compile(r'ID/Location Ref|\bART\s?\d{2}\b|\bFD\s?\d{2,3}S?\b|Reason for failure|Component:',
+                                  re.IGNORECASE)
+
+# Repeated lines are only looked for in the first/last few non-blank lines of a page
+HEADER_WINDOW_LINES = 12
+FOOTER_WINDOW_LINES = 4
+# A line is boilerplate if it's in the header/footer of at least this share of pages
+BOILERPLATE_PAGE_FRACTION = 0.5
+BOILERPLATE_MIN_PAGES = 3
+
+_NUMBERS = re.compile(r'\d+')
+
+
+@dataclass
+class PreprocessedSurvey:
+    """Cleaned survey text and what was taken out of it."""
+    text: str
+    original_chars: int
+    pages: int = 0
+    pages_removed: int = 0
+    lines_removed: int = 0  # Repeated header/footer lines
+
+    @property
+    def chars_removed(self) -> int:
+        return self.original_chars - len(self.text)
+
+
+@functools.lru_cache(maxsize=4096)
+def _normalize(line: str) -> str:
+    """Whitespace-collapsed line with numbers masked, so "Page 7" and "Page 8" match."""
+    return _NUMBERS.sub('#', ' '.join(line.split()))
+
+
+def _edge_lines(lines: List[str], window: int, from_end: bool) -> List[str]:
+    non_blank = (line for line in (reversed(lines) if from_end else lines) if line.strip())
+    return [_normalize(line) for line in itertools.islice(non_blank, window)]
+
+
+def _find_boilerplate(pages: List[List[str]]) -> Set[str]:
+    """Normalized lines that appear in the header or footer of most pages."""
+    if len(pages) < BOILERPLATE_MIN_PAGES:
+        return set()
+    page_counts = {}
+    for lines in pages:
+        for line in set(_edge_lines(lines, HEADER_WINDOW_LINES, False) + _edge_lines(lines, FOOTER_WINDOW_LINES, True)):
+            page_counts[line] = page_counts.get(line, 0) + 1
+    threshold = max(BOILERPLATE_MIN_PAGES, BOILERPLATE_PAGE_FRACTION * len(pages))
+    return {line for line, count in page_counts.items()
+            if count >= threshold and not DOOR_CONTENT_PATTERN.search(line)}
+
+
+def _strip_edges(lines: List[str], boilerplate: Set[str]) -> List[str]:
+    """Drop the leading and trailing runs of boilerplate (and blank) lines of a page."""
+    start, end = 0, len(lines)
+    while start < end and (not lines[start].strip() or _normalize(lines[start]) in boilerplate):
+        start += 1
+    while end > start and (not lines[end - 1].strip() or _normalize(lines[end - 1]) in boilerplate):
+        end -= 1
+    return lines[start:end]
+
+
+def _collapse_whitespace(lines: List[str]) -> str:
+    """Single spaces within lines, at most one blank line in a row."""
+    out = []
+    for line in lines:
+        line = ' '.join(line.split())
+        if line or (out and out[-1]):
+            out.append(line)
+    return "\n".join(out).strip()
+
+
+def preprocess_survey_text(full_text: str) -> PreprocessedSurvey:
+    """
+    Strip repeated page furniture and non-door pages from survey text.
+
+    Args:
+        full_text: Type 1 survey text, pages delimited by "--- Page N ---" lines
+
+    Returns:
+        PreprocessedSurvey with the cleaned text (page markers kept) and counts
+    """
+    markers = list(PAGE_BOUNDARY_PATTERN.finditer(full_text))
+    if not markers:
+        return PreprocessedSurvey(text=_collapse_whitespace(full_text.splitlines()) + "\n",
+                                  original_chars=len(full_text))
+
+    preamble = full_text[:markers[0].start()]
+    bodies = [full_text[m.end():following.start() if following else len(full_text)]
+              for m, following in zip(markers, markers[1:] + [None])]
+    pages = [body.splitlines() for body in bodies]
+
+    # Keep the cover page and everything from the first to the last page with door content
+    first_door = next((i for i in range(len(bodies)) if DOOR_CONTENT_PATTERN.search(bodies[i])), None)
+    if first_door is not None:
+        last_door = next(i for i in reversed(range(len(bodies))) if DOOR_CONTENT_PATTERN.search(bodies[i]))
+        keep = [0] + list(range(max(1, first_door), last_door + 1))
+    else:
+        keep = list(range(len(pages)))
+
+    boilerplate = _find_boilerplate(pages)
+    parts = [_collapse_whitespace(preamble.splitlines())] if preamble.strip() else []
+    lines_removed = 0
+    for i in keep:
+        lines = _strip_edges(pages[i], boilerplate)
+        lines_removed += sum(1 for line in pages[i] if line.strip()) - sum(1 for line in lines if line.strip())
+        parts.append(f"{markers[i].group(0)}\n{_collapse_whitespace(lines)}")
+
+    result = PreprocessedSurvey(
+        text="\n\n".join(parts) + "\n",
+        original_chars=len(full_text),
+        pages=len(pages),
+        pages_removed=len(pages) - len(keep),
+        lines_removed=lines_removed
+    )
+    logger.info(f"Pre-processed survey text: {result.original_chars} -> {len(result.text)} chars, "
+                f"{result.pages_removed}/{result.pages} pages and {result.lines_removed} boilerplate lines removed")
+    return result
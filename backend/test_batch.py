@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Batch endpoint test: a ZIP of surveys in, a ZIP of quotes plus manifest.json out,
+with one quote history row per successful survey and per-file errors in the manifest.
+Also covers re-quoting a saved quote from its stored doors.
+"""
+import io
+import json
+import asyncio
+import zipfile
+from pathlib import Path
+
+import httpx
+import pytest
+from openpyxl import Workbook
+
+import crud
+import llm_backend
+import blob_storage
+import firedoor_batch
+import firedoor_processor as fdp
+from main import app
+from database import SessionLocal
+from models import FireDoorQuote
+
+SURVEY = Path(__file__).parent / "test_files" / "Alpha Sights - Thames Court-Fire Door Survey-March 2026.txt"
+
+
+class _ClaudeStandIn(llm_backend.LLMBackend):
+    def complete(self, prompt, max_tokens, model, system=None, tool=None):
+        return llm_backend.LLMResponse(text=json.dumps([{
+            "door_id": "A01", "location": "Core 1 riser", "faults": ["Door gaps incorrect"],
+            "art_codes": ["ART04"], "fire_rating": "FD30", "door_config": "Single Leaf"
+        }]), stop_reason="end_turn")
+
+
+class _NoClaude(llm_backend.LLMBackend):
+    def complete(self, prompt, max_tokens, model, system=None, tool=None):
+        pytest.fail("Claude called")
+
+
+def _type2_survey(floor: str) -> bytes:
+    wb = Workbook()
+    ws = wb.active
+    ws.title = floor
+    ws.append(["Door No", "Location", "Type", "Gaps", "Seals"])
+    ws.append([1, "Stair", "FD30", "Gap too large at head", "OK"])
+    ws.append([2, "Plant", "FD30", "OK", "Smoke seals damaged"])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def _batch_zip() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr("Block A/survey.xlsx", _type2_survey("Floor 1"))
+        archive.writestr("Block B/survey.xlsx", _type2_survey("Floor 2"))  # same basename
+        archive.writestr("../../thames court.txt", SURVEY.read_bytes())  # path traversal attempt
+        archive.writestr("notes.docx", b"not a survey")
+        archive.writestr("__MACOSX/._survey.xlsx", b"resource fork")
+        archive.writestr("Block C/", b"")
+    return buffer.getvalue()
+
+
+async def _post(content: bytes):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as client:
+        return await client.post(
+            "/api/firedoor/batch",
+            files={"file": ("portfolio.zip", content, "application/zip")},
+            data={"client_name": "Portfolio Client"}
+        )
+
+
+async def _requote(quote_id: int, data: dict):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as client:
+        return await client.post(f"/api/firedoor/quotes/{quote_id}/requote", data=data)
+
+
+def test_batch_returns_quotes_and_manifest(monkeypatch, login):
+    monkeypatch.setattr(llm_backend, "get_backend", _ClaudeStandIn)
+    monkeypatch.setattr(blob_storage, "upload_to_blob", lambda pathname, *args: f"https://blob.test/{pathname}")
+
+    login()
+    response = asyncio.run(_post(_batch_zip()))
+    bad_response = asyncio.run(_post(b"not a zip"))
+
+    assert response.status_code == 200, response.text
+    assert (response.headers["X-Batch-Succeeded"], response.headers["X-Batch-Failed"]) == ("3", "1")
+    assert bad_response.status_code == 400
+
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        manifest = json.loads(archive.read(firedoor_batch.MANIFEST_NAME))
+        names = set(archive.namelist())
+
+    files = {entry['filename']: entry for entry in manifest['files']}
+    assert list(files) == ["Block A/survey.xlsx", "Block B/survey.xlsx", "../../thames court.txt", "notes.docx"]
+    assert (manifest['succeeded'], manifest['failed']) == (3, 1)
+    assert files["notes.docx"]['status'] == 'error' and files["notes.docx"]['quote_filename'] is None
+    assert files["../../thames court.txt"]['survey_type'] == 'TYPE_1'
+    assert files["Block A/survey.xlsx"]['door_count'] == 2
+
+    quote_names = [entry['quote_filename'] for entry in manifest['files'] if entry['status'] == 'ok']
+    assert quote_names == ["survey_Portfolio_Client_FireDoor_Quote.xlsx",
+                           "survey_(2)_Portfolio_Client_FireDoor_Quote.xlsx",
+                           "thames_court_Portfolio_Client_FireDoor_Quote.xlsx"]
+    assert names == set(quote_names) | {firedoor_batch.MANIFEST_NAME}
+
+    db = SessionLocal()
+    try:
+        quote_ids = [entry['quote_id'] for entry in manifest['files'] if entry['status'] == 'ok']
+        quotes = db.query(FireDoorQuote).filter(FireDoorQuote.id.in_(quote_ids)).all()
+        assert len(quotes) == 3
+        assert {quote.client_name for quote in quotes} == {"Portfolio Client"}
+    finally:
+        db.close()
+
+
+def test_failed_history_save_only_affects_its_own_file(monkeypatch, login):
+    monkeypatch.setattr(blob_storage, "upload_to_blob", lambda pathname, *args: f"https://blob.test/{pathname}")
+    create_quote = crud.create_firedoor_quote
+    calls = []
+
+    def create_quote_failing_once(db, **fields):
+        calls.append(fields)
+        if len(calls) == 1:
+            db.add(FireDoorQuote(user_id=None, client_name=None))  # violates NOT NULL on commit
+            db.commit()
+        return create_quote(db, **fields)
+
+    monkeypatch.setattr(crud, "create_firedoor_quote", create_quote_failing_once)
+
+    login()
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr("a.xlsx", _type2_survey("Floor 1"))
+        archive.writestr("b.xlsx", _type2_survey("Floor 2"))
+    response = asyncio.run(_post(buffer.getvalue()))
+
+    assert response.status_code == 200, response.text
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        files = json.loads(archive.read(firedoor_batch.MANIFEST_NAME))['files']
+    # Both quotes are still returned; only the failed save is missing its history row
+    assert [entry['status'] for entry in files] == ["ok", "ok"]
+    assert len(calls) == 2 and sorted(entry['quote_id'] is None for entry in files) == [False, True]
+
+
+def test_batch_archive_limits(tmp_path, monkeypatch):
+    monkeypatch.setattr(firedoor_batch, "BATCH_MAX_UNCOMPRESSED_BYTES", 1024)
+    path = tmp_path / "big.zip"
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("survey.txt", b"0" * 4096)
+    with pytest.raises(ValueError, match="larger than"):
+        firedoor_batch.extract_batch_archive(str(path), str(tmp_path))
+
+    empty = tmp_path / "empty.zip"
+    with zipfile.ZipFile(empty, 'w') as archive:
+        archive.writestr("folder/", b"")
+    with pytest.raises(ValueError, match="no survey files"):
+        firedoor_batch.extract_batch_archive(str(empty), str(tmp_path))
+
+
+def test_requote_from_stored_doors(monkeypatch, login):
+    from openpyxl import load_workbook
+
+    monkeypatch.setattr(blob_storage, "upload_to_blob", lambda pathname, *args: f"https://blob.test/{pathname}")
+
+    login()
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr("survey.xlsx", _type2_survey("Floor 1"))
+    response = asyncio.run(_post(buffer.getvalue()))
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        original_id = json.loads(archive.read(firedoor_batch.MANIFEST_NAME))['files'][0]['quote_id']
+
+    # Nothing is re-extracted: the survey is gone and Claude must not be called
+    monkeypatch.setattr(fdp, "load_survey", lambda *args: pytest.fail("survey re-loaded"))
+    monkeypatch.setattr(llm_backend, "get_backend", _NoClaude)
+    requote = asyncio.run(_requote(original_id, {"client_name": "New Client", "target_margin": "0.2"}))
+    bad_margin = asyncio.run(_requote(original_id, {"target_margin": "1.5"}))
+    missing = asyncio.run(_requote(10 ** 9, {}))
+
+    assert requote.status_code == 200, requote.text
+    assert (bad_margin.status_code, missing.status_code) == (400, 404)
+
+    quote_sheet = load_workbook(io.BytesIO(requote.content))["Quote Sheet"]
+    assert (quote_sheet["B4"].value, quote_sheet["R2"].value) == ("New Client", 0.2)
+
+    db = SessionLocal()
+    try:
+        new_quote = db.query(FireDoorQuote).get(int(requote.headers["X-Quote-Id"]))
+        assert new_quote.requoted_from_id == original_id
+        assert (new_quote.client_name, new_quote.target_margin, new_quote.door_count) == ("New Client", 0.2, 2)
+        assert [door['door_id'] for door in crud.unpack_doors(new_quote.doors_gz)] == ["Floor 1-1", "Floor 1-2"]
+    finally:
+        db.close()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Chunking tests: survey text is packed into chunks at door (else page, else
+paragraph) boundaries without losing or reordering text, a bad chunk can be halved
+for re-requesting, and doors from different chunks are merged by door_id.
+"""
+from pathlib import Path
+
+import firedoor_processor as fdp
+from survey_preprocess import preprocess_survey_text
+
+SURVEY = Path(__file__).parent / "test_files" / "Alpha Sights - Thames Court-Fire Door Survey-March 2026.txt"
+
+
+def _door(door_id: str, **fields) -> dict:
+    return {"door_id": door_id, "location": "", "faults": [], "art_codes": [], "fire_rating": "Unknown",
+            "door_config": "Single Leaf", "is_replacement": False, **fields}
+
+
+def test_pack_sections():
+    sections = ["a" * 40, "b" * 40, "c" * 40, "d" * 100, "e" * 10]
+    chunks = fdp._pack_sections(sections, max_chars=90, max_items=10)
+    assert chunks == ["a" * 40 + "b" * 40, "c" * 40, "d" * 100, "e" * 10]  # Oversized section kept whole
+    assert fdp._pack_sections(sections, max_chars=1000, max_items=2) == \
+        ["a" * 40 + "b" * 40, "c" * 40 + "d" * 100, "e" * 10]
+    assert fdp._pack_sections([], max_chars=90, max_items=2) == []
+
+
+def test_split_survey_text_keeps_all_door_text():
+    text = preprocess_survey_text(SURVEY.read_text(encoding='utf-8')).text
+    overview, chunks = fdp.split_survey_text(text, max_chars=6000, max_doors=4)
+    assert overview + "".join(chunks) == text
+    assert all(len(fdp.DOOR_BOUNDARY_PATTERN.findall(chunk)) <= 4 for chunk in chunks)
+    assert all(fdp.DOOR_BOUNDARY_PATTERN.match(chunk) for chunk in chunks)
+
+    # No door markers: page boundaries, then paragraphs
+    pages = "--- Page 1 ---\nfirst\n--- Page 2 ---\nsecond\n--- Page 3 ---\nthird\n"
+    assert fdp.split_survey_text(pages, max_chars=30) == \
+        ("", ["--- Page 1 ---\nfirst\n", "--- Page 2 ---\nsecond\n", "--- Page 3 ---\nthird\n"])
+
+
+def test_split_chunk():
+    doors = "Notes\n" + "".join(f"Product ID/Location Ref: A0{n} - Core {n}\nGaps\n" for n in range(1, 6))
+    first, second = fdp._split_chunk(doors)
+    assert first + second == doors
+    assert first.startswith("Notes\n") and first.count("Location Ref:") == 2
+    assert second.startswith("Product ID/Location Ref: A03") and second.count("Location Ref:") == 3
+
+    pages = "--- Page 1 ---\nA01\n--- Page 2 ---\nA02\n"
+    assert fdp._split_chunk(pages) == ["--- Page 1 ---\nA01\n", "--- Page 2 ---\nA02\n"]
+    assert fdp._split_chunk("A01 gaps\n\nA02 seals") == ["A01 gaps\n\n", "A02 seals\n\n"]
+    # A single door (or paragraph) can't be split further
+    single = "Product ID/Location Ref: A01 - Core 1\nGaps\n"
+    assert fdp._split_chunk(single) == [single]
+
+
+def test_merge_door_lists():
+    merged = fdp.merge_door_lists([
+        [_door("A01", faults=["Gaps"], art_codes=["ART04"]), _door("A02", location="Core 2")],
+        [_door("A01", location="Core 1 riser", faults=["Gaps", "Seals"], art_codes=["ART04", "ART18"],
+               fire_rating="FD30", is_replacement=True, extraction_warnings=["door_width_mm 'wide' ignored"]),
+         _door(" ", faults=["no id"]), _door("A03")],
+    ])
+
+    assert [door["door_id"] for door in merged] == ["A01", "A02", "A03"]
+    a01 = merged[0]
+    assert (a01["faults"], a01["art_codes"]) == (["Gaps", "Seals"], ["ART04", "ART18"])
+    # Missing details come from the later occurrence; flags from either
+    assert (a01["location"], a01["fire_rating"], a01["is_replacement"]) == ("Core 1 riser", "FD30", True)
+    assert a01["extraction_warnings"] == ["door_width_mm 'wide' ignored"]
+
+    # Details already known are not overwritten by a later occurrence
+    kept = fdp.merge_door_lists([[_door("A01", fire_rating="FD60")], [_door("A01", fire_rating="FD30")]])
+    assert kept[0]["fire_rating"] == "FD60"
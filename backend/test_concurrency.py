@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Concurrency test: fire door quote generation must not block the event loop.
+
+Fires several /api/firedoor/process requests (with a slow stubbed Claude call and
+the real PDF/Excel stages in the process pool) while polling /checklists, and checks
+that /checklists latency stays flat.
+"""
+import json
+import time
+import asyncio
+from pathlib import Path
+
+import httpx
+
+import llm_backend
+import blob_storage
+from main import app
+
+SURVEY = Path(__file__).parent / "test_files" / "Alpha Sights - Thames Court-Fire Door Survey-March 2026.txt"
+CLAUDE_LATENCY = 1.0
+CONCURRENT_QUOTES = 3
+
+
+class _SlowClaude(llm_backend.LLMBackend):
+    """Stand-in for the Claude API: blocks like a real HTTP call, returns one door."""
+
+    def complete(self, prompt, max_tokens, model, system=None, tool=None):
+        time.sleep(CLAUDE_LATENCY)
+        return llm_backend.LLMResponse(text=json.dumps([{
+            "door_id": "A01",
+            "location": "Core 1 tenant DB riser",
+            "faults": ["Door gaps incorrect"],
+            "art_codes": ["ART04"],
+            "fire_rating": "FD30",
+            "door_config": "Single Leaf"
+        }]), stop_reason="end_turn")
+
+
+async def _measure(client: httpx.AsyncClient, samples: int, interval: float = 0.05):
+    latencies = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        response = await client.get("/checklists")
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def _run():
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as client:
+        baseline = await _measure(client, samples=10)
+
+        async def quote(i):
+            # Distinct bytes per request so the extraction cache doesn't short-circuit
+            content = SURVEY.read_bytes() + f"\n--- request {i} ---\n".encode()
+            return await client.post(
+                "/api/firedoor/process",
+                files={"file": (SURVEY.name, content, "text/plain")},
+                data={"client_name": f"Concurrency {i}"}
+            )
+
+        quote_tasks = [asyncio.create_task(quote(i)) for i in range(CONCURRENT_QUOTES)]
+        await asyncio.sleep(0.1)
+        during = await _measure(client, samples=int(CLAUDE_LATENCY / 0.05))
+        responses = await asyncio.gather(*quote_tasks)
+
+    return baseline, during, responses
+
+
+def test_quotes_do_not_block_event_loop(monkeypatch, login):
+    monkeypatch.setattr(llm_backend, "get_backend", _SlowClaude)
+    monkeypatch.setattr(blob_storage, "upload_to_blob", lambda *args, **kwargs: None)
+
+    login()
+    baseline, during, responses = asyncio.run(_run())
+
+    for response in responses:
+        assert response.status_code == 200, response.text
+        assert response.headers["X-Survey-Type"] == "TYPE_1"
+
+    # A blocked loop would stall /checklists for the whole Claude call
+    assert max(during) < CLAUDE_LATENCY / 2
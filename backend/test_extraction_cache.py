@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Extraction cache tests: a stored result is returned for the same survey and
+extractor version (and counted as a hit), anything else misses, and the least
+recently used entries are evicted once the cache is over EXTRACTION_CACHE_MAX_BYTES.
+"""
+import json
+import hashlib
+from datetime import datetime
+
+import pytest
+
+import main  # noqa: F401 - creates the tables
+import extraction_cache
+from database import SessionLocal
+from models import ExtractionCacheEntry
+
+DOORS = [{"door_id": "A01", "location": "Core 1 riser", "faults": ["Gaps"], "art_codes": ["ART04"]}]
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(extraction_cache, "EXTRACTION_CACHE_ENABLED", True)
+    db = SessionLocal()
+    try:
+        db.query(ExtractionCacheEntry).delete()  # Other tests' entries would skew the eviction size
+        db.commit()
+    finally:
+        db.close()
+    return extraction_cache
+
+
+def _entries() -> dict:
+    db = SessionLocal()
+    try:
+        return {entry.cache_key: entry for entry in db.query(ExtractionCacheEntry).all()}
+    finally:
+        db.close()
+
+
+def _set_last_used(cache_key: str, when: datetime):
+    db = SessionLocal()
+    try:
+        db.query(ExtractionCacheEntry).filter(
+            ExtractionCacheEntry.cache_key == cache_key
+        ).update({ExtractionCacheEntry.last_used_at: when})
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_hit_and_miss(cache, tmp_path):
+    survey = tmp_path / "survey.txt"
+    survey.write_bytes(b"Product ID/Location Ref: A01 - Core 1 riser")
+    key = cache.compute_cache_key(str(survey), "v1")
+    assert key == cache.cache_key_for_digest(hashlib.sha256(survey.read_bytes()).hexdigest(), "v1")
+
+    assert cache.get_cached_doors(key) is None
+    cache.store_doors(key, "TYPE_1", DOORS)
+    assert cache.get_cached_doors(key) == DOORS
+    assert cache.get_cached_doors(key) == DOORS
+    assert _entries()[key].hit_count == 2
+
+    # A new extractor version or different survey bytes miss
+    assert cache.get_cached_doors(cache.compute_cache_key(str(survey), "v2")) is None
+    survey.write_bytes(b"Product ID/Location Ref: A02 - Core 2 riser")
+    assert cache.get_cached_doors(cache.compute_cache_key(str(survey), "v1")) is None
+
+
+def test_disabled_cache_neither_stores_nor_hits(cache, monkeypatch):
+    cache.store_doors("disabled:v1", "TYPE_1", DOORS)
+    monkeypatch.setattr(extraction_cache, "EXTRACTION_CACHE_ENABLED", False)
+    assert cache.get_cached_doors("disabled:v1") is None
+    cache.store_doors("disabled:v2", "TYPE_1", DOORS)
+    assert "disabled:v2" not in _entries()
+
+
+def test_least_recently_used_entries_are_evicted(cache, monkeypatch):
+    entry_size = len(json.dumps(DOORS).encode('utf-8'))
+    monkeypatch.setattr(extraction_cache, "EXTRACTION_CACHE_MAX_BYTES", entry_size * 2)
+
+    cache.store_doors("first:v1", "TYPE_1", DOORS)
+    cache.store_doors("second:v1", "TYPE_1", DOORS)
+    _set_last_used("first:v1", datetime(2020, 1, 1))
+    _set_last_used("second:v1", datetime(2020, 1, 2))
+    # Reading "first" makes "second" the least recently used
+    assert cache.get_cached_doors("first:v1") == DOORS
+
+    cache.store_doors("third:v1", "TYPE_1", DOORS)
+    assert set(_entries()) == {"first:v1", "third:v1"}
+
+    # A result bigger than the whole cache isn't stored at all
+    cache.store_doors("huge:v1", "TYPE_1", DOORS * 3)
+    assert set(_entries()) == {"first:v1", "third:v1"}
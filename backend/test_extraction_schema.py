@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Structured extraction tests: doors are validated one by one into ExtractedDoor
+(coercing odd values and flagging them), Claude returns them through the
+record_doors tool (SDK and raw HTTP, streamed and whole, against the local stub
+server), and a chunk with an unusable door or no door array is re-requested on its
+own, in halves, without redoing the other chunks.
+"""
+import json
+from pathlib import Path
+
+import pytest
+
+import llm_backend
+import metrics
+import firedoor_processor as fdp
+from extraction_schema import EXTRACTION_TOOL, validate_door
+from llm_backend import AnthropicBackend, LLMResponse
+from llm_stub_server import StubConfig, SyntheticBackend, start_stub_server, synthesize_response
+
+SURVEY = Path(__file__).parent / "test_files" / "Alpha Sights - Thames Court-Fire Door Survey-March 2026.txt"
+MARKER = "Ref: A14-Core 4 tenant DB riser"
+PROMPT = "Door sections:\nProduct ID/Location Ref: A01 - Core 1 riser | Level 2\nReason for failure:\nGaps, ART 04"
+
+
+def test_validate_door():
+    door, problem = validate_door({"door_id": " A01-L2 ", "art_codes": ["ART 4", "art18"], "door_config": "double",
+                                   "door_height_mm": "2100", "fire_rating": "", "notes": "ignored"})
+    assert problem is None
+    assert door == {"door_id": "A01-L2", "location": "", "faults": [], "art_codes": ["ART04", "ART18"],
+                    "fire_rating": "Unknown", "door_config": "Double Leaf", "door_height_mm": 2100,
+                    "door_width_mm": None, "is_replacement": False}
+
+    # Values the baseline accepted are coerced and flagged, not rejected
+    door, problem = validate_door({"door_id": "A02", "art_codes": ["ART04 (replace)", "Replace seals"],
+                                   "door_config": "Unknown", "door_height_mm": "2040mm", "door_width_mm": "wide"})
+    assert problem is None
+    assert (door["art_codes"], door["door_config"], door["door_height_mm"], door["door_width_mm"]) == \
+        (["ART04"], "Single Leaf", 2040, None)
+    assert door["extraction_warnings"] == ["ignored ART code 'Replace seals'",
+                                           "door config 'Unknown' not recognised, assumed Single Leaf",
+                                           "door_width_mm 'wide' not a size in mm, ignored"]
+
+    # Only a door that can't be identified is unusable
+    assert validate_door({"door_id": " ", "faults": ["Gaps"]}) == (None, "door ?: door_id: String should have "
+                                                                          "at least 1 character")
+    assert validate_door(["A03"])[0] is None
+
+
+@pytest.mark.parametrize("raw_http", [False, True])
+def test_tool_use_against_stub_server(raw_http):
+    with start_stub_server(StubConfig()) as server:
+        backend = AnthropicBackend(api_key="stub", base_url=server.url)
+        backend._use_raw_http = raw_http
+        whole = backend.complete(PROMPT, 1000, fdp.CLAUDE_MODEL, tool=EXTRACTION_TOOL)
+        pieces = []
+        streamed = backend.stream(PROMPT, 1000, fdp.CLAUDE_MODEL, pieces.append, tool=EXTRACTION_TOOL)
+
+    expected = json.loads(synthesize_response(PROMPT))
+    assert whole.stop_reason == streamed.stop_reason == "tool_use"
+    assert json.loads(whole.text) == {"doors": expected}
+    assert len(pieces) > 1 and "".join(pieces) == streamed.text and json.loads(streamed.text) == {"doors": expected}
+
+    body = AnthropicBackend.request_body(PROMPT, 1000, fdp.CLAUDE_MODEL, tool=EXTRACTION_TOOL)
+    assert body["tools"] == [EXTRACTION_TOOL]
+    assert body["tool_choice"] == {"type": "tool", "name": "record_doors"}
+
+
+class _BadFirstAnswer(SyntheticBackend):
+    """Spoils the first answer for any prompt containing `marker`; counts calls per door section."""
+
+    def __init__(self, marker: str, spoil):
+        super().__init__()
+        self.marker = marker
+        self.spoil = spoil
+        self.spoiled = False
+        self.calls = []
+
+    def stream(self, prompt, max_tokens, model, on_text, system=None, tool=None):
+        self.calls.append(prompt)
+        if self.marker in prompt and not self.spoiled:
+            self.spoiled = True
+            text = self.spoil(super().complete(prompt, max_tokens, model, system=system, tool=tool).text)
+            on_text(text)
+            return LLMResponse(text=text, stop_reason="tool_use")
+        return super().stream(prompt, max_tokens, model, on_text, system=system, tool=tool)
+
+
+@pytest.mark.parametrize("spoil, result", [
+    (lambda text: text.replace('"door_id": "', '"door_ref": "', 1), 'invalid'),
+    (lambda text: "I could not find any doors in this section.", 'no_array'),
+])
+def test_only_the_bad_chunk_is_re_requested(monkeypatch, spoil, result):
+    monkeypatch.setattr(fdp, "EXTRACTION_PREPROCESS", True)
+    monkeypatch.setattr(fdp, "FIREDNA_PARSER", False)
+    previous = llm_backend.set_backend(SyntheticBackend())
+    try:
+        expected = fdp.extract_type1_from_text(SURVEY.read_text(encoding='utf-8'))
+        backend = _BadFirstAnswer(MARKER, spoil)
+        llm_backend.set_backend(backend)
+        re_requested = metrics.EXTRACTION_CHUNK_DOORS.count(result=result)
+        doors = fdp.extract_type1_from_text(SURVEY.read_text(encoding='utf-8'))
+    finally:
+        llm_backend.set_backend(previous)
+
+    assert doors == expected
+    assert metrics.EXTRACTION_CHUNK_DOORS.count(result=result) == re_requested + 1
+    # The spoiled chunk once whole, then its two halves; every other chunk once
+    with_marker = [prompt for prompt in backend.calls if MARKER in prompt]
+    assert len(with_marker) == 2
+    assert with_marker[1].count("Location Ref:") < with_marker[0].count("Location Ref:")
+    assert len(backend.calls) == len(fdp.split_survey_text(
+        fdp.preprocess_survey_text(SURVEY.read_text(encoding='utf-8')).text)[1]) + 2
+
+
+def test_unusable_door_is_flagged_after_retries():
+    class _AlwaysUnusable(llm_backend.LLMBackend):
+        def complete(self, prompt, max_tokens, model, system=None, tool=None):
+            return LLMResponse(text='{"doors": [{"door_id": "A01", "faults": ["Gaps"]}, '
+                                    '{"door_id": "", "location": "Core 2"}]}', stop_reason="tool_use")
+
+    previous = llm_backend.set_backend(_AlwaysUnusable())
+    try:
+        doors = fdp._extract_chunk(PROMPT, retries=1)
+    finally:
+        llm_backend.set_backend(previous)
+
+    # The valid door is kept; the unusable one becomes a placeholder flagged for manual review
+    assert [door["door_id"] for door in doors][0] == "A01" and len(doors) == 2
+    assert doors[1]["door_id"].startswith("UNIDENTIFIED-") and doors[1]["location"] == "Core 2"
+    assert doors[1]["extraction_warnings"][0].startswith("unreadable door data (door ?: door_id")
+    assert fdp.flagged_door_count(doors) == 1
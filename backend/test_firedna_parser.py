@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+FireDNA parser tests: the Thames Court survey is read without Claude (doors, ART
+codes, ratings from the summary table, config, height), doors whose sections
+don't add up get a lower confidence, and extraction sends only those to Claude.
+"""
+import json
+import time
+from pathlib import Path
+
+import llm_backend
+import firedna_parser
+import firedoor_processor as fdp
+from llm_stub_server import SyntheticBackend, synthesize_response
+from survey_preprocess import preprocess_survey_text
+
+SURVEY = Path(__file__).parent / "test_files" / "Alpha Sights - Thames Court-Fire Door Survey-March 2026.txt"
+
+
+class _CountingBackend(SyntheticBackend):
+    def __init__(self):
+        super().__init__()
+        self.prompts = []
+
+    def stream(self, prompt, max_tokens, model, on_text, system=None, tool=None):
+        self.prompts.append(prompt)
+        return super().stream(prompt, max_tokens, model, on_text, system=system, tool=tool)
+
+
+def _parse_survey():
+    overview, sections = fdp.split_door_sections(preprocess_survey_text(SURVEY.read_text(encoding='utf-8')).text)
+    return sections, firedna_parser.parse_door_sections(overview, sections)
+
+
+def test_parses_thames_court_survey():
+    start = time.perf_counter()
+    sections, parsed = _parse_survey()
+    assert time.perf_counter() - start < 1.0
+
+    doors = {result.door['door_id']: result for result in parsed}
+    assert len(doors) == 39
+    # Same doors and ART codes as a correct Claude extraction, wherever the parser is confident
+    expected = json.loads(synthesize_response("Door sections:\n" + "".join(sections)))
+    assert list(doors) == [door['door_id'] for door in expected]
+    for door in expected:
+        if doors[door['door_id']].resolved:
+            assert sorted(doors[door['door_id']].door['art_codes']) == door['art_codes'], door['door_id']
+
+    a01 = doors['A01-L2'].door
+    assert (a01['location'], a01['fire_rating'], a01['door_config']) == \
+        ("Level 2 - Core 1 tenant DB riser", "FD30", "Double Leaf")  # Meeting stiles
+    assert a01['faults'][:3] == ["Lipping Damaged", "Hole in door from over recessed hardware",
+                                 "Door gaps Incorrect to Specification, Meeting stiles 8mm, Threshold 18mm"]
+    assert doors['A03-L2'].door['fire_rating'] == "Nominal"
+    assert doors['A09-L3'].door['fire_rating'] == "FD30"  # Rating on the same line as the ref
+    assert doors['A09-L3'].door['art_codes'] == [] and doors['A09-L3'].confidence == 1.0  # Passed
+
+    a14 = doors['A14-L3']
+    assert a14.resolved and a14.door['is_replacement']
+    assert (a14.door['door_height_mm'], a14.door['door_width_mm']) == (2650, 1810)
+
+    # Work summary lists ART 13, the actions ART 19: left for Claude
+    a21 = doors['A21-L3']
+    assert not a21.resolved and a21.confidence == 0.7
+    assert a21.issues == ["summary art mismatch: summary ARTs 05, 11, 13 vs actions ART11, ART05, ART19"]
+
+
+def test_section_checks_lower_confidence():
+    ratings = {('B01', '1'): 'FD60S'}
+    section = """Product ID/Location Ref: B01 - Plant room | Level 1
+Status: Failed
+Component: Frame/Leaf
+Intumescents
+Reason for failure:
+1.Seals missing,
+2.Seals painted over
+Actions:
+ART 11 - Replace seals
+Failed
+Component: Hinges
+Reason for failure:
+Worn
+Actions:
+Replace hinges
+Failed
+Inspection work summary:
+2 issues to action ARTs 08 & 11
+"""
+    result = firedna_parser.parse_door_section(section, ratings)
+    assert result.door['faults'] == ["Seals missing", "Seals painted over", "Worn"]
+    assert (result.door['fire_rating'], result.door['door_config']) == ("FD60S", "Single Leaf")
+    assert result.issues == ["component without art: Hinges",
+                             "summary art mismatch: summary ARTs 08, 11 vs actions ART11"]
+    assert result.confidence == 0.45 and not result.resolved
+
+    unrated = firedna_parser.parse_door_section(section.replace("B01", "B02"), ratings)
+    assert unrated.door['fire_rating'] == "Unknown" and "no rating" in unrated.issues
+
+    unreadable = firedna_parser.parse_door_section("Product ID/Location Ref:\nStatus: Failed", ratings)
+    assert unreadable.door is None and not unreadable.resolved
+
+
+def test_only_unresolved_doors_go_to_claude(monkeypatch):
+    monkeypatch.setattr(fdp, "EXTRACTION_PREPROCESS", True)
+    monkeypatch.setattr(fdp, "FIREDNA_PARSER", True)
+    _, parsed = _parse_survey()
+    unresolved = [result.door['door_id'] for result in parsed if not result.resolved]
+    assert 0 < len(unresolved) < len(parsed)
+
+    backend = _CountingBackend()
+    previous = llm_backend.set_backend(backend)
+    try:
+        doors = fdp.extract_type1_from_text(SURVEY.read_text(encoding='utf-8'))
+    finally:
+        llm_backend.set_backend(previous)
+
+    # Survey order is kept, whichever extractor each door came from
+    assert [door['door_id'] for door in doors] == [result.door['door_id'] for result in parsed]
+    sent = json.loads(synthesize_response("".join(backend.prompts)))
+    assert [door['door_id'] for door in sent] == unresolved
+    by_id = {door['door_id']: door for door in doors}
+    for result in parsed:
+        door = by_id[result.door['door_id']]
+        assert door['extraction_source'] == ('parser' if result.resolved else 'claude')
+        assert door['extraction_confidence'] == result.confidence
+        assert door['extraction_issues'] == result.issues
+    assert fdp.extraction_sources(doors) == f"parser={len(parsed) - len(unresolved)}, claude={len(unresolved)}"
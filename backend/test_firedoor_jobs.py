@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Job queue tests: POST /api/firedoor/jobs queues a survey, a worker claims and runs
+it, and the status and result endpoints report it to its owner only. Also covers
+claim order, run_after, reclaiming stale running jobs and retry/give-up in run_job.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+import database
+import llm_backend
+import firedoor_jobs
+import quote_storage
+import firedoor_processor as fdp
+from main import app
+from database import SessionLocal
+from llm_stub_server import SyntheticBackend
+from models import FireDoorJob, FireDoorQuote
+from quote_storage import LocalFilesystemStorage
+
+SURVEY = Path(__file__).parent / "test_files" / "Alpha Sights - Thames Court-Fire Door Survey-March 2026.txt"
+
+
+@pytest.fixture
+def storage(tmp_path):
+    # Clear out jobs queued by other tests first, so claims below see only this test's jobs
+    previous = quote_storage.set_storage(LocalFilesystemStorage(str(tmp_path)))
+    previous_backend = llm_backend.set_backend(SyntheticBackend())
+    try:
+        while firedoor_jobs.process_next_job("cleanup-worker"):
+            pass
+        yield tmp_path
+    finally:
+        quote_storage.set_storage(previous)
+        llm_backend.set_backend(previous_backend)
+
+
+def _queue(user_id: int, **fields) -> str:
+    db = SessionLocal()
+    try:
+        job = firedoor_jobs.enqueue_job(db, user_id, "Jobs Client", "survey.txt", SURVEY.read_bytes())
+        for name, value in fields.items():
+            setattr(job, name, value)
+        db.commit()
+        return job.id
+    finally:
+        db.close()
+
+
+def _job(job_id: str) -> FireDoorJob:
+    db = SessionLocal()
+    try:
+        return db.get(FireDoorJob, job_id)
+    finally:
+        db.close()
+
+
+async def _requests(login):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as client:
+        login("jobs@example.com", "user")
+        submitted = await client.post("/api/firedoor/jobs", files={"file": ("survey.txt", SURVEY.read_bytes(),
+                                                                            "text/plain")},
+                                      data={"client_name": "Jobs Client"})
+        job_id = submitted.json()["job_id"]
+        queued = await client.get(f"/api/firedoor/jobs/{job_id}")
+        early_result = await client.get(f"/api/firedoor/jobs/{job_id}/result")
+
+        assert firedoor_jobs.process_next_job("test-worker")
+        done = await client.get(f"/api/firedoor/jobs/{job_id}")
+        result = await client.get(done.json()["result_url"])
+
+        login("jobs-other@example.com", "user")
+        hidden = await client.get(f"/api/firedoor/jobs/{job_id}")
+        return submitted, queued, early_result, done, result, hidden
+
+
+def test_job_endpoints(storage, login):
+    user = login("jobs@example.com", "user")
+    submitted, queued, early_result, done, result, hidden = asyncio.run(_requests(login))
+
+    assert submitted.status_code == 202, submitted.text
+    job_id = submitted.json()["job_id"]
+    assert submitted.json()["status_url"] == f"/api/firedoor/jobs/{job_id}"
+    assert (queued.json()["status"], queued.json()["result_url"]) == ("queued", None)
+    assert early_result.status_code == 409
+
+    assert done.status_code == 200
+    status = done.json()
+    assert (status["status"], status["kind"], status["survey_type"], status["attempts"]) == \
+        ("done", "quote", "TYPE_1", 1)
+    assert result.status_code == 200 and result.content.startswith(b"PK")
+    assert result.headers["X-Survey-Type"] == "TYPE_1"
+    assert hidden.status_code == 404  # Another (non-admin) user's job
+
+    job = _job(job_id)
+    assert job.input_file is None  # Survey dropped once finished
+    db = SessionLocal()
+    try:
+        quote = db.get(FireDoorQuote, status["quote_id"])
+        assert (quote.user_id, quote.door_count) == (user.id, status["door_count"])
+        assert Path(quote.excel_url.removeprefix("file://")).is_relative_to(storage)
+    finally:
+        db.close()
+
+
+def test_claim_order_run_after_and_stale_reclaim(storage, login):
+    user_id = login().id
+    now = datetime.now(timezone.utc)
+    later = _queue(user_id, run_after=now + timedelta(hours=1))
+    oldest = _queue(user_id, created_at=now - timedelta(minutes=2))
+    newer = _queue(user_id, created_at=now - timedelta(minutes=1))
+    stale = _queue(user_id, status="running", attempts=1, worker_id="crashed-worker",
+                   created_at=now - timedelta(minutes=3),
+                   started_at=now - firedoor_jobs.JOB_STALE_AFTER - timedelta(seconds=1))
+    busy = _queue(user_id, status="running", attempts=1, worker_id="live-worker",
+                  created_at=now - timedelta(minutes=4), started_at=now)
+
+    claimed = []
+    db = SessionLocal()
+    try:
+        while (job := firedoor_jobs.claim_next_job(db, "test-worker")) is not None:
+            claimed.append(job.id)
+            assert (job.status, job.worker_id) == ("running", "test-worker")
+    finally:
+        db.close()
+
+    # Oldest first; the stale job is handed out again, the live one and the delayed one are not
+    assert claimed == [stale, oldest, newer]
+    assert _job(stale).attempts == 2
+    assert (_job(busy).worker_id, _job(later).status) == ("live-worker", "queued")
+
+    db = SessionLocal()
+    try:
+        for job_id in (later, busy):
+            db.get(FireDoorJob, job_id).status = "failed"  # Keep them out of other tests' queues
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_run_job_retries_then_gives_up(storage, monkeypatch, login):
+    def _overloaded(*args):
+        raise llm_backend.LLMUnavailable("Claude overloaded", retry_after=30)
+
+    monkeypatch.setattr(fdp, "generate_quote", _overloaded)
+    job_id = _queue(login().id)
+    for attempt in range(1, firedoor_jobs.JOB_MAX_ATTEMPTS):
+        assert firedoor_jobs.process_next_job("test-worker")
+        job = _job(job_id)
+        assert (job.status, job.attempts, job.error) == ("queued", attempt, "Claude overloaded")
+        # Not claimable again until Claude's retry-after has passed
+        assert job.run_after.replace(tzinfo=timezone.utc) > datetime.now(timezone.utc) + timedelta(seconds=20)
+        assert not firedoor_jobs.process_next_job("test-worker")
+
+        db = SessionLocal()
+        try:
+            db.get(FireDoorJob, job_id).run_after = None
+            db.commit()
+        finally:
+            db.close()
+
+    assert firedoor_jobs.process_next_job("test-worker")
+    job = _job(job_id)
+    assert (job.status, job.attempts, job.input_file) == ("failed", firedoor_jobs.JOB_MAX_ATTEMPTS, None)
+    assert job.error == "Error generating quote: Claude overloaded"
+
+
+def test_run_job_fails_bad_survey_without_retry(storage, monkeypatch, login):
+    def _unsupported(*args):
+        raise ValueError("Unsupported file format.")
+
+    monkeypatch.setattr(fdp, "generate_quote", _unsupported)
+    job_id = _queue(login().id)
+    assert firedoor_jobs.process_next_job("test-worker")
+    job = _job(job_id)
+    assert (job.status, job.attempts, job.error) == ("failed", 1, "Unsupported file format.")
+
+
+def test_init_db_adds_columns_to_an_existing_jobs_table(tmp_path, monkeypatch, capsys):
+    # A jobs table from before kind/run_after existed, as a standalone worker might first meet it
+    engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE firedoor_jobs (id VARCHAR(36) PRIMARY KEY, status VARCHAR(20))"))
+        conn.execute(text("INSERT INTO firedoor_jobs (id, status) VALUES ('old-job', 'queued')"))
+        conn.commit()
+    monkeypatch.setattr(database, "engine", engine)
+
+    database.init_db()
+
+    columns = {column['name'] for column in inspect(engine).get_columns("firedoor_jobs")}
+    assert {"kind", "doors_gz", "rate_card_version", "run_after"} <= columns
+    assert "Migration: added kind column to firedoor_jobs" in capsys.readouterr().out
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT kind FROM firedoor_jobs")).scalar_one() == "quote"
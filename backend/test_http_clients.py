@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP client tests: repeated calls to a service reuse one pooled keep-alive
+connection (checked against the local stub's connection count), and clients are
+closed on shutdown and transparently reopened on next use.
+"""
+
+import http_clients
+import firedoor_processor as fdp
+from llm_backend import AnthropicBackend
+from llm_stub_server import StubConfig, start_stub_server
+
+BODY = {"model": fdp.CLAUDE_MODEL, "max_tokens": 16, "messages": [{"role": "user", "content": "ping"}]}
+
+
+def test_calls_reuse_pooled_connection():
+    with start_stub_server(StubConfig()) as server:
+        client = http_clients.get_client("anthropic")
+        for _ in range(5):
+            client.post(f"{server.url}/v1/messages", json=BODY).raise_for_status()
+        assert http_clients.get_client("anthropic") is client
+
+        # SDK and raw HTTP paths both go through the shared client
+        for raw_http in (False, True):
+            backend = AnthropicBackend(api_key="stub", base_url=server.url, max_retries=0)
+            backend._use_raw_http = raw_http
+            backend.complete("ping", max_tokens=16, model=fdp.CLAUDE_MODEL)
+            backend.complete("ping", max_tokens=16, model=fdp.CLAUDE_MODEL)
+        stats = server.stats()
+
+    assert stats['requests'] == 9
+    assert stats['connections'] == 1
+
+
+def test_clients_close_and_reopen():
+    http_clients.open_clients()
+    clients = {name: http_clients.get_client(name) for name in http_clients.CLIENT_SETTINGS}
+    assert clients['blob'].timeout.write == http_clients.CLIENT_SETTINGS['blob'].write
+
+    with start_stub_server(StubConfig()) as server:
+        backend = AnthropicBackend(api_key="stub", base_url=server.url, max_retries=0)
+        backend.complete("ping", max_tokens=16, model=fdp.CLAUDE_MODEL)
+
+        http_clients.close_clients()
+        assert all(client.is_closed for client in clients.values())
+
+        # Next use (e.g. a job worker after an app restart) gets a fresh client, SDK included
+        reopened = http_clients.get_client("anthropic")
+        assert reopened is not clients['anthropic'] and not reopened.is_closed
+        assert backend.complete("ping", max_tokens=16, model=fdp.CLAUDE_MODEL).stop_reason == "end_turn"
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Incremental JSON array parser tests: elements come out as soon as they close,
+however the text is split, and truncated or malformed arrays are handled.
+"""
+import json
+import random
+
+import pytest
+
+from json_stream import JSONArrayStream
+
+DOORS = [
+    {"door_id": "A01", "location": "Core 1 riser [east]", "faults": ["Gaps > 4mm {head}", "Seal \"missing\""]},
+    {"door_id": "A02", "location": "Stair\\lobby", "faults": [], "nested": [{"a": [1, 2]}, {}]},
+    {"door_id": "A03", "location": "Plant room", "art_codes": ["ART04"], "is_replacement": True},
+]
+
+
+def _feed_all(parser: JSONArrayStream, text: str, sizes) -> list:
+    elements, i = [], 0
+    while i < len(text):
+        size = next(sizes)
+        elements.extend(parser.feed(text[i:i + size]))
+        i += size
+    return elements
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_elements_survive_any_split(seed):
+    text = "```json\n" + json.dumps(DOORS, indent=seed % 3 or None) + "\n```\nThat's all [3 doors]."
+    rng = random.Random(seed)
+    parser = JSONArrayStream()
+    sizes = iter(lambda: rng.randint(1, 7), None)
+    assert _feed_all(parser, text, sizes) == DOORS
+    assert parser.complete and parser.count == 3
+    parser.close()
+
+
+def test_elements_are_returned_as_they_close():
+    text = json.dumps(DOORS)
+    first_end = text.index('}, {') + 1
+    parser = JSONArrayStream()
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == [DOORS[0]]
+    assert parser.feed(text[first_end:]) == DOORS[1:]
+
+
+def test_truncated_and_malformed_arrays():
+    text = json.dumps(DOORS)
+    parser = JSONArrayStream()
+    assert parser.feed(text[:text.rindex('{')]) == DOORS[:2]
+    parser.close()
+    assert not parser.complete  # Cut off mid-element: the partial door is dropped
+
+    with pytest.raises(ValueError, match="No JSON array"):
+        empty = JSONArrayStream()
+        empty.feed("No doors were found in this survey.")
+        empty.close()
+
+    with pytest.raises(ValueError, match="element 2"):
+        JSONArrayStream().feed('[{"door_id": "A01"}, {"door_id": A02}]')
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+LLM limiter tests against the local stub server with injected errors and latency:
+retries with backoff that honours retry-after, the in-flight cap, the token
+budget, the circuit breaker, error events part-way through a stream, and a 503
+(not a 500) from /api/firedoor/process when Claude stays unavailable.
+"""
+import time
+import uuid
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+import pytest
+
+import llm_backend
+import firedoor_processor as fdp
+from llm_backend import AnthropicBackend, LLMBackend, LLMUnavailable
+from llm_limiter import CircuitBreaker, LimitedBackend, LLMLimiter
+from llm_stub_server import StubConfig, start_stub_server
+
+PROMPT = "Door sections:\nProduct ID/Location Ref: A01 - Core 1 riser | Level 2\nReason for failure:\nGaps, ART 04"
+
+
+def _limited(server, raw_http=False, **kwargs) -> LimitedBackend:
+    inner = AnthropicBackend(api_key="stub", base_url=server.url, max_retries=0)
+    inner._use_raw_http = raw_http
+    kwargs.setdefault('backoff_base', 0.01)
+    return LimitedBackend(inner, **kwargs)
+
+
+@pytest.mark.parametrize("raw_http", [False, True])
+def test_retries_injected_overload_errors(raw_http):
+    with start_stub_server(StubConfig(error_rate=0.5, error_status=529, retry_after=0, seed=7)) as server:
+        backend = _limited(server, raw_http, breaker=CircuitBreaker(threshold=100), max_retries=8)
+        responses = [backend.complete(PROMPT, 1000, fdp.CLAUDE_MODEL) for _ in range(10)]
+        stats = server.stats()
+
+    assert all(response.stop_reason == "end_turn" for response in responses)
+    assert stats['errors'] > 0 and stats['requests'] == 10 + stats['errors']
+
+
+def test_backoff_honours_retry_after_and_throttles():
+    delays = []
+    with start_stub_server(StubConfig(error_rate=1.0, error_status=429, retry_after=0.3)) as server:
+        limiter = LLMLimiter(max_in_flight=8)
+        backend = _limited(server, limiter=limiter, max_retries=2, sleep=delays.append)
+        with pytest.raises(LLMUnavailable, match="HTTP 429") as error:
+            backend.complete(PROMPT, 1000, fdp.CLAUDE_MODEL)
+        assert server.stats()['requests'] == 3
+
+    assert len(delays) == 2 and all(delay >= 0.3 for delay in delays)
+    assert error.value.retry_after == 0.3
+    assert limiter.limit == 1  # Halved on each of the three 429s: 8 -> 4 -> 2 -> 1
+    for _ in range(3):
+        limiter.succeeded()
+    assert 1 < limiter.limit < 3  # Grows back additively
+
+
+def test_circuit_breaker_fails_fast_then_recovers():
+    now = [0.0]
+    breaker = CircuitBreaker(threshold=3, cooldown=30, clock=lambda: now[0])
+    with start_stub_server(StubConfig(error_rate=1.0, error_status=529, retry_after=0)) as server:
+        backend = _limited(server, breaker=breaker, max_retries=5, sleep=lambda delay: None)
+        with pytest.raises(LLMUnavailable, match="unavailable after 3 failed calls"):
+            backend.complete(PROMPT, 1000, fdp.CLAUDE_MODEL)
+        assert server.stats()['requests'] == 3 and breaker.state == "open"
+
+        # Open: nothing reaches the API
+        with pytest.raises(LLMUnavailable) as error:
+            backend.complete(PROMPT, 1000, fdp.CLAUDE_MODEL)
+        assert server.stats()['requests'] == 3 and error.value.retry_after == 30
+
+        # After the cooldown one trial call goes through; success closes the breaker
+        server.config.error_rate = 0.0
+        now[0] = 31.0
+        assert backend.complete(PROMPT, 1000, fdp.CLAUDE_MODEL).stop_reason == "end_turn"
+        assert breaker.state == "closed" and server.stats()['requests'] == 4
+
+
+def test_only_client_errors_count_as_the_api_answering():
+    class _Fails(LLMBackend):
+        def __init__(self):
+            self.error = None
+
+        def complete(self, prompt, max_tokens, model, system=None, tool=None):
+            raise self.error
+
+    now = [0.0]
+    inner = _Fails()
+    breaker = CircuitBreaker(threshold=1, cooldown=30, clock=lambda: now[0])
+    backend = LimitedBackend(inner, breaker=breaker, sleep=lambda delay: None)
+    breaker.record_failure()
+    now[0] = 31.0
+
+    # A bug on our side is neither a recovery nor a failure, and frees the half-open trial slot
+    inner.error = KeyError("door_id")
+    for _ in range(2):
+        with pytest.raises(KeyError):
+            backend.complete(PROMPT, 1000, fdp.CLAUDE_MODEL)
+    assert (breaker.state, breaker.failures) == ("half_open", 1)
+
+    # A 4xx means the API is up and answering
+    request = httpx.Request("POST", "https://api.test/v1/messages")
+    inner.error = httpx.HTTPStatusError("bad request", request=request, response=httpx.Response(400, request=request))
+    with pytest.raises(httpx.HTTPStatusError):
+        backend.complete(PROMPT, 1000, fdp.CLAUDE_MODEL)
+    assert (breaker.state, breaker.failures) == ("closed", 0)
+
+
+def test_in_flight_cap_and_token_budget():
+    with start_stub_server(StubConfig(latency=0.2)) as server:
+        backend = _limited(server, limiter=LLMLimiter(max_in_flight=2))
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            list(executor.map(lambda _: backend.complete(PROMPT, 1000, fdp.CLAUDE_MODEL), range(6)))
+        assert server.stats()['peak_in_flight'] == 2
+
+    limiter = LLMLimiter(max_in_flight=8, tokens_per_minute=600)  # 10 tokens/s
+    with limiter.slot(100) as used:
+        used(600)  # Reported usage (input + output) replaces the estimate
+    assert limiter._wait_time(30, time.monotonic()) == pytest.approx(3.0, abs=0.1)
+
+
+def test_streams_are_not_retried_after_text_was_delivered():
+    calls = []
+
+    class _DropsMidStream(LLMBackend):
+        def complete(self, prompt, max_tokens, model, system=None, tool=None):
+            pytest.fail("not streamed")
+
+        def stream(self, prompt, max_tokens, model, on_text, system=None, tool=None):
+            calls.append(prompt)
+            on_text('[{"door_id": "A01"}')
+            raise httpx.ReadTimeout("stream stalled")
+
+    backend = LimitedBackend(_DropsMidStream(), sleep=lambda delay: None)
+    with pytest.raises(LLMUnavailable, match="ReadTimeout") as error:
+        backend.stream(PROMPT, 1000, fdp.CLAUDE_MODEL, lambda text: None)
+    assert len(calls) == 1 and error.value.partial
+
+
+@pytest.mark.parametrize("raw_http", [False, True])
+def test_stream_error_events_are_retried_and_open_the_breaker(raw_http):
+    config = StubConfig(stream_error_rate=1.0, stream_error_after=0)
+    with start_stub_server(config) as server:
+        breaker = CircuitBreaker(threshold=4)
+        backend = _limited(server, raw_http, breaker=breaker, max_retries=2, sleep=lambda delay: None)
+        # An overloaded_error event before any text is retried like an HTTP 529
+        with pytest.raises(LLMUnavailable, match=r"stream overloaded_error\) after 3 attempt") as error:
+            backend.stream(PROMPT, 1000, fdp.CLAUDE_MODEL, lambda text: None)
+        assert not error.value.partial
+        assert server.stats()['requests'] == 3 and (breaker.state, breaker.failures) == ("closed", 3)
+
+        # After part of the reply it isn't retried here, but still counts as a failure
+        config.stream_error_after = 1
+        with pytest.raises(LLMUnavailable) as error:
+            backend.stream(PROMPT, 1000, fdp.CLAUDE_MODEL, lambda text: None)
+        assert error.value.partial
+        assert server.stats()['requests'] == 4 and breaker.state == "open"
+
+
+def test_chunk_is_re_requested_once_after_an_error_event_mid_stream():
+    chunk = "".join(f"Product ID/Location Ref: A0{n} - Core {n} riser\nReason for failure:\nGaps, ART 04\n"
+                    for n in range(1, 4))
+    # Seeded so the first response is cut off by an overloaded_error event and the second isn't
+    with start_stub_server(StubConfig(stream_error_rate=0.5, stream_error_after=1, seed=9)) as server:
+        previous = llm_backend.set_backend(_limited(server, breaker=CircuitBreaker(threshold=100)))
+        try:
+            doors = fdp._extract_chunk(chunk)
+            assert server.stats()['requests'] == 2 and server.stats()['errors'] == 1
+
+            # Only once: a second failure mid-stream fails the chunk
+            server.config.stream_error_rate = 1.0
+            with pytest.raises(LLMUnavailable):
+                fdp._extract_chunk(chunk)
+            assert server.stats()['requests'] == 4
+        finally:
+            llm_backend.set_backend(previous)
+
+    assert [door['door_id'] for door in doors] == ["A01", "A02", "A03"]
+
+
+def test_process_returns_503_when_claude_unavailable(login):
+    from main import app
+
+    login()
+
+    async def post(content):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as client:
+            return await client.post("/api/firedoor/process", files={"file": ("survey.txt", content, "text/plain")},
+                                     data={"client_name": "Limiter Client"})
+
+    survey = Path(__file__).parent / "test_files" / "Alpha Sights - Thames Court-Fire Door Survey-March 2026.txt"
+    with start_stub_server(StubConfig(error_rate=1.0, error_status=529, retry_after=12)) as server:
+        # Breaker opens on the first failure, so the other chunks fail fast instead of waiting out retry-after
+        breaker = CircuitBreaker(threshold=1, cooldown=12)
+        previous = llm_backend.set_backend(_limited(server, breaker=breaker, max_retries=1, sleep=lambda delay: None))
+        try:
+            response = asyncio.run(post(survey.read_bytes() + f"\n{uuid.uuid4()}\n".encode()))
+        finally:
+            llm_backend.set_backend(previous)
+
+    assert response.status_code == 503, response.text
+    assert response.headers["Retry-After"] == "12"
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Metrics test: /api/firedoor/process returns a Server-Timing header covering every
+pipeline stage (including those run in the process pool), and /metrics exposes the
+stage and request histograms in Prometheus format.
+"""
+import uuid
+import asyncio
+from pathlib import Path
+
+import httpx
+import pytest
+
+import metrics
+import llm_backend
+import blob_storage
+from main import app
+from llm_stub_server import SyntheticBackend
+
+SURVEY = Path(__file__).parent / "test_files" / "Alpha Sights - Thames Court-Fire Door Survey-March 2026.txt"
+STAGES = ["upload_save", "detect_format", "text_extraction", "preprocess", "rule_parse", "llm_first_door", "llm_call",
+          "workbook_load", "mapping", "population", "workbook_save"]
+
+
+async def _process_then_scrape(content: bytes):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as client:
+        response = await client.post(
+            "/api/firedoor/process",
+            files={"file": ("survey.txt", content, "text/plain")},
+            data={"client_name": "Metrics Client"}
+        )
+        scrape = await client.get("/metrics")
+    return response, scrape
+
+
+def test_server_timing_and_metrics(monkeypatch, login):
+    monkeypatch.setattr(blob_storage, "upload_to_blob", lambda pathname, *args: f"https://blob.test/{pathname}")
+    previous = llm_backend.set_backend(SyntheticBackend())
+    login()
+    labels = {'method': "POST", 'route': "/api/firedoor/process", 'status': 200}
+    requests_before = metrics.REQUEST_SECONDS.count(**labels)
+    try:
+        # Unique bytes, so the extraction cache can't skip the LLM stage
+        content = SURVEY.read_bytes() + f"\n{uuid.uuid4()}\n".encode()
+        response, scrape = asyncio.run(_process_then_scrape(content))
+    finally:
+        llm_backend.set_backend(previous)
+
+    assert response.status_code == 200, response.text
+    # Storing the quote happens after the response (a quote_upload job), so it isn't timed here
+    assert response.headers["X-Quote-Job-Id"]
+    timings = {entry.split(';')[0].strip(): entry for entry in response.headers["Server-Timing"].split(',')}
+    assert list(timings) == STAGES + ["total"]
+    assert response.headers["X-Extraction-Sources"] == "parser=34, claude=5"
+
+    assert scrape.status_code == 200
+    assert scrape.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = scrape.text
+    assert '# TYPE firedoor_stage_seconds histogram' in body
+    for stage in STAGES:
+        assert f'firedoor_stage_seconds_count{{stage="{stage}"}}' in body
+    # Doors the FireDNA parser resolved, and the ones it left to Claude
+    for source in ("parser", "claude"):
+        assert f'firedoor_extraction_door_confidence_count{{source="{source}"}}' in body
+    assert 'http_request_duration_seconds_count{method="POST",route="/api/firedoor/process",status="200"}' in body
+    assert metrics.REQUEST_SECONDS.count(**labels) == requests_before + 1
+
+
+def test_histogram_buckets_and_server_timing_header():
+    histogram = metrics.Histogram("test_seconds", "Test", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, stage="a")
+    lines = histogram.render()
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="a",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="a"} 3' in lines
+    assert histogram.count(stage="a") == 3
+
+    header = metrics.server_timing_header([("llm_call", 0.5), ("mapping", 0.01), ("llm_call", 0.25)], total=1.0)
+    assert header == 'llm_call;dur=750.0;desc="2 calls", mapping;dur=10.0, total;dur=1000.0'
+
+    with metrics.collect_spans() as spans:
+        with pytest.raises(RuntimeError):
+            with metrics.span("failing"):
+                raise RuntimeError("stage failed")
+    assert [name for name, _ in spans] == ["failing"]
+    assert metrics.current_spans() == []
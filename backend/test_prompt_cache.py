@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Prompt caching tests: the extraction instructions and survey overview go in system
+blocks ending at a cache_control breakpoint, the stub server writes that prefix on
+the first call and reads it on the next (SDK and raw HTTP), and a chunked
+extraction writes it once and reads it for every other chunk.
+"""
+from pathlib import Path
+
+import pytest
+
+import llm_backend
+import metrics
+import firedoor_processor as fdp
+from llm_backend import AnthropicBackend
+from llm_stub_server import StubConfig, SyntheticBackend, start_stub_server
+from survey_preprocess import preprocess_survey_text
+
+SURVEY = Path(__file__).parent / "test_files" / "Alpha Sights - Thames Court-Fire Door Survey-March 2026.txt"
+
+
+def _survey_chunks():
+    return fdp.split_survey_text(preprocess_survey_text(SURVEY.read_text(encoding='utf-8')).text)
+
+
+def test_extraction_request_marks_cached_prefix():
+    overview, chunks = _survey_chunks()
+    system, prompt = fdp._build_extraction_request(chunks[0], overview)
+    assert system[0] == fdp.extraction_system_prompt() and overview in system[1]
+    assert chunks[0] in prompt and overview not in prompt
+    # Every chunk of a survey shares the same system blocks
+    assert all(fdp._build_extraction_request(chunk, overview)[0] == system for chunk in chunks)
+
+    body = AnthropicBackend.request_body(prompt, 1000, fdp.CLAUDE_MODEL, system)
+    assert [block.get("cache_control") for block in body["system"]] == [None, {"type": "ephemeral"}]
+    assert body["messages"] == [{"role": "user", "content": prompt}]
+
+
+@pytest.mark.parametrize("raw_http", [False, True])
+def test_stub_server_writes_then_reads_prompt_cache(raw_http):
+    overview, chunks = _survey_chunks()
+    with start_stub_server(StubConfig()) as server:
+        backend = AnthropicBackend(api_key="stub", base_url=server.url)
+        backend._use_raw_http = raw_http
+        responses = []
+        for chunk in chunks[:2]:
+            system, prompt = fdp._build_extraction_request(chunk, overview)
+            responses.append(backend.stream(prompt, 4000, fdp.CLAUDE_MODEL, lambda text: None, system=system))
+        first, second = responses
+
+    assert first.cache_status == "miss" and first.cache_creation_input_tokens > 1024
+    assert second.cache_status == "hit" and second.cache_read_input_tokens == first.cache_creation_input_tokens
+    assert second.total_input_tokens == second.input_tokens + second.cache_read_input_tokens
+
+
+def test_chunked_extraction_reads_cache_after_warmup(monkeypatch):
+    monkeypatch.setattr(fdp, "EXTRACTION_PREPROCESS", True)
+    monkeypatch.setattr(fdp, "FIREDNA_PARSER", False)
+    monkeypatch.setattr(llm_backend, "LLM_PROMPT_CACHE", True)
+    overview, chunks = _survey_chunks()
+    assert len(chunks) > 2
+
+    hits = metrics.LLM_CALL_SECONDS.count(cache="hit")
+    misses = metrics.LLM_CALL_SECONDS.count(cache="miss")
+    reads = metrics.LLM_INPUT_TOKENS.count(kind="cache_read")
+    # Slow enough input processing that a chunk starting before the write landed would miss
+    previous = llm_backend.set_backend(SyntheticBackend(StubConfig(latency=0.05, input_tokens_per_second=20000)))
+    try:
+        doors = fdp.extract_type1_from_text(SURVEY.read_text(encoding='utf-8'))
+    finally:
+        llm_backend.set_backend(previous)
+
+    assert len(doors) == 39
+    assert metrics.LLM_CALL_SECONDS.count(cache="miss") - misses == 1
+    assert metrics.LLM_CALL_SECONDS.count(cache="hit") - hits == len(chunks) - 1
+    assert metrics.LLM_INPUT_TOKENS.count(kind="cache_read") - reads == len(chunks)
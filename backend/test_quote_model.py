@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Quote model tests: per-door classification, counts, totals and margins computed
+without touching a workbook.
+"""
+from pathlib import Path
+
+import pytest
+
+from rate_card import RateCardSnapshot
+from quote_model import QuoteModel, QuoteRates, apply_margin, classify_door
+
+SNAPSHOT = RateCardSnapshot(
+    version="test",
+    source='test',
+    art_to_codes={'ART04': ('B01', 'B10'), 'ART07': ('B03',), 'ART17': ()},
+)
+RATES = QuoteRates(
+    b_rates={'B01': 120, 'B03': 150, 'B10': 85},
+    materials_rates={'B01': 70, 'B03': 100, 'B10': 25},
+    labour_rates={'B01': 50, 'B03': 50, 'B10': 60},
+    a_rates={'A01': 900, 'A05': 1000},
+    target_margin=0.35,
+)
+
+DOORS = [
+    {'door_id': 'D01', 'location': 'Stair 1', 'art_codes': ['ART04'], 'faults': ['Gaps incorrect'],
+     'fire_rating': 'FD30', 'door_config': 'Single Leaf'},
+    {'door_id': 'D02', 'location': 'Stair 2', 'art_codes': ['ART04', 'ART07'], 'faults': ['Closer broken'],
+     'fire_rating': 'FD30S', 'door_config': 'Single Leaf'},
+    {'door_id': 'D03', 'location': 'Plant', 'art_codes': ['ART17'], 'faults': ['Leaf split'],
+     'fire_rating': 'FD30', 'door_config': 'Single Leaf'},
+    {'door_id': 'D04', 'location': 'Office', 'art_codes': [], 'faults': [],
+     'fire_rating': 'FD30', 'door_config': 'Single Leaf'},
+]
+
+
+def test_classify_door_statuses():
+    lines = [classify_door(door, SNAPSHOT) for door in DOORS]
+    assert [line.status for line in lines] == ['remedial', 'remedial', 'replacement', 'compliant']
+    assert lines[0].primary_code == 'B01'
+    assert sorted(lines[1].b_codes) == ['B01', 'B03', 'B10']
+    assert lines[2].needs_replacement and lines[2].b_codes == []
+    assert lines[3].opt_a == 'COMPLIANT' and lines[3].qty == 0
+
+
+def test_extraction_warnings_flag_manual_review():
+    door = dict(DOORS[0], extraction_warnings=["door config 'Unknown' not recognised, assumed Single Leaf"])
+    line = classify_door(door, SNAPSHOT)
+    assert line.status == 'manual_review' and line.qty == 1
+    assert line.flags == "⚠️ Check extraction: door config 'Unknown' not recognised, assumed Single Leaf"
+
+
+def test_option_a_counts_and_totals():
+    model = QuoteModel.build(DOORS, RATES, SNAPSHOT)
+    assert model.b_code_counts == {'B01': 2, 'B10': 2, 'B03': 1}
+    assert model.b_code_door_ids['B01'] == ['D01', 'D02']
+    assert model.option_a_cost == 2 * 120 + 2 * 85 + 150
+    assert model.option_a_client == pytest.approx(model.option_a_cost / 0.65)
+
+    b01 = next(line for line in model.option_a_lines if line.code == 'B01')
+    assert (b01.materials_total, b01.labour_total, b01.cost_total) == (140, 100, 240)
+    assert b01.client_total == pytest.approx(apply_margin(240, 0.35))
+
+
+def test_option_b_counts_every_non_compliant_door():
+    model = QuoteModel.build(DOORS, RATES, SNAPSHOT)
+    assert sum(model.a_code_counts.values()) == 3
+    assert 'D04' not in [door_id for ids in model.a_code_door_ids.values() for door_id in ids]
+    assert model.option_b_cost == sum(model.a_code_counts.get(code, 0) * rate for code, rate in RATES.a_rates.items())
+
+
+def test_target_margin_override():
+    model = QuoteModel.build(DOORS, RATES, SNAPSHOT, target_margin=0.2)
+    assert model.option_a_client == pytest.approx(model.option_a_cost / 0.8)
+    assert model.to_dict()['target_margin'] == 0.2
+
+
+def test_rates_from_template():
+    from openpyxl import load_workbook
+    wb = load_workbook(Path(__file__).parent / "reference_files" / "WestPark_FireDoor_CostSheet_v3_AlphaSights.xlsx")
+    rates = QuoteRates.from_workbook(wb)
+    assert set(rates.b_rates) <= {f'B{i:02d}' for i in range(1, 13)}
+    assert rates.b_rates and rates.a_rates
+    assert 0 < rates.target_margin < 1
+
+
+def test_large_survey_renders_every_door(tmp_path):
+    """Surveys bigger than the template's old 96-row clear/199-row scan keep every door."""
+    from openpyxl import load_workbook
+    import firedoor_processor as fdp
+
+    doors = [dict(DOORS[i % len(DOORS)], door_id=f"D{i:04d}") for i in range(300)]
+    output_path = tmp_path / "quote.xlsx"
+    fdp.populate_excel_template(doors, "Large Estate", str(fdp.TEMPLATE_PATH), str(output_path), SNAPSHOT)
+
+    wb = load_workbook(output_path)
+    door_ids = [row[0] for row in wb["Door Schedule"].iter_rows(min_row=4, max_col=1, values_only=True) if row[0]]
+    assert door_ids == [door['door_id'] for door in doors]
+    # 75 doors of each pattern; D01 and D02 both carry B01
+    assert wb["Quote Sheet"]["C11"].value == 150
+
+
+def test_join_door_ids_fits_in_one_cell():
+    import firedoor_processor as fdp
+
+    door_ids = [f"Floor {i // 100}-{i}" for i in range(5000)]
+    text = fdp.join_door_ids(door_ids)
+    assert len(text) <= fdp.EXCEL_CELL_MAX_CHARS
+    assert text.startswith("Floor 0-0, Floor 0-1") and text.endswith("more)")
+    assert fdp.join_door_ids(door_ids[:3]) == "Floor 0-0, Floor 0-1, Floor 0-2"
+
+
+def test_streaming_renderer_matches_openpyxl(tmp_path):
+    from openpyxl import load_workbook
+    import firedoor_processor as fdp
+
+    doors = [dict(DOORS[i % len(DOORS)], door_id=f"D{i:04d}", location=f"Core <{i % 3}> & riser")
+             for i in range(120)]
+    for doors_case in (doors, doors[:6]):  # past the template's example rows, and within them
+        workbooks = {}
+        for renderer in fdp.DOOR_SCHEDULE_RENDERERS:
+            output_path = tmp_path / f"{renderer}.xlsx"
+            fdp.populate_excel_template(doors_case, "Client", str(fdp.TEMPLATE_PATH), str(output_path),
+                                        SNAPSHOT, renderer=renderer)
+            workbooks[renderer] = load_workbook(output_path)
+
+        expected, streamed = workbooks['openpyxl'], workbooks['streaming']
+        for ws in expected.worksheets:
+            other = streamed[ws.title]
+            assert ws.dimensions == other.dimensions
+            for row in ws.iter_rows():
+                for cell in row:
+                    streamed_cell = other[cell.coordinate]
+                    assert streamed_cell.value == cell.value, cell.coordinate
+                    assert repr(streamed_cell.fill) == repr(cell.fill), cell.coordinate
+                    assert repr(streamed_cell.border) == repr(cell.border), cell.coordinate
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Background quote upload test: /api/firedoor/process returns the workbook without
+touching quote storage, then a quote_upload job stores it (local filesystem
+storage here) and saves the quote history row, retrying with backoff on failure.
+"""
+import uuid
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+import pytest
+
+import crud
+import llm_backend
+import blob_storage
+import firedoor_jobs
+import quote_storage
+from main import app
+from database import SessionLocal
+from llm_stub_server import SyntheticBackend
+from models import FireDoorJob, FireDoorQuote
+from quote_storage import LocalFilesystemStorage, VercelBlobStorage
+
+SURVEY = Path(__file__).parent / "test_files" / "Alpha Sights - Thames Court-Fire Door Survey-March 2026.txt"
+
+
+class _FlakyStorage(quote_storage.QuoteStorage):
+    """Fails the first `failures` saves, then stores locally."""
+
+    def __init__(self, root: str, failures: int):
+        self.local = LocalFilesystemStorage(root)
+        self.failures = failures
+        self.calls = 0
+
+    def save(self, pathname, content, content_type):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise httpx.ConnectError("storage unreachable")
+        return self.local.save(pathname, content, content_type)
+
+
+async def _process(content: bytes):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as client:
+        return await client.post(
+            "/api/firedoor/process",
+            files={"file": ("survey.txt", content, "text/plain")},
+            data={"client_name": "Upload Client"}
+        )
+
+
+def _drain_queue():
+    while firedoor_jobs.process_next_job("test-worker"):
+        pass
+
+
+def test_quote_is_stored_after_response_with_retries(tmp_path, login):
+    # Clear out uploads queued by other tests' requests first
+    previous_storage = quote_storage.set_storage(LocalFilesystemStorage(str(tmp_path / "earlier")))
+    _drain_queue()
+    storage = _FlakyStorage(str(tmp_path), failures=1)
+    quote_storage.set_storage(storage)
+    previous_backend = llm_backend.set_backend(SyntheticBackend())
+    user = login()
+    db = SessionLocal()
+    try:
+        response = asyncio.run(_process(SURVEY.read_bytes() + f"\n{uuid.uuid4()}\n".encode()))
+        assert response.status_code == 200, response.text
+        assert storage.calls == 0  # Nothing stored on the request path
+        assert "X-Quote-Id" not in response.headers
+
+        job_id = response.headers["X-Quote-Job-Id"]
+        job = db.get(FireDoorJob, job_id)
+        assert (job.kind, job.status, job.result_file) == ("quote_upload", "queued", response.content)
+
+        # First attempt fails: back on the queue, not claimable until run_after
+        _drain_queue()
+        db.refresh(job)
+        assert (job.status, job.attempts, job.quote_id) == ("queued", 1, None)
+        assert "storage unreachable" in job.error
+        assert job.run_after.replace(tzinfo=timezone.utc) > datetime.now(timezone.utc)
+
+        job.run_after = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db.commit()
+        _drain_queue()
+        db.refresh(job)
+        assert (job.status, job.attempts, job.result_file, job.doors_gz) == ("done", 2, None, None)
+
+        quote = db.get(FireDoorQuote, job.quote_id)
+        assert (quote.user_id, quote.client_name, quote.survey_type) == (user.id, "Upload Client", "TYPE_1")
+        stored = Path(quote.excel_url.removeprefix("file://"))
+        assert stored.is_relative_to(tmp_path) and stored.read_bytes() == response.content
+        assert len(crud.unpack_doors(quote.doors_gz)) == quote.door_count > 0
+    finally:
+        db.close()
+        quote_storage.set_storage(previous_storage)
+        llm_backend.set_backend(previous_backend)
+
+
+def test_upload_retried_after_failing_to_finish_saves_one_quote(tmp_path, monkeypatch, login):
+    previous_storage = quote_storage.set_storage(LocalFilesystemStorage(str(tmp_path / "earlier")))
+    _drain_queue()
+    quote_storage.set_storage(LocalFilesystemStorage(str(tmp_path)))
+    previous_backend = llm_backend.set_backend(SyntheticBackend())
+    login()
+    finish_job = firedoor_jobs._finish_job
+
+    def _crashes_once(db, job, status, error=None):
+        # The quote row is in the session but the job isn't marked done yet
+        if status == "done" and not crashed:
+            crashed.append(job.id)
+            raise RuntimeError("connection lost")
+        finish_job(db, job, status, error)
+
+    crashed = []
+    monkeypatch.setattr(firedoor_jobs, "_finish_job", _crashes_once)
+    db = SessionLocal()
+    try:
+        response = asyncio.run(_process(SURVEY.read_bytes() + f"\n{uuid.uuid4()}\n".encode()))
+        job = db.get(FireDoorJob, response.headers["X-Quote-Job-Id"])
+        _drain_queue()
+        db.refresh(job)
+        assert (job.status, job.quote_id) == ("queued", None)
+        assert db.query(FireDoorQuote).filter(FireDoorQuote.excel_url.contains(job.id)).count() == 0
+
+        job.run_after = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db.commit()
+        _drain_queue()
+        db.refresh(job)
+        assert (crashed, job.status, job.attempts) == ([job.id], "done", 2)
+
+        assert db.query(FireDoorQuote).filter(FireDoorQuote.excel_url.contains(job.id)).count() == 1
+    finally:
+        db.close()
+        quote_storage.set_storage(previous_storage)
+        llm_backend.set_backend(previous_backend)
+
+
+def test_process_fails_when_upload_job_cannot_be_queued(monkeypatch, login):
+    def _db_down(*args, **kwargs):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(firedoor_jobs, "enqueue_quote_upload", _db_down)
+    previous_backend = llm_backend.set_backend(SyntheticBackend())
+    login()
+    try:
+        response = asyncio.run(_process(SURVEY.read_bytes() + f"\n{uuid.uuid4()}\n".encode()))
+    finally:
+        llm_backend.set_backend(previous_backend)
+
+    # No job id pointing at a job that will never exist
+    assert response.status_code == 500 and "could not be saved" in response.json()["detail"]
+    assert "X-Quote-Job-Id" not in response.headers
+
+
+def test_local_storage_stays_in_its_directory(tmp_path):
+    storage = LocalFilesystemStorage(str(tmp_path), public_url="https://files.test/quotes/")
+    assert storage.save("firedoor-quotes/a.xlsx", b"x", "application/octet-stream") == \
+        "https://files.test/quotes/firedoor-quotes/a.xlsx"
+    assert (tmp_path / "firedoor-quotes" / "a.xlsx").read_bytes() == b"x"
+    with pytest.raises(ValueError, match="escapes"):
+        storage.save("../outside.xlsx", b"x", "application/octet-stream")
+
+
+def test_vercel_blob_storage_fails_without_a_token(monkeypatch):
+    monkeypatch.setattr(blob_storage, "BLOB_READ_WRITE_TOKEN", None)
+    assert not blob_storage.check_token()
+    with pytest.raises(RuntimeError, match="BLOB_READ_WRITE_TOKEN is not set"):
+        VercelBlobStorage().save("firedoor-quotes/a.xlsx", b"x", blob_storage.XLSX_CONTENT_TYPE)
+
+
+def test_storage_backends_must_implement_save():
+    class _NoSave(quote_storage.QuoteStorage):
+        name = "nowhere"
+
+    with pytest.raises(TypeError, match="save"):
+        _NoSave()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Rate card snapshot tests: a snapshot's version is a hash of its content, so
+separately built snapshots of the same rate card (as in two processes) agree, and
+a price edit through the API is in the snapshot at once, without waiting for the TTL.
+"""
+import asyncio
+
+import httpx
+
+import rate_card
+from main import app
+from database import SessionLocal
+from models import RateCardItem
+
+
+def test_version_is_a_content_hash():
+    first, second = rate_card.build_snapshot(), rate_card.build_snapshot()
+    assert first is not second and first.version == second.version
+    assert len(first.version) == 12 and int(first.version, 16) >= 0
+
+    prices = dict(first.prices, B01=first.prices.get('B01', 0) + 1)
+    assert rate_card.snapshot_version(first.source, first.art_mapping, prices) != first.version
+    # Last-updated notes don't change what the rate card prices quotes with
+    mapping = {art_code: dict(item, notes="Last updated: just now") for art_code, item in first.art_mapping.items()}
+    assert rate_card.snapshot_version(first.source, mapping, first.prices) == first.version
+
+
+async def _set_price(item_id: int, unit_price: str):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.put(f"/api/firedoor/rates/{item_id}", data={"unit_price": unit_price})
+
+
+def test_price_edit_refreshes_snapshot(monkeypatch, login):
+    monkeypatch.setattr(rate_card, "RATE_CARD_TTL_SECONDS", 3600)
+    db = SessionLocal()
+    item = RateCardItem(art_code="ART-REFRESH-TEST", description="Refresh test", rate_card_code="Z99",
+                        unit_price="£10.00")
+    db.add(item)
+    db.commit()
+    login()
+    try:
+        before = rate_card.refresh_snapshot()
+        assert rate_card.get_snapshot() is before and before.prices["Z99"] == 10.0
+
+        response = asyncio.run(_set_price(item.id, "£1,250.50"))
+        assert response.status_code == 200, response.text
+        edited = rate_card.get_snapshot()
+        assert edited is not before and edited.prices["Z99"] == 1250.5 and edited.version != before.version
+
+        asyncio.run(_set_price(item.id, "£10.00"))
+        assert rate_card.get_snapshot().version == before.version
+    finally:
+        db.delete(item)
+        db.commit()
+        db.close()
+        rate_card.refresh_snapshot()
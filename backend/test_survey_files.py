@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Survey sniffing tests: format detection from magic bytes and a bounded prefix,
+and single-pass loading (each upload opened and parsed once).
+"""
+import shutil
+import hashlib
+from pathlib import Path
+
+import fitz
+import pytest
+from openpyxl import Workbook
+
+import survey_files
+import firedoor_processor as fdp
+from survey_files import SurveyFile
+
+THAMES_COURT = Path(__file__).parent / "test_files" / "Alpha Sights - Thames Court-Fire Door Survey-March 2026.txt"
+
+
+def _pdf(path: Path, pages: int = 3) -> Path:
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((50, 72), f"FireDNA Fire Door Survey\nDoor ID/Location Ref: A0{i}\nART04 gaps incorrect")
+    doc.save(str(path))
+    doc.close()
+    return path
+
+
+def _type2_workbook(path: Path) -> Path:
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Floor 1"
+    ws.append(["Door No", "Location", 2024, "Gaps", "Seals", "Closer"])  # numeric header cell
+    ws.append([1, "Stair", None, "Gap too large at head", "OK", None])
+    ws.append([2, "Plant", None, "OK", "Smoke seals damaged", "Closer not closing door fully"])
+    ws.append(["#VALUE!", None, None, "ignored", None, None])
+    wb.save(str(path))
+    return path
+
+
+def test_detects_by_content_not_extension(tmp_path):
+    pdf = _pdf(tmp_path / "survey.pdf")
+    misnamed = shutil.copy(pdf, tmp_path / "survey.xlsx")
+    assert fdp.detect_format(str(pdf), pdf.name) == 'TYPE_1'
+    assert fdp.detect_format(str(misnamed), "survey.xlsx") == 'TYPE_1'
+
+    binary = tmp_path / "notes.txt"
+    binary.write_bytes(b"\xff\xfe\x00\x01" * 100)
+    assert fdp.detect_format(str(binary), binary.name) == 'UNKNOWN'
+
+    legacy_xls = tmp_path / "old.xls"
+    legacy_xls.write_bytes(survey_files.OLE_MAGIC + b"\x00" * 512)
+    assert fdp.detect_format(str(legacy_xls), legacy_xls.name) == 'UNKNOWN'
+
+
+def test_text_sniff_reads_bounded_prefix():
+    with SurveyFile(str(THAMES_COURT)) as survey:
+        assert survey.kind == 'text'
+        assert survey.file_format == 'TYPE_1'
+        assert len(survey.prefix) <= survey_files.SNIFF_BYTES
+        assert survey._data is None  # detection didn't need the whole file
+
+
+def test_load_survey_opens_pdf_once(tmp_path, monkeypatch):
+    pdf = _pdf(tmp_path / "survey.pdf", pages=4)
+    opens = []
+    real_open = fitz.open
+    monkeypatch.setattr(survey_files.fitz, "open", lambda *a, **kw: opens.append(1) or real_open(*a, **kw))
+
+    loaded = fdp.load_survey(str(pdf), pdf.name)
+    assert loaded.file_format == 'TYPE_1'
+    assert len(opens) == 1
+    assert loaded.text.count("Door ID/Location Ref:") == 4
+    assert fdp.PAGE_BOUNDARY_PATTERN.findall(loaded.text) == [f"--- Page {n} ---" for n in range(1, 5)]
+    assert loaded.sha256 == hashlib.sha256(pdf.read_bytes()).hexdigest()
+
+
+def test_load_survey_type2_from_read_only_workbook(tmp_path):
+    path = _type2_workbook(tmp_path / "survey.xlsx")
+    loaded = fdp.load_survey(str(path), path.name)
+    assert loaded.file_format == 'TYPE_2'
+    assert [door['door_id'] for door in loaded.doors] == ["Floor 1-1", "Floor 1-2"]
+    assert sorted(loaded.doors[1]['b_codes']) == ['B01', 'B10']
+    assert loaded.doors == fdp.extract_type2_excel(str(path))
+
+
+def test_unsupported_type1_container(tmp_path):
+    path = _type2_workbook(tmp_path / "survey.xlsx")
+    with SurveyFile(str(path)) as survey, pytest.raises(ValueError):
+        fdp.survey_text(survey)
+
+
+def test_type2_sheet_groups_merge_in_workbook_order(tmp_path, monkeypatch):
+    wb = Workbook()
+    wb.remove(wb.active)
+    for floor, rows in enumerate([40, 5, 25, 10, 30], start=1):
+        ws = wb.create_sheet(f"Floor {floor}")
+        ws.append(["Door No", "Location", "Type", "Gaps", "Seals"])
+        for door_num in range(1, rows + 1):
+            ws.append([door_num, "Corridor", "FD30", "Gap too large" if door_num % 2 else "OK", "OK"])
+    path = tmp_path / "floors.xlsx"
+    wb.save(str(path))
+
+    monkeypatch.setattr(fdp, "TYPE2_PARALLEL_MIN_BYTES", 0)
+    with SurveyFile(str(path)) as survey:
+        groups = fdp.plan_type2_sheets(survey.workbook, workers=2)
+        serial = fdp.extract_type2_workbook(survey.workbook)
+        sheet_names = survey.workbook.sheetnames
+    assert len(groups) == 2
+    assert sorted(name for group in groups for name in group) == sorted(sheet_names)
+    assert groups[0][0] == "Floor 1"  # largest sheet first
+
+    results = [fdp.extract_type2_sheets(str(path), group) for group in reversed(groups)]
+    assert fdp.merge_type2_sheets(sheet_names, results) == serial
+    assert len(serial) == 20 + 3 + 13 + 5 + 15  # doors with a fault
+
+    monkeypatch.setattr(fdp, "TYPE2_PARALLEL_MIN_BYTES", 1 << 30)
+    with SurveyFile(str(path)) as survey:
+        assert fdp.plan_type2_sheets(survey.workbook, workers=2) == [sheet_names]
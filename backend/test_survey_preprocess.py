@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Survey pre-processing test: page furniture and non-door pages are stripped from the
+Thames Court survey without losing any door data, and the extraction prompts shrink.
+"""
+from pathlib import Path
+
+import llm_backend
+import firedoor_processor as fdp
+from llm_stub_server import SyntheticBackend
+from survey_preprocess import PAGE_BOUNDARY_PATTERN, preprocess_survey_text
+
+THAMES_COURT = Path(__file__).parent / "test_files" / "Alpha Sights - Thames Court-Fire Door Survey-March 2026.txt"
+
+
+def _normalize_faults(doors):
+    return {door['door_id']: [' '.join(fault.split()) for fault in door['faults']] for door in doors}
+
+
+def test_thames_court_keeps_every_door_detail():
+    text = THAMES_COURT.read_text(encoding='utf-8')
+    result = preprocess_survey_text(text)
+    cleaned = result.text
+
+    # Cover page and pages 11-77 (summary table and door sections) are kept; the
+    # scope/legal/floorplan pages 2-10 and the action-level legend on page 78 are not
+    pages = [int(marker.split()[2]) for marker in PAGE_BOUNDARY_PATTERN.findall(cleaned)]
+    assert pages == [1] + list(range(11, 78))
+    assert (result.pages, result.pages_removed) == (78, 10)
+    assert "Article 17 of the Fire Safety Order" not in cleaned
+    assert "Action Level & Timeframe Summary" not in cleaned
+
+    # Repeated header lines survive only on the cover page
+    assert cleaned.count("Design Copyright 2026. Fire DNA Ltd.") == 1
+    assert "\nPage 20\n" not in cleaned and "  " not in cleaned and "\n\n\n" not in cleaned
+
+    for marker in ("ID/Location Ref:", "Reason for failure:", "Component:", "ART "):
+        assert cleaned.count(marker) == text.count(marker), marker
+    assert len(cleaned) < 0.65 * len(text)
+
+
+def test_extraction_prompts_shrink_and_doors_are_unchanged(monkeypatch):
+    text = THAMES_COURT.read_text(encoding='utf-8')
+    monkeypatch.setattr(fdp, "FIREDNA_PARSER", False)  # Every door through the (stub) Claude prompt
+    previous = llm_backend.set_backend(SyntheticBackend())
+    try:
+        monkeypatch.setattr(fdp, "EXTRACTION_PREPROCESS", False)
+        raw_doors = fdp.extract_type1_from_text(text)
+        monkeypatch.setattr(fdp, "EXTRACTION_PREPROCESS", True)
+        doors = fdp.extract_type1_from_text(text)
+    finally:
+        llm_backend.set_backend(previous)
+
+    assert len(doors) == 39
+    assert [door['door_id'] for door in doors] == [door['door_id'] for door in raw_doors]
+    # Collapsed whitespace only adds codes: "ART  04" (two spaces) on page 45 becomes readable
+    gained = [set(door['art_codes']) - set(raw['art_codes']) for door, raw in zip(doors, raw_doors)]
+    assert [raw for door, raw in zip(doors, raw_doors) if not set(raw['art_codes']) <= set(door['art_codes'])] == []
+    assert [codes for codes in gained if codes] == [{'ART04'}]
+    assert _normalize_faults(doors) == _normalize_faults(raw_doors)
+
+    tokens_before = fdp.estimate_extraction_tokens(text)
+    tokens_after = fdp.estimate_extraction_tokens(preprocess_survey_text(text).text)
+    assert tokens_after < 0.7 * tokens_before
+
+
+def test_text_without_page_markers_is_only_whitespace_collapsed():
+    result = preprocess_survey_text("Door ID/Location Ref:   A01  \n\n\n\nReason for failure:\n  Gaps \n")
+    assert result.text == "Door ID/Location Ref: A01\n\nReason for failure:\nGaps\n"
+    assert (result.pages, result.pages_removed, result.lines_removed) == (0, 0, 0)
+
+
+def test_preprocessing_is_part_of_the_extraction_version(monkeypatch):
+    monkeypatch.setattr(fdp, "EXTRACTION_PREPROCESS", True)
+    preprocessed = fdp.extraction_version('TYPE_1')
+    monkeypatch.setattr(fdp, "SURVEY_PREPROCESS_VERSION", "v-next")
+    changed = fdp.extraction_version('TYPE_1')
+    monkeypatch.setattr(fdp, "EXTRACTION_PREPROCESS", False)
+    raw = fdp.extraction_version('TYPE_1')
+
+    # Cached extractions from differently pre-processed text are not reused
+    assert len({preprocessed, changed, raw}) == 3
+    assert fdp.extraction_version('TYPE_2') == f"TYPE_2:{fdp.TYPE2_EXTRACTOR_VERSION}"
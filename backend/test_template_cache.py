@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Template cache test: the cost sheet is parsed once per process, every call gets
+its own copy, and editing the file on disk invalidates the cached parse.
+"""
+import os
+import shutil
+
+import firedoor_processor as fdp
+
+
+def test_template_is_reparsed_only_when_the_file_changes(tmp_path, monkeypatch):
+    template = tmp_path / "template.xlsx"
+    shutil.copy(fdp.TEMPLATE_PATH, template)
+    parses = []
+    load_workbook = fdp.load_workbook
+
+    def counting_load_workbook(path, *args, **kwargs):
+        parses.append(path)
+        return load_workbook(path, *args, **kwargs)
+
+    monkeypatch.setattr(fdp, "load_workbook", counting_load_workbook)
+
+    first = fdp.load_template_workbook(str(template))
+    first["Quote Sheet"]["B4"] = "Changed by one request"
+    second = fdp.load_template_workbook(str(template))
+    assert len(parses) == 1
+    assert second["Quote Sheet"]["B4"].value != "Changed by one request"  # Independent copies
+
+    # Saving over the template changes its mtime/size, so the next load re-parses it
+    edited = load_workbook(str(template))
+    edited["Quote Sheet"]["B4"] = "Edited template"
+    edited.save(str(template))
+    stat = template.stat()
+    os.utime(template, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    third = fdp.load_template_workbook(str(template))
+    assert len(parses) == 2 and third["Quote Sheet"]["B4"].value == "Edited template"
+    fdp.load_template_workbook(str(template))
+    assert len(parses) == 2